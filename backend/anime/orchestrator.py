@@ -0,0 +1,268 @@
+"""
+Anime Scraper Orchestration - Hermes Media Server
+Execució concurrent de les fonts d'anime amb un temps límit global i
+resultats parcials, un cache curt de pàgines HTML compartit entre cerca,
+fitxa i episodis, i un circuit breaker per font perquè una web caiguda
+se salti de seguida.
+"""
+
+import time
+import asyncio
+import logging
+import contextvars
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+# Temps màxim de la cerca a totes les fonts (segons)
+SEARCH_DEADLINE = 8.0
+# Temps màxim d'una crida a una sola font (fitxa, episodis, cerca concreta)
+SOURCE_TIMEOUT = 15.0
+# Cache de pàgines
+PAGE_TTL = 300
+PAGE_CACHE_ENTRIES = 256
+# Errors seguits que obren el circuit, i quant de temps queda obert
+FAILURE_THRESHOLD = 3
+OPEN_SECONDS = 120.0
+
+# Errors de xarxa de la crida en curs (per saber si una font ha fallat encara
+# que el scraper s'empassi l'excepció i retorni una llista buida)
+_call_errors: contextvars.ContextVar[Optional[List[str]]] = contextvars.ContextVar("anime_call_errors", default=None)
+
+
+CIRCUIT_OPEN = "circuit obert"
+
+
+class SourceUnavailable(Exception):
+    """El circuit de la font és obert: no es fa la petició."""
+
+
+class CircuitBreaker:
+    """
+    Tancat: les peticions passen. Després de FAILURE_THRESHOLD errors seguits
+    s'obre i les peticions fallen a l'acte; passat OPEN_SECONDS deixa passar
+    una sola petició de prova (mig obert) que el torna a tancar o obrir.
+    """
+
+    def __init__(self, name: str, threshold: int = FAILURE_THRESHOLD, cooldown: float = OPEN_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        # Inici de la petició de prova en curs (si no torna, caduca com el circuit)
+        self._trial_at: Optional[float] = None
+
+    def _trial_running(self) -> bool:
+        return self._trial_at is not None and self._clock() - self._trial_at < self.cooldown
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self._trial_running() or self._clock() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._trial_running():
+            self._trial_at = self._clock()
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_at is not None or self.failures >= self.threshold:
+            if self.opened_at is None:
+                logger.warning(f"[Anime] Circuit obert per {self.name} ({self.failures} errors)")
+            self.opened_at = self._clock()
+        self._trial_at = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures}
+
+
+class PageCache:
+    """
+    Respostes GET recents per URL (LRU amb TTL). Les peticions simultànies a
+    la mateixa URL comparteixen una sola descàrrega.
+    """
+
+    def __init__(self, ttl: float = PAGE_TTL, max_entries: int = PAGE_CACHE_ENTRIES,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, url: str) -> Optional[httpx.Response]:
+        entry = self._entries.get(url)
+        if entry is None:
+            return None
+        expires, response = entry
+        if expires < self._clock():
+            del self._entries[url]
+            return None
+        self._entries.move_to_end(url)
+        return response
+
+    def store(self, url: str, response: httpx.Response):
+        self._entries[url] = (self._clock() + self.ttl, response)
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def fetch(self, url: str, download: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        cached = self.lookup(url)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        inflight = self._inflight.get(url)
+        if inflight is not None:
+            self.hits += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        # La descàrrega va en una tasca pròpia: si qui l'ha iniciada es
+        # cancel·la (timeout de la seva font), els altres la segueixen esperant
+        task = asyncio.ensure_future(self._download(url, download))
+        self._inflight[url] = task
+        # Evita l'avís d'excepció no recollida si ja no l'espera ningú
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return await asyncio.shield(task)
+
+    async def _download(self, url: str, download: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        try:
+            response = await download()
+        finally:
+            self._inflight.pop(url, None)
+        # Només es guarden les respostes correctes: 4xx com 403/429 solen ser
+        # transitòries (límits, bloquejos) i 5xx poden ser-ho
+        if 200 <= response.status_code < 300:
+            self.store(url, response)
+        return response
+
+    def clear(self):
+        self._entries.clear()
+
+
+class SourceClient:
+    """
+    Client HTTP d'una font: mateixa interfície que httpx.AsyncClient per als
+    scrapers (get, aclose), amb el cache de pàgines i el circuit breaker.
+    """
+
+    def __init__(self, source: str, client: httpx.AsyncClient, cache: PageCache, breaker: CircuitBreaker):
+        self.source = source
+        self.client = client
+        self.cache = cache
+        self.breaker = breaker
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        if kwargs:
+            return await self._download(url, **kwargs)
+        return await self.cache.fetch(url, lambda: self._download(url))
+
+    async def _download(self, url: str, **kwargs) -> httpx.Response:
+        if not self.breaker.allow():
+            errors = _call_errors.get()
+            if errors is not None:
+                errors.append(CIRCUIT_OPEN)
+            raise SourceUnavailable(f"{self.source}: {CIRCUIT_OPEN}")
+        try:
+            response = await self.client.get(url, **kwargs)
+        except (httpx.HTTPError, OSError) as e:
+            self._failed(f"{type(e).__name__}: {e}")
+            raise
+        if response.status_code >= 500:
+            self._failed(f"HTTP {response.status_code}")
+        else:
+            self.breaker.record_success()
+        return response
+
+    def _failed(self, error: str):
+        self.breaker.record_failure()
+        errors = _call_errors.get()
+        if errors is not None:
+            errors.append(error)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class SourceOrchestrator:
+    """Crides a les fonts amb límit de temps i estat per font."""
+
+    def __init__(self, breakers: Dict[str, CircuitBreaker]):
+        self.breakers = breakers
+
+    async def call(self, source: str, make_call: Callable[[], Awaitable], default=None,
+                   timeout: float = SOURCE_TIMEOUT) -> Dict[str, Any]:
+        """
+        Executa una crida a una font. Retorna {"status", "value", "elapsed_ms", "error"}
+        amb status ok, error, timeout o skipped (circuit obert).
+        """
+        breaker = self.breakers[source]
+        if breaker.state == "open":
+            return {"status": "skipped", "value": default, "elapsed_ms": 0, "error": CIRCUIT_OPEN}
+
+        errors: List[str] = []
+        started = time.monotonic()
+
+        async def run():
+            _call_errors.set(errors)
+            return await make_call()
+
+        try:
+            value = await asyncio.wait_for(run(), timeout)
+            if not errors:
+                status = "ok"
+            else:
+                # El scraper s'ha empassat l'error: la font ha fallat igualment
+                status = "skipped" if all(e == CIRCUIT_OPEN for e in errors) else "error"
+        except asyncio.TimeoutError:
+            breaker.record_failure()
+            value, status = default, "timeout"
+        except SourceUnavailable:
+            value, status = default, "skipped"
+        except Exception as e:
+            value, status = default, "error"
+            errors.append(str(e))
+        return {
+            "status": status,
+            "value": value if value is not None else default,
+            "elapsed_ms": int((time.monotonic() - started) * 1000),
+            "error": errors[-1] if errors else None,
+        }
+
+    async def fan_out(self, calls: Dict[str, Callable[[], Awaitable]], default=None,
+                      deadline: float = SEARCH_DEADLINE) -> Dict[str, Dict[str, Any]]:
+        """
+        Executa les crides de totes les fonts alhora. Totes comparteixen el
+        límit global: les que no acaben a temps queden com a timeout.
+        """
+        sources = list(calls)
+        outcomes = await asyncio.gather(*(
+            self.call(source, calls[source], default, timeout=deadline) for source in sources
+        ))
+        return dict(zip(sources, outcomes))
+
+    def health(self) -> Dict[str, Dict[str, Any]]:
+        return {source: breaker.snapshot() for source, breaker in self.breakers.items()}
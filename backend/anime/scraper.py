@@ -11,6 +11,10 @@ from typing import Optional, List, Dict, Any
 from urllib.parse import quote, urljoin
 import httpx
 
+from backend.anime.orchestrator import (
+    SEARCH_DEADLINE, CircuitBreaker, PageCache, SourceClient, SourceOrchestrator
+)
+
 logger = logging.getLogger(__name__)
 
 # User agent to avoid blocks
@@ -597,30 +601,47 @@ class AnimeScraperManager:
             'henaojara': HenaoJaraScraper(),
             'fansubscat': FansubsCatScraper(),
         }
+        # Cache de pàgines compartit i un circuit breaker per font
+        self.page_cache = PageCache()
+        self.breakers = {name: CircuitBreaker(name) for name in self.scrapers}
+        for name, scraper in self.scrapers.items():
+            scraper.client = SourceClient(name, scraper.client, self.page_cache, self.breakers[name])
+        self.orchestrator = SourceOrchestrator(self.breakers)
+
+    async def search_detailed(self, query: str, deadline: float = SEARCH_DEADLINE) -> Dict[str, Any]:
+        """
+        Search all sources concurrently under a global deadline.
+        Returns the results per source, the status of each source and
+        whether the response is partial.
+        """
+        outcome = await self.orchestrator.fan_out(
+            {name: (lambda scraper=scraper: scraper.search(query)) for name, scraper in self.scrapers.items()},
+            default=[],
+            deadline=deadline,
+        )
+        return {
+            'results': {name: item['value'] for name, item in outcome.items()},
+            'sources': {
+                name: {
+                    'status': item['status'],
+                    'count': len(item['value']),
+                    'elapsed_ms': item['elapsed_ms'],
+                    'error': item['error'],
+                }
+                for name, item in outcome.items()
+            },
+            'partial': any(item['status'] != 'ok' for item in outcome.values()),
+        }
 
     async def search_all(self, query: str) -> Dict[str, List[Dict[str, Any]]]:
         """Search across all sources"""
-        results = {}
-
-        # Run searches in parallel
-        tasks = {
-            name: scraper.search(query)
-            for name, scraper in self.scrapers.items()
-        }
-
-        for name, task in tasks.items():
-            try:
-                results[name] = await task
-            except Exception as e:
-                logger.error(f"Error searching {name}: {e}")
-                results[name] = []
-
-        return results
+        return (await self.search_detailed(query))['results']
 
     async def search(self, query: str, source: str = None) -> List[Dict[str, Any]]:
         """Search in specific source or all sources"""
         if source and source in self.scrapers:
-            return await self.scrapers[source].search(query)
+            outcome = await self.orchestrator.call(source, lambda: self.scrapers[source].search(query), default=[])
+            return outcome['value']
 
         # Search all and combine results
         all_results = await self.search_all(query)
@@ -633,17 +654,23 @@ class AnimeScraperManager:
         """Get anime info from specific source"""
         if source not in self.scrapers:
             return None
-        return await self.scrapers[source].get_anime_info(anime_id)
+        outcome = await self.orchestrator.call(source, lambda: self.scrapers[source].get_anime_info(anime_id))
+        return outcome['value']
 
     async def get_episode_sources(self, source: str, anime_id: str, episode: int) -> List[Dict[str, Any]]:
         """Get episode sources from specific source"""
         if source not in self.scrapers:
             return []
+        outcome = await self.orchestrator.call(
+            source, lambda: self._episode_sources(source, anime_id, episode), default=[]
+        )
+        return outcome['value']
 
+    async def _episode_sources(self, source: str, anime_id: str, episode: int) -> List[Dict[str, Any]]:
         if source == 'animeflv':
             return await self.scrapers[source].get_episode_sources(anime_id, episode)
         elif source == 'henaojara':
-            # HenaoJara needs the full episode URL
+            # HenaoJara needs the full episode URL (the anime page comes from the page cache)
             anime_info = await self.scrapers[source].get_anime_info(anime_id)
             if anime_info:
                 for ep in anime_info.get('episodes', []):
@@ -655,6 +682,10 @@ class AnimeScraperManager:
 
         return []
 
+    def health(self) -> Dict[str, Dict[str, Any]]:
+        """Circuit state of each source"""
+        return self.orchestrator.health()
+
     async def close_all(self):
         """Close all scraper connections"""
         for scraper in self.scrapers.values():
@@ -1,7 +1,11 @@
 #!/usr/bin/env python3
 """
 Hermes Audiobooks Scanner
-Escaneja biblioteques d'audiollibres organitzades per autor/llibre
+Escaneja biblioteques d'audiollibres organitzades per autor/llibre.
+L'escaneig és incremental: cada fitxer guarda la mida i el mtime, i només
+es passa per ffprobe si és nou o ha canviat. Els canvis s'apliquen amb
+upserts, de manera que els ids de audiobook_files (i el progrés que hi
+apunta) es mantenen entre escanejos.
 """
 
 import os
@@ -26,8 +30,12 @@ class AudiobooksScanner:
 
     SUPPORTED_FORMATS = ['.mp3', '.m4a', '.m4b', '.ogg', '.flac', '.opus', '.aac']
 
-    def __init__(self):
-        self.db_path = settings.DATABASE_PATH
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or settings.DATABASE_PATH
+        # Llistats de directoris de la passada actual
+        self._listings: Dict[str, List[Tuple[str, bool, bool]]] = {}
+        self.files_probed = 0
+        self.files_unchanged = 0
         self._init_database()
         self._check_ffprobe()
 
@@ -91,10 +99,15 @@ class AudiobooksScanner:
                 duration INTEGER DEFAULT 0,
                 file_size INTEGER DEFAULT 0,
                 format TEXT,
+                mtime_ns INTEGER,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (audiobook_id) REFERENCES audiobooks(id)
             )
         """)
+        try:
+            cursor.execute("ALTER TABLE audiobook_files ADD COLUMN mtime_ns INTEGER")
+        except sqlite3.OperationalError:
+            pass
 
         # Taula de progrés d'escolta
         cursor.execute("""
@@ -125,6 +138,8 @@ class AudiobooksScanner:
             "authors_found": 0,
             "audiobooks_found": 0,
             "audiobooks_updated": 0,
+            "files_probed": 0,
+            "files_unchanged": 0,
             "errors": []
         }
 
@@ -146,6 +161,8 @@ class AudiobooksScanner:
             results["audiobooks_found"] += lib_result.get("audiobooks_found", 0)
             results["audiobooks_updated"] += lib_result.get("audiobooks_updated", 0)
 
+        results["files_probed"] = self.files_probed
+        results["files_unchanged"] = self.files_unchanged
         return results
 
     def scan_library(self, library_path: str) -> Dict:
@@ -159,58 +176,77 @@ class AudiobooksScanner:
             "audiobooks_updated": 0
         }
 
+        self._listings = {}
         conn = sqlite3.connect(self.db_path)
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
 
         # Iterar per carpetes d'autors
-        for author_name in os.listdir(library_path):
-            author_path = os.path.join(library_path, author_name)
-
-            if not os.path.isdir(author_path):
+        for author_name, _, is_dir in self._listdir(library_path):
+            if not is_dir:
                 continue
+            author_path = os.path.join(library_path, author_name)
 
             # Crear o obtenir autor
             author_id = self._get_or_create_author(cursor, author_name, author_path)
             result["authors_found"] += 1
 
             # Buscar audiollibres de l'autor (subcarpetes)
-            for audiobook_name in os.listdir(author_path):
+            loose_files = []
+            for audiobook_name, is_file, is_dir in self._listdir(author_path):
                 audiobook_path = os.path.join(author_path, audiobook_name)
 
-                if not os.path.isdir(audiobook_path):
-                    # Potser és un audiollibres d'un sol fitxer
-                    if self._is_audio_file(audiobook_path):
-                        # Crear un audiollibres virtual per l'autor
-                        try:
-                            if self._add_or_update_audiobook(cursor, author_id, author_path, author_name, single_file=audiobook_path):
-                                result["audiobooks_found"] += 1
-                            else:
-                                result["audiobooks_updated"] += 1
-                        except Exception as e:
-                            logger.error(f"    Error afegint audiollibres {audiobook_name}: {e}")
+                if not is_dir:
+                    # Fitxers solts: un audiollibres virtual per l'autor
+                    if is_file and self._is_audio_file(audiobook_path):
+                        loose_files.append(audiobook_path)
                     continue
 
                 # És una carpeta - buscar fitxers d'àudio
-                logger.info(f"    Carpeta: {audiobook_name}")
                 audio_files = self._find_audio_files(audiobook_path)
-                logger.info(f"    Fitxers àudio trobats: {len(audio_files)}")
                 if audio_files:
-                    try:
-                        if self._add_or_update_audiobook(cursor, author_id, audiobook_path, audiobook_name):
-                            result["audiobooks_found"] += 1
-                        else:
-                            result["audiobooks_updated"] += 1
-                    except Exception as e:
-                        logger.error(f"    Error afegint audiollibres {audiobook_name}: {e}")
+                    self._count_audiobook(result, cursor, author_id, audiobook_path, audiobook_name)
+
+            if loose_files:
+                self._count_audiobook(result, cursor, author_id, author_path, author_name,
+                                      single_files=sorted(loose_files))
 
             logger.info(f"  Autor: {author_name}")
 
         conn.commit()
         conn.close()
+        self._listings = {}
 
         return result
 
+    def _count_audiobook(self, result: Dict, cursor, author_id: int, folder_path: str, title: str,
+                         single_files: List[str] = None):
+        """Afegeix o actualitza un audiollibres i ho compta al resultat"""
+        try:
+            if self._add_or_update_audiobook(cursor, author_id, folder_path, title, single_files=single_files):
+                result["audiobooks_found"] += 1
+            else:
+                result["audiobooks_updated"] += 1
+        except Exception as e:
+            logger.error(f"    Error afegint audiollibres {title}: {e}")
+
+    def _listdir(self, folder_path: str) -> List[Tuple[str, bool, bool]]:
+        """Entrades (nom, és fitxer, és carpeta) d'un directori, llegides una vegada per passada"""
+        listing = self._listings.get(folder_path)
+        if listing is None:
+            listing = []
+            try:
+                with os.scandir(folder_path) as entries:
+                    for entry in entries:
+                        try:
+                            listing.append((entry.name, entry.is_file(), entry.is_dir()))
+                        except OSError:
+                            continue
+            except OSError as e:
+                logger.warning(f"No s'ha pogut llistar {folder_path}: {e}")
+            self._listings[folder_path] = listing
+        return listing
+
     def _is_audio_file(self, file_path: str) -> bool:
         """Comprova si un fitxer és un format d'àudio suportat"""
         ext = os.path.splitext(file_path)[1].lower()
@@ -219,9 +255,9 @@ class AudiobooksScanner:
     def _find_audio_files(self, folder_path: str) -> List[str]:
         """Troba tots els fitxers d'àudio en una carpeta"""
         audio_files = []
-        for item in os.listdir(folder_path):
+        for item, is_file, _ in self._listdir(folder_path):
             item_path = os.path.join(folder_path, item)
-            if os.path.isfile(item_path) and self._is_audio_file(item_path):
+            if is_file and self._is_audio_file(item_path):
                 audio_files.append(item_path)
         return sorted(audio_files)
 
@@ -240,91 +276,115 @@ class AudiobooksScanner:
 
         return cursor.lastrowid
 
-    def _add_or_update_audiobook(self, cursor, author_id: int, folder_path: str, title: str, single_file: str = None) -> bool:
+    def _add_or_update_audiobook(self, cursor, author_id: int, folder_path: str, title: str,
+                                 single_files: List[str] = None) -> bool:
         """Afegeix o actualitza un audiollibres. Retorna True si és nou."""
         try:
             # Comprovar si ja existeix
-            cursor.execute("SELECT id FROM audiobooks WHERE folder_path = ?", (folder_path,))
+            cursor.execute("SELECT * FROM audiobooks WHERE folder_path = ?", (folder_path,))
             existing = cursor.fetchone()
-            logger.info(f"      Existeix: {existing is not None}")
 
             # Buscar fitxers d'àudio
-            if single_file:
-                audio_files = [single_file]
-            else:
-                audio_files = self._find_audio_files(folder_path)
-
-            logger.info(f"      Audio files dins funció: {len(audio_files)}")
-
+            audio_files = single_files if single_files else self._find_audio_files(folder_path)
             if not audio_files:
                 logger.warning(f"      No s'han trobat fitxers d'àudio!")
                 return False
 
             # Buscar portada
-            cover = self._find_cover(folder_path if not single_file else os.path.dirname(folder_path))
+            cover = self._find_cover(folder_path)
+
+            # Fitxers ja coneguts: només es proben els nous o canviats
+            known = {}
+            if existing:
+                cursor.execute("SELECT * FROM audiobook_files WHERE audiobook_id = ?", (existing["id"],))
+                known = {row["file_path"]: row for row in cursor.fetchall()}
 
-            # Calcular durada total
             total_duration = 0
             file_infos = []
             for i, audio_file in enumerate(audio_files):
-                info = self._get_audio_info(audio_file)
-                info['track_number'] = i + 1
+                try:
+                    st = os.stat(audio_file)
+                except OSError:
+                    continue
+                row = known.get(audio_file)
+                if row and row["file_size"] == st.st_size and row["mtime_ns"] == st.st_mtime_ns:
+                    info = {
+                        'file_path': audio_file,
+                        'file_name': row["file_name"],
+                        'format': row["format"],
+                        'file_size': row["file_size"],
+                        'duration': row["duration"] or 0,
+                        'title': row["title"],
+                    }
+                    self.files_unchanged += 1
+                else:
+                    info = self._get_audio_info(audio_file)
+                    self.files_probed += 1
+                info['mtime_ns'] = st.st_mtime_ns
+                info['track_number'] = len(file_infos) + 1
                 file_infos.append(info)
                 total_duration += info.get('duration', 0)
 
-            logger.info(f"      Durada total: {total_duration}s, fitxers: {len(file_infos)}")
-
+            values = (author_id, title, cover, total_duration, len(file_infos))
             if existing:
                 audiobook_id = existing["id"]
-                # Actualitzar
-                cursor.execute("""
-                    UPDATE audiobooks SET
-                        author_id = ?, title = ?, cover = ?,
-                        total_duration = ?, total_files = ?
-                    WHERE id = ?
-                """, (
-                    author_id, title, cover,
-                    total_duration, len(audio_files), audiobook_id
-                ))
-
-                # Eliminar fitxers antics i afegir nous
-                cursor.execute("DELETE FROM audiobook_files WHERE audiobook_id = ?", (audiobook_id,))
-
-                for info in file_infos:
-                    self._add_audio_file(cursor, audiobook_id, info)
-
-                return False
+                # Només s'escriu si ha canviat (no mou l'ETag de la biblioteca)
+                if (existing["author_id"], existing["title"], existing["cover"],
+                        existing["total_duration"], existing["total_files"]) != values:
+                    cursor.execute("""
+                        UPDATE audiobooks SET
+                            author_id = ?, title = ?, cover = ?,
+                            total_duration = ?, total_files = ?
+                        WHERE id = ?
+                    """, (*values, audiobook_id))
             else:
-                # Inserir nou
                 cursor.execute("""
                     INSERT INTO audiobooks (
                         author_id, title, folder_path, cover,
                         total_duration, total_files
                     ) VALUES (?, ?, ?, ?, ?, ?)
-                """, (
-                    author_id, title, folder_path, cover,
-                    total_duration, len(audio_files)
-                ))
-
+                """, (author_id, title, folder_path, cover, total_duration, len(file_infos)))
                 audiobook_id = cursor.lastrowid
 
-                # Afegir fitxers
-                for info in file_infos:
-                    self._add_audio_file(cursor, audiobook_id, info)
-
-                logger.info(f"    + {title} ({len(audio_files)} fitxers, {self._format_duration(total_duration)})")
-                return True
+            changed = False
+            for info in file_infos:
+                row = known.get(info['file_path'])
+                if row and all(row[key] == info.get(key) for key in self._FILE_COLUMNS):
+                    continue
+                self._add_audio_file(cursor, audiobook_id, info)
+                changed = True
+
+            if self._remove_missing_files(cursor, audiobook_id, [info['file_path'] for info in file_infos]):
+                changed = True
+            if existing and changed:
+                from backend.audiobooks.streaming import audiobook_streams
+                audiobook_streams.invalidate(audiobook_id)
+
+            if not existing:
+                logger.info(f"    + {title} ({len(file_infos)} fitxers, {self._format_duration(total_duration)})")
+            return not existing
         except Exception as e:
             logger.error(f"      Error en _add_or_update_audiobook: {e}")
             return False
 
+    _FILE_COLUMNS = ('file_name', 'title', 'track_number', 'duration', 'file_size', 'format', 'mtime_ns')
+
     def _add_audio_file(self, cursor, audiobook_id: int, info: Dict):
-        """Afegeix un fitxer d'àudio a la base de dades"""
+        """Afegeix o actualitza un fitxer d'àudio (l'id es conserva si ja existia)"""
         cursor.execute("""
             INSERT INTO audiobook_files (
                 audiobook_id, file_path, file_name, title,
-                track_number, duration, file_size, format
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                track_number, duration, file_size, format, mtime_ns
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(file_path) DO UPDATE SET
+                audiobook_id = excluded.audiobook_id,
+                file_name = excluded.file_name,
+                title = excluded.title,
+                track_number = excluded.track_number,
+                duration = excluded.duration,
+                file_size = excluded.file_size,
+                format = excluded.format,
+                mtime_ns = excluded.mtime_ns
         """, (
             audiobook_id,
             info['file_path'],
@@ -333,35 +393,44 @@ class AudiobooksScanner:
             info.get('track_number', 0),
             info.get('duration', 0),
             info.get('file_size', 0),
-            info.get('format', '')
+            info.get('format', ''),
+            info.get('mtime_ns')
         ))
 
+    def _remove_missing_files(self, cursor, audiobook_id: int, current: List[str]) -> bool:
+        """Esborra els fitxers que ja no hi són i deslliga el progrés que hi apuntava"""
+        cursor.execute("SELECT id, file_path FROM audiobook_files WHERE audiobook_id = ?", (audiobook_id,))
+        current = set(current)
+        gone = [row["id"] for row in cursor.fetchall() if row["file_path"] not in current]
+        if not gone:
+            return False
+        marks = ",".join("?" * len(gone))
+        cursor.execute(f"""
+            UPDATE audiobook_progress SET current_file_id = NULL, current_position = 0
+            WHERE current_file_id IN ({marks})
+        """, gone)
+        cursor.execute(f"DELETE FROM audiobook_files WHERE id IN ({marks})", gone)
+        return True
+
     def _find_cover(self, folder_path: str) -> Optional[str]:
         """Busca una imatge de portada en la carpeta"""
         cover_names = ['cover', 'folder', 'front', 'albumart', 'album']
         cover_extensions = ['.jpg', '.jpeg', '.png', '.webp']
 
-        for item in os.listdir(folder_path):
-            item_lower = item.lower()
-            item_path = os.path.join(folder_path, item)
-
-            if not os.path.isfile(item_path):
+        first_image = None
+        for item, is_file, _ in self._listdir(folder_path):
+            if not is_file:
                 continue
 
-            name, ext = os.path.splitext(item_lower)
+            name, ext = os.path.splitext(item.lower())
             if ext in cover_extensions:
                 if name in cover_names or 'cover' in name:
-                    return item_path
+                    return os.path.join(folder_path, item)
+                # Si no trobem res específic, agafar la primera imatge
+                if first_image is None:
+                    first_image = os.path.join(folder_path, item)
 
-        # Si no trobem res específic, agafar la primera imatge
-        for item in os.listdir(folder_path):
-            item_path = os.path.join(folder_path, item)
-            if os.path.isfile(item_path):
-                ext = os.path.splitext(item.lower())[1]
-                if ext in cover_extensions:
-                    return item_path
-
-        return None
+        return first_image
 
     def _get_audio_info(self, file_path: str) -> Dict:
         """Obté informació d'un fitxer d'àudio"""
@@ -376,17 +445,10 @@ class AudiobooksScanner:
 
         if self.ffprobe_available:
             try:
-                result = subprocess.run([
-                    'ffprobe',
-                    '-v', 'quiet',
-                    '-print_format', 'json',
-                    '-show_format',
-                    '-show_streams',
-                    file_path
-                ], capture_output=True, timeout=30)
-
-                if result.returncode == 0:
-                    data = json.loads(result.stdout)
+                from backend.services.probe_cache import probe_media
+                data = probe_media(file_path)
+
+                if data is not None:
                     fmt = data.get('format', {})
 
                     # Durada
@@ -424,6 +486,8 @@ class AudiobooksScanner:
             "authors_removed": 0
         }
 
+        from backend.audiobooks.streaming import audiobook_streams
+
         # Eliminar audiollibres que no existeixen
         cursor.execute("SELECT id, folder_path FROM audiobooks")
         for audiobook in cursor.fetchall():
@@ -431,6 +495,7 @@ class AudiobooksScanner:
                 cursor.execute("DELETE FROM audiobook_progress WHERE audiobook_id = ?", (audiobook["id"],))
                 cursor.execute("DELETE FROM audiobook_files WHERE audiobook_id = ?", (audiobook["id"],))
                 cursor.execute("DELETE FROM audiobooks WHERE id = ?", (audiobook["id"],))
+                audiobook_streams.forget(audiobook["id"])
                 stats["audiobooks_removed"] += 1
                 logger.info(f"Eliminat audiollibres inexistent: {audiobook['folder_path']}")
 
@@ -0,0 +1,787 @@
+"""
+Hermes Audiobook Streaming
+Cada audiollibres com una sola línia de temps: una seqüència de fitxers
+amb els seus offsets en segons i en bytes, i un mapa de capítols fet amb
+els límits dels fitxers i els capítols incrustats (m4b).
+
+Es serveix de dues maneres:
+- Stream concatenat a nivell de bytes, si tots els fitxers són MP3 (o AAC
+  ADTS) amb els mateixos paràmetres: un sol fitxer virtual amb Range.
+- Playlist HLS d'àudio, per a la resta: segments MPEG-TS generats a
+  demanda amb ffmpeg i guardats a disc. Si l'àudio es pot copiar, cada
+  segment surt d'un tall independent; si s'ha de recodificar, un sol
+  ffmpeg codifica el fitxer de manera contínua des del segment demanat
+  (segments independents farien clics i buits de priming a cada límit).
+
+La playlist HLS també té perfils de poc ample de banda (Opus mono per a
+veu, en fMP4, i AAC per als clients sense Opus), que es trien per
+capacitat del client o per l'ample de banda que indica.
+"""
+
+import os
+import math
+import time
+import shutil
+import sqlite3
+import logging
+import threading
+import subprocess
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from backend.services.disk_quota import DiskQuota
+from backend.services.thumbnails import FfmpegBudget, ffmpeg_budget
+
+logger = logging.getLogger(__name__)
+
+
+AUDIO_TYPES = {
+    'mp3': 'audio/mpeg',
+    'm4a': 'audio/mp4',
+    'm4b': 'audio/mp4',
+    'ogg': 'audio/ogg',
+    'flac': 'audio/flac',
+    'opus': 'audio/opus',
+    'aac': 'audio/aac',
+}
+# Formats que es poden concatenar byte a byte
+CONCAT_FORMATS = ('mp3', 'aac')
+# Codecs que MPEG-TS admet sense transcodificar
+TS_COPY_CODECS = ('mp3', 'aac')
+SEGMENT_SECONDS = 30
+SEGMENT_TIMEOUT = 120
+CHUNK_SIZE = 256 * 1024
+# Segments que un client pot anar per davant d'una codificació en marxa
+ENCODE_LOOKAHEAD = 4
+# Amb l'ffmpeg_budget ple, s'atura la codificació que fa més que ningú no espera
+ENCODE_IDLE = 60
+ENCODE_POLL = 0.1
+# Segons que una línia de temps en memòria serveix sense tornar a mirar la BD ni els fitxers
+TIMELINE_RECHECK = 30
+SEGMENT_CACHE_BYTES = int(os.environ.get("HERMES_AUDIOBOOK_HLS_CACHE_BYTES", str(2 * 1024 ** 3)))
+
+# Perfils de la playlist HLS. "source" copia l'àudio si el contenidor ho admet.
+SOURCE_PROFILE = "source"
+AUDIO_PROFILES = {
+    "source": {"codec": None, "container": "ts"},
+    "aac-64": {"codec": "aac", "bitrate": "64k", "channels": 1, "container": "ts",
+               "codecs": "mp4a.40.2", "bandwidth": 72000},
+    "opus-48": {"codec": "libopus", "bitrate": "48k", "channels": 1, "container": "fmp4",
+                "codecs": "opus", "bandwidth": 56000, "options": ['-application', 'voip', '-ar', '48000']},
+    "opus-32": {"codec": "libopus", "bitrate": "32k", "channels": 1, "container": "fmp4",
+                "codecs": "opus", "bandwidth": 40000, "options": ['-application', 'voip', '-ar', '48000']},
+}
+SEGMENT_EXTENSIONS = {"ts": "ts", "fmp4": "m4s"}
+SOURCE_CODECS = {"mp3": "mp4a.40.34", "aac": "mp4a.40.2"}
+# Per sota d'aquests kbps es passa a un perfil reduït (i del primer, al més petit)
+LOW_BANDWIDTH_KBPS = 256
+VERY_LOW_BANDWIDTH_KBPS = 96
+
+# Taules de l'MPEG Layer III (kbps i Hz) per saltar el frame Xing/Info
+_MP3_BITRATES = {
+    True: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 0],
+    False: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160, 0],
+}
+_MP3_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+class AudiobookStreamError(Exception):
+    """L'audiollibres, el fitxer o el segment no es poden servir."""
+
+
+def audio_type(format_type: Optional[str]) -> str:
+    return AUDIO_TYPES.get((format_type or '').lower(), 'audio/mpeg')
+
+
+# ---------- Bytes d'àudio de cada fitxer ----------
+
+def _id3v2_length(header: bytes) -> int:
+    """Mida del tag ID3v2 del principi (0 si no n'hi ha)."""
+    if len(header) < 10 or header[:3] != b"ID3":
+        return 0
+    size = 0
+    for byte in header[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if header[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _mp3_frame_length(header: bytes) -> int:
+    """Longitud d'un frame MPEG Layer III a partir de la capçalera (0 si no ho és)."""
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return 0
+    version = (header[1] >> 3) & 3
+    layer = (header[1] >> 1) & 3
+    if version == 1 or layer != 1:
+        return 0
+    bitrate = _MP3_BITRATES[version == 3][header[2] >> 4] * 1000
+    rate_index = (header[2] >> 2) & 3
+    if not bitrate or rate_index == 3:
+        return 0
+    padding = (header[2] >> 1) & 1
+    return (144 if version == 3 else 72) * bitrate // _MP3_RATES[version][rate_index] + padding
+
+
+def audio_payload(path: Union[str, Path], format_type: str) -> Tuple[int, int]:
+    """
+    Rang [inici, final) dels bytes d'àudio d'un fitxer: sense els tags ID3
+    i, als MP3, sense el frame Xing/Info (descriu només aquest fitxer i
+    faria creure al navegador que tot el llibre dura el que dura el primer).
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        start = _id3v2_length(f.read(10))
+        end = size
+        if size >= 128:
+            f.seek(size - 128)
+            if f.read(3) == b"TAG":
+                end = size - 128
+        if format_type == 'mp3' and start < end:
+            f.seek(start)
+            frame = f.read(200)
+            length = _mp3_frame_length(frame)
+            if length and any(tag in frame[:length] for tag in (b"Xing", b"Info", b"VBRI")):
+                start += length
+    return min(start, end), end
+
+
+# ---------- Línia de temps ----------
+
+def _audio_stream(path: str) -> Dict:
+    from backend.services.probe_cache import probe_media
+    data = probe_media(path) or {}
+    for stream in data.get('streams', []):
+        if stream.get('codec_type') == 'audio':
+            return stream
+    return {}
+
+
+def _duration(path: str, fallback: int) -> float:
+    from backend.services.probe_cache import probe_duration
+    return probe_duration(path) or float(fallback or 0)
+
+
+def _file_chapters(path: str, format_type: str) -> List[Dict]:
+    """Capítols incrustats d'un fitxer (només m4b/m4a en porten de manera habitual)."""
+    if format_type not in ('m4b', 'm4a'):
+        return []
+    from backend.services.probe_cache import probe_chapters
+    chapters = []
+    for chapter in probe_chapters(path):
+        try:
+            start, end = float(chapter['start_time']), float(chapter['end_time'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        title = (chapter.get('tags') or {}).get('title')
+        chapters.append({"start": start, "end": end, "title": title})
+    return chapters
+
+
+def build_timeline(audiobook_id: int, rows: List[Dict]) -> Dict:
+    """
+    Línia de temps d'un audiollibres a partir dels seus fitxers (en ordre):
+    offsets en segons i en bytes del stream concatenat, mode de streaming i
+    mapa de capítols.
+    """
+    files = []
+    chapters = []
+    seconds = 0.0
+    offset = 0
+    for row in rows:
+        path = row['file_path']
+        format_type = (row['format'] or '').lower()
+        duration = _duration(path, row['duration'])
+        stream = _audio_stream(path)
+        byte_start, byte_end = audio_payload(path, format_type)
+        files.append({
+            "file_id": row['id'],
+            "path": path,
+            "format": format_type,
+            "title": row['title'] or row['file_name'],
+            "codec": stream.get('codec_name'),
+            "sample_rate": stream.get('sample_rate'),
+            "channels": stream.get('channels'),
+            "start": seconds,
+            "duration": duration,
+            "byte_start": byte_start,
+            "byte_end": byte_end,
+            "offset": offset,
+        })
+
+        embedded = _file_chapters(path, format_type)
+        if len(embedded) > 1:
+            for chapter in embedded:
+                chapters.append({
+                    "title": chapter['title'] or files[-1]['title'],
+                    "start": seconds + chapter['start'],
+                    "end": seconds + min(chapter['end'], duration or chapter['end']),
+                    "file_id": row['id'],
+                    "file_offset": chapter['start'],
+                })
+        else:
+            chapters.append({
+                "title": files[-1]['title'],
+                "start": seconds,
+                "end": seconds + duration,
+                "file_id": row['id'],
+                "file_offset": 0.0,
+            })
+
+        seconds += duration
+        offset += byte_end - byte_start
+
+    for index, chapter in enumerate(chapters):
+        chapter["index"] = index
+
+    formats = {f["format"] for f in files}
+    params = {(f["sample_rate"], f["channels"]) for f in files}
+    concat = len(formats) == 1 and formats <= set(CONCAT_FORMATS) and len(params) == 1
+    return {
+        "audiobook_id": audiobook_id,
+        "duration": seconds,
+        "mode": "concat" if concat else "hls",
+        "media_type": audio_type(files[0]["format"]) if files else None,
+        "size": offset,
+        "files": files,
+        "chapters": chapters,
+    }
+
+
+def locate(timeline: Dict, position: float) -> Tuple[Dict, float]:
+    """Fitxer i segon dins del fitxer per a una posició del llibre."""
+    files = timeline["files"]
+    if not files:
+        raise AudiobookStreamError("Audiollibres sense fitxers")
+    position = max(0.0, position)
+    for entry in files:
+        if position < entry["start"] + entry["duration"]:
+            return entry, position - entry["start"]
+    last = files[-1]
+    return last, last["duration"]
+
+
+def iter_concat(timeline: Dict, start: int, end: int, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Bytes [start, end] del stream concatenat, llegint de cada fitxer el tros que toca."""
+    for entry in timeline["files"]:
+        length = entry["byte_end"] - entry["byte_start"]
+        if entry["offset"] + length <= start:
+            continue
+        if entry["offset"] > end:
+            break
+        first = max(start - entry["offset"], 0)
+        last = min(end - entry["offset"], length - 1)
+        with open(entry["path"], "rb") as f:
+            f.seek(entry["byte_start"] + first)
+            remaining = last - first + 1
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+
+# ---------- HLS ----------
+
+def segment_count(entry: Dict, segment_seconds: int = SEGMENT_SECONDS) -> int:
+    return max(1, math.ceil(entry["duration"] / segment_seconds)) if entry["duration"] else 1
+
+
+def segment_name(profile: str, n: int) -> str:
+    return f"{n}.{SEGMENT_EXTENSIONS[AUDIO_PROFILES[profile]['container']]}"
+
+
+@lru_cache(maxsize=None)
+def encoder_available(name: str) -> bool:
+    """Comprova si l'ffmpeg instal·lat té l'encoder (libopus no sempre hi és)."""
+    try:
+        result = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'], capture_output=True, timeout=10)
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    return f" {name} ".encode() in result.stdout
+
+
+def available_profiles() -> List[str]:
+    return [name for name, profile in AUDIO_PROFILES.items()
+            if profile["codec"] in (None, "aac") or encoder_available(profile["codec"])]
+
+
+def negotiate_profile(requested: Optional[str] = None, codecs: Optional[List[str]] = None,
+                      bandwidth_kbps: Optional[float] = None, save_data: bool = False) -> str:
+    """
+    Tria el perfil: el demanat explícitament si existeix; si no, segons
+    l'ample de banda (o Save-Data) i els codecs que el client diu que admet.
+    """
+    profiles = available_profiles()
+    if requested in profiles:
+        return requested
+    if not save_data and (bandwidth_kbps is None or bandwidth_kbps >= LOW_BANDWIDTH_KBPS):
+        return SOURCE_PROFILE
+    very_low = save_data or bandwidth_kbps < VERY_LOW_BANDWIDTH_KBPS
+    if codecs is None or "opus" in codecs:
+        for name in (("opus-32",) if very_low else ("opus-48", "opus-32")):
+            if name in profiles:
+                return name
+    return "aac-64"
+
+
+def _source_bandwidth(timeline: Dict) -> int:
+    total = sum(os.path.getsize(f["path"]) for f in timeline["files"])
+    return int(total * 8 / timeline["duration"]) if timeline["duration"] else 128000
+
+
+def hls_master_playlist(timeline: Dict, base_url: str, query: str = "") -> str:
+    """Playlist mestra amb una variant per perfil, perquè el reproductor triï per ample de banda."""
+    lines = ["#EXTM3U", "#EXT-X-VERSION:7", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    variants = []
+    for name in available_profiles():
+        profile = AUDIO_PROFILES[name]
+        if profile["codec"] is None:
+            codec = timeline["files"][0].get("codec")
+            same = len({f.get("codec") for f in timeline["files"]}) == 1
+            codecs = SOURCE_CODECS.get(codec) if same and codec in TS_COPY_CODECS else "mp4a.40.2"
+            bandwidth = _source_bandwidth(timeline)
+        else:
+            codecs, bandwidth = profile["codecs"], profile["bandwidth"]
+        variants.append((bandwidth, name, codecs))
+    for bandwidth, name, codecs in sorted(variants, reverse=True):
+        lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},CODECS="{codecs}"')
+        lines.append(f"{base_url}/{name}/playlist.m3u8{query}")
+    return "\n".join(lines) + "\n"
+
+
+def hls_playlist(timeline: Dict, base_url: str, profile: str = SOURCE_PROFILE,
+                 segment_seconds: int = SEGMENT_SECONDS, query: str = "") -> str:
+    """
+    Playlist VOD amb els segments de tots els fitxers. Els segments no
+    travessen fitxers, i a cada canvi de fitxer hi ha una discontinuïtat.
+    """
+    fmp4 = AUDIO_PROFILES[profile]["container"] == "fmp4"
+    lines = [
+        "#EXTM3U",
+        f"#EXT-X-VERSION:{7 if fmp4 else 3}",
+        f"#EXT-X-TARGETDURATION:{segment_seconds}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+    ]
+    for position, entry in enumerate(timeline["files"]):
+        if position:
+            lines.append("#EXT-X-DISCONTINUITY")
+        prefix = f"{base_url}/{profile}/{entry['file_id']}"
+        if fmp4:
+            lines.append(f'#EXT-X-MAP:URI="{prefix}/init.mp4{query}"')
+        count = segment_count(entry, segment_seconds)
+        for n in range(count):
+            length = min(segment_seconds, entry["duration"] - n * segment_seconds) if entry["duration"] else segment_seconds
+            lines.append(f"#EXTINF:{max(length, 0.001):.3f},")
+            lines.append(f"{prefix}/{segment_name(profile, n)}{query}")
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+def run_ffmpeg(cmd: List[str], timeout: int = SEGMENT_TIMEOUT) -> Tuple[bool, str]:
+    """Executa ffmpeg. Retorna (correcte, error)."""
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        return False, str(e)
+    if result.returncode != 0:
+        return False, result.stderr.decode("utf-8", "ignore")[-500:]
+    return True, ""
+
+
+def segment_command(entry: Dict, n: int, output: Path, segment_seconds: int = SEGMENT_SECONDS) -> List[str]:
+    """
+    Comanda ffmpeg per al segment n d'un fitxer que es pot copiar (MP3/AAC
+    a MPEG-TS), amb marques de temps del llibre.
+    """
+    start = n * segment_seconds
+    return ['ffmpeg', '-v', 'error', '-y', '-ss', f"{start:.3f}", '-t', str(segment_seconds),
+            '-i', entry["path"], '-vn', '-map', '0:a:0', '-c:a', 'copy',
+            '-output_ts_offset', f"{entry['start'] + start:.3f}", '-f', 'mpegts', str(output)]
+
+
+def copies_audio(entry: Dict, profile: str) -> bool:
+    """El perfil copia l'àudio del fitxer (cada segment es pot tallar per separat)."""
+    return AUDIO_PROFILES[profile]["codec"] is None and entry.get("codec") in TS_COPY_CODECS
+
+
+def encode_command(entry: Dict, first: int, folder: Path, work: Path, profile: str = SOURCE_PROFILE,
+                   segments: Optional[int] = None, segment_seconds: int = SEGMENT_SECONDS) -> List[str]:
+    """
+    Comanda ffmpeg que codifica el fitxer seguit des del segment first (fins
+    al final, o només segments segments) amb el muxer HLS. Els segments
+    surten a folder amb el seu número i apareixen sencers (temp_file); la
+    playlist de treball i, en fMP4, l'init.mp4 van a work. Un sol encoder
+    per a tot el tros: el priming de l'AAC/Opus només hi és al principi.
+    """
+    settings = AUDIO_PROFILES[profile]
+    start = first * segment_seconds
+    cmd = ['ffmpeg', '-v', 'error', '-y']
+    if start:
+        cmd.extend(['-ss', f"{start:.3f}"])
+    if segments:
+        cmd.extend(['-t', str(segments * segment_seconds)])
+    cmd.extend(['-i', entry["path"], '-vn', '-map', '0:a:0'])
+    if settings["codec"] is None:
+        cmd.extend(['-c:a', 'aac', '-b:a', '128k'])
+    else:
+        cmd.extend(['-c:a', settings["codec"], '-b:a', settings["bitrate"], '-ac', str(settings["channels"])])
+        cmd.extend(settings.get("options", []))
+    cmd.extend([
+        '-output_ts_offset', f"{entry['start'] + start:.3f}",
+        '-f', 'hls',
+        '-hls_time', str(segment_seconds),
+        '-hls_list_size', '0',
+        '-hls_flags', 'temp_file',
+        '-start_number', str(first),
+    ])
+    if settings["container"] == "fmp4":
+        cmd.extend(['-hls_segment_type', 'fmp4', '-hls_fmp4_init_filename', 'init.mp4'])
+    cmd.extend([
+        '-hls_segment_filename', str(folder / f"%05d.{SEGMENT_EXTENSIONS[settings['container']]}"),
+        str(work / 'index.m3u8'),
+    ])
+    return cmd
+
+
+def spawn_ffmpeg(cmd: List[str], log_path: Path) -> subprocess.Popen:
+    """Engega ffmpeg en segon pla; els errors van a log_path."""
+    with open(log_path, "wb") as log:
+        return subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=log)
+
+
+@dataclass
+class _Encode:
+    """Codificació contínua en marxa d'un fitxer en un perfil."""
+    process: subprocess.Popen
+    first: int
+    last: Optional[int]
+    work: Path
+    ready: int = 0  # Primer segment (des de first) que encara no s'ha vist al disc
+    touched: float = 0.0  # Última petició que n'esperava un segment
+    holds_slot: bool = True
+    message: str = ""
+
+    def error(self) -> str:
+        if self.message:
+            return self.message
+        try:
+            return (self.work / "ffmpeg.log").read_bytes().decode("utf-8", "ignore")[-500:]
+        except OSError:
+            return ""
+
+
+# ---------- Gestor ----------
+
+class AudiobookStreams:
+    """Línies de temps en memòria (per signatura dels fitxers) i cache de segments HLS."""
+
+    def __init__(self, db_path: Union[str, Path] = None, cache_root: Union[str, Path] = None,
+                 runner: Callable[[List[str]], Tuple[bool, str]] = None,
+                 spawn: Callable[[List[str], Path], subprocess.Popen] = None,
+                 quota_bytes: int = SEGMENT_CACHE_BYTES, budget: FfmpegBudget = None):
+        self._db_path = db_path
+        self._cache_root = Path(cache_root) if cache_root else None
+        self._runner = runner or run_ffmpeg
+        self._spawn = spawn or spawn_ffmpeg
+        # Cada ffmpeg (talls i codificacions) ocupa una plaça del límit de tot el servidor
+        self.budget = budget or ffmpeg_budget
+        # audiobook_id → (signatura, línia de temps, última comprovació)
+        self._timelines: Dict[int, Tuple[Tuple, Dict, float]] = {}
+        self._encodes: Dict[Path, _Encode] = {}
+        self._lock = threading.Lock()
+        # Els init.mp4 no hi entren: són petits i els comparteixen tots els segments
+        self.quota = DiskQuota(lambda: self.cache_root, quota_bytes, pattern="*/*/*/*.*s", label="Audiobook HLS")
+        self.built = 0
+        self.segments_made = 0
+
+    @property
+    def cache_root(self) -> Path:
+        if self._cache_root is None:
+            from config import settings
+            self._cache_root = Path(settings.CACHE_DIR) / "audiobook_hls"
+        return self._cache_root
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db_path is None:
+            from config import settings
+            self._db_path = settings.DATABASE_PATH
+        conn = sqlite3.connect(str(self._db_path), timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def timeline(self, audiobook_id: int, max_age: float = 0) -> Dict:
+        """
+        Línia de temps vigent (es refà si algun fitxer ha canviat). Amb
+        max_age es fa servir la de memòria si s'ha comprovat fa menys de
+        max_age segons: els segments no tornen a mirar la BD i els fitxers.
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._timelines.get(audiobook_id)
+        if cached and max_age and now - cached[2] < max_age:
+            return cached[1]
+
+        conn = self._connect()
+        try:
+            rows = [dict(row) for row in conn.execute("""
+                SELECT * FROM audiobook_files
+                WHERE audiobook_id = ?
+                ORDER BY track_number, file_name
+            """, (audiobook_id,))]
+        finally:
+            conn.close()
+
+        present = []
+        signature = []
+        for row in rows:
+            try:
+                st = os.stat(row['file_path'])
+            except OSError:
+                continue
+            present.append(row)
+            signature.append((row['id'], st.st_size, st.st_mtime_ns))
+        if not present:
+            raise AudiobookStreamError("Audiollibres sense fitxers disponibles")
+        signature = tuple(signature)
+
+        if cached and cached[0] == signature:
+            timeline = cached[1]
+        else:
+            timeline = build_timeline(audiobook_id, present)
+            timeline["signature"] = signature
+            self.built += 1
+        with self._lock:
+            self._timelines[audiobook_id] = (signature, timeline, now)
+        return timeline
+
+    def invalidate(self, audiobook_id: int):
+        """Els fitxers han canviat (escaneig): la propera petició refà la línia de temps."""
+        with self._lock:
+            self._timelines.pop(audiobook_id, None)
+
+    def _file_folder(self, audiobook_id: int, timeline: Dict, file_id: int) -> Tuple[Dict, Path]:
+        entry = next((f for f in timeline["files"] if f["file_id"] == file_id), None)
+        if entry is None:
+            raise AudiobookStreamError("Fitxer no trobat")
+        size, mtime_ns = next(s[1:] for s in timeline["signature"] if s[0] == file_id)
+        folder = self.cache_root / str(audiobook_id) / f"{file_id}-{size}-{mtime_ns}"
+        if not folder.exists():
+            # Segments d'una versió anterior del fitxer
+            for old in folder.parent.glob(f"{file_id}-*"):
+                self._stop_encodes(old)
+                shutil.rmtree(old, ignore_errors=True)
+            self.quota.invalidate()
+        return entry, folder
+
+    def segment_file(self, audiobook_id: int, file_id: int, n: int, profile: str = SOURCE_PROFILE) -> Path:
+        """Segment HLS n d'un fitxer en el perfil indicat, generat només la primera vegada."""
+        if profile not in AUDIO_PROFILES:
+            raise AudiobookStreamError(f"Perfil {profile} desconegut")
+        timeline = self.timeline(audiobook_id, max_age=TIMELINE_RECHECK)
+        entry, folder = self._file_folder(audiobook_id, timeline, file_id)
+        if not 0 <= n < segment_count(entry):
+            raise AudiobookStreamError(f"Segment {n} fora de rang")
+
+        folder = folder / profile
+        target = folder / f"{n:05d}.{SEGMENT_EXTENSIONS[AUDIO_PROFILES[profile]['container']]}"
+        if target.exists():
+            self.quota.touch(target)
+            return target
+
+        folder.mkdir(parents=True, exist_ok=True)
+        if not copies_audio(entry, profile):
+            self._wait_encoded(entry, n, profile, folder, target)
+        else:
+            partial = folder / f"{n:05d}.{threading.get_ident()}.part"
+            if not self.budget.acquire(interactive=True, timeout=SEGMENT_TIMEOUT):
+                raise AudiobookStreamError("Massa processos ffmpeg en marxa")
+            try:
+                ok, error = self._runner(segment_command(entry, n, partial))
+                if not ok or not partial.exists():
+                    raise AudiobookStreamError(f"No s'ha pogut generar el segment: {error}")
+                os.replace(partial, target)
+            finally:
+                self.budget.release(interactive=True)
+                if partial.exists():
+                    partial.unlink()
+        self.segments_made += 1
+        self.quota.added(target)
+        return target
+
+    # ---------- Codificació contínua ----------
+
+    def _wait_encoded(self, entry: Dict, n: int, profile: str, folder: Path, target: Path) -> _Encode:
+        """Espera el segment n d'una codificació contínua (n'engega una si cap no hi arribarà aviat)."""
+        ext = SEGMENT_EXTENSIONS[AUDIO_PROFILES[profile]["container"]]
+        with self._lock:
+            run = self._encodes.get(folder)
+            if run is not None and not self._will_reach(run, n, folder, ext):
+                self._stop(folder, run)
+                run = None
+            if run is not None:
+                run.touched = time.monotonic()
+        if run is None:
+            run = self._start_encode(entry, n, profile, folder, ext)
+
+        deadline = time.monotonic() + SEGMENT_TIMEOUT
+        while not target.exists():
+            if run.process.poll() is not None:
+                if target.exists():
+                    break
+                raise AudiobookStreamError(f"No s'ha pogut generar el segment: {run.error()}")
+            if time.monotonic() > deadline:
+                raise AudiobookStreamError("Temps esgotat generant el segment")
+            time.sleep(ENCODE_POLL)
+        self._publish_init(run, folder)
+        return run
+
+    def _publish_init(self, run: _Encode, folder: Path):
+        """
+        Copia l'init.mp4 de la codificació al directori del perfil. Quan ja
+        hi ha un segment de la tanda, l'ffmpeg l'ha acabat d'escriure; és el
+        mateix per a totes les tandes del fitxer.
+        """
+        init, source = folder / "init.mp4", run.work / "init.mp4"
+        if init.exists() or not source.exists():
+            return
+        partial = folder / f"init.{threading.get_ident()}.part"
+        try:
+            shutil.copyfile(source, partial)
+            os.replace(partial, init)
+        except OSError as e:
+            logger.debug(f"[Audiobook HLS] No s'ha pogut copiar {source}: {e}")
+            if partial.exists():
+                partial.unlink()
+
+    def _will_reach(self, run: _Encode, n: int, folder: Path, ext: str) -> bool:
+        """La codificació en marxa arribarà al segment n d'aquí a poc."""
+        if run.process.poll() is not None or n < run.first or (run.last is not None and n > run.last):
+            return False
+        while (folder / f"{run.first + run.ready:05d}.{ext}").exists():
+            run.ready += 1
+        return n <= run.first + run.ready + ENCODE_LOOKAHEAD
+
+    def _start_encode(self, entry: Dict, n: int, profile: str, folder: Path, ext: str) -> _Encode:
+        # La codificació ocupa una plaça de l'ffmpeg_budget mentre dura
+        if not self.budget.acquire(interactive=True, timeout=0):
+            self._stop_idle()
+            if not self.budget.acquire(interactive=True, timeout=SEGMENT_TIMEOUT):
+                raise AudiobookStreamError("Massa processos ffmpeg en marxa")
+        with self._lock:
+            # Mentre s'esperava plaça, una altra petició pot haver-la engegat
+            existing = self._encodes.get(folder)
+            if existing is not None and self._will_reach(existing, n, folder, ext):
+                self.budget.release(interactive=True)
+                existing.touched = time.monotonic()
+                return existing
+            if existing is not None:
+                self._stop(folder, existing)
+
+            # Només fins al següent segment que ja es té (no es recodifica el que hi ha)
+            count = segment_count(entry)
+            last = next((i - 1 for i in range(n + 1, count) if (folder / f"{i:05d}.{ext}").exists()), None)
+            work = folder / f".encode-{n}"
+            shutil.rmtree(work, ignore_errors=True)
+            work.mkdir()
+            cmd = encode_command(entry, n, folder, work, profile, segments=None if last is None else last - n + 1)
+            try:
+                process = self._spawn(cmd, work / "ffmpeg.log")
+            except OSError as e:
+                self.budget.release(interactive=True)
+                shutil.rmtree(work, ignore_errors=True)
+                raise AudiobookStreamError(f"No s'ha pogut engegar ffmpeg: {e}")
+            run = _Encode(process=process, first=n, last=last, work=work, touched=time.monotonic())
+            self._encodes[folder] = run
+        # La plaça es torna quan ffmpeg acaba, l'esperi algú o no
+        threading.Thread(target=self._watch, args=(folder, run), daemon=True,
+                         name="audiobook-encode").start()
+        return run
+
+    def _watch(self, folder: Path, run: _Encode):
+        run.process.wait()
+        with self._lock:
+            if self._encodes.get(folder) is run:
+                self._stop(folder, run)
+        # Els segments que ha deixat es tornen a comptar
+        self.quota.invalidate()
+
+    def _stop(self, folder: Path, run: _Encode):
+        if self._encodes.get(folder) is run:
+            del self._encodes[folder]
+        if run.process.poll() is None:
+            run.process.kill()
+            run.process.wait()
+        elif run.process.returncode:
+            run.message = run.error()
+        elif (folder / f"{run.first:05d}.m4s").exists():
+            self._publish_init(run, folder)
+        if run.holds_slot:
+            run.holds_slot = False
+            self.budget.release(interactive=True)
+        shutil.rmtree(run.work, ignore_errors=True)
+
+    def _stop_idle(self):
+        """Atura la codificació que fa més estona que ningú no espera (si n'hi ha cap)."""
+        now = time.monotonic()
+        with self._lock:
+            idle = [(run.touched, folder, run) for folder, run in self._encodes.items()
+                    if now - run.touched > ENCODE_IDLE]
+            if idle:
+                _, folder, run = min(idle, key=lambda item: item[0])
+                self._stop(folder, run)
+
+    def _stop_encodes(self, prefix: Path):
+        with self._lock:
+            for folder, run in list(self._encodes.items()):
+                if prefix in folder.parents:
+                    self._stop(folder, run)
+
+    def close(self):
+        """Atura les codificacions en marxa (aturada del servidor)."""
+        with self._lock:
+            for folder, run in list(self._encodes.items()):
+                self._stop(folder, run)
+
+    def init_file(self, audiobook_id: int, file_id: int, profile: str) -> Path:
+        """Segment d'inicialització (fMP4) d'un fitxer; surt amb el primer segment que es codifica."""
+        if AUDIO_PROFILES.get(profile, {}).get("container") != "fmp4":
+            raise AudiobookStreamError(f"El perfil {profile} no té segment d'inicialització")
+        timeline = self.timeline(audiobook_id, max_age=TIMELINE_RECHECK)
+        entry, folder = self._file_folder(audiobook_id, timeline, file_id)
+        folder = folder / profile
+        init = folder / "init.mp4"
+        if init.exists():
+            return init
+        folder.mkdir(parents=True, exist_ok=True)
+        # Primer segment de la tanda en marxa, o el primer que falta
+        with self._lock:
+            run = self._encodes.get(folder)
+            running = run is not None and run.process.poll() is None
+        if running:
+            first = run.first
+        else:
+            first = next((i for i in range(segment_count(entry)) if not (folder / f"{i:05d}.m4s").exists()), None)
+            if first is None:
+                # Hi ha tots els segments menys la capçalera: es refà el primer
+                first = 0
+                (folder / "00000.m4s").unlink(missing_ok=True)
+        self._wait_encoded(entry, first, profile, folder, folder / f"{first:05d}.m4s")
+        if not init.exists():
+            raise AudiobookStreamError("No s'ha pogut generar el segment d'inicialització")
+        return init
+
+    def forget(self, audiobook_id: int):
+        """Oblida la línia de temps i els segments d'un audiollibres."""
+        with self._lock:
+            self._timelines.pop(audiobook_id, None)
+        self._stop_encodes(self.cache_root / str(audiobook_id))
+        shutil.rmtree(self.cache_root / str(audiobook_id), ignore_errors=True)
+        self.quota.invalidate()
+
+
+# Instància global
+audiobook_streams = AudiobookStreams()
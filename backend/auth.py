@@ -6,13 +6,18 @@ Sistema d'autenticació amb JWT
 
 import os
 import sys
+import time
+import asyncio
 import sqlite3
 import hashlib
 import secrets
 import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Optional, Dict
+from typing import Callable, Optional, Dict
 
 sys.path.append(str(Path(__file__).parent.parent))
 from config import settings
@@ -100,14 +105,147 @@ class SimpleJWT:
             return None
 
 
+class TokenCache:
+    """
+    Cache de sessions verificades.
+    Guarda els tokens ja validats (signatura + expiració) i les dades
+    d'usuari, per evitar recalcular l'HMAC i obrir la BD a cada petició.
+    """
+
+    def __init__(self, max_tokens: int = 2048, max_users: int = 512, user_ttl: int = 300,
+                 clock: Callable[[], float] = time.time):
+        self._tokens: "OrderedDict[str, tuple]" = OrderedDict()  # token -> (user_id, exp_ts)
+        self._users: "OrderedDict[int, tuple]" = OrderedDict()  # user_id -> (user, cached_at)
+        self._max_tokens = max_tokens
+        self._max_users = max_users
+        self._user_ttl = user_ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get_token(self, token: str) -> Optional[int]:
+        """Retorna l'user_id d'un token verificat i no caducat."""
+        with self._lock:
+            entry = self._tokens.get(token)
+            if entry is None:
+                return None
+            user_id, exp_ts = entry
+            if exp_ts is not None and self._clock() > exp_ts:
+                del self._tokens[token]
+                return None
+            self._tokens.move_to_end(token)
+            return user_id
+
+    def set_token(self, token: str, user_id: int, exp_ts: Optional[float]):
+        """Registra un token verificat."""
+        with self._lock:
+            self._tokens[token] = (user_id, exp_ts)
+            self._tokens.move_to_end(token)
+            while len(self._tokens) > self._max_tokens:
+                self._tokens.popitem(last=False)
+
+    def get_user(self, user_id: int) -> Optional[Dict]:
+        """Retorna una còpia de l'usuari si és al cache i no ha expirat."""
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None or self._clock() - entry[1] >= self._user_ttl:
+                self._users.pop(user_id, None)
+                self._misses += 1
+                return None
+            self._users.move_to_end(user_id)
+            self._hits += 1
+            return dict(entry[0])
+
+    def set_user(self, user_id: int, user: Dict):
+        """Guarda les dades d'un usuari."""
+        with self._lock:
+            self._users[user_id] = (dict(user), self._clock())
+            self._users.move_to_end(user_id)
+            while len(self._users) > self._max_users:
+                self._users.popitem(last=False)
+
+    def invalidate_user(self, user_id: int, drop_tokens: bool = False):
+        """Descarta les dades d'un usuari (i opcionalment els seus tokens)."""
+        with self._lock:
+            self._users.pop(user_id, None)
+            if drop_tokens:
+                for token in [t for t, (uid, _) in self._tokens.items() if uid == user_id]:
+                    del self._tokens[token]
+
+    def clear(self):
+        """Buida tot el cache."""
+        with self._lock:
+            self._tokens.clear()
+            self._users.clear()
+            self._hits = 0
+            self._misses = 0
+
+    @property
+    def stats(self) -> Dict:
+        """Estadístiques del cache."""
+        total = self._hits + self._misses
+        return {
+            "tokens": len(self._tokens),
+            "users": len(self._users),
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": f"{(self._hits / total * 100):.1f}%" if total > 0 else "0%",
+        }
+
+
+# Pool de fils pel hashing de contrasenyes (PBKDF2 és car i bloquejant).
+# Limitat perquè una ràfega de logins no ocupi tots els fils del servidor.
+PASSWORD_WORKERS = 2
+_password_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_password_executor() -> ThreadPoolExecutor:
+    global _password_executor
+    if _password_executor is None:
+        _password_executor = ThreadPoolExecutor(
+            max_workers=PASSWORD_WORKERS,
+            thread_name_prefix="hermes-auth"
+        )
+    return _password_executor
+
+
 class AuthManager:
     """Gestor d'autenticació"""
 
     def __init__(self):
         self.db_path = settings.DATABASE_PATH
         self.jwt = SimpleJWT(settings.SECRET_KEY)
+        self.token_cache = TokenCache()
         self._init_database()
 
+    async def _run_in_pool(self, func, *args):
+        """Executa una operació amb hashing de contrasenya fora del bucle d'esdeveniments"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_password_executor(), func, *args)
+
+    async def login_async(self, username: str, password: str) -> Dict:
+        """Versió no bloquejant de login()"""
+        return await self._run_in_pool(self.login, username, password)
+
+    async def register_async(self, username: str, password: str, email: str = None,
+                             display_name: str = None) -> Dict:
+        """Versió no bloquejant de register()"""
+        return await self._run_in_pool(self.register, username, password, email, display_name)
+
+    async def register_with_invitation_async(self, username: str, password: str,
+                                             invitation_code: str, email: str = None,
+                                             display_name: str = None) -> Dict:
+        """Versió no bloquejant de register_with_invitation()"""
+        return await self._run_in_pool(
+            self.register_with_invitation, username, password, invitation_code, email, display_name
+        )
+
+    async def change_password_async(self, user_id: int, old_password: str,
+                                    new_password: str) -> Dict:
+        """Versió no bloquejant de change_password()"""
+        return await self._run_in_pool(self.change_password, user_id, old_password, new_password)
+
     def _init_database(self):
         """Inicialitza les taules d'usuaris"""
         conn = sqlite3.connect(self.db_path)
@@ -361,10 +499,23 @@ class AuthManager:
 
     def verify_token(self, token: str) -> Optional[Dict]:
         """Verifica un token i retorna les dades de l'usuari"""
-        payload = self.jwt.decode(token)
+        user_id = self.token_cache.get_token(token)
 
-        if not payload:
-            return None
+        if user_id is None:
+            payload = self.jwt.decode(token)
+            if not payload:
+                return None
+
+            user_id = payload.get("user_id")
+            exp_ts = None
+            if 'exp' in payload:
+                exp = datetime.fromisoformat(payload['exp'])
+                exp_ts = (exp - datetime(1970, 1, 1)).total_seconds()
+            self.token_cache.set_token(token, user_id, exp_ts)
+
+        cached = self.token_cache.get_user(user_id)
+        if cached is not None:
+            return cached
 
         conn = sqlite3.connect(self.db_path)
         conn.row_factory = sqlite3.Row
@@ -373,7 +524,7 @@ class AuthManager:
         cursor.execute("""
             SELECT id, username, display_name, email, avatar, is_admin, is_premium
             FROM users WHERE id = ?
-        """, (payload.get("user_id"),))
+        """, (user_id,))
 
         user = cursor.fetchone()
         conn.close()
@@ -381,7 +532,7 @@ class AuthManager:
         if not user:
             return None
 
-        return {
+        result = {
             "id": user["id"],
             "username": user["username"],
             "display_name": user["display_name"],
@@ -390,6 +541,8 @@ class AuthManager:
             "is_admin": bool(user["is_admin"]),
             "is_premium": bool(user["is_premium"]) if user["is_premium"] is not None else False
         }
+        self.token_cache.set_user(user_id, result)
+        return result
 
     def get_user(self, user_id: int) -> Optional[Dict]:
         """Obté les dades d'un usuari"""
@@ -439,6 +592,7 @@ class AuthManager:
 
         conn.commit()
         conn.close()
+        self.token_cache.invalidate_user(user_id)
 
         return {"status": "success", "message": "Perfil actualitzat"}
 
@@ -463,6 +617,7 @@ class AuthManager:
 
         conn.commit()
         conn.close()
+        self.token_cache.invalidate_user(user_id)
 
         return {"status": "success", "message": "Contrasenya canviada"}
 
@@ -627,6 +782,7 @@ class AuthManager:
 
         conn.commit()
         conn.close()
+        self.token_cache.invalidate_user(user_id, drop_tokens=not active)
 
         return {"status": "success", "message": f"Usuari {'activat' if active else 'desactivat'}"}
 
@@ -663,6 +819,7 @@ class AuthManager:
 
         conn.commit()
         conn.close()
+        self.token_cache.invalidate_user(user_id, drop_tokens=True)
 
         return {"status": "success", "message": "Usuari eliminat"}
 
@@ -685,6 +842,7 @@ class AuthManager:
 
         conn.commit()
         conn.close()
+        self.token_cache.invalidate_user(user_id)
 
         return {"status": "success", "message": f"Usuari {'promogut a' if is_admin else 'tret de'} admin"}
 
@@ -699,6 +857,7 @@ class AuthManager:
 
         conn.commit()
         conn.close()
+        self.token_cache.invalidate_user(user_id)
 
         return {"status": "success", "message": f"Usuari {'ara és' if is_premium else 'ja no és'} premium"}
 
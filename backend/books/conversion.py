@@ -0,0 +1,383 @@
+"""
+Hermes Book Conversion
+Cua persistent de conversions a EPUB (MOBI/AZW/FB2) amb ebook-convert.
+L'escaneig només encua; un pool limitat de fils fa les conversions en
+segon pla, per prioritat. El resultat es guarda adreçat pel hash del
+fitxer original, de manera que un fitxer repetit o mogut no es torna a convertir.
+"""
+
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+import subprocess
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+
+# Formats que es converteixen a EPUB per al lector
+CONVERTIBLE_FORMATS = ("mobi", "azw", "azw3", "fb2")
+# Conversions simultànies (ebook-convert és pesat: per defecte dues)
+CONVERSION_WORKERS = int(os.environ.get("HERMES_CONVERSION_WORKERS", "2"))
+CONVERSION_TIMEOUT = 300
+# Intents per fitxer i espera entre intents (segons)
+MAX_ATTEMPTS = 3
+RETRY_AFTER = 3600
+
+# Prioritats: l'escaneig encua amb la normal; obrir el llibre la puja
+PRIORITY_SCAN = 0
+PRIORITY_USER = 10
+
+
+def init_conversion_tables(conn: sqlite3.Connection):
+    """Crea la taula de la cua de conversions."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS book_conversions (
+            source_path TEXT PRIMARY KEY,
+            book_id INTEGER,
+            source_identity TEXT,
+            source_hash TEXT,
+            output_path TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            priority INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            next_attempt REAL,
+            created_at REAL,
+            updated_at REAL
+        )
+    """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_book_conversions_queue ON book_conversions(status, priority, created_at)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_book_conversions_book ON book_conversions(book_id)")
+    conn.commit()
+
+
+def needs_conversion(format_type: Optional[str]) -> bool:
+    return (format_type or "").lower() in CONVERTIBLE_FORMATS
+
+
+def _identity(path: str) -> str:
+    st = os.stat(path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def file_digest(path: Union[str, Path]) -> str:
+    """SHA-1 del contingut sencer (clau del fitxer convertit)."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def run_ebook_convert(source: str, output: str, timeout: int = CONVERSION_TIMEOUT) -> Tuple[bool, str]:
+    """Executa ebook-convert. Retorna (correcte, error)."""
+    try:
+        result = subprocess.run(
+            ["ebook-convert", source, output],
+            capture_output=True,
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        return False, f"Temps esgotat ({timeout}s)"
+    except OSError as e:
+        return False, str(e)
+    if result.returncode != 0:
+        stderr = result.stderr.decode(errors="replace").strip()
+        return False, stderr[-500:] or f"Codi de sortida {result.returncode}"
+    return True, ""
+
+
+class BookConverter:
+    """Cua de conversions (taula book_conversions) i els fils que la buiden."""
+
+    def __init__(self, db_path: Union[str, Path] = None, output_root: Union[str, Path] = None,
+                 workers: int = CONVERSION_WORKERS, runner: Callable[[str, str], Tuple[bool, str]] = None,
+                 available: Optional[bool] = None):
+        self._db_path = db_path
+        self._output_root = Path(output_root) if output_root else None
+        self.workers = max(workers, 1)
+        self._runner = runner or run_ebook_convert
+        self._available = available
+        self._tables_ready = False
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.converted = 0
+        self.failed = 0
+
+    @property
+    def output_root(self) -> Path:
+        if self._output_root is None:
+            from config import settings
+            self._output_root = Path(settings.CACHE_DIR) / "converted_books"
+        return self._output_root
+
+    @property
+    def available(self) -> bool:
+        """ebook-convert (Calibre) instal·lat."""
+        if self._available is None:
+            self._available = shutil.which("ebook-convert") is not None
+            if not self._available:
+                logger.warning("ebook-convert no disponible. Els MOBI/AZW queden a la cua sense convertir.")
+        return self._available
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db_path is None:
+            from config import settings
+            self._db_path = settings.DATABASE_PATH
+        conn = sqlite3.connect(str(self._db_path), timeout=30)
+        conn.row_factory = sqlite3.Row
+        if not self._tables_ready:
+            init_conversion_tables(conn)
+            # Conversions interrompudes per una aturada del servidor
+            conn.execute("UPDATE book_conversions SET status = 'pending' WHERE status = 'running'")
+            conn.commit()
+            self._tables_ready = True
+        return conn
+
+    def output_path(self, digest: str) -> Path:
+        return self.output_root / digest[:2] / f"{digest}.epub"
+
+    # ---------- Cua ----------
+
+    def enqueue(self, items: Iterable[Tuple[str, Optional[int]]], priority: int = PRIORITY_SCAN) -> int:
+        """
+        Encua (camí, book_id). Un fitxer ja convertit i sense canvis no es
+        torna a encuar; si ha canviat, torna a pendent. Retorna els encuats.
+        """
+        now = time.time()
+        rows = []
+        for source_path, book_id in items:
+            try:
+                rows.append((source_path, book_id, _identity(source_path), priority, now, now))
+            except OSError:
+                continue
+        if not rows:
+            return 0
+
+        conn = self._connect()
+        try:
+            before = conn.total_changes
+            conn.executemany("""
+                INSERT INTO book_conversions
+                    (source_path, book_id, source_identity, priority, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(source_path) DO UPDATE SET
+                    book_id = COALESCE(excluded.book_id, book_id),
+                    priority = MAX(priority, excluded.priority),
+                    status = 'pending', attempts = 0, last_error = NULL,
+                    next_attempt = NULL, output_path = NULL,
+                    source_identity = excluded.source_identity, updated_at = excluded.updated_at
+                WHERE source_identity IS NOT excluded.source_identity
+            """, rows)
+            conn.commit()
+            added = conn.total_changes - before
+        finally:
+            conn.close()
+        self.kick()
+        return added
+
+    def request(self, source_path: str, book_id: Optional[int] = None) -> Dict:
+        """
+        Un usuari vol llegir el llibre: s'encua si cal, passa davant de la
+        cua i, si havia fallat, es torna a intentar. Retorna l'estat.
+        """
+        self.enqueue([(source_path, book_id)], priority=PRIORITY_USER)
+        current = self.status(source_path)
+        # Convertit però el fitxer s'ha esborrat del cache: es torna a fer
+        lost = bool(current) and current["status"] == "done" and not (
+            current["output_path"] and os.path.exists(current["output_path"]))
+        conn = self._connect()
+        try:
+            if lost:
+                conn.execute(
+                    "UPDATE book_conversions SET status = 'pending', output_path = NULL WHERE source_path = ?",
+                    (source_path,)
+                )
+            conn.execute("""
+                UPDATE book_conversions SET
+                    priority = MAX(priority, ?),
+                    status = CASE WHEN status = 'failed' THEN 'pending' ELSE status END,
+                    attempts = CASE WHEN status = 'failed' THEN 0 ELSE attempts END,
+                    next_attempt = CASE WHEN status = 'pending' OR status = 'failed' THEN NULL ELSE next_attempt END
+                WHERE source_path = ? AND status != 'done'
+            """, (PRIORITY_USER, source_path))
+            conn.commit()
+        finally:
+            conn.close()
+        self.kick()
+        return self.status(source_path)
+
+    def status(self, source_path: str) -> Optional[Dict]:
+        conn = self._connect()
+        try:
+            row = conn.execute("""
+                SELECT source_path, book_id, status, priority, attempts, last_error, output_path, updated_at
+                FROM book_conversions WHERE source_path = ?
+            """, (source_path,)).fetchone()
+            if not row:
+                return None
+            result = dict(row)
+            if row["status"] == "pending":
+                # Posició a la cua (pendents que passaran abans)
+                result["queue_position"] = conn.execute("""
+                    SELECT COUNT(*) FROM book_conversions
+                    WHERE status = 'pending' AND (priority > ? OR (priority = ? AND rowid < (
+                        SELECT rowid FROM book_conversions WHERE source_path = ?)))
+                """, (row["priority"], row["priority"], source_path)).fetchone()[0]
+            result["available"] = self.available
+            return result
+        finally:
+            conn.close()
+
+    def stats(self) -> Dict:
+        conn = self._connect()
+        try:
+            counts = dict(conn.execute(
+                "SELECT status, COUNT(*) FROM book_conversions GROUP BY status"
+            ).fetchall())
+        finally:
+            conn.close()
+        return {
+            "available": self.available,
+            "workers": self.workers,
+            "active_workers": sum(t.is_alive() for t in self._threads),
+            "pending": counts.get("pending", 0),
+            "running": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "converted": self.converted,
+        }
+
+    def failures(self, limit: int = 50) -> List[Dict]:
+        conn = self._connect()
+        try:
+            rows = conn.execute("""
+                SELECT source_path, book_id, attempts, last_error, updated_at
+                FROM book_conversions WHERE status = 'failed'
+                ORDER BY updated_at DESC LIMIT ?
+            """, (limit,)).fetchall()
+            return [dict(row) for row in rows]
+        finally:
+            conn.close()
+
+    # ---------- Fils ----------
+
+    def kick(self):
+        """Engega fils fins al límit si hi ha feina i ebook-convert."""
+        if not self.available or self._stop.is_set():
+            return
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name="book-convert", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def wait(self, timeout: Optional[float] = None):
+        """Espera que els fils acabin la cua (tests i línia d'ordres)."""
+        deadline = time.monotonic() + timeout if timeout else None
+        for thread in list(self._threads):
+            thread.join(None if deadline is None else max(deadline - time.monotonic(), 0))
+
+    def shutdown(self):
+        """Els fils acaben la conversió en curs i no n'agafen cap altra."""
+        self._stop.set()
+
+    def _work(self):
+        while not self._stop.is_set():
+            job = self._claim()
+            if job is None:
+                return
+            try:
+                self._convert(job)
+            except Exception as e:
+                logger.error(f"[Conversió] Error inesperat amb {job['source_path']}: {e}")
+                self._finish_failed(job, str(e))
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """Agafa la feina pendent de més prioritat (dins d'una transacció exclusiva)."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            job = conn.execute("""
+                SELECT * FROM book_conversions
+                WHERE status = 'pending' AND (next_attempt IS NULL OR next_attempt <= ?)
+                ORDER BY priority DESC, created_at, rowid
+                LIMIT 1
+            """, (time.time(),)).fetchone()
+            if job is not None:
+                conn.execute(
+                    "UPDATE book_conversions SET status = 'running', updated_at = ? WHERE source_path = ?",
+                    (time.time(), job["source_path"])
+                )
+            conn.commit()
+            return job
+        finally:
+            conn.close()
+
+    def _convert(self, job: sqlite3.Row):
+        source = job["source_path"]
+        if not os.path.exists(source):
+            self._finish_failed(job, "Fitxer no trobat", final=True)
+            return
+
+        digest = file_digest(source)
+        output = self.output_path(digest)
+        if not output.exists():
+            logger.info(f"[Conversió] Convertint a EPUB: {os.path.basename(source)}")
+            output.parent.mkdir(parents=True, exist_ok=True)
+            partial = output.with_name(f"{digest}.{threading.get_ident()}.part.epub")
+            ok, error = self._runner(source, str(partial))
+            if not ok or not partial.exists():
+                partial.unlink(missing_ok=True)
+                self._finish_failed(job, error or "ebook-convert no ha generat cap fitxer")
+                return
+            os.replace(partial, output)
+            self.converted += 1
+
+        conn = self._connect()
+        try:
+            conn.execute("""
+                UPDATE book_conversions SET
+                    status = 'done', source_hash = ?, output_path = ?, last_error = NULL, updated_at = ?
+                WHERE source_path = ?
+            """, (digest, str(output), time.time(), source))
+            try:
+                conn.execute("UPDATE books SET converted_path = ? WHERE file_path = ?", (str(output), source))
+            except sqlite3.OperationalError:
+                pass  # Sense taula de llibres (tests)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _finish_failed(self, job: sqlite3.Row, error: str, final: bool = False):
+        attempts = job["attempts"] + 1
+        failed = final or attempts >= MAX_ATTEMPTS
+        self.failed += failed
+        logger.warning(f"[Conversió] {os.path.basename(job['source_path'])} ha fallat ({attempts}): {error}")
+        conn = self._connect()
+        try:
+            conn.execute("""
+                UPDATE book_conversions SET
+                    status = ?, attempts = ?, last_error = ?, next_attempt = ?, updated_at = ?
+                WHERE source_path = ?
+            """, (
+                "failed" if failed else "pending", attempts, error,
+                None if failed else time.time() + RETRY_AFTER * attempts, time.time(), job["source_path"]
+            ))
+            conn.commit()
+        finally:
+            conn.close()
+
+
+# Instància global
+book_converter = BookConverter()
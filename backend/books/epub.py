@@ -0,0 +1,595 @@
+"""
+Hermes EPUB Service
+Llegeix l'estructura d'un EPUB (spine, TOC i recursos) una sola vegada i
+la guarda com a manifest JSON al cache del llibre. Els recursos es llegeixen
+amb ZipFile oberts i reutilitzats (LRU), amb cerca directa per nom.
+Els capítols es netegen i es reescriuen una vegada i es guarden al mateix cache.
+"""
+
+import os
+import re
+import json
+import shutil
+import hashlib
+import logging
+import posixpath
+import threading
+import warnings
+import zipfile
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from urllib.parse import quote, unquote
+
+from bs4 import BeautifulSoup, XMLParsedAsHTMLWarning
+
+logger = logging.getLogger(__name__)
+
+
+# Versió del format del manifest (canviar-la invalida els guardats)
+MANIFEST_VERSION = 1
+# ZipFile oberts com a molt
+MAX_OPEN_ZIPS = 16
+# Manifests en memòria
+MAX_MANIFESTS = 64
+# Mida dels trossos en servir un recurs
+STREAM_CHUNK = 64 * 1024
+# Versió del HTML processat dels capítols
+CHAPTER_VERSION = 1
+
+# Etiquetes que no es serveixen mai al lector
+UNSAFE_TAGS = ("script", "iframe", "frame", "frameset", "object", "embed", "applet",
+               "form", "input", "button", "textarea", "select", "base", "meta", "noscript")
+# Atributs amb URLs de recursos
+URL_ATTRS = ("src", "href", "xlink:href", "poster")
+_SCHEME = re.compile(r"^[a-zA-Z][a-zA-Z0-9+.-]*:")
+
+NS = {
+    "container": "urn:oasis:names:tc:opendocument:xmlns:container",
+    "opf": "http://www.idpf.org/2007/opf",
+    "dc": "http://purl.org/dc/elements/1.1/",
+    "ncx": "http://www.daisy.org/z3986/2005/ncx/",
+    "xhtml": "http://www.w3.org/1999/xhtml",
+    "epub": "http://www.idpf.org/2007/ops",
+}
+
+
+class EpubError(Exception):
+    """L'EPUB no es pot llegir."""
+
+
+def _identity(path: Union[str, Path]) -> List[int]:
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def book_cache_dir(path: Union[str, Path]) -> Path:
+    """Directori de cache d'un llibre (manifest i capítols processats)."""
+    from config import settings
+    key = hashlib.sha1(str(path).encode()).hexdigest()[:16]
+    return Path(settings.CACHE_DIR) / "epub" / key
+
+
+def resolve_href(base: str, href: str) -> str:
+    """Camí dins del zip d'un href relatiu al fitxer `base` (sense fragment)."""
+    href = unquote(href.split("#", 1)[0])
+    if not href:
+        return base
+    return posixpath.normpath(posixpath.join(posixpath.dirname(base), href)).lstrip("/")
+
+
+# ---------- ZipFile compartits ----------
+
+class ZipPool:
+    """
+    LRU de ZipFile oberts. Un handle en ús no es tanca fins que s'allibera,
+    encara que surti de l'LRU.
+    """
+
+    def __init__(self, max_open: int = MAX_OPEN_ZIPS):
+        self.max_open = max_open
+        self._handles: "OrderedDict[str, Tuple[List[int], zipfile.ZipFile]]" = OrderedDict()
+        self._refs: Dict[int, int] = {}
+        self._retired: Dict[int, zipfile.ZipFile] = {}
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    @contextmanager
+    def open(self, path: Union[str, Path]) -> Iterator[zipfile.ZipFile]:
+        key = str(path)
+        identity = _identity(path)
+        with self._lock:
+            entry = self._handles.get(key)
+            if entry and entry[0] != identity:
+                self._retire(self._handles.pop(key)[1])
+                entry = None
+            if entry is None:
+                zf = zipfile.ZipFile(key, "r")
+                self.opened += 1
+                self._handles[key] = (identity, zf)
+                while len(self._handles) > self.max_open:
+                    self._retire(self._handles.popitem(last=False)[1][1])
+            else:
+                zf = entry[1]
+                self._handles.move_to_end(key)
+            self._refs[id(zf)] = self._refs.get(id(zf), 0) + 1
+        try:
+            yield zf
+        finally:
+            with self._lock:
+                self._refs[id(zf)] -= 1
+                if not self._refs[id(zf)]:
+                    del self._refs[id(zf)]
+                    retired = self._retired.pop(id(zf), None)
+                    if retired is not None:
+                        retired.close()
+
+    def _retire(self, zf: zipfile.ZipFile):
+        if self._refs.get(id(zf)):
+            self._retired[id(zf)] = zf
+        else:
+            zf.close()
+
+    def close_all(self):
+        with self._lock:
+            for _, zf in self._handles.values():
+                self._retire(zf)
+            self._handles.clear()
+
+
+zip_pool = ZipPool()
+
+
+# ---------- Parseig ----------
+
+def _text(element: Optional[ET.Element]) -> Optional[str]:
+    if element is None:
+        return None
+    text = "".join(element.itertext()).strip()
+    return " ".join(text.split()) or None
+
+
+def _parse_ncx(zf: zipfile.ZipFile, ncx_path: str) -> List[Dict]:
+    root = ET.fromstring(zf.read(ncx_path))
+
+    def points(parent) -> List[Dict]:
+        entries = []
+        for point in parent.findall("ncx:navPoint", NS):
+            content = point.find("ncx:content", NS)
+            entry = {
+                "title": _text(point.find("ncx:navLabel/ncx:text", NS)) or "",
+                "href": _toc_href(ncx_path, content.get("src")) if content is not None else None,
+            }
+            children = points(point)
+            if children:
+                entry["children"] = children
+            entries.append(entry)
+        return entries
+
+    nav_map = root.find("ncx:navMap", NS)
+    return points(nav_map) if nav_map is not None else []
+
+
+def _parse_nav(zf: zipfile.ZipFile, nav_path: str) -> List[Dict]:
+    root = ET.fromstring(zf.read(nav_path))
+    toc_nav = None
+    for nav in root.iter(f"{{{NS['xhtml']}}}nav"):
+        if nav.get(f"{{{NS['epub']}}}type") == "toc":
+            toc_nav = nav
+            break
+        toc_nav = toc_nav or nav
+
+    def items(ol) -> List[Dict]:
+        entries = []
+        for li in ol.findall("xhtml:li", NS):
+            link = li.find("xhtml:a", NS)
+            if link is None:
+                link = li.find("xhtml:span", NS)
+            entry = {
+                "title": _text(link) or "",
+                "href": _toc_href(nav_path, link.get("href")) if link is not None and link.get("href") else None,
+            }
+            sub = li.find("xhtml:ol", NS)
+            if sub is not None:
+                entry["children"] = items(sub)
+            entries.append(entry)
+        return entries
+
+    if toc_nav is None:
+        return []
+    ol = toc_nav.find("xhtml:ol", NS)
+    return items(ol) if ol is not None else []
+
+
+def _toc_href(base: str, href: Optional[str]) -> Optional[str]:
+    """href del TOC com a camí dins del zip, conservant el fragment."""
+    if not href:
+        return None
+    path, _, fragment = href.partition("#")
+    resolved = resolve_href(base, path)
+    return f"{resolved}#{fragment}" if fragment else resolved
+
+
+def parse_epub(zf: zipfile.ZipFile) -> Dict:
+    """Manifest de l'EPUB a partir del container i l'OPF (sense llegir els capítols)."""
+    try:
+        container = ET.fromstring(zf.read("META-INF/container.xml"))
+        rootfile = container.find(".//container:rootfile", NS)
+        opf_path = rootfile.get("full-path")
+        opf = ET.fromstring(zf.read(opf_path))
+    except (KeyError, AttributeError, ET.ParseError) as e:
+        raise EpubError(f"OPF no trobat o invàlid: {e}")
+
+    metadata = opf.find("opf:metadata", NS)
+    title = _text(metadata.find("dc:title", NS)) if metadata is not None else None
+    author = _text(metadata.find("dc:creator", NS)) if metadata is not None else None
+    language = _text(metadata.find("dc:language", NS)) if metadata is not None else None
+
+    names = set(zf.namelist())
+    items = {}
+    nav_path = None
+    for item in opf.iterfind("opf:manifest/opf:item", NS):
+        href = item.get("href")
+        if not href:
+            continue
+        path = resolve_href(opf_path, href)
+        items[item.get("id")] = (path, item.get("media-type"))
+        if "nav" in (item.get("properties") or "").split():
+            nav_path = path
+
+    spine_element = opf.find("opf:spine", NS)
+    spine = []
+    if spine_element is not None:
+        for itemref in spine_element.iterfind("opf:itemref", NS):
+            entry = items.get(itemref.get("idref"))
+            if entry and entry[0] in names:
+                spine.append({
+                    "id": itemref.get("idref"),
+                    "href": entry[0],
+                    "linear": itemref.get("linear", "yes") != "no",
+                })
+
+    toc = []
+    ncx_id = spine_element.get("toc") if spine_element is not None else None
+    try:
+        if nav_path and nav_path in names:
+            toc = _parse_nav(zf, nav_path)
+        if not toc and ncx_id in items and items[ncx_id][0] in names:
+            toc = _parse_ncx(zf, items[ncx_id][0])
+    except ET.ParseError as e:
+        logger.debug(f"TOC invàlid: {e}")
+
+    media_types = {path: media_type for path, media_type in items.values()}
+    resources = {}
+    for info in zf.infolist():
+        if info.is_dir():
+            continue
+        resources[info.filename] = {
+            "size": info.file_size,
+            "media_type": media_types.get(info.filename) or mime_type(info.filename),
+        }
+
+    return {
+        "version": MANIFEST_VERSION,
+        "opf": opf_path,
+        "title": title,
+        "author": author,
+        "language": language,
+        "spine": spine,
+        "toc": toc,
+        "resources": resources,
+    }
+
+
+def mime_type(filename: str) -> str:
+    """Determina el MIME type d'un fitxer"""
+    ext = os.path.splitext(filename)[1].lower()
+    mime_types = {
+        '.html': 'text/html',
+        '.xhtml': 'application/xhtml+xml',
+        '.htm': 'text/html',
+        '.css': 'text/css',
+        '.js': 'application/javascript',
+        '.jpg': 'image/jpeg',
+        '.jpeg': 'image/jpeg',
+        '.png': 'image/png',
+        '.gif': 'image/gif',
+        '.svg': 'image/svg+xml',
+        '.webp': 'image/webp',
+        '.woff': 'font/woff',
+        '.woff2': 'font/woff2',
+        '.ttf': 'font/ttf',
+        '.otf': 'font/otf',
+        '.ncx': 'application/x-dtbncx+xml',
+        '.opf': 'application/oebps-package+xml',
+    }
+    return mime_types.get(ext, 'application/octet-stream')
+
+
+# ---------- Llibre ----------
+
+class EpubBook:
+    """Un EPUB amb el seu manifest (índexs de cerca construïts en carregar)."""
+
+    def __init__(self, path: Union[str, Path], manifest: Dict, pool: ZipPool = None,
+                 cache_dir: Optional[Path] = None):
+        self.path = str(path)
+        self.manifest = manifest
+        self.pool = pool or zip_pool
+        self.cache_dir = cache_dir
+        self.resources: Dict[str, Dict] = manifest["resources"]
+        self._opf_dir = posixpath.dirname(manifest["opf"])
+        # Per a referències antigues que només coincideixen pel final del camí
+        self._by_basename: Dict[str, List[str]] = {}
+        for name in self.resources:
+            self._by_basename.setdefault(posixpath.basename(name), []).append(name)
+        self._spine_index = {item["href"]: i for i, item in enumerate(self.spine)}
+        self._titles = {}
+        self._index_toc(manifest["toc"])
+
+    def _index_toc(self, entries: List[Dict]):
+        for entry in entries:
+            href = (entry.get("href") or "").split("#", 1)[0]
+            if href in self._spine_index:
+                self._titles.setdefault(self._spine_index[href], entry.get("title"))
+            self._index_toc(entry.get("children", []))
+
+    @property
+    def spine(self) -> List[Dict]:
+        return self.manifest["spine"]
+
+    def find(self, resource_path: str) -> Optional[str]:
+        """Nom dins del zip d'un recurs: exacte, relatiu a l'OPF o pel final del camí."""
+        resource_path = unquote(resource_path.split("#", 1)[0]).lstrip("/")
+        if resource_path in self.resources:
+            return resource_path
+        relative = posixpath.normpath(posixpath.join(self._opf_dir, resource_path))
+        if relative in self.resources:
+            return relative
+        clean = posixpath.normpath(resource_path)
+        while clean.startswith("../"):
+            clean = clean[3:]
+        for name in self._by_basename.get(posixpath.basename(clean), ()):
+            if name.endswith(clean):
+                return name
+        return None
+
+    def media_type(self, name: str) -> str:
+        return self.resources[name]["media_type"]
+
+    def read(self, name: str) -> bytes:
+        with self.pool.open(self.path) as zf:
+            return zf.read(name)
+
+    def iter_resource(self, name: str, chunk_size: int = STREAM_CHUNK) -> Iterator[bytes]:
+        """Contingut d'un recurs per trossos (sense carregar-lo sencer)."""
+        with self.pool.open(self.path) as zf:
+            with zf.open(name) as member:
+                while True:
+                    chunk = member.read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+
+    # ---------- Capítols ----------
+
+    def chapter_index(self, href: Optional[str]) -> Optional[int]:
+        """Posició al spine del capítol d'un href complet (amb fragment o sense)."""
+        if not href:
+            return None
+        return self._spine_index.get(href.split("#", 1)[0])
+
+    def toc(self) -> Dict:
+        """TOC lleuger: entrades amb l'índex de capítol i el spine sense recursos."""
+        def entries(items: List[Dict]) -> List[Dict]:
+            result = []
+            for item in items:
+                href = item.get("href") or ""
+                entry = {
+                    "title": item.get("title"),
+                    "chapter": self.chapter_index(href),
+                    "anchor": href.partition("#")[2] or None,
+                }
+                if item.get("children"):
+                    entry["children"] = entries(item["children"])
+                result.append(entry)
+            return result
+
+        return {
+            "title": self.manifest.get("title") or "Sense títol",
+            "author": self.manifest.get("author") or "Autor desconegut",
+            "language": self.manifest.get("language"),
+            "chapters": entries(self.manifest["toc"]),
+            "spine": [
+                {"index": i, "id": item["id"], "title": self._titles.get(i), "linear": item.get("linear", True)}
+                for i, item in enumerate(self.spine)
+            ],
+            "total": len(self.spine),
+        }
+
+    def chapter(self, index: int, base_url: str) -> Dict:
+        """
+        Capítol netejat amb les URLs reescrites a `base_url`/resource/...
+        Es processa una sola vegada i es guarda al cache del llibre.
+        """
+        if not 0 <= index < len(self.spine):
+            raise IndexError(index)
+
+        cache_path = self.cache_dir / "chapters" / f"{index}.json" if self.cache_dir else None
+        if cache_path:
+            try:
+                cached = json.loads(cache_path.read_text())
+                if cached.get("version") == CHAPTER_VERSION and cached.get("base") == base_url:
+                    return cached["chapter"]
+            except (OSError, ValueError):
+                pass
+
+        chapter = self._render_chapter(index, base_url)
+
+        if cache_path:
+            try:
+                cache_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = cache_path.with_suffix(f".{threading.get_ident()}.tmp")
+                tmp.write_text(json.dumps({"version": CHAPTER_VERSION, "base": base_url, "chapter": chapter}))
+                os.replace(tmp, cache_path)
+            except OSError as e:
+                logger.warning(f"No s'ha pogut guardar el capítol {index} de {self.path}: {e}")
+        return chapter
+
+    def _render_chapter(self, index: int, base_url: str) -> Dict:
+        href = self.spine[index]["href"]
+        # XHTML llegit com a HTML a propòsit: és com el mostrarà el navegador
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", XMLParsedAsHTMLWarning)
+            soup = BeautifulSoup(self.read(href), "lxml")
+
+        for tag in soup.find_all(list(UNSAFE_TAGS)):
+            tag.decompose()
+
+        stylesheets = []
+        for link in soup.find_all("link"):
+            target = self._rewrite_url(href, link.get("href"), base_url)
+            if "stylesheet" in (link.get("rel") or []) and target:
+                stylesheets.append(target)
+            link.decompose()
+
+        for tag in soup.find_all(True):
+            for attr in list(tag.attrs):
+                value = tag.attrs[attr]
+                if attr.lower().startswith("on"):
+                    del tag.attrs[attr]
+                elif attr in URL_ATTRS and isinstance(value, str):
+                    if tag.name == "a" and attr == "href":
+                        self._rewrite_link(tag, href, value, base_url)
+                        continue
+                    target = self._rewrite_url(href, value, base_url)
+                    if target is None:
+                        del tag.attrs[attr]
+                    else:
+                        tag.attrs[attr] = target
+
+        # Els estils del <head> es conserven davant del cos
+        styles = "".join(str(style) for style in soup.head.find_all("style")) if soup.head else ""
+        body = soup.body or soup
+        return {
+            "index": index,
+            "id": self.spine[index]["id"],
+            "title": self._titles.get(index),
+            "html": styles + body.decode_contents(),
+            "stylesheets": stylesheets,
+            "words": len(body.get_text(" ").split()),
+            "prev": index - 1 if index > 0 else None,
+            "next": index + 1 if index + 1 < len(self.spine) else None,
+            "total": len(self.spine),
+        }
+
+    def _rewrite_url(self, base: str, value: Optional[str], base_url: str) -> Optional[str]:
+        """URL d'un recurs del llibre cap a l'API (None si no es pot servir)."""
+        if not value:
+            return None
+        value = value.strip()
+        if value.startswith("#") or value.startswith("data:"):
+            return value
+        if _SCHEME.match(value):
+            return value if value.lower().startswith(("http:", "https:")) else None
+        name = self.find(resolve_href(base, value))
+        if name is None:
+            return None
+        fragment = value.partition("#")[2]
+        return f"{base_url}/resource/{quote(name)}" + (f"#{fragment}" if fragment else "")
+
+    def _rewrite_link(self, tag, base: str, value: str, base_url: str):
+        """Enllaços: els externs s'obren a part i els interns apunten al capítol."""
+        value = value.strip()
+        if value.startswith("#"):
+            return
+        if _SCHEME.match(value):
+            if value.lower().startswith(("http:", "https:", "mailto:")):
+                tag["target"] = "_blank"
+                tag["rel"] = "noopener noreferrer"
+            else:
+                del tag["href"]
+            return
+        target = resolve_href(base, value)
+        fragment = value.partition("#")[2]
+        chapter = self._spine_index.get(target)
+        if chapter is not None:
+            tag["href"] = f"#{fragment}" if fragment else "#"
+            tag["data-chapter"] = str(chapter)
+            if fragment:
+                tag["data-anchor"] = fragment
+        else:
+            rewritten = self._rewrite_url(base, value, base_url)
+            if rewritten is None:
+                del tag["href"]
+            else:
+                tag["href"] = rewritten
+
+
+class EpubCache:
+    """Manifests en memòria (LRU) i a disc, invalidats si el fitxer canvia."""
+
+    def __init__(self, pool: ZipPool = None, max_entries: int = MAX_MANIFESTS, cache_dir_for=None):
+        self.pool = pool or zip_pool
+        self.max_entries = max_entries
+        self._cache_dir_for = cache_dir_for or book_cache_dir
+        self._books: "OrderedDict[str, Tuple[List[int], EpubBook]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.parsed = 0
+
+    def get(self, path: Union[str, Path]) -> EpubBook:
+        """Llibre amb el manifest vigent (es parseja només la primera vegada)."""
+        key = str(path)
+        identity = _identity(key)
+        with self._lock:
+            entry = self._books.get(key)
+            if entry and entry[0] == identity:
+                self._books.move_to_end(key)
+                return entry[1]
+
+        manifest = self._load(key, identity)
+        if manifest is None:
+            with self.pool.open(key) as zf:
+                manifest = parse_epub(zf)
+            self.parsed += 1
+            self._save(key, identity, manifest)
+
+        book = EpubBook(key, manifest, self.pool, self._cache_dir_for(key))
+        with self._lock:
+            self._books[key] = (identity, book)
+            self._books.move_to_end(key)
+            while len(self._books) > self.max_entries:
+                self._books.popitem(last=False)
+        return book
+
+    def _manifest_path(self, path: str) -> Path:
+        return self._cache_dir_for(path) / "manifest.json"
+
+    def _load(self, path: str, identity: List[int]) -> Optional[Dict]:
+        try:
+            data = json.loads(self._manifest_path(path).read_text())
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != MANIFEST_VERSION or data.get("identity") != identity:
+            return None
+        return data["manifest"]
+
+    def _save(self, path: str, identity: List[int], manifest: Dict):
+        target = self._manifest_path(path)
+        # Els capítols processats són del fitxer anterior
+        shutil.rmtree(target.parent / "chapters", ignore_errors=True)
+        try:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp = target.with_suffix(".tmp")
+            tmp.write_text(json.dumps({
+                "version": MANIFEST_VERSION, "identity": identity, "path": path, "manifest": manifest
+            }))
+            os.replace(tmp, target)
+        except OSError as e:
+            logger.warning(f"No s'ha pogut guardar el manifest de {path}: {e}")
+
+
+# Instància global
+epub_cache = EpubCache()
@@ -0,0 +1,350 @@
+"""
+Hermes Paged Documents
+Índex de pàgines (nombre i mides) de PDFs i còmics CBZ/CBR, calculat una
+vegada en escanejar. Les pàgines dels còmics s'extreuen d'una en una del
+fitxer (sense descomprimir-lo sencer) i es guarden a un cache a disc amb
+mida màxima; les dels PDF es renderitzen amb PyMuPDF només si es demanen
+com a imatge.
+"""
+
+import os
+import re
+import io
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+import zipfile
+import posixpath
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from backend.services.disk_quota import DiskQuota
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fitz  # PyMuPDF
+    FITZ_AVAILABLE = True
+except ImportError:
+    FITZ_AVAILABLE = False
+
+try:
+    import rarfile
+    RAR_AVAILABLE = True
+except ImportError:
+    RAR_AVAILABLE = False
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+
+PAGED_FORMATS = ("pdf", "cbz", "cbr")
+COMIC_FORMATS = ("cbz", "cbr")
+IMAGE_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp",
+    ".gif": "image/gif",
+    ".bmp": "image/bmp",
+    ".avif": "image/avif",
+}
+# Amplada en píxels de les pàgines de PDF renderitzades
+PDF_PAGE_WIDTH = 1280
+# Mida màxima del cache de pàgines extretes
+PAGE_CACHE_BYTES = int(os.environ.get("HERMES_PAGE_CACHE_BYTES", str(1024 ** 3)))
+
+
+class PagedDocumentError(Exception):
+    """El document no es pot obrir o la pàgina no existeix."""
+
+
+def init_page_tables(conn: sqlite3.Connection):
+    """Crea la taula de l'índex de pàgines."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS book_page_index (
+            book_id INTEGER PRIMARY KEY,
+            file_path TEXT NOT NULL,
+            identity TEXT NOT NULL,
+            format TEXT NOT NULL,
+            page_count INTEGER NOT NULL DEFAULT 0,
+            pages TEXT,
+            error TEXT,
+            indexed_at REAL
+        )
+    """)
+    conn.commit()
+
+
+def is_paged(format_type: Optional[str]) -> bool:
+    return (format_type or "").lower() in PAGED_FORMATS
+
+
+def _identity(path: str) -> str:
+    st = os.stat(path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def natural_key(name: str) -> List:
+    """Ordre natural: 'p2.jpg' abans de 'p10.jpg'."""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", name)]
+
+
+# ---------- Còmics ----------
+
+@contextmanager
+def open_comic(path: Union[str, Path]) -> Iterator:
+    """
+    Obre un CBZ o CBR. Molts .cbr són en realitat zip, i al revés:
+    es mira el contingut, no l'extensió.
+    """
+    path = str(path)
+    if zipfile.is_zipfile(path):
+        archive = zipfile.ZipFile(path)
+    elif RAR_AVAILABLE and rarfile.is_rarfile(path):
+        archive = rarfile.RarFile(path)
+    elif not RAR_AVAILABLE:
+        raise PagedDocumentError("Cal el paquet rarfile (i unrar) per llegir CBR")
+    else:
+        raise PagedDocumentError("Arxiu de còmic no reconegut")
+    try:
+        yield archive
+    finally:
+        archive.close()
+
+
+def comic_members(archive) -> List[str]:
+    """Imatges de l'arxiu en ordre de lectura (sense carpetes ni fitxers ocults)."""
+    names = []
+    for info in archive.infolist():
+        name = info.filename
+        if info.is_dir() or name.startswith("__MACOSX/"):
+            continue
+        if posixpath.basename(name).startswith("."):
+            continue
+        if os.path.splitext(name)[1].lower() in IMAGE_TYPES:
+            names.append(name)
+    return sorted(names, key=natural_key)
+
+
+def _image_size(data: io.BufferedIOBase) -> Tuple[Optional[int], Optional[int]]:
+    """Mides llegint només la capçalera de la imatge."""
+    if not PIL_AVAILABLE:
+        return None, None
+    try:
+        with Image.open(data) as image:
+            return image.size
+    except Exception:
+        return None, None
+
+
+def index_document(path: Union[str, Path], format_type: str) -> Dict:
+    """Nombre de pàgines i mides de cada pàgina (punts per als PDF, píxels per als còmics)."""
+    format_type = format_type.lower()
+    pages = []
+    if format_type == "pdf":
+        if not FITZ_AVAILABLE:
+            raise PagedDocumentError("PyMuPDF no instal·lat")
+        with fitz.open(str(path)) as doc:
+            for page in doc:
+                pages.append({"w": round(page.rect.width), "h": round(page.rect.height)})
+    elif format_type in COMIC_FORMATS:
+        with open_comic(path) as archive:
+            for name in comic_members(archive):
+                with archive.open(name) as member:
+                    # Pillow només necessita la capçalera
+                    width, height = _image_size(io.BytesIO(member.read(256 * 1024)))
+                pages.append({"w": width, "h": height, "name": name})
+    else:
+        raise PagedDocumentError(f"Format {format_type} no paginat")
+    return {"format": format_type, "page_count": len(pages), "pages": pages}
+
+
+def render_pdf_page(path: Union[str, Path], index: int, dest: Path, width: int = PDF_PAGE_WIDTH):
+    """Renderitza una pàgina de PDF a PNG amb l'amplada indicada."""
+    if not FITZ_AVAILABLE:
+        raise PagedDocumentError("PyMuPDF no instal·lat")
+    with fitz.open(str(path)) as doc:
+        if not 0 <= index < len(doc):
+            raise PagedDocumentError(f"Pàgina {index} fora de rang")
+        page = doc[index]
+        zoom = width / page.rect.width if page.rect.width else 1
+        pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        pixmap.save(str(dest))
+
+
+# ---------- Índex i cache ----------
+
+class PageIndex:
+    """Índex de pàgines per llibre (taula book_page_index) i cache de pàgines extretes."""
+
+    def __init__(self, db_path: Union[str, Path] = None, cache_root: Union[str, Path] = None,
+                 quota_bytes: int = PAGE_CACHE_BYTES):
+        self._db_path = db_path
+        self._cache_root = Path(cache_root) if cache_root else None
+        self._tables_ready = False
+        self.quota = DiskQuota(lambda: self.cache_root, quota_bytes, "*/*", "Pàgines")
+        self.indexed = 0
+        self.extracted = 0
+
+    @property
+    def cache_root(self) -> Path:
+        if self._cache_root is None:
+            from config import settings
+            self._cache_root = Path(settings.CACHE_DIR) / "pages"
+        return self._cache_root
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db_path is None:
+            from config import settings
+            self._db_path = settings.DATABASE_PATH
+        conn = sqlite3.connect(str(self._db_path), timeout=30)
+        conn.row_factory = sqlite3.Row
+        if not self._tables_ready:
+            init_page_tables(conn)
+            self._tables_ready = True
+        return conn
+
+    def cache_dir(self, path: Union[str, Path]) -> Path:
+        return self.cache_root / hashlib.sha1(str(path).encode()).hexdigest()[:16]
+
+    def get(self, book_id: int, path: str, format_type: str) -> Dict:
+        """Índex vigent del llibre (es calcula si falta o el fitxer ha canviat)."""
+        identity = _identity(path)
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT * FROM book_page_index WHERE book_id = ?", (book_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        if row and row["file_path"] == path and row["identity"] == identity:
+            if row["error"]:
+                raise PagedDocumentError(row["error"])
+            return {"format": row["format"], "page_count": row["page_count"], "pages": json.loads(row["pages"])}
+        return self._index(book_id, path, format_type, identity)
+
+    def index_books(self, books: Iterable[Tuple[int, str, str]]) -> int:
+        """Indexa els llibres (book_id, camí, format) que falten o han canviat. Retorna quants."""
+        count = 0
+        conn = self._connect()
+        try:
+            current = {
+                row["book_id"]: (row["file_path"], row["identity"])
+                for row in conn.execute("SELECT book_id, file_path, identity FROM book_page_index")
+            }
+        finally:
+            conn.close()
+        for book_id, path, format_type in books:
+            try:
+                identity = _identity(path)
+            except OSError:
+                continue
+            if current.get(book_id) == (path, identity):
+                continue
+            try:
+                self._index(book_id, path, format_type, identity)
+            except PagedDocumentError:
+                pass
+            count += 1
+        return count
+
+    def _index(self, book_id: int, path: str, format_type: str, identity: str) -> Dict:
+        error = None
+        try:
+            index = index_document(path, format_type)
+        except PagedDocumentError as e:
+            error, index = str(e), {"format": format_type, "page_count": 0, "pages": []}
+        except Exception as e:
+            error, index = f"Document il·legible: {e}", {"format": format_type, "page_count": 0, "pages": []}
+
+        # Les pàgines extretes eren del fitxer anterior
+        if self.cache_dir(path).exists():
+            shutil.rmtree(self.cache_dir(path), ignore_errors=True)
+            self.quota.invalidate()
+        conn = self._connect()
+        try:
+            conn.execute("""
+                INSERT OR REPLACE INTO book_page_index
+                    (book_id, file_path, identity, format, page_count, pages, error, indexed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (book_id, path, identity, index["format"], index["page_count"],
+                  json.dumps(index["pages"]), error, time.time()))
+            if not error:
+                try:
+                    conn.execute("UPDATE books SET pages = ? WHERE id = ?", (index["page_count"], book_id))
+                except sqlite3.OperationalError:
+                    pass  # Sense taula de llibres (tests)
+            conn.commit()
+        finally:
+            conn.close()
+        self.indexed += 1
+
+        if error:
+            logger.warning(f"[Pàgines] No s'ha pogut indexar {path}: {error}")
+            raise PagedDocumentError(error)
+        return index
+
+    def page_file(self, book_id: int, path: str, format_type: str, page: int) -> Tuple[Path, str]:
+        """
+        Fitxer d'imatge d'una pàgina, extret (o renderitzat) només la primera
+        vegada. Retorna (camí, media type).
+        """
+        index = self.get(book_id, path, format_type)
+        if not 0 <= page < index["page_count"]:
+            raise PagedDocumentError(f"Pàgina {page} fora de rang")
+
+        cache_dir = self.cache_dir(path)
+        if index["format"] == "pdf":
+            target, media_type = cache_dir / f"{page:05d}.png", "image/png"
+        else:
+            name = index["pages"][page]["name"]
+            ext = os.path.splitext(name)[1].lower()
+            target, media_type = cache_dir / f"{page:05d}{ext}", IMAGE_TYPES[ext]
+
+        if target.exists():
+            self.quota.touch(target)
+            return target, media_type
+
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        partial = target.with_name(f"{target.stem}.{threading.get_ident()}.part{target.suffix}")
+        try:
+            if index["format"] == "pdf":
+                render_pdf_page(path, page, partial)
+            else:
+                # Només es descomprimeix la pàgina demanada
+                with open_comic(path) as archive, archive.open(name) as member, open(partial, "wb") as out:
+                    shutil.copyfileobj(member, out, 256 * 1024)
+            os.replace(partial, target)
+        finally:
+            if partial.exists():
+                partial.unlink()
+        self.extracted += 1
+        self.quota.added(target)
+        return target, media_type
+
+    def forget(self, book_ids: Iterable[int]):
+        """Esborra l'índex i les pàgines en cache de llibres eliminats."""
+        conn = self._connect()
+        try:
+            for book_id in book_ids:
+                row = conn.execute("SELECT file_path FROM book_page_index WHERE book_id = ?", (book_id,)).fetchone()
+                if row:
+                    shutil.rmtree(self.cache_dir(row["file_path"]), ignore_errors=True)
+                    self.quota.invalidate()
+                conn.execute("DELETE FROM book_page_index WHERE book_id = ?", (book_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+
+# Instància global
+page_index = PageIndex()
@@ -15,6 +15,7 @@ from typing import Dict, Optional, List, Tuple
 
 sys.path.append(str(Path(__file__).parent.parent.parent))
 from config import settings
+from backend.books.conversion import needs_conversion
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -59,17 +60,17 @@ class BookReader:
         format_type = book['format'].lower()
         file_path = book['file_path']
 
-        # Si és MOBI/AZW i tenim versió convertida
-        if format_type in ['mobi', 'azw', 'azw3'] and book.get('converted_path'):
+        # Si és MOBI/AZW/FB2 i tenim versió convertida
+        if needs_conversion(format_type) and book.get('converted_path'):
             if os.path.exists(book['converted_path']):
                 return 'epub', book['converted_path']
 
         return format_type, file_path
 
-    def get_epub_content(self, book_id: int) -> Optional[Dict]:
-        """
-        Processa un EPUB i retorna el contingut estructurat.
-        """
+    def get_epub_book(self, book_id: int):
+        """EpubBook amb el manifest en cache (None si no és un EPUB llegible)."""
+        from backend.books.epub import EpubError, epub_cache
+
         content_type, file_path = self.get_book_content_type(book_id)
 
         if content_type != 'epub' or not file_path:
@@ -79,117 +80,56 @@ class BookReader:
             return None
 
         try:
-            return self._parse_epub(file_path)
-        except Exception as e:
+            return epub_cache.get(file_path)
+        except (EpubError, zipfile.BadZipFile, OSError) as e:
             logger.error(f"Error processant EPUB: {e}")
             return None
 
-    def _parse_epub(self, epub_path: str) -> Dict:
-        """Parseja un EPUB i retorna estructura"""
-        try:
-            import ebooklib
-            from ebooklib import epub
-
-            book = epub.read_epub(epub_path)
-
-            # Metadades
-            title = book.get_metadata('DC', 'title')
-            author = book.get_metadata('DC', 'creator')
-
-            result = {
-                'title': title[0][0] if title else 'Sense títol',
-                'author': author[0][0] if author else 'Autor desconegut',
-                'chapters': [],
-                'spine': []
-            }
-
-            # Obtenir ordre de lectura (spine)
-            for item in book.spine:
-                item_id = item[0]
-                doc = book.get_item_with_id(item_id)
-                if doc:
-                    result['spine'].append({
-                        'id': item_id,
-                        'href': doc.get_name()
-                    })
-
-            # Processar capítols (TOC)
-            toc = book.toc
-            for item in toc:
-                if isinstance(item, epub.Link):
-                    result['chapters'].append({
-                        'title': item.title,
-                        'href': item.href
-                    })
-                elif isinstance(item, tuple):
-                    # Secció amb subentrades
-                    section_title = item[0].title if hasattr(item[0], 'title') else str(item[0])
-                    result['chapters'].append({
-                        'title': section_title,
-                        'href': item[0].href if hasattr(item[0], 'href') else None,
-                        'children': [
-                            {'title': sub.title, 'href': sub.href}
-                            for sub in item[1] if hasattr(sub, 'title')
-                        ]
-                    })
-
-            return result
-
-        except ImportError:
-            logger.error("ebooklib no instal·lat")
-            return None
-        except Exception as e:
-            logger.error(f"Error parsejant EPUB: {e}")
+    def get_epub_content(self, book_id: int) -> Optional[Dict]:
+        """
+        Processa un EPUB i retorna l'estructura (TOC i spine, sense capítols).
+        El contingut es demana capítol a capítol amb get_epub_chapter.
+        """
+        return self.get_epub_toc(book_id)
+
+    def get_epub_toc(self, book_id: int) -> Optional[Dict]:
+        """TOC lleuger d'un EPUB (sense contingut dels capítols)."""
+        book = self.get_epub_book(book_id)
+        return book.toc() if book else None
+
+    def get_epub_chapter(self, book_id: int, index: int) -> Optional[Dict]:
+        """
+        Un capítol de l'EPUB ja netejat, amb els recursos apuntant a l'API.
+        Retorna None si el llibre o el capítol no existeixen.
+        """
+        book = self.get_epub_book(book_id)
+        if not book or not 0 <= index < len(book.spine):
             return None
+        return book.chapter(index, f"/api/books/{book_id}")
 
     def get_epub_resource(self, book_id: int, resource_path: str) -> Tuple[Optional[bytes], str]:
         """
         Obté un recurs (HTML, CSS, imatge) d'un EPUB.
         Retorna (contingut, mime_type)
         """
-        content_type, file_path = self.get_book_content_type(book_id)
-
-        if content_type != 'epub' or not file_path:
+        book = self.get_epub_book(book_id)
+        if not book:
             return None, ''
 
-        try:
-            with zipfile.ZipFile(file_path, 'r') as zf:
-                # Els EPUBs són ZIPs
-                # El resource_path pot ser relatiu
-                for name in zf.namelist():
-                    if name.endswith(resource_path) or resource_path in name:
-                        content = zf.read(name)
-                        mime_type = self._get_mime_type(name)
-                        return content, mime_type
-
+        name = book.find(resource_path)
+        if not name:
             return None, ''
 
+        try:
+            return book.read(name), book.media_type(name)
         except Exception as e:
             logger.error(f"Error obtenint recurs EPUB: {e}")
             return None, ''
 
     def _get_mime_type(self, filename: str) -> str:
         """Determina el MIME type d'un fitxer"""
-        ext = os.path.splitext(filename)[1].lower()
-        mime_types = {
-            '.html': 'text/html',
-            '.xhtml': 'application/xhtml+xml',
-            '.htm': 'text/html',
-            '.css': 'text/css',
-            '.js': 'application/javascript',
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.png': 'image/png',
-            '.gif': 'image/gif',
-            '.svg': 'image/svg+xml',
-            '.woff': 'font/woff',
-            '.woff2': 'font/woff2',
-            '.ttf': 'font/ttf',
-            '.otf': 'font/otf',
-            '.ncx': 'application/x-dtbncx+xml',
-            '.opf': 'application/oebps-package+xml',
-        }
-        return mime_types.get(ext, 'application/octet-stream')
+        from backend.books.epub import mime_type
+        return mime_type(filename)
 
     def update_reading_progress(self, book_id: int, position: str,
                                  page: int = 0, total_pages: int = 0,
@@ -9,13 +9,13 @@ import sys
 import sqlite3
 import logging
 import hashlib
-import subprocess
-import shutil
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 
 sys.path.append(str(Path(__file__).parent.parent.parent))
 from config import settings
+from backend.books.conversion import book_converter, needs_conversion
+from backend.books.pages import is_paged, page_index
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -24,27 +24,15 @@ logger = logging.getLogger(__name__)
 class BooksScanner:
     """Escaneja biblioteques de llibres"""
 
-    SUPPORTED_FORMATS = ['.epub', '.pdf', '.mobi', '.azw', '.azw3', '.cbz', '.cbr']
+    SUPPORTED_FORMATS = ['.epub', '.pdf', '.mobi', '.azw', '.azw3', '.fb2', '.cbz', '.cbr']
 
     def __init__(self):
         self.db_path = settings.DATABASE_PATH
         self._init_database()
-        self._check_ebook_convert()
-
-    def _check_ebook_convert(self):
-        """Comprova si ebook-convert (Calibre) està disponible"""
-        self.ebook_convert_available = False
-        try:
-            result = subprocess.run(
-                ['ebook-convert', '--version'],
-                capture_output=True,
-                timeout=10
-            )
-            if result.returncode == 0:
-                self.ebook_convert_available = True
-                logger.info("ebook-convert (Calibre) disponible per conversions")
-        except (subprocess.CalledProcessError, FileNotFoundError, subprocess.TimeoutExpired):
-            logger.warning("ebook-convert no disponible. MOBI/AZW no es podran convertir automàticament.")
+        # Llibres pendents de convertir a EPUB (s'encuen en acabar l'escaneig)
+        self._conversions = []
+        # PDFs i còmics per indexar les pàgines en acabar l'escaneig
+        self._paged = []
 
     def _init_database(self):
         """Inicialitza les taules per llibres"""
@@ -111,6 +99,7 @@ class BooksScanner:
             "authors_found": 0,
             "books_found": 0,
             "books_updated": 0,
+            "conversions_queued": 0,
             "errors": []
         }
 
@@ -131,6 +120,7 @@ class BooksScanner:
             results["authors_found"] += lib_result.get("authors_found", 0)
             results["books_found"] += lib_result.get("books_found", 0)
             results["books_updated"] += lib_result.get("books_updated", 0)
+            results["conversions_queued"] += lib_result.get("conversions_queued", 0)
 
         return results
 
@@ -196,6 +186,16 @@ class BooksScanner:
         conn.commit()
         conn.close()
 
+        # La conversió es fa en segon pla i no bloqueja l'escaneig
+        if self._conversions:
+            result["conversions_queued"] = book_converter.enqueue(self._conversions)
+            self._conversions = []
+
+        # Nombre i mides de les pàgines (només els nous o modificats)
+        if self._paged:
+            result["pages_indexed"] = page_index.index_books(self._paged)
+            self._paged = []
+
         return result
 
     def _get_or_create_author(self, cursor, name: str, path: str) -> int:
@@ -219,7 +219,7 @@ class BooksScanner:
         file_hash = self._calculate_file_hash(file_path)
 
         # Comprovar si ja existeix
-        cursor.execute("SELECT id, file_hash FROM books WHERE file_path = ?", (file_path,))
+        cursor.execute("SELECT id, file_hash, converted_path FROM books WHERE file_path = ?", (file_path,))
         existing = cursor.fetchone()
 
         # Extreure informació del fitxer
@@ -233,25 +233,27 @@ class BooksScanner:
         if metadata.get('title'):
             title = metadata['title']
 
-        # Convertir MOBI/AZW a EPUB si cal
-        converted_path = None
-        if format_ext in ['mobi', 'azw', 'azw3'] and self.ebook_convert_available:
-            converted_path = self._convert_to_epub(file_path)
+        convert = needs_conversion(format_ext)
 
         if existing:
-            # Actualitzar si ha canviat
-            if existing["file_hash"] != file_hash:
+            changed = existing["file_hash"] != file_hash
+            if is_paged(format_ext):
+                self._paged.append((existing["id"], file_path, format_ext))
+            if convert and (changed or not existing["converted_path"]):
+                self._conversions.append((file_path, existing["id"]))
+            # Actualitzar si ha canviat (la versió convertida ja no és vàlida)
+            if changed:
                 cursor.execute("""
                     UPDATE books SET
                         author_id = ?, title = ?, file_hash = ?, format = ?,
                         cover = ?, language = ?, description = ?, pages = ?,
-                        file_size = ?, converted_path = ?
+                        file_size = ?, converted_path = NULL
                     WHERE id = ?
                 """, (
                     author_id, title, file_hash, format_ext,
                     metadata.get('cover'), metadata.get('language'),
                     metadata.get('description'), metadata.get('pages'),
-                    file_size, converted_path, existing["id"]
+                    file_size, existing["id"]
                 ))
             return False
         else:
@@ -259,14 +261,18 @@ class BooksScanner:
             cursor.execute("""
                 INSERT INTO books (
                     author_id, title, file_path, file_hash, format,
-                    cover, language, description, pages, file_size, converted_path
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    cover, language, description, pages, file_size
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, (
                 author_id, title, file_path, file_hash, format_ext,
                 metadata.get('cover'), metadata.get('language'),
                 metadata.get('description'), metadata.get('pages'),
-                file_size, converted_path
+                file_size
             ))
+            if convert:
+                self._conversions.append((file_path, cursor.lastrowid))
+            if is_paged(format_ext):
+                self._paged.append((cursor.lastrowid, file_path, format_ext))
             logger.info(f"    + {title} ({format_ext})")
             return True
 
@@ -390,39 +396,6 @@ class BooksScanner:
             logger.debug(f"Error guardant portada: {e}")
             return None
 
-    def _convert_to_epub(self, file_path: str) -> Optional[str]:
-        """Converteix MOBI/AZW a EPUB usant ebook-convert"""
-        try:
-            # Directori per fitxers convertits
-            converted_dir = settings.CACHE_DIR / "converted_books"
-            converted_dir.mkdir(parents=True, exist_ok=True)
-
-            # Nom del fitxer convertit
-            base_name = os.path.splitext(os.path.basename(file_path))[0]
-            output_path = converted_dir / f"{base_name}.epub"
-
-            # Si ja existeix, no convertir
-            if output_path.exists():
-                return str(output_path)
-
-            logger.info(f"    Convertint a EPUB: {base_name}")
-
-            result = subprocess.run(
-                ['ebook-convert', file_path, str(output_path)],
-                capture_output=True,
-                timeout=300  # 5 minuts màxim
-            )
-
-            if result.returncode == 0 and output_path.exists():
-                return str(output_path)
-            else:
-                logger.warning(f"Error convertint {file_path}")
-                return None
-
-        except Exception as e:
-            logger.error(f"Error en conversió: {e}")
-            return None
-
     def cleanup_missing_books(self) -> Dict:
         """Elimina llibres i autors que ja no existeixen"""
         conn = sqlite3.connect(self.db_path)
@@ -435,9 +408,11 @@ class BooksScanner:
         }
 
         # Eliminar llibres que no existeixen
+        removed = []
         cursor.execute("SELECT id, file_path FROM books")
         for book in cursor.fetchall():
             if not os.path.exists(book["file_path"]):
+                removed.append(book["id"])
                 cursor.execute("DELETE FROM reading_progress WHERE book_id = ?", (book["id"],))
                 cursor.execute("DELETE FROM books WHERE id = ?", (book["id"],))
                 stats["books_removed"] += 1
@@ -453,6 +428,9 @@ class BooksScanner:
         conn.commit()
         conn.close()
 
+        if removed:
+            page_index.forget(removed)
+
         return stats
 
 
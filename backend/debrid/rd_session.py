@@ -0,0 +1,330 @@
+"""
+Hermes Media Server - Sessió de Real-Debrid
+Reutilitza els torrents i links que ja té el compte en lloc de tornar a
+afegir el magnet a cada reproducció, i guarda hash+fitxer → link amb caducitat.
+"""
+
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from .realdebrid import RealDebridClient, RealDebridError
+
+logger = logging.getLogger(__name__)
+
+
+# Cada quant es torna a llegir la llista de torrents del compte (segons)
+TORRENTS_INDEX_TTL = 300
+# Els links de descàrrega (unrestrict) caduquen; els links del torrent duren més
+DOWNLOAD_URL_TTL = 4 * 3600
+TORRENT_LINK_TTL = 7 * 24 * 3600
+
+
+def init_rd_tables(conn: sqlite3.Connection):
+    """Crea la taula de links resolts de Real-Debrid."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS rd_links (
+            account TEXT NOT NULL,
+            info_hash TEXT NOT NULL,
+            file_key TEXT NOT NULL,
+            torrent_id TEXT,
+            link TEXT,
+            download_url TEXT,
+            filename TEXT,
+            filesize INTEGER,
+            mimetype TEXT,
+            link_expires_at REAL,
+            download_expires_at REAL,
+            PRIMARY KEY (account, info_hash, file_key)
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_rd_links_expires
+        ON rd_links(link_expires_at)
+    """)
+    conn.commit()
+
+
+def _default_db():
+    from backend.services.database import get_db
+    return get_db()
+
+
+def file_key(file_idx: Optional[int] = None, season: Optional[int] = None,
+             episode: Optional[int] = None) -> str:
+    """Clau del fitxer dins el torrent (mateixa prioritat que choose_file)."""
+    if season is not None and episode is not None:
+        return f"s{season}e{episode}"
+    if file_idx is not None:
+        return f"idx{file_idx}"
+    return "main"
+
+
+def link_for_file(info: Dict, file_id: Optional[int]) -> Optional[str]:
+    """
+    Link del torrent que correspon a un fitxer.
+    RD retorna un link per fitxer seleccionat, en l'ordre dels ids.
+    """
+    links = info.get("links") or []
+    if not links:
+        return None
+    selected = sorted(f["id"] for f in info.get("files", []) if f.get("selected"))
+    if file_id is None:
+        return links[0] if len(links) == 1 else None
+    if file_id not in selected:
+        return None
+    position = selected.index(file_id)
+    if len(links) != len(selected) or position >= len(links):
+        # RD agrupa fitxers en un RAR: no hi ha correspondència 1 a 1
+        return links[0] if len(links) == 1 and len(selected) == 1 else None
+    return links[position]
+
+
+class RealDebridSession:
+    """
+    Resolució de streams per a un compte de Real-Debrid:
+    1. Link de descàrrega guardat i vigent → cap crida
+    2. Link del torrent guardat → una crida (unrestrict)
+    3. Torrent ja present al compte amb el fitxer seleccionat → info + unrestrict
+    4. Si no, afegir el magnet i esperar (backoff exponencial)
+    """
+
+    def __init__(self, api_key: str, db_factory: Callable = None):
+        self.client = RealDebridClient(api_key)
+        self.account = hashlib.sha1(api_key.encode()).hexdigest()[:12]
+        self._db_factory = db_factory or _default_db
+        self._torrents: Dict[str, List[Dict]] = {}
+        self._torrents_loaded_at = 0.0
+        self._index_lock = asyncio.Lock()
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._tables_ready = False
+
+    # ---------- Persistència ----------
+
+    @contextmanager
+    def _db(self):
+        with self._db_factory() as conn:
+            if not self._tables_ready:
+                init_rd_tables(conn)
+                self._tables_ready = True
+            yield conn
+
+    def _load_link(self, info_hash: str, key: str) -> Optional[Dict]:
+        try:
+            with self._db() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT torrent_id, link, download_url, filename, filesize, mimetype,
+                           link_expires_at, download_expires_at
+                    FROM rd_links WHERE account = ? AND info_hash = ? AND file_key = ?
+                """, (self.account, info_hash, key))
+                row = cursor.fetchone()
+        except Exception as e:
+            logger.warning(f"No s'ha pogut llegir rd_links: {e}")
+            return None
+        if not row:
+            return None
+        return {
+            "torrent_id": row[0], "link": row[1], "download_url": row[2],
+            "filename": row[3], "filesize": row[4], "mimetype": row[5],
+            "link_expires_at": row[6] or 0, "download_expires_at": row[7] or 0,
+        }
+
+    def _save_link(self, info_hash: str, key: str, torrent_id: str, link: str, unrestricted: Dict):
+        now = time.time()
+        try:
+            with self._db() as conn:
+                conn.execute("""
+                    INSERT OR REPLACE INTO rd_links
+                        (account, info_hash, file_key, torrent_id, link, download_url,
+                         filename, filesize, mimetype, link_expires_at, download_expires_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (
+                    self.account, info_hash, key, torrent_id, link,
+                    unrestricted.get("download"), unrestricted.get("filename"),
+                    unrestricted.get("filesize"), unrestricted.get("mimeType"),
+                    now + TORRENT_LINK_TTL, now + DOWNLOAD_URL_TTL,
+                ))
+                conn.execute(
+                    "DELETE FROM rd_links WHERE link_expires_at < ?", (now,)
+                )
+                conn.commit()
+        except Exception as e:
+            logger.warning(f"No s'ha pogut guardar rd_links: {e}")
+
+    def _forget_link(self, info_hash: str, key: str):
+        try:
+            with self._db() as conn:
+                conn.execute(
+                    "DELETE FROM rd_links WHERE account = ? AND info_hash = ? AND file_key = ?",
+                    (self.account, info_hash, key),
+                )
+                conn.commit()
+        except Exception as e:
+            logger.warning(f"No s'ha pogut esborrar de rd_links: {e}")
+
+    # ---------- Índex de torrents del compte ----------
+
+    async def refresh_torrents(self, force: bool = False) -> Dict[str, List[Dict]]:
+        """Índex hash → torrents del compte (amb TTL)."""
+        async with self._index_lock:
+            if not force and time.time() - self._torrents_loaded_at < TORRENTS_INDEX_TTL:
+                return self._torrents
+            torrents = await self.client.get_torrents()
+            index: Dict[str, List[Dict]] = {}
+            for torrent in torrents:
+                torrent_hash = (torrent.get("hash") or "").lower()
+                if torrent_hash:
+                    index.setdefault(torrent_hash, []).append(torrent)
+            self._torrents = index
+            self._torrents_loaded_at = time.time()
+            logger.debug(f"Índex RD: {len(index)} torrents")
+            return index
+
+    def _remember_torrent(self, info_hash: str, torrent_id: str):
+        entries = self._torrents.setdefault(info_hash, [])
+        if not any(t.get("id") == torrent_id for t in entries):
+            entries.append({"id": torrent_id, "hash": info_hash, "status": "downloaded"})
+
+    # ---------- Resolució ----------
+
+    def _result(self, unrestricted: Dict, torrent_id: str) -> Dict:
+        return {
+            "url": unrestricted.get("download"),
+            "filename": unrestricted.get("filename"),
+            "filesize": unrestricted.get("filesize"),
+            "mimetype": unrestricted.get("mimeType"),
+            "torrent_id": torrent_id,
+        }
+
+    async def _from_existing(self, info_hash: str, file_idx, season, episode) -> Optional[Dict]:
+        """Provar amb els torrents que ja té el compte."""
+        try:
+            index = await self.refresh_torrents()
+        except RealDebridError as e:
+            logger.debug(f"No s'ha pogut llegir la llista de torrents: {e}")
+            return None
+
+        for torrent in index.get(info_hash, []):
+            if torrent.get("status") != "downloaded":
+                continue
+            try:
+                info = await self.client.get_torrent_info(torrent["id"])
+            except RealDebridError:
+                continue
+            files = info.get("files", [])
+            file_id = self.client.choose_file(files, file_idx, season, episode)
+            link = link_for_file(info, file_id)
+            if link:
+                logger.info(f"Reutilitzant torrent RD existent {torrent['id']} per {info_hash}")
+                return {"torrent_id": torrent["id"], "link": link}
+        return None
+
+    async def _add_and_wait(self, magnet: str, info_hash: str, file_idx, season, episode) -> Dict:
+        """Afegir el magnet, seleccionar el fitxer i esperar els links."""
+        add_result = await self.client.add_magnet(magnet)
+        torrent_id = add_result["id"]
+        try:
+            info = await self.client.get_torrent_info(torrent_id)
+            file_id = None
+            if info.get("status") == "waiting_files_selection":
+                file_id = self.client.choose_file(info.get("files", []), file_idx, season, episode)
+                await self.client.select_files(torrent_id, str(file_id) if file_id else "all")
+            info = await self.client.wait_until_downloaded(torrent_id)
+        except RealDebridError:
+            raise
+        except Exception as e:
+            logger.error(f"Error inesperat obtenint stream: {e}")
+            raise RealDebridError(f"Error inesperat: {str(e)}")
+
+        if file_id is None:
+            file_id = self.client.choose_file(info.get("files", []), file_idx, season, episode)
+        link = link_for_file(info, file_id) or info["links"][0]
+        self._remember_torrent(info_hash, torrent_id)
+        return {"torrent_id": torrent_id, "link": link}
+
+    async def get_stream(self, info_hash: str, magnet: str, file_idx: Optional[int] = None,
+                         season: Optional[int] = None, episode: Optional[int] = None) -> Dict:
+        """
+        URL de streaming per un fitxer d'un torrent.
+
+        Returns:
+            Dict amb 'url', 'filename', 'filesize', 'mimetype', 'torrent_id'
+
+        Raises:
+            RealDebridError: Si no es pot resoldre
+        """
+        info_hash = info_hash.lower()
+        key = file_key(file_idx, season, episode)
+        lock = self._locks.setdefault(f"{info_hash}:{key}", asyncio.Lock())
+
+        # Peticions simultànies pel mateix fitxer esperen la primera
+        async with lock:
+            now = time.time()
+            saved = self._load_link(info_hash, key)
+            if saved and saved["download_url"] and saved["download_expires_at"] > now:
+                return {
+                    "url": saved["download_url"], "filename": saved["filename"],
+                    "filesize": saved["filesize"], "mimetype": saved["mimetype"],
+                    "torrent_id": saved["torrent_id"],
+                }
+
+            if saved and saved["link"] and saved["link_expires_at"] > now:
+                try:
+                    unrestricted = await self.client.unrestrict_link(saved["link"])
+                    self._save_link(info_hash, key, saved["torrent_id"], saved["link"], unrestricted)
+                    return self._result(unrestricted, saved["torrent_id"])
+                except RealDebridError as e:
+                    # El torrent s'ha esborrat del compte o el link ja no és vàlid
+                    logger.info(f"Link RD guardat no vàlid per {info_hash}: {e}")
+                    self._forget_link(info_hash, key)
+
+            found = await self._from_existing(info_hash, file_idx, season, episode)
+            if found is None:
+                found = await self._add_and_wait(magnet, info_hash, file_idx, season, episode)
+
+            unrestricted = await self.client.unrestrict_link(found["link"])
+            self._save_link(info_hash, key, found["torrent_id"], found["link"], unrestricted)
+            return self._result(unrestricted, found["torrent_id"])
+
+    async def prefetch_episode(self, info_hash: str, magnet: str, season: int, episode: int) -> bool:
+        """
+        Resol per avançat un episodi d'un season pack que ja és al compte.
+        No afegeix magnets nous: només aprofita torrents existents.
+        """
+        info_hash = info_hash.lower()
+        saved = self._load_link(info_hash, file_key(None, season, episode))
+        if saved and saved["download_url"] and saved["download_expires_at"] > time.time():
+            return True
+
+        index = await self.refresh_torrents()
+        for torrent in index.get(info_hash, []):
+            if torrent.get("status") != "downloaded":
+                continue
+            info = await self.client.get_torrent_info(torrent["id"])
+            has_episode = any(
+                f.get("selected") and self.client.matches_episode(f.get("path", ""), season, episode)
+                for f in info.get("files", [])
+            )
+            if has_episode:
+                await self.get_stream(info_hash, magnet, season=season, episode=episode)
+                return True
+        return False
+
+
+# Una sessió per clau d'API
+_sessions: Dict[str, RealDebridSession] = {}
+
+
+def get_rd_session(api_key: str) -> RealDebridSession:
+    """Sessió de Real-Debrid per a la clau d'API indicada."""
+    session = _sessions.get(api_key)
+    if session is None:
+        session = RealDebridSession(api_key)
+        _sessions[api_key] = session
+    return session
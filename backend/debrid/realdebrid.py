@@ -4,12 +4,44 @@ Documentació: https://api.real-debrid.com/
 """
 
 import httpx
+import asyncio
 import logging
 from typing import Optional, Dict, List, Any
 from urllib.parse import quote
 
 logger = logging.getLogger(__name__)
 
+VIDEO_EXTENSIONS = {'.mkv', '.mp4', '.avi', '.mov', '.wmv', '.flv', '.webm'}
+
+# Espera màxima perquè un torrent estigui llest (per torrents no cached pot trigar més)
+MAX_WAIT_SECONDS = 40
+# Interval de consulta de l'estat: backoff exponencial
+POLL_INITIAL_DELAY = 0.5
+POLL_BACKOFF = 1.6
+POLL_MAX_DELAY = 5.0
+
+# Client compartit amb keep-alive per a totes les peticions a l'API
+_shared_client: Optional[httpx.AsyncClient] = None
+
+
+def get_shared_client() -> httpx.AsyncClient:
+    """Client HTTP compartit per Real-Debrid (una connexió TLS reutilitzada)."""
+    global _shared_client
+    if _shared_client is None or _shared_client.is_closed:
+        _shared_client = httpx.AsyncClient(
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=5),
+        )
+    return _shared_client
+
+
+async def close_shared_client():
+    """Tanca el client compartit (shutdown)."""
+    global _shared_client
+    if _shared_client is not None:
+        await _shared_client.aclose()
+        _shared_client = None
+
 
 class RealDebridError(Exception):
     """Error específic de Real-Debrid"""
@@ -39,35 +71,35 @@ class RealDebridClient:
     ) -> Any:
         """Fer una petició a l'API de Real-Debrid"""
         url = f"{self.BASE_URL}{endpoint}"
+        client = get_shared_client()
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            try:
-                if method == "GET":
-                    response = await client.get(url, headers=self.headers, params=params)
-                elif method == "POST":
-                    response = await client.post(url, headers=self.headers, data=data)
-                elif method == "DELETE":
-                    response = await client.delete(url, headers=self.headers)
-                else:
-                    raise ValueError(f"Mètode no suportat: {method}")
-
-                # Real-Debrid retorna 204 per deletes exitosos
-                if response.status_code == 204:
-                    return None
-
-                # Gestionar errors
-                if response.status_code >= 400:
-                    error_data = response.json() if response.text else {}
-                    error_msg = error_data.get("error", f"Error HTTP {response.status_code}")
-                    error_code = error_data.get("error_code")
-                    logger.error(f"Real-Debrid error: {error_msg} (code: {error_code})")
-                    raise RealDebridError(error_msg, error_code)
-
-                return response.json() if response.text else None
-
-            except httpx.RequestError as e:
-                logger.error(f"Error de connexió amb Real-Debrid: {e}")
-                raise RealDebridError(f"Error de connexió: {str(e)}")
+        try:
+            if method == "GET":
+                response = await client.get(url, headers=self.headers, params=params)
+            elif method == "POST":
+                response = await client.post(url, headers=self.headers, data=data)
+            elif method == "DELETE":
+                response = await client.delete(url, headers=self.headers)
+            else:
+                raise ValueError(f"Mètode no suportat: {method}")
+
+            # Real-Debrid retorna 204 per deletes exitosos
+            if response.status_code == 204:
+                return None
+
+            # Gestionar errors
+            if response.status_code >= 400:
+                error_data = response.json() if response.text else {}
+                error_msg = error_data.get("error", f"Error HTTP {response.status_code}")
+                error_code = error_data.get("error_code")
+                logger.error(f"Real-Debrid error: {error_msg} (code: {error_code})")
+                raise RealDebridError(error_msg, error_code)
+
+            return response.json() if response.text else None
+
+        except httpx.RequestError as e:
+            logger.error(f"Error de connexió amb Real-Debrid: {e}")
+            raise RealDebridError(f"Error de connexió: {str(e)}")
 
     async def get_user(self) -> Dict:
         """Obtenir informació de l'usuari (validar API key)"""
@@ -101,6 +133,10 @@ class RealDebridClient:
         logger.info(f"Magnet afegit a Real-Debrid: {result.get('id')}")
         return result
 
+    async def get_torrents(self, limit: int = 100) -> List[Dict]:
+        """Llistar els torrents del compte (més recents primer)"""
+        return await self._request("GET", "/torrents", params={"limit": limit}) or []
+
     async def get_torrent_info(self, torrent_id: str) -> Dict:
         """Obtenir informació d'un torrent"""
         return await self._request("GET", f"/torrents/info/{torrent_id}")
@@ -135,7 +171,7 @@ class RealDebridClient:
         logger.info(f"Link unrestricted: {result.get('filename')}")
         return result
 
-    def _parse_episode_from_filename(self, filename: str, target_season: int, target_episode: int) -> bool:
+    def matches_episode(self, filename: str, target_season: int, target_episode: int) -> bool:
         """
         Comprovar si un nom de fitxer correspon a un episodi específic.
 
@@ -175,6 +211,122 @@ class RealDebridClient:
 
         return False
 
+    def choose_file(self, files: List[Dict], file_idx: Optional[int] = None,
+                    season: Optional[int] = None, episode: Optional[int] = None) -> Optional[int]:
+        """
+        Triar l'id (RD) del fitxer a reproduir d'un torrent.
+
+        Prioritat: episodi pel nom del fitxer > fileIdx de Torrentio > vídeo més gran.
+        Retorna None si no hi ha cap candidat (cal seleccionar-ho tot).
+        """
+        if not files:
+            return None
+
+        video_files = [
+            f for f in files
+            if any(f.get("path", "").lower().endswith(ext) for ext in VIDEO_EXTENSIONS)
+        ]
+
+        selected_id = None
+
+        # PRIORITAT 1: Si tenim season i episode, buscar per nom de fitxer
+        # Això és el mètode més fiable per season packs
+        if season is not None and episode is not None and video_files:
+            logger.info(f"Buscant episodi S{season:02d}E{episode:02d} per nom de fitxer...")
+            for f in video_files:
+                filepath = f.get("path", "")
+                if self.matches_episode(filepath, season, episode):
+                    selected_id = f["id"]
+                    logger.info(f"Trobat episodi per nom: {filepath}")
+                    break
+
+            if selected_id is None:
+                logger.warning(f"No s'ha trobat S{season:02d}E{episode:02d} per nom, usant file_idx o fallback")
+
+        # PRIORITAT 2: Si tenim file_idx de Torrentio, usar-lo
+        if selected_id is None and file_idx is not None:
+            # Buscar el fitxer amb aquest índex
+            for f in files:
+                if f.get("id") == file_idx + 1:  # RD usa ids basats en 1
+                    selected_id = f["id"]
+                    logger.info(f"Seleccionant fitxer per fileIdx {file_idx}: {f.get('path')}")
+                    break
+            # Si no trobem per id, provar per posició
+            if selected_id is None and file_idx < len(files):
+                selected_id = files[file_idx]["id"]
+                logger.info(f"Seleccionant fitxer per posició {file_idx}: {files[file_idx].get('path')}")
+
+        # PRIORITAT 3: Si no tenim file_idx o no l'hem trobat, seleccionar el vídeo més gran
+        if selected_id is None and video_files:
+            largest = max(video_files, key=lambda x: x.get("bytes", 0))
+            selected_id = largest["id"]
+            logger.info(f"Seleccionant vídeo més gran: {largest.get('path')}")
+
+        return selected_id
+
+    async def wait_until_downloaded(self, torrent_id: str) -> Dict:
+        """
+        Esperar que un torrent estigui descarregat (consultes amb backoff exponencial).
+
+        Returns:
+            Info del torrent amb 'links'
+
+        Raises:
+            RealDebridError: Error del torrent, cua, descàrrega lenta o timeout
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        delay = POLL_INITIAL_DELAY
+        last_status = None
+        last_progress = 0
+
+        while True:
+            info = await self.get_torrent_info(torrent_id)
+            status = info.get("status")
+            progress = info.get("progress", 0)
+            elapsed = loop.time() - started
+
+            # Log només quan canvia l'estat
+            if status != last_status:
+                logger.info(f"Torrent {torrent_id}: status={status}, progress={progress}%")
+                last_status = status
+            last_progress = progress
+
+            if status == "downloaded":
+                if info.get("links"):
+                    return info
+                # Descarregat però sense links - error
+                logger.error(f"Torrent {torrent_id} descarregat però sense links")
+                raise RealDebridError("Torrent descarregat però sense links disponibles")
+
+            elif status in ("error", "dead", "magnet_error", "virus"):
+                logger.error(f"Error amb torrent: {status}")
+                try:
+                    await self.delete_torrent(torrent_id)
+                except Exception:
+                    pass
+                raise RealDebridError(f"Error del torrent: {status}")
+
+            elif status == "queued":
+                # En cua, esperar més temps
+                if elapsed > 20:
+                    raise RealDebridError("El torrent està en cua. Prova amb una font en cache (⚡)")
+
+            elif status == "downloading":
+                # Descarregant, si no és cached pot trigar molt
+                if elapsed > 30 and progress < 50:
+                    logger.warning(f"Descarrega lenta: {progress}% després de {elapsed:.0f}s")
+                    raise RealDebridError(f"Descàrrega lenta ({progress}%). Prova amb una font en cache (⚡)")
+
+            if elapsed + delay > MAX_WAIT_SECONDS:
+                break
+            await asyncio.sleep(delay)
+            delay = min(delay * POLL_BACKOFF, POLL_MAX_DELAY)
+
+        # Timeout
+        logger.warning(f"Timeout esperant torrent {torrent_id} (últim estat: {last_status}, progrés: {last_progress}%)")
+        raise RealDebridError(f"Temps d'espera excedit. Últim estat: {last_status}")
+
     async def get_streaming_url(self, magnet: str, file_idx: Optional[int] = None,
                                  season: Optional[int] = None, episode: Optional[int] = None) -> Optional[Dict]:
         """
@@ -193,7 +345,6 @@ class RealDebridClient:
         Raises:
             RealDebridError: Si hi ha un error específic de Real-Debrid
         """
-        import asyncio
         torrent_id = None
 
         try:
@@ -206,114 +357,21 @@ class RealDebridClient:
 
             # 3. Seleccionar fitxers si cal
             if info.get("status") == "waiting_files_selection":
-                files = info.get("files", [])
-                if files:
-                    video_extensions = {'.mkv', '.mp4', '.avi', '.mov', '.wmv', '.flv', '.webm'}
-                    video_files = [
-                        f for f in files
-                        if any(f.get("path", "").lower().endswith(ext) for ext in video_extensions)
-                    ]
-
-                    selected_id = None
-
-                    # PRIORITAT 1: Si tenim season i episode, buscar per nom de fitxer
-                    # Això és el mètode més fiable per season packs
-                    if season is not None and episode is not None and video_files:
-                        logger.info(f"Buscant episodi S{season:02d}E{episode:02d} per nom de fitxer...")
-                        for f in video_files:
-                            filepath = f.get("path", "")
-                            if self._parse_episode_from_filename(filepath, season, episode):
-                                selected_id = f["id"]
-                                logger.info(f"Trobat episodi per nom: {filepath}")
-                                break
-
-                        if selected_id is None:
-                            logger.warning(f"No s'ha trobat S{season:02d}E{episode:02d} per nom, usant file_idx o fallback")
-
-                    # PRIORITAT 2: Si tenim file_idx de Torrentio, usar-lo
-                    if selected_id is None and file_idx is not None:
-                        # Buscar el fitxer amb aquest índex
-                        for f in files:
-                            if f.get("id") == file_idx + 1:  # RD usa ids basats en 1
-                                selected_id = f["id"]
-                                logger.info(f"Seleccionant fitxer per fileIdx {file_idx}: {f.get('path')}")
-                                break
-                        # Si no trobem per id, provar per posició
-                        if selected_id is None and file_idx < len(files):
-                            selected_id = files[file_idx]["id"]
-                            logger.info(f"Seleccionant fitxer per posició {file_idx}: {files[file_idx].get('path')}")
-
-                    # PRIORITAT 3: Si no tenim file_idx o no l'hem trobat, seleccionar el vídeo més gran
-                    if selected_id is None and video_files:
-                        video_files.sort(key=lambda x: x.get("bytes", 0), reverse=True)
-                        selected_id = video_files[0]["id"]
-                        logger.info(f"Seleccionant vídeo més gran: {video_files[0].get('path')}")
-
-                    if selected_id:
-                        await self.select_files(torrent_id, str(selected_id))
-                    else:
-                        await self.select_files(torrent_id, "all")
-                else:
-                    await self.select_files(torrent_id, "all")
+                selected_id = self.choose_file(info.get("files", []), file_idx, season, episode)
+                await self.select_files(torrent_id, str(selected_id) if selected_id else "all")
 
             # 4. Esperar que estigui llest i obtenir links
-            # Max 40 segons d'espera (per torrents no cached pot trigar més)
-            max_wait_seconds = 40
-            last_status = None
-            last_progress = 0
-
-            for i in range(max_wait_seconds):
-                info = await self.get_torrent_info(torrent_id)
-                status = info.get("status")
-                progress = info.get("progress", 0)
-
-                # Log només quan canvia l'estat o cada 5 segons
-                if status != last_status or i % 5 == 0:
-                    logger.info(f"Torrent {torrent_id}: status={status}, progress={progress}%")
-                    last_status = status
-                    last_progress = progress
-
-                if status == "downloaded":
-                    links = info.get("links", [])
-                    if links:
-                        # Obtenir URL directa del primer link
-                        unrestricted = await self.unrestrict_link(links[0])
-                        return {
-                            "url": unrestricted.get("download"),
-                            "filename": unrestricted.get("filename"),
-                            "filesize": unrestricted.get("filesize"),
-                            "mimetype": unrestricted.get("mimeType"),
-                            "torrent_id": torrent_id
-                        }
-                    else:
-                        # Descarregat però sense links - error
-                        logger.error(f"Torrent {torrent_id} descarregat però sense links")
-                        raise RealDebridError("Torrent descarregat però sense links disponibles")
-
-                elif status in ("error", "dead", "magnet_error", "virus"):
-                    logger.error(f"Error amb torrent: {status}")
-                    try:
-                        await self.delete_torrent(torrent_id)
-                    except Exception:
-                        pass
-                    raise RealDebridError(f"Error del torrent: {status}")
-
-                elif status == "queued":
-                    # En cua, esperar més temps
-                    if i > 20:
-                        raise RealDebridError("El torrent està en cua. Prova amb una font en cache (⚡)")
-
-                elif status == "downloading":
-                    # Descarregant, si no és cached pot trigar molt
-                    if i > 30 and progress < 50:
-                        logger.warning(f"Descarrega lenta: {progress}% després de {i}s")
-                        raise RealDebridError(f"Descàrrega lenta ({progress}%). Prova amb una font en cache (⚡)")
-
-                await asyncio.sleep(1)
-
-            # Timeout
-            logger.warning(f"Timeout esperant torrent {torrent_id} (últim estat: {last_status}, progrés: {last_progress}%)")
-            raise RealDebridError(f"Temps d'espera excedit. Últim estat: {last_status}")
+            info = await self.wait_until_downloaded(torrent_id)
+            links = info.get("links", [])
+            # Obtenir URL directa del primer link
+            unrestricted = await self.unrestrict_link(links[0])
+            return {
+                "url": unrestricted.get("download"),
+                "filename": unrestricted.get("filename"),
+                "filesize": unrestricted.get("filesize"),
+                "mimetype": unrestricted.get("mimeType"),
+                "torrent_id": torrent_id
+            }
 
         except RealDebridError:
             # Re-llançar errors de Real-Debrid
@@ -10,7 +10,6 @@ import re
 import sqlite3
 import logging
 import asyncio
-import unicodedata
 import urllib.parse
 from pathlib import Path
 from typing import Optional, List, Dict
@@ -19,7 +18,7 @@ from datetime import datetime
 
 from fastapi import FastAPI, HTTPException, Depends, Query, Request, BackgroundTasks, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, StreamingResponse, Response
+from fastapi.responses import FileResponse, StreamingResponse, Response, RedirectResponse
 from pydantic import BaseModel
 import mimetypes
 
@@ -31,7 +30,25 @@ from apscheduler.triggers.cron import CronTrigger
 sys.path.append(str(Path(__file__).parent.parent))
 from config import settings
 from backend.scanner.scan import HermesScanner
-from backend.streaming.hls_engine import HermesStreamer
+from backend.streaming.hls_engine import FFMPEG_AVAILABLE, HermesStreamer
+from backend.services.projection import (
+    FastJSONResponse, FieldError, parse_fields, project, select_list, table_columns
+)
+from backend.services.validators import (
+    REVALIDATE, check_not_modified, file_response, make_etag, parse_range, ranged_file_response, table_etag
+)
+from backend.services.prefetch import (
+    LiveStreamMiddleware, LiveStreams, Prefetcher, should_prefetch, system_busy, warm_file
+)
+from backend.services.thumbnails import ffmpeg_budget, thumbnail_pool, thumbnail_store
+from backend.services.images import image_cache, image_response
+from backend.services.artwork import DEFAULT_SIZES, artwork_mirror, is_mirrorable, tmdb_url
+from backend.books.conversion import book_converter, needs_conversion
+from backend.books.pages import COMIC_FORMATS, PagedDocumentError, is_paged, page_index
+from backend.audiobooks.streaming import (
+    AUDIO_PROFILES, AudiobookStreamError, audio_type, audiobook_streams, available_profiles,
+    hls_master_playlist, hls_playlist, iter_concat, locate, negotiate_profile
+)
 
 # Configurar logging
 logging.basicConfig(
@@ -127,6 +144,8 @@ class SimpleCache:
 tmdb_cache = SimpleCache(default_ttl=86400)  # 24h per episodis/detalls
 torrents_cache = SimpleCache(default_ttl=1800)  # 30min per torrents
 stream_url_cache = SimpleCache(default_ttl=14400)  # 4h per URLs de Real-Debrid
+extract_cache = SimpleCache(default_ttl=1200)  # 20min per streams extrets (tokens curts)
+subtitles_cache = SimpleCache(default_ttl=3600)  # 1h per cerques de subtítols
 
 # Client httpx global amb connection pooling per reutilitzar connexions
 import httpx
@@ -165,6 +184,29 @@ def get_bbc_segment_semaphore() -> asyncio.Semaphore:
     return _bbc_segment_semaphore
 
 
+# Peticions de reproducció (vídeo local, proxy, BBC, audiollibres): les
+# compta LiveStreamMiddleware perquè el prefetch sàpiga qui està mirant
+LIVE_STREAM_PATHS = (
+    r"^/api/(stream/|video/proxy|bbc/(stream|proxy/)|3cat/onepiece/stream/"
+    r"|audiobooks/\d+/(stream|hls/|files/\d+/stream))"
+)
+live_streams = LiveStreams()
+
+
+def _prefetch_busy() -> bool:
+    """El prefetch no pot competir amb la reproducció en directe."""
+    return (
+        system_busy()
+        or live_streams.busy()
+        or ffmpeg_budget.interactive > 0
+        or thumbnail_pool.inflight > 0
+        or get_bbc_segment_semaphore().locked()
+    )
+
+
+prefetcher = Prefetcher(is_busy=_prefetch_busy)
+
+
 # Lifespan per gestionar startup/shutdown
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -208,6 +250,12 @@ async def lifespan(app: FastAPI):
     scheduler.start()
     logger.info("✓ Scheduler iniciat - Sincronització diària a les 2:30 AM")
 
+    # 5. Còpia local de l'artwork que encara no s'ha descarregat
+    await artwork_mirror.mirror_library_async()
+
+    # 6. Conversions de llibres que havien quedat a la cua
+    book_converter.kick()
+
     logger.info("🚀 Hermes Media Server iniciat correctament")
 
     yield  # L'aplicació s'executa aquí
@@ -225,6 +273,18 @@ async def lifespan(app: FastAPI):
         _http_client = None
         logger.info("✓ Client HTTP tancat")
 
+    from backend.streaming.source_race import close_scrape_client
+    await close_scrape_client()
+    from backend.debrid.realdebrid import close_shared_client
+    await close_shared_client()
+    from backend.streaming.range_cache import range_cache
+    await range_cache.close()
+    thumbnail_pool.shutdown()
+    audiobook_streams.close()
+    image_cache.shutdown()
+    await artwork_mirror.close()
+    book_converter.shutdown()
+
     # 3. Tancar connection pool SQLite
     try:
         close_db_pool()
@@ -253,37 +313,14 @@ app.add_middleware(
     expose_headers=["*"]
 )
 
-# Middleware de compressió GZip per respostes (redueix ~70% el tràfic)
-from starlette.middleware.gzip import GZipMiddleware
-app.add_middleware(GZipMiddleware, minimum_size=1000)  # Comprimir respostes > 1KB
+# Middleware de compressió: zstd/brotli/gzip només per a text (JSON, VTT, m3u8...)
+# Vídeo, àudio, imatges i respostes Range es deixen intactes
+from backend.services.compression import CompressionMiddleware, PrecompressedStaticFiles
+app.add_middleware(CompressionMiddleware, minimum_size=1000)  # Comprimir respostes > 1KB
+app.add_middleware(LiveStreamMiddleware, streams=live_streams, pattern=LIVE_STREAM_PATHS)
 
 # === DATABASE ===
 
-def normalize_for_sort(text: str) -> str:
-    """
-    Normalitza text per ordenar: elimina accents i converteix a minúscules.
-    Així 'Érase' s'ordena com 'erase' (a la E, no al final).
-    """
-    if not text:
-        return ""
-    # Descompon accents (é → e + ́) i elimina marques diacrítiques
-    normalized = unicodedata.normalize('NFD', text)
-    # Elimina caràcters de combinació (accents)
-    without_accents = ''.join(c for c in normalized if unicodedata.category(c) != 'Mn')
-    return without_accents.lower()
-
-
-def collate_noaccent(str1: str, str2: str) -> int:
-    """Col·lació personalitzada per SQLite que ignora accents."""
-    s1 = normalize_for_sort(str1 or "")
-    s2 = normalize_for_sort(str2 or "")
-    if s1 < s2:
-        return -1
-    elif s1 > s2:
-        return 1
-    return 0
-
-
 @contextmanager
 def get_db():
     """Context manager per connexions a la BD"""
@@ -293,8 +330,6 @@ def get_db():
         isolation_level=None
     )
     conn.row_factory = sqlite3.Row
-    # Registrar col·lació personalitzada per ordenar sense accents
-    conn.create_collation("NOACCENT", collate_noaccent)
     conn.execute("PRAGMA journal_mode=WAL")
     conn.execute("PRAGMA busy_timeout=5000")
     try:
@@ -748,6 +783,20 @@ def init_all_tables():
         except Exception as e:
             logger.debug(f"Actualització name_normalized: {e}")
 
+        # Claus d'ordenació sense accents (series, books, authors, audiobooks)
+        try:
+            from backend.services.sorting import install_sort_keys
+            install_sort_keys(conn)
+        except Exception as e:
+            logger.warning(f"Claus d'ordenació: {e}")
+
+        # Comptadors de canvis per taula (ETags de les respostes JSON)
+        try:
+            from backend.services.validators import install_change_counters
+            install_change_counters(conn)
+        except Exception as e:
+            logger.warning(f"Comptadors de canvis: {e}")
+
         # === FULL-TEXT SEARCH (FTS5) PER CERQUES RÀPIDES ===
         # Crear taula virtual FTS5 per cerques instantànies
         try:
@@ -798,9 +847,13 @@ def init_all_tables():
                 VALUES ('delete', OLD.id, OLD.name, OLD.title, OLD.title_english, OLD.title_romaji, OLD.title_native, OLD.original_title, OLD.overview);
             END
             """,
-            # Trigger UPDATE
+            # Trigger UPDATE (només columnes indexades: així els UPDATE de sort_name,
+            # progrés o metadades no reindexen i no es disparen abans del trigger INSERT)
+            "DROP TRIGGER IF EXISTS series_fts_update",
             """
-            CREATE TRIGGER IF NOT EXISTS series_fts_update AFTER UPDATE ON series BEGIN
+            CREATE TRIGGER series_fts_update
+            AFTER UPDATE OF name, title, title_english, title_romaji, title_native, original_title, overview
+            ON series BEGIN
                 INSERT INTO series_fts(series_fts, rowid, name, title, title_english, title_romaji, title_native, original_title, overview)
                 VALUES ('delete', OLD.id, OLD.name, OLD.title, OLD.title_english, OLD.title_romaji, OLD.title_native, OLD.original_title, OLD.overview);
                 INSERT INTO series_fts(rowid, name, title, title_english, title_romaji, title_native, original_title, overview)
@@ -899,77 +952,13 @@ class WatchlistRequest(BaseModel):
 
 # === STREAMING AMB RANGE SUPPORT ===
 
-def get_range_header(range_header: str, file_size: int):
-    """Parseja la capçalera Range i retorna start, end"""
-    if not range_header:
-        return 0, file_size - 1
-
-    range_str = range_header.replace("bytes=", "")
-    parts = range_str.split("-")
-
-    start = int(parts[0]) if parts[0] else 0
-    end = int(parts[1]) if parts[1] else file_size - 1
-
-    # Limitar end a file_size - 1
-    end = min(end, file_size - 1)
-
-    return start, end
-
-
-def stream_file_range(file_path: Path, start: int, end: int, chunk_size: int = 1024 * 1024):
-    """Generator per streaming de rang de bytes"""
-    with open(file_path, "rb") as f:
-        f.seek(start)
-        remaining = end - start + 1
-        while remaining > 0:
-            chunk = f.read(min(chunk_size, remaining))
-            if not chunk:
-                break
-            remaining -= len(chunk)
-            yield chunk
-
-
 async def stream_video_with_range(file_path: Path, request: Request):
     """Streaming de video amb suport Range requests per seek"""
-    file_size = file_path.stat().st_size
-    range_header = request.headers.get("range")
-
     # Determinar el content type
     content_type, _ = mimetypes.guess_type(str(file_path))
     if not content_type:
         content_type = "video/mp4"
-
-    if range_header:
-        start, end = get_range_header(range_header, file_size)
-        content_length = end - start + 1
-
-        headers = {
-            "Content-Range": f"bytes {start}-{end}/{file_size}",
-            "Accept-Ranges": "bytes",
-            "Content-Length": str(content_length),
-            "Content-Type": content_type,
-        }
-
-        return StreamingResponse(
-            stream_file_range(file_path, start, end),
-            status_code=206,
-            headers=headers,
-            media_type=content_type
-        )
-    else:
-        # Sense Range header, retornar tot el fitxer
-        headers = {
-            "Accept-Ranges": "bytes",
-            "Content-Length": str(file_size),
-            "Content-Type": content_type,
-        }
-
-        return StreamingResponse(
-            stream_file_range(file_path, 0, file_size - 1),
-            status_code=200,
-            headers=headers,
-            media_type=content_type
-        )
+    return ranged_file_response(request, file_path, media_type=content_type)
 
 
 # === AUTENTICACIÓ ===
@@ -978,6 +967,10 @@ def get_current_user(request: Request) -> Optional[Dict]:
     """Obté l'usuari actual del token"""
     from backend.auth import get_auth_manager
 
+    # Subpeticions de /api/batch: l'usuari ja s'ha verificat una vegada
+    if "hermes_user" in request.scope:
+        return request.scope["hermes_user"]
+
     auth_header = request.headers.get("Authorization")
     if not auth_header or not auth_header.startswith("Bearer "):
         return None
@@ -1004,7 +997,7 @@ async def register(data: RegisterRequest):
         raise HTTPException(status_code=400, detail="La contrasenya ha de tenir mínim 4 caràcters")
 
     auth = get_auth_manager()
-    result = auth.register(
+    result = await auth.register_async(
         username=data.username,
         password=data.password,
         email=data.email,
@@ -1023,7 +1016,7 @@ async def login(data: LoginRequest):
     from backend.auth import get_auth_manager
 
     auth = get_auth_manager()
-    result = auth.login(data.username, data.password)
+    result = await auth.login_async(data.username, data.password)
 
     if result["status"] == "error":
         raise HTTPException(status_code=401, detail=result["message"])
@@ -1067,7 +1060,7 @@ async def change_password(request: Request, data: PasswordChangeRequest):
 
     user = require_auth(request)
     auth = get_auth_manager()
-    result = auth.change_password(
+    result = await auth.change_password_async(
         user_id=user["id"],
         old_password=data.old_password,
         new_password=data.new_password
@@ -1160,7 +1153,7 @@ async def register_with_invitation(data: RegisterWithInviteRequest):
     from backend.auth import get_auth_manager
 
     auth = get_auth_manager()
-    result = auth.register_with_invitation(
+    result = await auth.register_with_invitation_async(
         username=data.username,
         password=data.password,
         invitation_code=data.invitation_code,
@@ -1776,176 +1769,45 @@ async def precache_episodes(request: Request):
 
 
 @app.get("/api/user/continue-watching")
-async def get_continue_watching(request: Request):
-    """Retorna el contingut que l'usuari està veient (per continuar)"""
+async def get_continue_watching(request: Request, response: Response, since: Optional[int] = None):
+    """
+    Retorna el contingut que l'usuari està veient (per continuar).
+    Es llegeix del feed materialitzat; amb `since` només retorna els canvis
+    posteriors a aquell cursor (capçalera X-Feed-Cursor).
+    """
+    from backend.services import home_feed
+
     user = get_current_user(request)
     user_id = user["id"] if user else 1  # Default user_id 1 si no autenticat
 
-    watching = []
-
     with get_db() as conn:
-        cursor = conn.cursor()
-
-        # 1. Obtenir contingut local en progrés (no acabat) - sèries i pel·lícules
-        cursor.execute("""
-            SELECT
-                wp.media_id,
-                wp.progress_seconds,
-                wp.total_seconds,
-                wp.updated_date,
-                mf.title as episode_title,
-                mf.season_number,
-                mf.episode_number,
-                mf.duration,
-                s.id as series_id,
-                s.name as series_name,
-                s.media_type,
-                s.poster,
-                s.backdrop,
-                s.tmdb_id
-            FROM watch_progress wp
-            JOIN media_files mf ON wp.media_id = mf.id
-            LEFT JOIN series s ON mf.series_id = s.id
-            WHERE wp.user_id = ?
-            AND wp.progress_seconds > 30
-            AND (wp.total_seconds IS NULL OR wp.progress_seconds < wp.total_seconds * 0.9)
-            ORDER BY wp.updated_date DESC
-            LIMIT 20
-        """, (user_id,))
-
-        for row in cursor.fetchall():
-            progress_pct = 0
-            if row["total_seconds"] and row["total_seconds"] > 0:
-                progress_pct = (row["progress_seconds"] / row["total_seconds"]) * 100
-
-            # Determinar el tipus basant-se en media_type de la taula series
-            media_type = row["media_type"] if row["media_type"] else "series"
-            if media_type == "movie":
-                item_type = "movie"
-            else:
-                item_type = "episode"
-
-            watching.append({
-                "id": row["media_id"],
-                "type": item_type,
-                "series_id": row["series_id"],
-                "series_name": row["series_name"],
-                "title": row["episode_title"],
-                "season_number": row["season_number"],
-                "episode_number": row["episode_number"],
-                "poster": row["poster"],
-                "backdrop": row["backdrop"],
-                "progress_seconds": row["progress_seconds"],
-                "total_seconds": row["total_seconds"],
-                "progress_percentage": round(progress_pct, 1),
-                "last_watched": row["updated_date"],
-                "tmdb_id": row["tmdb_id"],
-                "source": "local"
-            })
+        if since is not None:
+            changes = home_feed.get_changes(conn, user_id, home_feed.KIND_CONTINUE, since)
+            response.headers["X-Feed-Cursor"] = str(changes["cursor"])
+            return changes
 
-        # 2. Obtenir contingut de streaming en progrés (no acabat)
-        cursor.execute("""
-            SELECT
-                id,
-                tmdb_id,
-                media_type,
-                season_number,
-                episode_number,
-                progress_percent,
-                progress_seconds,
-                total_seconds,
-                completed,
-                title,
-                poster_path,
-                backdrop_path,
-                still_path,
-                updated_date
-            FROM streaming_progress
-            WHERE user_id = ?
-            AND completed = 0
-            AND progress_percent > 0
-            ORDER BY updated_date DESC
-            LIMIT 30
-        """, (user_id,))
-
-        # Filtrar duplicats en Python - més fiable que SQL complex
-        # Per sèries: només mostrar l'episodi més recent (agrupar per tmdb_id)
-        seen_movies = set()  # Per pel·lícules: només tmdb_id
-        seen_series = set()  # Per sèries: només tmdb_id (un entry per sèrie)
-
-        for row in cursor.fetchall():
-            tmdb_id = row["tmdb_id"]
-            media_type = row["media_type"]
-
-            # Filtrar duplicats
-            if media_type == "movie":
-                if tmdb_id in seen_movies:
-                    continue  # Saltar duplicat
-                seen_movies.add(tmdb_id)
-                item_type = "movie"
-            else:
-                # Per sèries, només mostrar un entry (l'episodi més recent)
-                if tmdb_id in seen_series:
-                    continue  # Ja tenim aquesta sèrie
-                seen_series.add(tmdb_id)
-                item_type = "series"
-
-            # Usar valors reals si disponibles, si no estimar
-            progress_secs = row["progress_seconds"]
-            total_secs = row["total_seconds"]
-            if progress_secs is None or total_secs is None:
-                # Fallback per entrades antigues sense segons reals
-                total_secs = 6000  # 100 min estimat
-                progress_secs = int((row["progress_percent"] / 100) * total_secs)
-
-            watching.append({
-                "id": row["id"],
-                "type": item_type,
-                "tmdb_id": tmdb_id,
-                "series_name": row["title"],
-                "title": row["title"],
-                "season_number": row["season_number"],
-                "episode_number": row["episode_number"],
-                "poster": row["poster_path"],
-                "backdrop": row["backdrop_path"],
-                "still_path": row["still_path"],
-                "progress_seconds": progress_secs,
-                "total_seconds": total_secs,
-                "progress_percentage": row["progress_percent"],
-                "last_watched": row["updated_date"],
-                "source": "streaming"
-            })
-
-        # Ordenar tot per data i limitar
-        watching.sort(key=lambda x: x.get("last_watched", ""), reverse=True)
-        return watching[:20]
+        items, cursor = home_feed.get_items(conn, user_id, home_feed.KIND_CONTINUE, 20)
+        response.headers["X-Feed-Cursor"] = str(cursor)
+        return items
 
 
 @app.get("/api/user/recently-watched")
-async def get_recently_watched(request: Request, limit: int = 10):
-    """Retorna contingut vist recentment"""
+async def get_recently_watched(request: Request, response: Response, limit: int = 10, since: Optional[int] = None):
+    """Retorna contingut vist recentment (des del feed materialitzat)"""
+    from backend.services import home_feed
+
     user = get_current_user(request)
     user_id = user["id"] if user else 1
 
     with get_db() as conn:
-        cursor = conn.cursor()
+        if since is not None:
+            changes = home_feed.get_changes(conn, user_id, home_feed.KIND_RECENT, since)
+            response.headers["X-Feed-Cursor"] = str(changes["cursor"])
+            return changes
 
-        cursor.execute("""
-            SELECT DISTINCT
-                s.id as series_id,
-                s.name as series_name,
-                s.poster,
-                MAX(wp.updated_date) as last_watched
-            FROM watch_progress wp
-            JOIN media_files mf ON wp.media_id = mf.id
-            JOIN series s ON mf.series_id = s.id
-            WHERE wp.user_id = ?
-            GROUP BY s.id
-            ORDER BY last_watched DESC
-            LIMIT ?
-        """, (user_id, limit))
-
-        return [dict(row) for row in cursor.fetchall()]
+        items, cursor = home_feed.get_items(conn, user_id, home_feed.KIND_RECENT, limit)
+        response.headers["X-Feed-Cursor"] = str(cursor)
+        return items
 
 
 # === WATCHLIST ===
@@ -2015,6 +1877,10 @@ async def add_to_watchlist(data: WatchlistRequest, request: Request):
                   data.poster_path, data.backdrop_path, data.year, data.rating))
 
             conn.commit()
+            await artwork_mirror.enqueue_async([
+                tmdb_url(data.poster_path, DEFAULT_SIZES["poster"]),
+                tmdb_url(data.backdrop_path, DEFAULT_SIZES["backdrop"]),
+            ])
 
             return {
                 "status": "success",
@@ -2108,6 +1974,14 @@ async def save_watch_progress(media_id: int, data: WatchProgressRequest, request
 
         conn.commit()
 
+        from backend.services import home_feed
+        home_feed.on_watch_progress(conn, user_id, media_id)
+
+        # Als crèdits, preparar el següent episodi
+        outro_start = _outro_start(cursor, media_id)
+        if should_prefetch(data.progress_seconds, data.total_seconds, outro_start):
+            _prefetch_next_local(cursor, media_id)
+
         return {
             "status": "success",
             "message": "Progrés guardat",
@@ -2190,6 +2064,22 @@ async def save_streaming_progress(data: StreamingProgressRequest, request: Reque
               data.poster_path, data.backdrop_path, data.still_path))
 
         conn.commit()
+        await artwork_mirror.enqueue_async([
+            tmdb_url(data.poster_path, DEFAULT_SIZES["poster"]),
+            tmdb_url(data.backdrop_path, DEFAULT_SIZES["backdrop"]),
+            tmdb_url(data.still_path, DEFAULT_SIZES["still"]),
+        ])
+
+        from backend.services import home_feed
+        home_feed.on_streaming_progress(conn, user_id, data.tmdb_id, data.media_type)
+
+        if data.media_type == "series" and season and episode:
+            if data.progress_seconds and data.total_seconds:
+                near_end = should_prefetch(data.progress_seconds, data.total_seconds)
+            else:
+                near_end = should_prefetch(data.progress_percent, 100)
+            if near_end:
+                _prefetch_next_streaming(data.tmdb_id, season, episode)
 
         return {
             "status": "success",
@@ -2256,11 +2146,40 @@ async def get_streaming_progress(
         }
 
 
+# === BATCH DE PETICIONS ===
+
+from backend.services.batch import MAX_BATCH_REQUESTS, run_batch
+
+
+class BatchRequest(BaseModel):
+    """Llista de rutes GET internes (amb query string) a executar juntes"""
+    requests: List[str]
+
+
+@app.post("/api/batch")
+async def batch_requests(data: BatchRequest, request: Request):
+    """
+    Executa diverses rutes GET internes en una sola petició HTTP.
+    L'autenticació es verifica una sola vegada i les subpeticions s'executen
+    concurrentment, cadascuna amb les seves connexions a la BD.
+    Útil per carregar la pàgina d'inici (continuar veient, watchlist,
+    historial...) amb una sola resposta.
+    """
+    if len(data.requests) > MAX_BATCH_REQUESTS:
+        raise HTTPException(status_code=400, detail=f"Màxim {MAX_BATCH_REQUESTS} peticions per batch")
+
+    user = get_current_user(request)
+    responses = await run_batch(request, data.requests, user)
+    return {"responses": responses}
+
+
 # === ENDPOINTS ===
 
 @app.get("/")
-async def root():
-    """Endpoint arrel"""
+async def root(request: Request):
+    """Endpoint arrel (els navegadors reben el frontend si està compilat)"""
+    if frontend_files is not None and "text/html" in request.headers.get("accept", ""):
+        return await frontend_files.get_response("index.html", request.scope)
     return {
         "name": "Hermes Media Server",
         "version": "1.0.0",
@@ -2302,25 +2221,135 @@ async def get_stats():
             "total_gb": round(total_size / (1024**3), 2)
         }
 
-@app.get("/api/library/series")
-async def get_series(content_type: str = None, page: int = 1, limit: int = 50, sort_by: str = "name", search: str = None, category: str = None):
+# Columnes SQL necessàries per a cada camp dels llistats de sèries i pel·lícules
+_SEASON_COUNT = "COUNT(DISTINCT m.season_number) AS season_count"
+_EPISODE_COUNT = "COUNT(m.id) AS episode_count"
+_DISPLAY_NAME = ["s.name", "s.title_english", "s.title_romaji"]
+
+SERIES_LIST_COLUMNS = {
+    "id": ["s.id"],
+    "name": _DISPLAY_NAME,
+    "original_name": ["s.name"],
+    "path": ["s.path"],
+    "poster": ["s.poster"],
+    "backdrop": ["s.backdrop"],
+    "season_count": [_SEASON_COUNT, "s.tmdb_seasons"],
+    "episode_count": [_EPISODE_COUNT, "s.tmdb_episodes"],
+    "local_season_count": [_SEASON_COUNT],
+    "local_episode_count": [_EPISODE_COUNT],
+    "tmdb_id": ["s.tmdb_id"],
+    "year": ["s.year"],
+    "rating": ["s.rating"],
+    "content_type": ["s.content_type"],
+}
+
+MOVIE_LIST_COLUMNS = {
+    "id": ["s.id"],
+    "name": _DISPLAY_NAME,
+    "original_name": ["s.name"],
+    "poster": ["s.poster"],
+    "backdrop": ["s.backdrop"],
+    "duration": ["m.duration"],
+    "file_size": ["m.file_size"],
+    "has_file": ["m.id AS media_id"],
+    "is_imported": ["s.is_imported"],
+    "year": ["s.year"],
+    "rating": ["s.rating"],
+    "content_type": ["s.content_type"],
+}
+
+
+def _list_fields(fields: Optional[str], available) -> Optional[List[str]]:
+    """Valida el paràmetre fields= d'un llistat"""
+    try:
+        return parse_fields(fields, available)
+    except FieldError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _list_page(items: List[dict], names: Optional[List[str]], compact: bool, available,
+               total: int, page: int, limit: int, headers: Dict[str, str]) -> FastJSONResponse:
+    """Resposta paginada d'un llistat amb la projecció i les capçaleres de cache"""
+    items = project(items, names, compact, available)
+    result = items if compact else {"items": items}
+    result.update({
+        "total": total,
+        "page": page,
+        "limit": limit,
+        "total_pages": (total + limit - 1) // limit
+    })
+    return FastJSONResponse(result, headers=headers)
+
+
+def _display_name(row: dict, contains_non_latin_characters) -> Optional[str]:
+    """Preferir títol en llatí (title_english > title_romaji > name)"""
+    display_name = row.get("name")
+    if contains_non_latin_characters(display_name or ""):
+        title_english = row.get("title_english")
+        title_romaji = row.get("title_romaji")
+        if title_english and not contains_non_latin_characters(title_english):
+            display_name = title_english
+        elif title_romaji and not contains_non_latin_characters(title_romaji):
+            display_name = title_romaji
+    return display_name
+
+
+async def _tmdb_category_ids(category: str) -> List[int]:
+    """
+    IDs de TMDB d'una categoria (en emissió, avui, cartellera), una hora al cache.
+    Llista buida si no hi ha API key o TMDB no respon (això no es guarda).
+    """
+    from datetime import date
+    from backend.metadata.tmdb import TMDBClient
+
+    cache_key = f"category:{category}:{date.today().isoformat()}"
+    cached = tmdb_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    api_key = get_tmdb_api_key()
+    if not api_key:
+        return []
+    client = TMDBClient(api_key)
+    fetch = {
+        "on_the_air": client.get_tv_on_the_air,
+        "airing_today": client.get_tv_airing_today,
+        "now_playing": client.get_movies_now_playing,
+    }[category]
+    try:
+        tmdb_ids = await fetch()
+    except Exception as e:
+        logger.error(f"Error obtenint {category} de TMDB: {e}")
+        return []
+    if tmdb_ids:
+        tmdb_cache.set(cache_key, tmdb_ids, ttl=3600)
+    return tmdb_ids
+
+
+@app.get("/api/library/series", response_class=FastJSONResponse)
+async def get_series(request: Request, content_type: str = None, page: int = 1, limit: int = 50, sort_by: str = "name",
+                     search: str = None, category: str = None, fields: str = None, compact: bool = False):
     """Retorna les sèries amb paginació. Filtre opcional: series, anime, toons (comma-separated for multiple)
-    Categories: popular (mínim vots + ordenar per rating), on_the_air (en emissió TMDB), airing_today (avui TMDB)"""
-    from backend.metadata.tmdb import TMDBClient, contains_non_latin_characters
+    Categories: popular (mínim vots + ordenar per rating), on_the_air (en emissió TMDB), airing_today (avui TMDB)
+    fields: camps a retornar (id,name,poster...). compact: files en llistes en lloc de dicts"""
+    from backend.metadata.tmdb import contains_non_latin_characters
+
+    names = _list_fields(fields, SERIES_LIST_COLUMNS)
 
     # Per on_the_air i airing_today, obtenim els IDs de TMDB
     tmdb_ids = []
     if category in ["on_the_air", "airing_today"]:
-        api_key = get_tmdb_api_key()
-        if api_key:
-            try:
-                client = TMDBClient(api_key)
-                if category == "on_the_air":
-                    tmdb_ids = await client.get_tv_on_the_air()
-                else:
-                    tmdb_ids = await client.get_tv_airing_today()
-            except Exception as e:
-                logger.error(f"Error obtenint {category} de TMDB: {e}")
+        tmdb_ids = await _tmdb_category_ids(category)
+
+    # Les categories de TMDB canvien encara que la BD no canviï: l'ETag inclou
+    # els IDs, i si TMDB no ha respost la resposta no es guarda al client
+    if category in ["on_the_air", "airing_today"] and not tmdb_ids:
+        cache_headers = {}
+    else:
+        with get_db() as conn:
+            cache_headers = check_not_modified(request, table_etag(
+                conn, ("series", "media_files"), "series", request.url.query, sorted(tmdb_ids)
+            ))
 
     with get_db() as conn:
         cursor = conn.cursor()
@@ -2354,7 +2383,7 @@ async def get_series(content_type: str = None, page: int = 1, limit: int = 50, s
                     count_params.extend(fts_ids)
                 else:
                     # Si FTS no troba res, retornar buit
-                    return {"items": [], "total": 0, "page": page, "limit": limit, "total_pages": 0}
+                    return _list_page([], names, compact, SERIES_LIST_COLUMNS, 0, page, limit, cache_headers)
             except Exception as e:
                 # Fallback a LIKE si FTS falla
                 logger.debug(f"FTS fallback a LIKE: {e}")
@@ -2374,7 +2403,7 @@ async def get_series(content_type: str = None, page: int = 1, limit: int = 50, s
                 count_params.extend(tmdb_ids)
             else:
                 # Si no hi ha IDs, retornar buit
-                return {"items": [], "total": 0, "page": page, "limit": limit, "total_pages": 0}
+                return _list_page([], names, compact, SERIES_LIST_COLUMNS, 0, page, limit, cache_headers)
 
         where_clause = " AND ".join(where_conditions)
 
@@ -2383,33 +2412,42 @@ async def get_series(content_type: str = None, page: int = 1, limit: int = 50, s
         cursor.execute(count_query, count_params)
         total = cursor.fetchone()[0]
 
-        # Main query
-        query = f"""
-            SELECT s.*, COUNT(DISTINCT m.season_number) as season_count,
-                       COUNT(m.id) as episode_count, s.content_type
-            FROM series s
-            LEFT JOIN media_files m ON s.id = m.series_id
-            WHERE {where_clause}
-        """
+        # Main query: només les columnes dels camps demanats
+        needed = list(names or SERIES_LIST_COLUMNS)
+        if search:
+            needed.append("name")  # Cal per descartar títols no llatins
+        if sort_by in ("episodes", "seasons"):
+            needed.extend(["local_season_count", "local_episode_count"])
+        columns = select_list(needed, SERIES_LIST_COLUMNS)
+
+        # El JOIN amb media_files només cal per als comptadors
+        if _SEASON_COUNT in columns or _EPISODE_COUNT in columns:
+            query = f"""
+                SELECT {columns}
+                FROM series s
+                LEFT JOIN media_files m ON s.id = m.series_id
+                WHERE {where_clause}
+                GROUP BY s.id
+            """
+        else:
+            query = f"SELECT {columns} FROM series s WHERE {where_clause}"
         params = count_params.copy()
 
-        query += " GROUP BY s.id"
-
         # Sorting basat en categoria o sort_by
         if category == "popular":
             # Populars: ordenar per rating DESC (les millor valorades amb mínim vots)
-            query += " ORDER BY COALESCE(s.rating, 0) DESC, s.name_normalized"
+            query += " ORDER BY COALESCE(s.rating, 0) DESC, s.sort_name"
         elif category in ["on_the_air", "airing_today"]:
             # En emissió / Avui: ordenar per popularitat
-            query += " ORDER BY COALESCE(s.popularity, 0) DESC, s.name_normalized"
+            query += " ORDER BY COALESCE(s.popularity, 0) DESC, s.sort_name"
         elif sort_by == "year":
-            query += " ORDER BY s.year DESC, s.name_normalized"
+            query += " ORDER BY s.year DESC, s.sort_name"
         elif sort_by == "episodes":
-            query += " ORDER BY episode_count DESC, s.name_normalized"
+            query += " ORDER BY episode_count DESC, s.sort_name"
         elif sort_by == "seasons":
-            query += " ORDER BY season_count DESC, s.name_normalized"
+            query += " ORDER BY season_count DESC, s.sort_name"
         else:
-            query += " ORDER BY s.name_normalized"
+            query += " ORDER BY s.sort_name"
 
         # Pagination
         offset = (page - 1) * limit
@@ -2420,74 +2458,66 @@ async def get_series(content_type: str = None, page: int = 1, limit: int = 50, s
 
         series = []
         for row in cursor.fetchall():
+            row = dict(row)
             # Usar TMDB metadata si no hi ha fitxers locals
-            local_seasons = row["season_count"]
-            local_episodes = row["episode_count"]
-            tmdb_seasons = row["tmdb_seasons"] if "tmdb_seasons" in row.keys() else None
-            tmdb_episodes = row["tmdb_episodes"] if "tmdb_episodes" in row.keys() else None
+            local_seasons = row.get("season_count") or 0
+            local_episodes = row.get("episode_count") or 0
 
             # Prioritzar: si hi ha locals, usar-los; si no, usar TMDB
-            final_seasons = local_seasons if local_seasons > 0 else (tmdb_seasons or 0)
-            final_episodes = local_episodes if local_episodes > 0 else (tmdb_episodes or 0)
+            final_seasons = local_seasons if local_seasons > 0 else (row.get("tmdb_seasons") or 0)
+            final_episodes = local_episodes if local_episodes > 0 else (row.get("tmdb_episodes") or 0)
 
-            # Preferir títol en llatí (title_english > title_romaji > name)
-            display_name = row["name"]
-            title_english = row["title_english"] if "title_english" in row.keys() else None
-            title_romaji = row["title_romaji"] if "title_romaji" in row.keys() else None
-
-            # Si el nom principal té caràcters no-llatins, buscar alternativa
-            if contains_non_latin_characters(display_name or ""):
-                if title_english and not contains_non_latin_characters(title_english):
-                    display_name = title_english
-                elif title_romaji and not contains_non_latin_characters(title_romaji):
-                    display_name = title_romaji
+            display_name = _display_name(row, contains_non_latin_characters)
 
             # Si estem cercant i no tenim títol llatí, saltar aquest item
             if search and contains_non_latin_characters(display_name or ""):
                 continue
 
             series.append({
-                "id": row["id"],
+                "id": row.get("id"),
                 "name": display_name,
-                "original_name": row["name"],  # Guardar nom original per referència
-                "path": row["path"],
-                "poster": row["poster"],
-                "backdrop": row["backdrop"],
+                "original_name": row.get("name"),  # Guardar nom original per referència
+                "path": row.get("path"),
+                "poster": row.get("poster"),
+                "backdrop": row.get("backdrop"),
                 "season_count": final_seasons,
                 "episode_count": final_episodes,
                 "local_season_count": local_seasons,
                 "local_episode_count": local_episodes,
-                "tmdb_id": row["tmdb_id"] if "tmdb_id" in row.keys() else None,
-                "year": row["year"] if "year" in row.keys() else None,
-                "rating": row["rating"] if "rating" in row.keys() else None,
-                "content_type": row["content_type"] or "series"
+                "tmdb_id": row.get("tmdb_id"),
+                "year": row.get("year"),
+                "rating": row.get("rating"),
+                "content_type": row.get("content_type") or "series"
             })
 
-        return {
-            "items": series,
-            "total": total,
-            "page": page,
-            "limit": limit,
-            "total_pages": (total + limit - 1) // limit
-        }
+        return _list_page(series, names, compact, SERIES_LIST_COLUMNS, total, page, limit, cache_headers)
 
-@app.get("/api/library/movies")
-async def get_movies(content_type: str = None, page: int = 1, limit: int = 50, sort_by: str = "name", search: str = None, category: str = None):
+@app.get("/api/library/movies", response_class=FastJSONResponse)
+async def get_movies(request: Request, content_type: str = None, page: int = 1, limit: int = 50, sort_by: str = "name",
+                     search: str = None, category: str = None, fields: str = None, compact: bool = False):
     """Retorna les pel·lícules amb paginació. Filtre opcional: movie, anime_movie, animated (comma-separated for multiple)
-    Categories: popular (mínim vots + ordenar per rating), now_playing (en cartellera TMDB), upcoming (release_date > avui)"""
+    Categories: popular (mínim vots + ordenar per rating), now_playing (en cartellera TMDB), upcoming (release_date > avui)
+    fields: camps a retornar (id,name,poster...). compact: files en llistes en lloc de dicts"""
     from datetime import datetime, date
-    from backend.metadata.tmdb import TMDBClient, contains_non_latin_characters
+    from backend.metadata.tmdb import contains_non_latin_characters
+
+    names = _list_fields(fields, MOVIE_LIST_COLUMNS)
 
     # Per now_playing, obtenim els IDs de TMDB
     now_playing_ids = []
     if category == "now_playing":
-        api_key = get_tmdb_api_key()
-        if api_key:
-            try:
-                client = TMDBClient(api_key)
-                now_playing_ids = await client.get_movies_now_playing()
-            except Exception as e:
-                logger.error(f"Error obtenint now_playing de TMDB: {e}")
+        now_playing_ids = await _tmdb_category_ids(category)
+
+    # upcoming canvia cada dia i now_playing amb la llista de TMDB, encara que
+    # la BD no canviï; si TMDB no ha respost la resposta no es guarda al client
+    day = date.today().isoformat() if category == "upcoming" else ""
+    if category == "now_playing" and not now_playing_ids:
+        cache_headers = {}
+    else:
+        with get_db() as conn:
+            cache_headers = check_not_modified(request, table_etag(
+                conn, ("series", "media_files"), "movies", request.url.query, day, sorted(now_playing_ids)
+            ))
 
     with get_db() as conn:
         cursor = conn.cursor()
@@ -2520,7 +2550,7 @@ async def get_movies(content_type: str = None, page: int = 1, limit: int = 50, s
                     count_params.extend(fts_ids)
                 else:
                     # Si FTS no troba res, retornar buit
-                    return {"items": [], "total": 0, "page": page, "limit": limit, "total_pages": 0}
+                    return _list_page([], names, compact, MOVIE_LIST_COLUMNS, 0, page, limit, cache_headers)
             except Exception as e:
                 # Fallback a LIKE si FTS falla
                 logger.debug(f"FTS fallback a LIKE: {e}")
@@ -2540,7 +2570,7 @@ async def get_movies(content_type: str = None, page: int = 1, limit: int = 50, s
                 count_params.extend(now_playing_ids)
             else:
                 # Si no hi ha IDs, retornar buit
-                return {"items": [], "total": 0, "page": page, "limit": limit, "total_pages": 0}
+                return _list_page([], names, compact, MOVIE_LIST_COLUMNS, 0, page, limit, cache_headers)
         elif category == "upcoming":
             # Pròximament: release_date > avui (dia i mes)
             today = date.today().isoformat()  # Format YYYY-MM-DD
@@ -2554,10 +2584,12 @@ async def get_movies(content_type: str = None, page: int = 1, limit: int = 50, s
         cursor.execute(count_query, count_params)
         total = cursor.fetchone()[0]
 
-        # Main query
+        # Main query: només les columnes dels camps demanats
+        needed = list(names or MOVIE_LIST_COLUMNS)
+        if search:
+            needed.append("name")  # Cal per descartar títols no llatins
         query = f"""
-            SELECT s.*, m.duration, m.file_size, m.id as media_id,
-                   s.is_imported, s.year, s.rating, s.content_type
+            SELECT {select_list(needed, MOVIE_LIST_COLUMNS)}
             FROM series s
             LEFT JOIN media_files m ON s.id = m.series_id
             WHERE {where_clause}
@@ -2567,19 +2599,19 @@ async def get_movies(content_type: str = None, page: int = 1, limit: int = 50, s
         # Sorting basat en categoria o sort_by
         if category == "popular":
             # Populars: ordenar per rating DESC (les millor valorades amb mínim vots)
-            query += " ORDER BY COALESCE(s.rating, 0) DESC, s.name_normalized"
+            query += " ORDER BY COALESCE(s.rating, 0) DESC, s.sort_name"
         elif category == "now_playing":
             # Cartellera: ordenar per popularitat
-            query += " ORDER BY COALESCE(s.popularity, 0) DESC, s.name_normalized"
+            query += " ORDER BY COALESCE(s.popularity, 0) DESC, s.sort_name"
         elif category == "upcoming":
             # Pròximament: ordenar per data d'estrena ASC (properes primer)
-            query += " ORDER BY s.release_date ASC, s.name_normalized"
+            query += " ORDER BY s.release_date ASC, s.sort_name"
         elif sort_by == "year":
-            query += " ORDER BY s.year DESC, s.name_normalized"
+            query += " ORDER BY s.year DESC, s.sort_name"
         elif sort_by == "duration":
-            query += " ORDER BY m.duration DESC, s.name_normalized"
+            query += " ORDER BY m.duration DESC, s.sort_name"
         else:
-            query += " ORDER BY s.name_normalized"
+            query += " ORDER BY s.sort_name"
 
         # Pagination
         offset = (page - 1) * limit
@@ -2590,50 +2622,38 @@ async def get_movies(content_type: str = None, page: int = 1, limit: int = 50, s
 
         movies = []
         for row in cursor.fetchall():
-            # Preferir títol en llatí (title_english > title_romaji > name)
-            display_name = row["name"]
-            title_english = row["title_english"] if "title_english" in row.keys() else None
-            title_romaji = row["title_romaji"] if "title_romaji" in row.keys() else None
-
-            # Si el nom principal té caràcters no-llatins, buscar alternativa
-            if contains_non_latin_characters(display_name or ""):
-                if title_english and not contains_non_latin_characters(title_english):
-                    display_name = title_english
-                elif title_romaji and not contains_non_latin_characters(title_romaji):
-                    display_name = title_romaji
+            row = dict(row)
+            display_name = _display_name(row, contains_non_latin_characters)
 
             # Si estem cercant i no tenim títol llatí, saltar aquest item
             if search and contains_non_latin_characters(display_name or ""):
                 continue
 
             movies.append({
-                "id": row["id"],
+                "id": row.get("id"),
                 "name": display_name,
-                "original_name": row["name"],
-                "poster": row["poster"],
-                "backdrop": row["backdrop"],
-                "duration": row["duration"],
-                "file_size": row["file_size"],
-                "has_file": row["media_id"] is not None,
-                "is_imported": row["is_imported"] == 1,
-                "year": row["year"],
-                "rating": row["rating"],
-                "content_type": row["content_type"] or "movie"
+                "original_name": row.get("name"),
+                "poster": row.get("poster"),
+                "backdrop": row.get("backdrop"),
+                "duration": row.get("duration"),
+                "file_size": row.get("file_size"),
+                "has_file": row.get("media_id") is not None,
+                "is_imported": row.get("is_imported") == 1,
+                "year": row.get("year"),
+                "rating": row.get("rating"),
+                "content_type": row.get("content_type") or "movie"
             })
 
-        return {
-            "items": movies,
-            "total": total,
-            "page": page,
-            "limit": limit,
-            "total_pages": (total + limit - 1) // limit
-        }
+        return _list_page(movies, names, compact, MOVIE_LIST_COLUMNS, total, page, limit, cache_headers)
 
 @app.get("/api/series/{series_id}")
-async def get_series_detail(series_id: int):
+async def get_series_detail(series_id: int, request: Request, response: Response):
     """Retorna detalls d'una sèrie amb temporades"""
     import json as json_module
     with get_db() as conn:
+        response.headers.update(check_not_modified(
+            request, table_etag(conn, ("series", "media_files"), "series", series_id)
+        ))
         cursor = conn.cursor()
 
         # Info de la sèrie
@@ -3148,7 +3168,7 @@ async def get_movie_detail(movie_id: int):
         }
 
 @app.post("/api/library/scan")
-async def scan_library(request: ScanRequest = None):
+async def scan_library(background_tasks: BackgroundTasks, request: ScanRequest = None):
     """Escaneja la biblioteca"""
     scanner = HermesScanner()
 
@@ -3221,33 +3241,41 @@ async def scan_all_libraries(background_tasks: BackgroundTasks):
     }
 
 @app.get("/api/image/poster/{item_id}")
-async def get_poster(item_id: int):
-    """Retorna el poster d'un item"""
+async def get_poster(item_id: int, request: Request, w: Optional[int] = None,
+                     fmt: Optional[str] = Query(None, alias="format")):
+    """Retorna el poster d'un item (redimensionat si es demana ?w=)"""
     with get_db() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT poster FROM series WHERE id = ?", (item_id,))
         result = cursor.fetchone()
 
-        if result and result["poster"]:
-            poster_path = Path(result["poster"])
-            if poster_path.exists():
-                return FileResponse(poster_path)
+    if result and result["poster"]:
+        # Contingut importat: URL de TMDB (còpia local si ja s'ha descarregat)
+        if is_mirrorable(result["poster"]):
+            return await artwork_response(request, result["poster"], width=w, fmt=fmt)
+        poster_path = Path(result["poster"])
+        if poster_path.exists():
+            return await image_response(request, poster_path, width=w, fmt=fmt)
 
     # Retornar 404 si no hi ha poster disponible
     raise HTTPException(status_code=404, detail="Poster not available")
 
 @app.get("/api/image/backdrop/{item_id}")
-async def get_backdrop(item_id: int):
-    """Retorna el backdrop d'un item"""
+async def get_backdrop(item_id: int, request: Request, w: Optional[int] = None,
+                       fmt: Optional[str] = Query(None, alias="format")):
+    """Retorna el backdrop d'un item (redimensionat si es demana ?w=)"""
     with get_db() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT backdrop FROM series WHERE id = ?", (item_id,))
         result = cursor.fetchone()
 
-        if result and result["backdrop"]:
-            backdrop_path = Path(result["backdrop"])
-            if backdrop_path.exists():
-                return FileResponse(backdrop_path)
+    if result and result["backdrop"]:
+        # Contingut importat: URL de TMDB (còpia local si ja s'ha descarregat)
+        if is_mirrorable(result["backdrop"]):
+            return await artwork_response(request, result["backdrop"], width=w, fmt=fmt)
+        backdrop_path = Path(result["backdrop"])
+        if backdrop_path.exists():
+            return await image_response(request, backdrop_path, width=w, fmt=fmt)
 
     # Retornar 404 si no hi ha backdrop disponible
     raise HTTPException(status_code=404, detail="Backdrop not available")
@@ -3256,9 +3284,9 @@ async def get_backdrop(item_id: int):
 # === ENDPOINTS COMPATIBILITAT FRONTEND ===
 
 @app.get("/api/library/series/{series_id}")
-async def get_library_series_detail(series_id: int):
+async def get_library_series_detail(series_id: int, request: Request, response: Response):
     """Alias per compatibilitat amb frontend - Detalls sèrie"""
-    return await get_series_detail(series_id)
+    return await get_series_detail(series_id, request, response)
 
 
 @app.get("/api/library/series/{series_id}/enriched")
@@ -3427,12 +3455,17 @@ async def cleanup_library():
 
 
 @app.get("/api/library/series/{series_id}/seasons/{season_number}/episodes")
-async def get_library_season_episodes(series_id: int, season_number: int, request: Request):
+async def get_library_season_episodes(series_id: int, season_number: int, request: Request, response: Response):
     """Retorna episodis d'una temporada - format frontend"""
     user = get_current_user(request)
     user_id = user["id"] if user else 1
 
     with get_db() as conn:
+        # El progrés és per usuari: comptador propi de watch_progress
+        response.headers.update(check_not_modified(request, table_etag(
+            conn, ("series", "media_files", f"watch_progress:{user_id}"),
+            "episodes", series_id, season_number, user_id
+        )))
         cursor = conn.cursor()
 
         # Consulta amb LEFT JOIN a watch_progress per obtenir el progrés
@@ -4337,6 +4370,11 @@ async def get_fallback_artwork(media_type: str, tmdb_id: int):
     """
     from backend.metadata.fanart import FanartTVClient
 
+    # Resposta guardada: no cal tornar a preguntar a Fanart.tv
+    cached = await asyncio.to_thread(artwork_mirror.get_fallback, media_type, tmdb_id)
+    if cached and cached[1]:
+        return cached[0]
+
     is_movie = media_type == "movie"
     client = FanartTVClient()
 
@@ -4390,9 +4428,17 @@ async def get_fallback_artwork(media_type: str, tmdb_id: int):
             result["logo"] = client.get_best_image(images.get("logos", []))
             result["banner"] = client.get_best_image(images.get("banners", []))
             result["clearart"] = client.get_best_image(images.get("clearart", []))
+            if await asyncio.to_thread(artwork_mirror.save_fallback, media_type, tmdb_id, result):
+                artwork_mirror.kick()
+        elif cached:
+            # Fanart.tv no ha respost (o error de xarxa): no es trepitja la resposta bona
+            return cached[0]
 
     except Exception as e:
         logger.warning(f"Error getting fallback artwork: {e}")
+        # Sense xarxa: la resposta antiga és millor que res
+        if cached:
+            return cached[0]
 
     return result
 
@@ -4407,6 +4453,54 @@ async def get_media_logo(media_type: str, tmdb_id: int):
     return {"logo": result.get("logo")}
 
 
+async def artwork_response(request: Request, url: str, width: int = None, fmt: str = None) -> Response:
+    """
+    Serveix artwork remot des de la còpia local. Si encara no s'ha
+    descarregat, redirigeix el navegador a l'origen i l'encua si la
+    biblioteca ja la coneix (o si la demana un usuari autenticat).
+    """
+    local_path, queued = await asyncio.to_thread(
+        artwork_mirror.lookup, url, allow_new=get_current_user(request) is not None
+    )
+    if local_path is not None:
+        return await image_response(request, local_path, width=width, fmt=fmt)
+    if queued:
+        artwork_mirror.kick()
+    return RedirectResponse(url, status_code=307)
+
+
+@app.get("/api/artwork/tmdb/{size}/{filename}")
+async def get_tmdb_artwork(size: str, filename: str, request: Request,
+                           fmt: Optional[str] = Query(None, alias="format")):
+    """Imatge de TMDB (/t/p/{size}/{filename}) servida des de la còpia local"""
+    if not re.match(r"^(w\d+|h\d+|original)$", size) or not re.match(r"^[\w.-]+$", filename):
+        raise HTTPException(status_code=400, detail="Imatge no vàlida")
+    # Si només tenim una altra mida, es redimensiona a la demanada
+    width = int(size[1:]) if size.startswith("w") else None
+    return await artwork_response(request, tmdb_url(f"/{filename}", size), width=width, fmt=fmt)
+
+
+@app.get("/api/artwork/remote")
+async def get_remote_artwork(url: str, request: Request, w: Optional[int] = None,
+                             fmt: Optional[str] = Query(None, alias="format")):
+    """Imatge de TMDB o Fanart.tv per URL completa, servida des de la còpia local"""
+    if not is_mirrorable(url):
+        raise HTTPException(status_code=400, detail="Origen no permès")
+    return await artwork_response(request, url, width=w, fmt=fmt)
+
+
+@app.get("/api/artwork/mirror/status")
+async def get_artwork_mirror_status():
+    """Estat de la còpia local de l'artwork"""
+    return await asyncio.to_thread(artwork_mirror.stats)
+
+
+@app.post("/api/artwork/mirror/sync")
+async def sync_artwork_mirror():
+    """Encua l'artwork de la biblioteca que encara no es té"""
+    return {"status": "queued", "added": await artwork_mirror.mirror_library_async()}
+
+
 @app.get("/api/tvdb/search")
 async def search_tvdb(q: str, year: int = None):
     """
@@ -4596,6 +4690,8 @@ async def convert_anime_ids(
 @app.get("/api/metadata/series/{tmdb_id}")
 async def get_series_metadata_lazy(
     tmdb_id: int,
+    request: Request,
+    response: Response,
     anilist_id: int = None,
     refresh: bool = False
 ):
@@ -4635,6 +4731,11 @@ async def get_series_metadata_lazy(
     else:
         content_type = ContentType.ANIME
 
+    # Validator: moment en què es va obtenir l'entrada del cache
+    fetched_at = metadata_service.series_cache_timestamp(tmdb_id, anilist_id)
+    if fetched_at:
+        check_not_modified(request, make_etag("metadata", tmdb_id, anilist_id, fetched_at))
+
     data = await metadata_service.get_series_metadata(
         tmdb_id=tmdb_id,
         anilist_id=anilist_id,
@@ -4644,6 +4745,10 @@ async def get_series_metadata_lazy(
     if not data:
         raise HTTPException(status_code=404, detail="Sèrie no trobada")
 
+    fetched_at = metadata_service.series_cache_timestamp(tmdb_id, anilist_id)
+    if fetched_at:
+        response.headers["ETag"] = make_etag("metadata", tmdb_id, anilist_id, fetched_at)
+        response.headers["Cache-Control"] = REVALIDATE
     return data
 
 
@@ -4828,12 +4933,13 @@ async def get_embed_sources(media_type: str, tmdb_id: int, season: int = None, e
 
 
 @app.get("/api/extract-stream/{media_type}/{tmdb_id}")
-async def extract_stream_url(media_type: str, tmdb_id: int, season: int = None, episode: int = None, source: str = "vidsrc"):
+async def extract_stream_url(media_type: str, tmdb_id: int, season: int = None, episode: int = None, source: str = None):
     """
     Intenta extreure la URL directa del stream (HLS/MP4) d'un servei d'embed.
     Això permet reproduir el vídeo amb el reproductor natiu.
+    source: font preferida (es prova primer); si no, s'ordenen per historial.
     """
-    import httpx
+    from backend.streaming.source_race import get_scrape_client, hedged_race
     import re
     import base64
 
@@ -4853,37 +4959,38 @@ async def extract_stream_url(media_type: str, tmdb_id: int, season: int = None,
                 e = episode or 1
                 api_url = f"https://vidsrc.xyz/embed/tv/{tmdb_id}/{s}/{e}"
 
-            async with httpx.AsyncClient(follow_redirects=True, timeout=20.0, verify=False) as client:
-                resp = await client.get(api_url, headers=headers)
-                if resp.status_code != 200:
-                    return None
-                html = resp.text
-
-                # Buscar URLs HLS/M3U8 directament
-                patterns = [
-                    r'source:\s*["\']([^"\']+\.m3u8[^"\']*)["\']',
-                    r'file:\s*["\']([^"\']+\.m3u8[^"\']*)["\']',
-                    r'src:\s*["\']([^"\']+\.m3u8[^"\']*)["\']',
-                    r'(https?://[^\s"\'<>]+\.m3u8[^\s"\'<>]*)',
-                    r'playbackURL["\']?\s*[:=]\s*["\']([^"\']+)["\']',
-                ]
-
-                for pattern in patterns:
-                    match = re.search(pattern, html, re.IGNORECASE)
-                    if match:
-                        url = match.group(1)
-                        if url.startswith('//'):
-                            url = 'https:' + url
-                        return {
-                            "url": url,
-                            "type": "hls",
-                            "source": "VidSrc.xyz"
-                        }
-
+            client = get_scrape_client()
+            resp = await client.get(api_url, headers=headers)
+            if resp.status_code == 404:
                 return None
+            resp.raise_for_status()
+            html = resp.text
+
+            # Buscar URLs HLS/M3U8 directament
+            patterns = [
+                r'source:\s*["\']([^"\']+\.m3u8[^"\']*)["\']',
+                r'file:\s*["\']([^"\']+\.m3u8[^"\']*)["\']',
+                r'src:\s*["\']([^"\']+\.m3u8[^"\']*)["\']',
+                r'(https?://[^\s"\'<>]+\.m3u8[^\s"\'<>]*)',
+                r'playbackURL["\']?\s*[:=]\s*["\']([^"\']+)["\']',
+            ]
+
+            for pattern in patterns:
+                match = re.search(pattern, html, re.IGNORECASE)
+                if match:
+                    url = match.group(1)
+                    if url.startswith('//'):
+                        url = 'https:' + url
+                    return {
+                        "url": url,
+                        "type": "hls",
+                        "source": "VidSrc.xyz"
+                    }
+
+            return None
         except Exception as e:
             logging.error(f"Error extracting vidsrc.xyz: {e}")
-            return None
+            raise
 
     async def extract_2embed():
         """Extreu stream de 2embed.cc"""
@@ -4895,45 +5002,47 @@ async def extract_stream_url(media_type: str, tmdb_id: int, season: int = None,
                 e = episode or 1
                 api_url = f"https://www.2embed.cc/embedtv/{tmdb_id}&s={s}&e={e}"
 
-            async with httpx.AsyncClient(follow_redirects=True, timeout=20.0, verify=False) as client:
-                resp = await client.get(api_url, headers=headers)
-                if resp.status_code != 200:
-                    return None
-                html = resp.text
-
-                # Buscar iframes amb fonts de vídeo
-                iframe_match = re.search(r'<iframe[^>]+src=["\']([^"\']+)["\']', html, re.IGNORECASE)
-                if iframe_match:
-                    iframe_url = iframe_match.group(1)
-                    if iframe_url.startswith('//'):
-                        iframe_url = 'https:' + iframe_url
-
-                    # Seguir l'iframe per trobar el stream
-                    resp2 = await client.get(iframe_url, headers={**headers, "Referer": api_url})
-                    if resp2.status_code == 200:
-                        html2 = resp2.text
-
-                        patterns = [
-                            r'(https?://[^\s"\'<>]+\.m3u8[^\s"\'<>]*)',
-                            r'file:\s*["\']([^"\']+)["\']',
-                            r'source:\s*["\']([^"\']+)["\']',
-                        ]
+            client = get_scrape_client()
+            resp = await client.get(api_url, headers=headers)
+            if resp.status_code == 404:
+                return None
+            resp.raise_for_status()
+            html = resp.text
+
+            # Buscar iframes amb fonts de vídeo
+            iframe_match = re.search(r'<iframe[^>]+src=["\']([^"\']+)["\']', html, re.IGNORECASE)
+            if iframe_match:
+                iframe_url = iframe_match.group(1)
+                if iframe_url.startswith('//'):
+                    iframe_url = 'https:' + iframe_url
+
+                # Seguir l'iframe per trobar el stream
+                resp2 = await client.get(iframe_url, headers={**headers, "Referer": api_url})
+                if resp2.status_code != 404:
+                    resp2.raise_for_status()
+                    html2 = resp2.text
+
+                    patterns = [
+                        r'(https?://[^\s"\'<>]+\.m3u8[^\s"\'<>]*)',
+                        r'file:\s*["\']([^"\']+)["\']',
+                        r'source:\s*["\']([^"\']+)["\']',
+                    ]
 
-                        for pattern in patterns:
-                            match = re.search(pattern, html2, re.IGNORECASE)
-                            if match:
-                                url = match.group(1)
-                                if '.m3u8' in url or 'stream' in url.lower():
-                                    return {
-                                        "url": url,
-                                        "type": "hls",
-                                        "source": "2Embed"
-                                    }
+                    for pattern in patterns:
+                        match = re.search(pattern, html2, re.IGNORECASE)
+                        if match:
+                            url = match.group(1)
+                            if '.m3u8' in url or 'stream' in url.lower():
+                                return {
+                                    "url": url,
+                                    "type": "hls",
+                                    "source": "2Embed"
+                                }
 
-                return None
+            return None
         except Exception as e:
             logging.error(f"Error extracting 2embed: {e}")
-            return None
+            raise
 
     async def extract_embedsu():
         """Extreu stream de embed.su"""
@@ -4945,35 +5054,36 @@ async def extract_stream_url(media_type: str, tmdb_id: int, season: int = None,
                 e = episode or 1
                 api_url = f"https://embed.su/embed/tv/{tmdb_id}/{s}/{e}"
 
-            async with httpx.AsyncClient(follow_redirects=True, timeout=20.0, verify=False) as client:
-                resp = await client.get(api_url, headers=headers)
-                if resp.status_code != 200:
-                    return None
-                html = resp.text
-
-                # Buscar configuració del player
-                patterns = [
-                    r'(https?://[^\s"\'<>]+\.m3u8[^\s"\'<>]*)',
-                    r'file:\s*["\']([^"\']+)["\']',
-                    r'source:\s*["\']([^"\']+)["\']',
-                    r'src:\s*["\']([^"\']+\.m3u8[^"\']*)["\']',
-                ]
-
-                for pattern in patterns:
-                    match = re.search(pattern, html, re.IGNORECASE)
-                    if match:
-                        url = match.group(1)
-                        if '.m3u8' in url:
-                            return {
-                                "url": url,
-                                "type": "hls",
-                                "source": "Embed.su"
-                            }
-
+            client = get_scrape_client()
+            resp = await client.get(api_url, headers=headers)
+            if resp.status_code == 404:
                 return None
+            resp.raise_for_status()
+            html = resp.text
+
+            # Buscar configuració del player
+            patterns = [
+                r'(https?://[^\s"\'<>]+\.m3u8[^\s"\'<>]*)',
+                r'file:\s*["\']([^"\']+)["\']',
+                r'source:\s*["\']([^"\']+)["\']',
+                r'src:\s*["\']([^"\']+\.m3u8[^"\']*)["\']',
+            ]
+
+            for pattern in patterns:
+                match = re.search(pattern, html, re.IGNORECASE)
+                if match:
+                    url = match.group(1)
+                    if '.m3u8' in url:
+                        return {
+                            "url": url,
+                            "type": "hls",
+                            "source": "Embed.su"
+                        }
+
+            return None
         except Exception as e:
             logging.error(f"Error extracting embed.su: {e}")
-            return None
+            raise
 
     async def extract_autoembed():
         """Extreu stream de autoembed.cc"""
@@ -4985,33 +5095,34 @@ async def extract_stream_url(media_type: str, tmdb_id: int, season: int = None,
                 e = episode or 1
                 api_url = f"https://autoembed.cc/embed/tv/{tmdb_id}/{s}/{e}"
 
-            async with httpx.AsyncClient(follow_redirects=True, timeout=20.0, verify=False) as client:
-                resp = await client.get(api_url, headers=headers)
-                if resp.status_code != 200:
-                    return None
-                html = resp.text
+            client = get_scrape_client()
+            resp = await client.get(api_url, headers=headers)
+            if resp.status_code == 404:
+                return None
+            resp.raise_for_status()
+            html = resp.text
 
-                patterns = [
-                    r'(https?://[^\s"\'<>]+\.m3u8[^\s"\'<>]*)',
-                    r'file:\s*["\']([^"\']+)["\']',
-                    r'sources:\s*\[\s*\{\s*file:\s*["\']([^"\']+)["\']',
-                ]
+            patterns = [
+                r'(https?://[^\s"\'<>]+\.m3u8[^\s"\'<>]*)',
+                r'file:\s*["\']([^"\']+)["\']',
+                r'sources:\s*\[\s*\{\s*file:\s*["\']([^"\']+)["\']',
+            ]
 
-                for pattern in patterns:
-                    match = re.search(pattern, html, re.IGNORECASE)
-                    if match:
-                        url = match.group(1)
-                        if '.m3u8' in url or 'stream' in url.lower():
-                            return {
-                                "url": url,
-                                "type": "hls",
-                                "source": "AutoEmbed"
-                            }
+            for pattern in patterns:
+                match = re.search(pattern, html, re.IGNORECASE)
+                if match:
+                    url = match.group(1)
+                    if '.m3u8' in url or 'stream' in url.lower():
+                        return {
+                            "url": url,
+                            "type": "hls",
+                            "source": "AutoEmbed"
+                        }
 
-                return None
+            return None
         except Exception as e:
             logging.error(f"Error extracting autoembed: {e}")
-            return None
+            raise
 
     async def extract_superembed():
         """Extreu stream de SuperEmbed/MultiEmbed"""
@@ -5023,33 +5134,34 @@ async def extract_stream_url(media_type: str, tmdb_id: int, season: int = None,
                 e = episode or 1
                 api_url = f"https://multiembed.mov/?video_id={tmdb_id}&tmdb=1&s={s}&e={e}"
 
-            async with httpx.AsyncClient(follow_redirects=True, timeout=20.0, verify=False) as client:
-                resp = await client.get(api_url, headers=headers)
-                if resp.status_code != 200:
-                    return None
-                html = resp.text
+            client = get_scrape_client()
+            resp = await client.get(api_url, headers=headers)
+            if resp.status_code == 404:
+                return None
+            resp.raise_for_status()
+            html = resp.text
 
-                patterns = [
-                    r'(https?://[^\s"\'<>]+\.m3u8[^\s"\'<>]*)',
-                    r'file:\s*["\']([^"\']+)["\']',
-                    r'source:\s*["\']([^"\']+)["\']',
-                ]
+            patterns = [
+                r'(https?://[^\s"\'<>]+\.m3u8[^\s"\'<>]*)',
+                r'file:\s*["\']([^"\']+)["\']',
+                r'source:\s*["\']([^"\']+)["\']',
+            ]
 
-                for pattern in patterns:
-                    match = re.search(pattern, html, re.IGNORECASE)
-                    if match:
-                        url = match.group(1)
-                        if '.m3u8' in url or 'stream' in url.lower():
-                            return {
-                                "url": url,
-                                "type": "hls",
-                                "source": "SuperEmbed"
-                            }
+            for pattern in patterns:
+                match = re.search(pattern, html, re.IGNORECASE)
+                if match:
+                    url = match.group(1)
+                    if '.m3u8' in url or 'stream' in url.lower():
+                        return {
+                            "url": url,
+                            "type": "hls",
+                            "source": "SuperEmbed"
+                        }
 
-                return None
+            return None
         except Exception as e:
             logging.error(f"Error extracting SuperEmbed: {e}")
-            return None
+            raise
 
     # Intentar extreure de cada font
     extractors = {
@@ -5060,19 +5172,19 @@ async def extract_stream_url(media_type: str, tmdb_id: int, season: int = None,
         "superembed": extract_superembed,
     }
 
-    # Si s'especifica una font, provar només aquesta
-    if source in extractors:
-        result = await extractors[source]()
-        if result:
-            return result
-
-    # Si no, provar totes les fonts en ordre
-    for name, extractor in extractors.items():
-        logging.info(f"Provant extractor: {name}")
-        result = await extractor()
-        if result:
-            logging.info(f"Extracció exitosa amb {name}: {result['url'][:50]}...")
-            return result
+    # Cursa esglaonada: primer la font amb millor historial (o la demanada),
+    # la resta si tarda; guanya el primer stream vàlid
+    content_key = f"{media_type}:{tmdb_id}:{season or ''}:{episode or ''}"
+    if season and episode:
+        prefetcher.remember(tmdb_id, "extract", media_type=media_type)
+    # Si es demana una font concreta (canvi de servidor), no usar el cache
+    cached = extract_cache.get(content_key) if not source else None
+    if cached:
+        return cached
+    result = await hedged_race(extractors, content_key, preferred=source)
+    if result:
+        extract_cache.set(content_key, result)
+        return result
 
     # Si cap funciona, retornar error
     raise HTTPException(
@@ -5494,6 +5606,116 @@ async def propagate_intro(episode_id: int, request: PropagateIntroRequest, backg
         return {"status": "error", "message": str(e)}
 
 
+def _find_next_episode(cursor, current):
+    """Següent episodi (mateixa temporada o primer de la següent)."""
+    cursor.execute("""
+        SELECT id, season_number, episode_number, title, file_path
+        FROM media_files
+        WHERE series_id = ? AND season_number = ? AND episode_number > ?
+        ORDER BY episode_number
+        LIMIT 1
+    """, (current["series_id"], current["season_number"], current["episode_number"]))
+
+    next_ep = cursor.fetchone()
+
+    # Si no hi ha més episodis en aquesta temporada, buscar primera de la següent
+    if not next_ep:
+        cursor.execute("""
+            SELECT id, season_number, episode_number, title, file_path
+            FROM media_files
+            WHERE series_id = ? AND season_number > ?
+            ORDER BY season_number, episode_number
+            LIMIT 1
+        """, (current["series_id"], current["season_number"]))
+        next_ep = cursor.fetchone()
+
+    return next_ep
+
+
+def _outro_start(cursor, media_id: int) -> Optional[float]:
+    """Inici de l'outro/crèdits (de l'episodi o de la plantilla de la sèrie)."""
+    cursor.execute("""
+        SELECT start_time FROM media_segments
+        WHERE segment_type IN ('outro', 'credits')
+          AND (media_id = ? OR (media_id IS NULL AND series_id = (
+              SELECT series_id FROM media_files WHERE id = ?)))
+        ORDER BY media_id IS NULL, start_time
+        LIMIT 1
+    """, (media_id, media_id))
+    row = cursor.fetchone()
+    return row["start_time"] if row else None
+
+
+def _prefetch_next_local(cursor, media_id: int):
+    """Porta al page cache el fitxer del següent episodi."""
+    cursor.execute("""
+        SELECT series_id, season_number, episode_number
+        FROM media_files WHERE id = ?
+    """, (media_id,))
+    current = cursor.fetchone()
+    if not current or current["series_id"] is None or current["episode_number"] is None:
+        return
+    next_ep = _find_next_episode(cursor, current)
+    if not next_ep or not next_ep["file_path"]:
+        return
+
+    file_path = next_ep["file_path"]
+
+    async def job():
+        if os.path.exists(file_path):
+            await asyncio.to_thread(warm_file, file_path)
+
+    prefetcher.schedule(f"local:{next_ep['id']}", job)
+
+
+def _prefetch_next_streaming(tmdb_id: int, season: int, episode: int):
+    """
+    Prepara el següent episodi d'un contingut extern segons com s'ha
+    resolt l'actual: link de Real-Debrid, stream de BBC o embed extret.
+    Els subtítols es preparen sempre.
+    """
+    next_episode = episode + 1
+    resolutions = prefetcher.resolutions(tmdb_id)
+
+    rd = resolutions.get("rd")
+    rd_api_key = get_rd_api_key() if rd else None
+    if rd and rd_api_key and rd["season"] == season:
+        from backend.debrid.rd_session import get_rd_session
+
+        async def rd_job():
+            await get_rd_session(rd_api_key).prefetch_episode(rd["info_hash"], rd["magnet"], season, next_episode)
+
+        prefetcher.schedule(f"rd:{rd['info_hash']}:{season}:{next_episode}", rd_job)
+
+    bbc = resolutions.get("bbc")
+    if bbc:
+        async def bbc_job():
+            from backend.debrid import BBCiPlayerClient
+            from backend.debrid.bbc_mapping import get_bbc_programme_id
+            programme_id = get_bbc_programme_id(tmdb_id, bbc["episode"] + 1, bbc["content_type"])
+            if programme_id:
+                await BBCiPlayerClient().get_stream_info(programme_id, quality=bbc["quality"])
+
+        prefetcher.schedule(f"bbc:{tmdb_id}:{bbc['episode'] + 1}", bbc_job)
+
+    extract = resolutions.get("extract")
+    if extract:
+        async def extract_job():
+            try:
+                await extract_stream_url(extract["media_type"], tmdb_id, season, next_episode)
+            except HTTPException:
+                pass
+
+        prefetcher.schedule(f"extract:{tmdb_id}:{season}:{next_episode}", extract_job)
+
+    async def subtitles_job():
+        result = await _search_subtitles("tv", tmdb_id, season, next_episode, "ca,es,en")
+        if result["subtitles"]:
+            await get_subtitle_client().download_subtitle(result["subtitles"][0]["id"])
+
+    prefetcher.schedule(f"subtitles:{tmdb_id}:{season}:{next_episode}", subtitles_job)
+
+
 @app.get("/api/library/episodes/{episode_id}/next")
 async def get_next_episode(episode_id: int):
     """Retorna el següent episodi d'una sèrie"""
@@ -5510,28 +5732,7 @@ async def get_next_episode(episode_id: int):
         if not current:
             raise HTTPException(status_code=404, detail="Episodi no trobat")
 
-        # Buscar següent episodi (mateixa temporada)
-        cursor.execute("""
-            SELECT id, season_number, episode_number, title
-            FROM media_files
-            WHERE series_id = ? AND season_number = ? AND episode_number > ?
-            ORDER BY episode_number
-            LIMIT 1
-        """, (current["series_id"], current["season_number"], current["episode_number"]))
-
-        next_ep = cursor.fetchone()
-
-        # Si no hi ha més episodis en aquesta temporada, buscar primera de la següent
-        if not next_ep:
-            cursor.execute("""
-                SELECT id, season_number, episode_number, title
-                FROM media_files
-                WHERE series_id = ? AND season_number > ?
-                ORDER BY season_number, episode_number
-                LIMIT 1
-            """, (current["series_id"], current["season_number"]))
-            next_ep = cursor.fetchone()
-
+        next_ep = _find_next_episode(cursor, current)
         if not next_ep:
             return None
 
@@ -5708,20 +5909,28 @@ async def detect_intros_series_v2(series_id: int):
 # BIBLIOTECA DE LLIBRES
 # ============================================================
 
-@app.get("/api/books/authors")
-async def get_authors():
-    """Retorna tots els autors"""
+@app.get("/api/books/authors", response_class=FastJSONResponse)
+async def get_authors(fields: str = None, compact: bool = False):
+    """Retorna tots els autors. fields: camps a retornar; compact: files en llistes"""
     with get_db() as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT a.*, COUNT(b.id) as book_count
-            FROM authors a
-            LEFT JOIN books b ON a.id = b.author_id
-            GROUP BY a.id
-            ORDER BY a.name
-        """)
+        columns = {c: [f"a.{c}"] for c in table_columns(cursor, "authors")}
+        columns["book_count"] = ["COUNT(b.id) AS book_count"]
+        names = _list_fields(fields, columns)
+
+        if names is None or "book_count" in names:
+            select = select_list(names, columns) if names else "a.*, COUNT(b.id) as book_count"
+            cursor.execute(f"""
+                SELECT {select}
+                FROM authors a
+                LEFT JOIN books b ON a.id = b.author_id
+                GROUP BY a.id
+                ORDER BY a.sort_name
+            """)
+        else:
+            cursor.execute(f"SELECT {select_list(names, columns)} FROM authors a ORDER BY a.sort_name")
         authors = [dict(row) for row in cursor.fetchall()]
-        return authors
+        return FastJSONResponse(project(authors, names, compact, columns))
 
 
 @app.get("/api/books/authors/{author_id}")
@@ -5737,7 +5946,7 @@ async def get_author_detail(author_id: int):
 
         cursor.execute("""
             SELECT * FROM books WHERE author_id = ?
-            ORDER BY title
+            ORDER BY sort_title
         """, (author_id,))
         books = [dict(row) for row in cursor.fetchall()]
 
@@ -5747,20 +5956,36 @@ async def get_author_detail(author_id: int):
         }
 
 
-@app.get("/api/books")
-async def get_all_books(content_type: str = None):
-    """Retorna tots els llibres. Filtre opcional: book, manga, comic (comma-separated for multiple)"""
+@app.get("/api/books", response_class=FastJSONResponse)
+async def get_all_books(request: Request, content_type: str = None, fields: str = None, compact: bool = False):
+    """Retorna tots els llibres. Filtre opcional: book, manga, comic (comma-separated for multiple)
+    fields: camps a retornar (id,title,cover...); compact: files en llistes"""
     with get_db() as conn:
+        cache_headers = check_not_modified(
+            request, table_etag(conn, ("books", "authors"), "books", request.url.query)
+        )
         cursor = conn.cursor()
+        columns = {c: [f"b.{c}"] for c in table_columns(cursor, "books")}
+        columns["author_name"] = ["a.name AS author_name"]
+        names = _list_fields(fields, columns)
 
         # Parse content types (can be comma-separated)
         content_types = [ct.strip() for ct in content_type.split(',')] if content_type else None
 
-        query = """
-            SELECT b.*, a.name as author_name
-            FROM books b
-            LEFT JOIN authors a ON b.author_id = a.id
-        """
+        if names is None:
+            query = """
+                SELECT b.*, a.name as author_name
+                FROM books b
+                LEFT JOIN authors a ON b.author_id = a.id
+            """
+        elif "author_name" in names:
+            query = f"""
+                SELECT {select_list(names, columns)}
+                FROM books b
+                LEFT JOIN authors a ON b.author_id = a.id
+            """
+        else:
+            query = f"SELECT {select_list(names, columns)} FROM books b"
         params = []
 
         if content_types:
@@ -5770,11 +5995,34 @@ async def get_all_books(content_type: str = None):
             params.append('book')  # Treat NULL as 'book'
             params.extend(content_types)
 
-        query += " ORDER BY b.title"
+        query += " ORDER BY b.sort_title"
 
         cursor.execute(query, params)
         books = [dict(row) for row in cursor.fetchall()]
-        return books
+        return FastJSONResponse(project(books, names, compact, columns), headers=cache_headers)
+
+
+@app.get("/api/books/conversions")
+async def get_book_conversions(failed: bool = False):
+    """Estat de la cua de conversions a EPUB (i els errors si es demanen)"""
+    stats = await asyncio.to_thread(book_converter.stats)
+    if failed:
+        stats["failures"] = await asyncio.to_thread(book_converter.failures)
+    return stats
+
+
+@app.post("/api/books/{book_id}/convert")
+async def convert_book(book_id: int):
+    """Posa un llibre davant de la cua de conversió (o reintenta si havia fallat)"""
+    from backend.books.reader import BookReader
+
+    book = BookReader().get_book_info(book_id)
+    if not book:
+        raise HTTPException(status_code=404, detail="Llibre no trobat")
+    if not needs_conversion(book["format"]):
+        raise HTTPException(status_code=400, detail=f"El format {book['format']} no es converteix")
+
+    return await asyncio.to_thread(book_converter.request, book["file_path"], book_id)
 
 
 @app.get("/api/books/{book_id}")
@@ -5812,7 +6060,7 @@ async def get_book_content(book_id: int):
         raise HTTPException(status_code=404, detail="Fitxer del llibre no trobat")
 
     if content_type == 'epub':
-        content = reader.get_epub_content(book_id)
+        content = await asyncio.to_thread(reader.get_epub_content, book_id)
         if content:
             return {"type": "epub", "content": content}
         else:
@@ -5827,14 +6075,26 @@ async def get_book_content(book_id: int):
                 }
             }
 
-    elif content_type == 'pdf':
-        return {"type": "pdf", "file_path": file_path}
-
-    # Formats MOBI/AZW - necessiten conversió o descàrrega directa
-    elif content_type in ['mobi', 'azw', 'azw3']:
+    elif content_type == 'pdf' or content_type in COMIC_FORMATS:
+        # Només l'índex de pàgines: el contingut es demana per rangs o pàgina a pàgina
+        try:
+            index = await asyncio.to_thread(page_index.get, book_id, file_path, content_type)
+        except (PagedDocumentError, OSError) as e:
+            logger.warning(f"No s'ha pogut indexar el llibre {book_id}: {e}")
+            index = {"page_count": None, "pages": []}
+        if content_type == 'pdf':
+            return {"type": "pdf", "file_path": file_path, "page_count": index["page_count"],
+                    "pages": [{"w": p["w"], "h": p["h"]} for p in index["pages"]]}
+        return {"type": "comic", "format": content_type, "page_count": index["page_count"],
+                "pages": [{"w": p["w"], "h": p["h"]} for p in index["pages"]]}
+
+    # Formats MOBI/AZW/FB2 sense convertir: passen davant de la cua de conversió
+    elif needs_conversion(content_type):
+        conversion = await asyncio.to_thread(book_converter.request, file_path, book_id)
         return {
             "type": content_type,
             "message": f"Format {content_type.upper()} - Necessita conversió a EPUB o descàrrega directa",
+            "conversion": conversion,
             "download_available": True,
             "book_info": {
                 "title": book_info.get("title"),
@@ -5845,23 +6105,70 @@ async def get_book_content(book_id: int):
     raise HTTPException(status_code=400, detail=f"Format {content_type} no suportat")
 
 
+def _epub_etag(book, *parts) -> str:
+    """ETag dels continguts d'un EPUB: només canvien si canvia el fitxer."""
+    return make_etag("epub", book.path, book.manifest.get("opf"), os.path.getmtime(book.path), *parts)
+
+
+@app.get("/api/books/{book_id}/toc")
+async def get_book_toc(book_id: int, request: Request):
+    """TOC lleuger d'un EPUB: títols, índexs de capítol i mida del spine"""
+    from backend.books.reader import BookReader
+
+    reader = BookReader()
+    book = await asyncio.to_thread(reader.get_epub_book, book_id)
+    if not book:
+        raise HTTPException(status_code=404, detail="EPUB no trobat")
+
+    headers = check_not_modified(request, _epub_etag(book, "toc"))
+    return FastJSONResponse(book.toc(), headers=headers)
+
+
+@app.get("/api/books/{book_id}/chapters/{index}")
+async def get_book_chapter(book_id: int, index: int, request: Request, background_tasks: BackgroundTasks):
+    """
+    Un capítol de l'EPUB netejat i amb els recursos reescrits.
+    Indica el capítol següent perquè el client el demani per avançat.
+    """
+    from backend.books.reader import BookReader
+
+    reader = BookReader()
+    book = await asyncio.to_thread(reader.get_epub_book, book_id)
+    if not book or not 0 <= index < len(book.spine):
+        raise HTTPException(status_code=404, detail="Capítol no trobat")
+
+    headers = check_not_modified(request, _epub_etag(book, "chapter", index), cache_control="private, max-age=86400")
+    chapter = await asyncio.to_thread(book.chapter, index, f"/api/books/{book_id}")
+
+    if chapter["next"] is not None:
+        headers["Link"] = f'</api/books/{book_id}/chapters/{chapter["next"]}>; rel=prefetch'
+        # El següent capítol queda processat al disc abans que el demanin
+        background_tasks.add_task(book.chapter, chapter["next"], f"/api/books/{book_id}")
+
+    return FastJSONResponse(chapter, headers=headers)
+
+
 @app.get("/api/books/{book_id}/resource/{resource_path:path}")
-async def get_book_resource(book_id: int, resource_path: str):
-    """Serveix un recurs d'un EPUB (HTML, CSS, imatges)"""
+async def get_book_resource(book_id: int, resource_path: str, request: Request):
+    """Serveix un recurs d'un EPUB (HTML, CSS, imatges) directament del zip"""
     from backend.books.reader import BookReader
 
     reader = BookReader()
-    content, mime_type = reader.get_epub_resource(book_id, resource_path)
+    book = await asyncio.to_thread(reader.get_epub_book, book_id)
+    name = book.find(resource_path) if book else None
 
-    if content is None:
+    if name is None:
         raise HTTPException(status_code=404, detail="Recurs no trobat")
 
-    return Response(content=content, media_type=mime_type)
+    # El contingut només canvia si canvia el fitxer del llibre
+    headers = check_not_modified(request, _epub_etag(book, name), cache_control="private, max-age=86400")
+    headers["Content-Length"] = str(book.resources[name]["size"])
+    return StreamingResponse(book.iter_resource(name), media_type=book.media_type(name), headers=headers)
 
 
 @app.get("/api/books/{book_id}/file")
-async def get_book_file(book_id: int):
-    """Serveix el fitxer del llibre directament (per PDF viewer)"""
+async def get_book_file(book_id: int, request: Request):
+    """Serveix el fitxer del llibre directament, amb suport de Range (per PDF viewer)"""
     from backend.books.reader import BookReader
 
     reader = BookReader()
@@ -5872,24 +6179,67 @@ async def get_book_file(book_id: int):
 
     file_path = book['file_path']
 
-    # Si és MOBI/AZW i tenim versió convertida, servir l'EPUB
-    if book['format'] in ['mobi', 'azw', 'azw3'] and book.get('converted_path'):
+    # Si és MOBI/AZW/FB2 i tenim versió convertida, servir l'EPUB
+    if needs_conversion(book['format']) and book.get('converted_path'):
         if os.path.exists(book['converted_path']):
             file_path = book['converted_path']
 
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="Fitxer no trobat")
 
-    return FileResponse(
-        path=file_path,
-        filename=os.path.basename(file_path),
-        media_type='application/octet-stream'
-    )
+    media_type = {
+        '.pdf': 'application/pdf',
+        '.epub': 'application/epub+zip',
+    }.get(os.path.splitext(file_path)[1].lower(), 'application/octet-stream')
+    return ranged_file_response(request, file_path, media_type=media_type, filename=os.path.basename(file_path))
+
+
+def _paged_book(book_id: int):
+    """(camí, format) d'un PDF o còmic, o 404."""
+    from backend.books.reader import BookReader
+
+    book = BookReader().get_book_info(book_id)
+    if not book or not is_paged(book['format']):
+        raise HTTPException(status_code=404, detail="Document paginat no trobat")
+    if not os.path.exists(book['file_path']):
+        raise HTTPException(status_code=404, detail="Fitxer no trobat")
+    return book['file_path'], book['format'].lower()
+
+
+@app.get("/api/books/{book_id}/pages")
+async def get_book_pages(book_id: int):
+    """Nombre de pàgines i mides de cada pàgina d'un PDF o còmic"""
+    file_path, format_type = _paged_book(book_id)
+    try:
+        index = await asyncio.to_thread(page_index.get, book_id, file_path, format_type)
+    except PagedDocumentError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {
+        "format": index["format"],
+        "page_count": index["page_count"],
+        "pages": [{"w": p["w"], "h": p["h"]} for p in index["pages"]],
+    }
+
+
+@app.get("/api/books/{book_id}/pages/{page}")
+async def get_book_page(book_id: int, page: int, request: Request, w: Optional[int] = None,
+                        fmt: Optional[str] = Query(None, alias="format")):
+    """
+    Una pàgina com a imatge: als còmics s'extreu només aquesta pàgina de
+    l'arxiu; als PDF es renderitza. Les dues queden al cache a disc.
+    """
+    file_path, format_type = _paged_book(book_id)
+    try:
+        path, media_type = await asyncio.to_thread(page_index.page_file, book_id, file_path, format_type, page)
+    except PagedDocumentError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return await image_response(request, path, media_type=media_type, width=w, fmt=fmt)
 
 
 @app.get("/api/books/{book_id}/cover")
-async def get_book_cover(book_id: int):
-    """Serveix la portada d'un llibre"""
+async def get_book_cover(book_id: int, request: Request, w: Optional[int] = None,
+                         fmt: Optional[str] = Query(None, alias="format")):
+    """Serveix la portada d'un llibre (redimensionada si es demana ?w=)"""
     from backend.books.reader import BookReader
 
     reader = BookReader()
@@ -5901,7 +6251,7 @@ async def get_book_cover(book_id: int):
     if not os.path.exists(book['cover']):
         raise HTTPException(status_code=404, detail="Fitxer de portada no trobat")
 
-    return FileResponse(path=book['cover'], media_type='image/jpeg')
+    return await image_response(request, book['cover'], media_type='image/jpeg', width=w, fmt=fmt)
 
 
 class ReadingProgressRequest(BaseModel):
@@ -5994,7 +6344,7 @@ async def get_audiobook_authors():
             FROM audiobook_authors a
             LEFT JOIN audiobooks ab ON a.id = ab.author_id
             GROUP BY a.id
-            ORDER BY a.name
+            ORDER BY a.sort_name
         """)
         authors = [dict(row) for row in cursor.fetchall()]
         return authors
@@ -6013,7 +6363,7 @@ async def get_audiobook_author_detail(author_id: int):
 
         cursor.execute("""
             SELECT * FROM audiobooks WHERE author_id = ?
-            ORDER BY title
+            ORDER BY sort_title
         """, (author_id,))
         audiobooks = [dict(row) for row in cursor.fetchall()]
 
@@ -6023,19 +6373,30 @@ async def get_audiobook_author_detail(author_id: int):
         }
 
 
-@app.get("/api/audiobooks")
-async def get_all_audiobooks():
-    """Retorna tots els audiollibres"""
+@app.get("/api/audiobooks", response_class=FastJSONResponse)
+async def get_all_audiobooks(fields: str = None, compact: bool = False):
+    """Retorna tots els audiollibres. fields: camps a retornar; compact: files en llistes"""
     with get_db() as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT ab.*, a.name as author_name
-            FROM audiobooks ab
-            LEFT JOIN audiobook_authors a ON ab.author_id = a.id
-            ORDER BY ab.title
-        """)
+        columns = {c: [f"ab.{c}"] for c in table_columns(cursor, "audiobooks")}
+        columns["author_name"] = ["a.name AS author_name"]
+        names = _list_fields(fields, columns)
+
+        if names is None:
+            select = "ab.*, a.name as author_name"
+        else:
+            select = select_list(names, columns)
+        if names is None or "author_name" in names:
+            cursor.execute(f"""
+                SELECT {select}
+                FROM audiobooks ab
+                LEFT JOIN audiobook_authors a ON ab.author_id = a.id
+                ORDER BY ab.sort_title
+            """)
+        else:
+            cursor.execute(f"SELECT {select} FROM audiobooks ab ORDER BY ab.sort_title")
         audiobooks = [dict(row) for row in cursor.fetchall()]
-        return audiobooks
+        return FastJSONResponse(project(audiobooks, names, compact, columns))
 
 
 @app.get("/api/audiobooks/{audiobook_id}")
@@ -6081,8 +6442,9 @@ async def get_audiobook_detail(audiobook_id: int, request: Request):
 
 
 @app.get("/api/audiobooks/{audiobook_id}/cover")
-async def get_audiobook_cover(audiobook_id: int):
-    """Serveix la portada d'un audiollibres"""
+async def get_audiobook_cover(audiobook_id: int, request: Request, w: Optional[int] = None,
+                              fmt: Optional[str] = Query(None, alias="format")):
+    """Serveix la portada d'un audiollibres (redimensionada si es demana ?w=)"""
     with get_db() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT cover FROM audiobooks WHERE id = ?", (audiobook_id,))
@@ -6094,7 +6456,7 @@ async def get_audiobook_cover(audiobook_id: int):
         if not os.path.exists(audiobook['cover']):
             raise HTTPException(status_code=404, detail="Fitxer de portada no trobat")
 
-        return FileResponse(path=audiobook['cover'], media_type='image/jpeg')
+    return await image_response(request, audiobook['cover'], media_type='image/jpeg', width=w, fmt=fmt)
 
 
 @app.get("/api/audiobooks/{audiobook_id}/files/{file_id}/stream")
@@ -6111,74 +6473,166 @@ async def stream_audiobook_file(audiobook_id: int, file_id: int, request: Reques
         if not file_info:
             raise HTTPException(status_code=404, detail="Fitxer no trobat")
 
-        file_path = file_info['file_path']
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="Fitxer d'àudio no trobat")
-
-        file_size = os.path.getsize(file_path)
-
-        # Determinar mime type
-        ext = file_info['format'].lower()
-        mime_types = {
-            'mp3': 'audio/mpeg',
-            'm4a': 'audio/mp4',
-            'm4b': 'audio/mp4',
-            'ogg': 'audio/ogg',
-            'flac': 'audio/flac',
-            'opus': 'audio/opus',
-            'aac': 'audio/aac'
-        }
-        mime_type = mime_types.get(ext, 'audio/mpeg')
+    file_path = file_info['file_path']
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="Fitxer d'àudio no trobat")
 
-        # Range request support
-        range_header = request.headers.get('range')
-        if range_header:
-            range_match = range_header.replace('bytes=', '').split('-')
-            start = int(range_match[0]) if range_match[0] else 0
-            end = int(range_match[1]) if len(range_match) > 1 and range_match[1] else file_size - 1
+    return ranged_file_response(request, file_path, media_type=audio_type(file_info['format']))
 
-            if start >= file_size:
-                raise HTTPException(status_code=416, detail="Range not satisfiable")
 
-            chunk_size = end - start + 1
+async def _audiobook_timeline(audiobook_id: int) -> Dict:
+    try:
+        return await asyncio.to_thread(audiobook_streams.timeline, audiobook_id)
+    except AudiobookStreamError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@app.get("/api/audiobooks/{audiobook_id}/timeline")
+async def get_audiobook_timeline(audiobook_id: int, request: Request):
+    """
+    Línia de temps de l'audiollibres: fitxers amb el seu inici dins del
+    llibre, mapa de capítols i URL del stream continu (concatenat o HLS).
+    """
+    timeline = await _audiobook_timeline(audiobook_id)
+    headers = check_not_modified(request, make_etag("audiobook-timeline", audiobook_id, timeline["signature"]))
+    base = f"/api/audiobooks/{audiobook_id}"
+    return FastJSONResponse({
+        "audiobook_id": audiobook_id,
+        "duration": timeline["duration"],
+        "mode": timeline["mode"],
+        "stream_url": f"{base}/stream" if timeline["mode"] == "concat" else f"{base}/hls/playlist.m3u8",
+        "hls_url": f"{base}/hls/master.m3u8",
+        "profiles": available_profiles(),
+        "files": [
+            {key: entry[key] for key in ("file_id", "title", "format", "start", "duration")}
+            for entry in timeline["files"]
+        ],
+        "chapters": timeline["chapters"],
+    }, headers=headers)
+
+
+@app.get("/api/audiobooks/{audiobook_id}/stream")
+async def stream_audiobook(audiobook_id: int, request: Request):
+    """
+    Tot l'audiollibres com un sol fitxer (MP3/AAC homogenis concatenats),
+    amb Range sobre el llibre sencer.
+    """
+    timeline = await _audiobook_timeline(audiobook_id)
+    if timeline["mode"] != "concat":
+        raise HTTPException(status_code=409, detail="Fitxers heterogenis: utilitza la playlist HLS")
+
+    size = timeline["size"]
+    etag = make_etag("audiobook-stream", audiobook_id, timeline["signature"])
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, max-age=86400",
+        "Accept-Ranges": "bytes",
+        "X-Content-Duration": f"{timeline['duration']:.3f}",
+    }
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and if_range and if_range.strip() != etag:
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
 
-            def iterfile():
-                with open(file_path, 'rb') as f:
-                    f.seek(start)
-                    remaining = chunk_size
-                    while remaining > 0:
-                        read_size = min(8192, remaining)
-                        data = f.read(read_size)
-                        if not data:
-                            break
-                        remaining -= len(data)
-                        yield data
-
-            headers = {
-                'Content-Range': f'bytes {start}-{end}/{file_size}',
-                'Accept-Ranges': 'bytes',
-                'Content-Length': str(chunk_size),
-                'Content-Type': mime_type
-            }
+    if byte_range is None:
+        start, end, status = 0, size - 1, 200
+    else:
+        (start, end), status = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(iter_concat(timeline, start, end), status_code=status,
+                             media_type=timeline["media_type"], headers=headers)
+
+
+@app.get("/api/audiobooks/{audiobook_id}/hls/master.m3u8")
+async def audiobook_hls_master(audiobook_id: int, request: Request):
+    """Playlist mestra amb tots els perfils (el reproductor tria per ample de banda)"""
+    timeline = await _audiobook_timeline(audiobook_id)
+    headers = check_not_modified(request, make_etag("audiobook-hls-master", audiobook_id, timeline["signature"],
+                                                    *available_profiles()))
+    playlist = hls_master_playlist(timeline, f"/api/audiobooks/{audiobook_id}/hls")
+    return Response(playlist, media_type="application/vnd.apple.mpegurl", headers=headers)
+
+
+@app.get("/api/audiobooks/{audiobook_id}/hls/playlist.m3u8")
+async def audiobook_hls_playlist(
+    audiobook_id: int,
+    request: Request,
+    profile: Optional[str] = Query(None, description="Perfil: source, aac-64, opus-48, opus-32"),
+    bandwidth: Optional[float] = Query(None, description="Ample de banda disponible en kbps"),
+    codecs: Optional[str] = Query(None, description="Codecs que admet el client (ex: opus,aac)"),
+):
+    """
+    Playlist HLS d'àudio de tot el llibre en el perfil negociat: el demanat,
+    o segons l'ample de banda (paràmetre, capçalera Downlink o Save-Data)
+    i els codecs que admet el client.
+    """
+    if bandwidth is None and request.headers.get("downlink"):
+        try:
+            bandwidth = float(request.headers["downlink"]) * 1000  # Mbps
+        except ValueError:
+            pass
+    chosen = negotiate_profile(
+        profile,
+        [c.strip().lower() for c in codecs.split(",")] if codecs else None,
+        bandwidth,
+        request.headers.get("save-data", "").lower() == "on",
+    )
+    response = await audiobook_hls_profile_playlist(audiobook_id, chosen, request)
+    response.headers["Vary"] = "Save-Data, Downlink"
+    return response
 
-            return StreamingResponse(
-                iterfile(),
-                status_code=206,
-                headers=headers,
-                media_type=mime_type
-            )
 
-        # Full file
-        return FileResponse(
-            path=file_path,
-            media_type=mime_type,
-            headers={'Accept-Ranges': 'bytes'}
-        )
+@app.get("/api/audiobooks/{audiobook_id}/hls/{profile}/playlist.m3u8")
+async def audiobook_hls_profile_playlist(audiobook_id: int, profile: str, request: Request):
+    """Playlist HLS d'àudio d'un perfil concret (segments generats a demanda)"""
+    if profile not in AUDIO_PROFILES:
+        raise HTTPException(status_code=404, detail="Perfil desconegut")
+    timeline = await _audiobook_timeline(audiobook_id)
+    headers = check_not_modified(request, make_etag("audiobook-hls", audiobook_id, profile, timeline["signature"]))
+    headers["X-Audio-Profile"] = profile
+    playlist = hls_playlist(timeline, f"/api/audiobooks/{audiobook_id}/hls", profile)
+    return Response(playlist, media_type="application/vnd.apple.mpegurl", headers=headers)
+
+
+@app.get("/api/audiobooks/{audiobook_id}/hls/{profile}/{file_id}/{name}")
+async def audiobook_hls_segment(audiobook_id: int, profile: str, file_id: int, name: str, request: Request):
+    """
+    Segment de l'audiollibres (MPEG-TS, o fMP4 amb init.mp4 per a Opus).
+    Cada ffmpeg ocupa una plaça del límit compartit amb les miniatures,
+    amb prioritat sobre les tandes.
+    """
+    if not FFMPEG_AVAILABLE:
+        raise HTTPException(status_code=503, detail="FFmpeg no disponible")
+    if profile not in available_profiles():
+        raise HTTPException(status_code=404, detail="Perfil no disponible")
+
+    stem, _, ext = name.partition(".")
+    fmp4 = AUDIO_PROFILES[profile]["container"] == "fmp4"
+    try:
+        if name == "init.mp4" and fmp4:
+            path = await asyncio.to_thread(audiobook_streams.init_file, audiobook_id, file_id, profile)
+            media_type = "audio/mp4"
+        elif stem.isdigit() and ext == ("m4s" if fmp4 else "ts"):
+            path = await asyncio.to_thread(audiobook_streams.segment_file,
+                                           audiobook_id, file_id, int(stem), profile)
+            media_type = "audio/mp4" if fmp4 else "video/mp2t"
+        else:
+            raise HTTPException(status_code=404, detail="Segment no trobat")
+    except AudiobookStreamError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return file_response(request, path, media_type=media_type)
 
 
 class AudiobookProgressRequest(BaseModel):
-    file_id: int
+    file_id: Optional[int] = None
     position: int = 0
+    # Posició dins del llibre sencer (stream continu); té prioritat sobre file_id/position
+    book_position: Optional[float] = None
 
 
 @app.post("/api/audiobooks/{audiobook_id}/progress")
@@ -6187,6 +6641,13 @@ async def update_audiobook_progress(audiobook_id: int, progress: AudiobookProgre
     user = get_current_user(request)
     user_id = user["id"] if user else 1
 
+    if progress.book_position is not None:
+        timeline = await _audiobook_timeline(audiobook_id)
+        entry, offset = locate(timeline, progress.book_position)
+        progress.file_id, progress.position = entry["file_id"], int(offset)
+    elif progress.file_id is None:
+        raise HTTPException(status_code=422, detail="Cal file_id o book_position")
+
     with get_db() as conn:
         cursor = conn.cursor()
 
@@ -7719,9 +8180,7 @@ async def update_audiobook_by_search_result(audiobook_id: int, cover_id: int = Q
 # THUMBNAILS PER EPISODIS
 # ============================================================
 
-import subprocess
-
-THUMBNAILS_DIR = settings.METADATA_DIR / "thumbnails"
+THUMBNAILS_DIR = thumbnail_store.root
 THUMBNAILS_DIR.mkdir(parents=True, exist_ok=True)
 
 # Estat global per seguiment de progrés
@@ -7731,6 +8190,7 @@ thumbnail_progress = {
     "total": 0,
     "generated": 0,
     "errors": 0,
+    "skipped": 0,
     "status": "idle"  # idle, deleting, generating, completed
 }
 
@@ -7741,171 +8201,146 @@ async def get_thumbnail_progress():
     return thumbnail_progress
 
 
-def generate_thumbnail(video_path: Path, output_path: Path, time_percent: int = 20) -> bool:
-    """
-    Genera un thumbnail d'un vídeo a un percentatge específic de la durada.
-
-    Args:
-        video_path: Path al fitxer de vídeo
-        output_path: Path on guardar el thumbnail
-        time_percent: Percentatge de la durada del vídeo (per defecte 20%)
-
-    Returns:
-        True si s'ha generat correctament
-    """
-    try:
-        # Primer obtenim la durada del vídeo
-        probe_cmd = [
-            'ffprobe', '-v', 'error', '-show_entries', 'format=duration',
-            '-of', 'default=noprint_wrappers=1:nokey=1', str(video_path)
-        ]
-        result = subprocess.run(probe_cmd, capture_output=True, text=True, timeout=30)
-        duration = float(result.stdout.strip())
-
-        # Calculem el temps on extreure el frame
-        seek_time = (duration * time_percent) / 100
-
-        # Generem el thumbnail
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-
-        cmd = [
-            'ffmpeg', '-y',
-            '-ss', str(seek_time),
-            '-i', str(video_path),
-            '-vframes', '1',
-            '-q:v', '3',
-            '-vf', 'scale=480:-1',
-            str(output_path)
-        ]
+def _media_video_path(media_id: int) -> Path:
+    """Camí del vídeo d'un media_file (404 si no existeix)."""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT file_path FROM media_files WHERE id = ?", (media_id,))
+        result = cursor.fetchone()
 
-        subprocess.run(cmd, capture_output=True, timeout=60)
-        return output_path.exists()
+    if not result:
+        raise HTTPException(status_code=404, detail="Media no trobat")
 
-    except Exception as e:
-        logger.error(f"Error generant thumbnail: {e}")
-        return False
+    video_path = Path(result["file_path"])
+    if not video_path.exists():
+        raise HTTPException(status_code=404, detail="Fitxer no existeix")
+    return video_path
 
 
 @app.get("/api/media/{media_id}/thumbnail")
-async def get_media_thumbnail(media_id: int):
+async def get_media_thumbnail(media_id: int, request: Request):
     """Retorna el thumbnail d'un episodi/pel·lícula"""
-    thumbnail_path = THUMBNAILS_DIR / f"{media_id}.jpg"
+    thumbnail_path = thumbnail_store.poster_path(media_id)
 
-    # Si existeix, retornar-lo
-    if thumbnail_path.exists():
-        return FileResponse(thumbnail_path, media_type="image/jpeg")
+    # Si no existeix, generar-lo al pool (sense bloquejar el bucle d'esdeveniments)
+    if thumbnail_path is None:
+        video_path = _media_video_path(media_id)
+        thumbnail_path = await thumbnail_pool.run(
+            f"poster:{media_id}", thumbnail_store.generate_poster, media_id, video_path
+        )
+        if thumbnail_path is None:
+            raise HTTPException(status_code=500, detail="Error generant thumbnail")
 
-    # Si no existeix, intentar generar-lo
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT file_path FROM media_files WHERE id = ?", (media_id,))
-        result = cursor.fetchone()
+    media_type = "image/webp" if thumbnail_path.suffix == ".webp" else "image/jpeg"
+    return file_response(request, thumbnail_path, media_type=media_type)
 
-        if not result:
-            raise HTTPException(status_code=404, detail="Media no trobat")
 
-        video_path = Path(result["file_path"])
-        if not video_path.exists():
-            raise HTTPException(status_code=404, detail="Fitxer no existeix")
+@app.get("/api/media/{media_id}/trickplay.vtt")
+async def get_media_trickplay(media_id: int, request: Request):
+    """
+    Índex WebVTT de les miniatures per al seek. Si encara no existeix,
+    es posa a la cua i es respon 202.
+    """
+    vtt_path = thumbnail_store.trickplay_vtt(media_id)
+    if vtt_path is None:
+        video_path = _media_video_path(media_id)
+        thumbnail_pool.submit(f"trickplay:{media_id}", thumbnail_store.generate_trickplay, media_id, video_path)
+        return Response(status_code=202, headers={"Retry-After": "30"})
+    return file_response(request, vtt_path, media_type="text/vtt")
 
-        # Generar thumbnail
-        if generate_thumbnail(video_path, thumbnail_path):
-            return FileResponse(thumbnail_path, media_type="image/jpeg")
-        else:
-            raise HTTPException(status_code=500, detail="Error generant thumbnail")
 
+@app.get("/api/media/{media_id}/trickplay/{name}")
+async def get_media_trickplay_sheet(media_id: int, name: str, request: Request):
+    """Full de sprites del trickplay"""
+    sheet_path = thumbnail_store.trickplay_sheet(media_id, name)
+    if sheet_path is None:
+        raise HTTPException(status_code=404, detail="Full no trobat")
+    return file_response(request, sheet_path, media_type="image/webp")
 
-@app.post("/api/thumbnails/generate-all")
-async def generate_all_thumbnails():
-    """Genera thumbnails per tots els episodis/pel·lícules que no en tinguin"""
-    generated = 0
-    errors = 0
-    skipped = 0
 
+def _run_thumbnail_batch(force: bool, trickplay: bool):
+    """Genera les miniatures de tota la biblioteca al pool, actualitzant el progrés."""
     with get_db() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT id, file_path FROM media_files")
+        rows = cursor.fetchall()
 
-        for row in cursor.fetchall():
-            thumbnail_path = THUMBNAILS_DIR / f"{row['id']}.jpg"
+    total = len(rows)
+    thumbnail_progress["total"] = total
+    thumbnail_progress["status"] = "generating"
+    logger.info(f"Iniciant generació de {total} thumbnails ({thumbnail_pool.workers} processos)...")
 
-            if thumbnail_path.exists():
-                skipped += 1
+    def jobs():
+        for row in rows:
+            thumbnail_progress["current"] += 1
+            video_path = Path(row["file_path"]) if row["file_path"] else None
+            if not video_path or not video_path.exists():
+                thumbnail_progress["errors"] += 1
                 continue
-
-            video_path = Path(row["file_path"])
-            if not video_path.exists():
-                errors += 1
+            # Vídeo sense canvis des de l'última generació
+            if not force and thumbnail_store.is_complete(row["id"], video_path, trickplay):
+                thumbnail_progress["skipped"] += 1
                 continue
+            yield f"batch:{row['id']}", thumbnail_store.generate, (row["id"], video_path, force, trickplay)
 
-            if generate_thumbnail(video_path, thumbnail_path):
-                generated += 1
-            else:
-                errors += 1
-
-    logger.info(f"Thumbnails generats: {generated}, errors: {errors}, omesos: {skipped}")
-    return {"status": "success", "generated": generated, "errors": errors, "skipped": skipped}
+    def on_done(key: str, success: bool):
+        thumbnail_progress["generated" if success else "errors"] += 1
+        if success and thumbnail_progress["generated"] % 50 == 0:
+            logger.info(f"[{thumbnail_progress['current']}/{total}] Progrés: {thumbnail_progress['generated']} generades, {thumbnail_progress['errors']} errors")
 
+    try:
+        thumbnail_pool.run_batch(jobs(), on_done)
+    finally:
+        thumbnail_progress["status"] = "completed"
+        thumbnail_progress["active"] = False
 
-@app.post("/api/thumbnails/regenerate-all")
-async def regenerate_all_thumbnails():
-    """Esborra i regenera TOTS els thumbnails"""
-    global thumbnail_progress
-
-    # Inicialitzar progrés
-    thumbnail_progress["active"] = True
-    thumbnail_progress["status"] = "deleting"
-    thumbnail_progress["current"] = 0
-    thumbnail_progress["total"] = 0
-    thumbnail_progress["generated"] = 0
-    thumbnail_progress["errors"] = 0
-
-    # Esborrar tots els thumbnails existents
-    deleted = 0
-    if THUMBNAILS_DIR.exists():
-        for thumb in THUMBNAILS_DIR.glob("*.jpg"):
-            try:
-                thumb.unlink()
-                deleted += 1
-            except Exception as e:
-                logger.error(f"Error esborrant thumbnail {thumb}: {e}")
+    logger.info(f"COMPLETAT: {thumbnail_progress['generated']} thumbnails generats, "
+                f"{thumbnail_progress['errors']} errors, {thumbnail_progress['skipped']} omesos")
 
-    logger.info(f"Thumbnails esborrats: {deleted}")
 
-    # Regenerar tots
-    thumbnail_progress["status"] = "generating"
+def _start_thumbnail_batch(force: bool) -> bool:
+    """Inicialitza el progrés i programa la tanda. False si ja n'hi ha una en curs."""
+    if thumbnail_progress["active"]:
+        return False
+    thumbnail_progress.update({
+        "active": True, "status": "deleting" if force else "generating",
+        "current": 0, "total": 0, "generated": 0, "errors": 0, "skipped": 0,
+    })
+    return True
 
-    with get_db() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, file_path FROM media_files")
-        rows = cursor.fetchall()
-        total = len(rows)
-        thumbnail_progress["total"] = total
 
-        logger.info(f"Iniciant generació de {total} thumbnails...")
+@app.post("/api/thumbnails/generate-all")
+async def generate_all_thumbnails(background_tasks: BackgroundTasks, trickplay: bool = True):
+    """
+    Genera en segon pla thumbnails (i trickplay) per tots els episodis/pel·lícules
+    que no en tinguin o que hagin canviat.
 
-        for i, row in enumerate(rows, 1):
-            thumbnail_progress["current"] = i
-            thumbnail_path = THUMBNAILS_DIR / f"{row['id']}.jpg"
-            video_path = Path(row["file_path"])
+    Retorna de seguida {"status": "started"} (o "already_running" amb el
+    progrés actual), no el resultat: els comptadors generated/errors/skipped
+    es consulten a /api/thumbnails/progress.
+    """
+    if not _start_thumbnail_batch(force=False):
+        return {"status": "already_running", "progress": thumbnail_progress}
+    background_tasks.add_task(_run_thumbnail_batch, False, trickplay)
+    return {"status": "started"}
 
-            if not video_path.exists():
-                thumbnail_progress["errors"] += 1
-                logger.warning(f"[{i}/{total}] Fitxer no existeix: {video_path.name}")
-                continue
 
-            if generate_thumbnail(video_path, thumbnail_path):
-                thumbnail_progress["generated"] += 1
-                if thumbnail_progress["generated"] % 50 == 0 or i == total:
-                    logger.info(f"[{i}/{total}] Progrés: {thumbnail_progress['generated']} generades, {thumbnail_progress['errors']} errors")
-            else:
-                thumbnail_progress["errors"] += 1
+@app.post("/api/thumbnails/regenerate-all")
+async def regenerate_all_thumbnails(background_tasks: BackgroundTasks, trickplay: bool = True):
+    """
+    Esborra i regenera TOTS els thumbnails en segon pla.
+    Retorna {"status": "started", "deleted": n}; el progrés es consulta a
+    /api/thumbnails/progress.
+    """
+    if not _start_thumbnail_batch(force=True):
+        return {"status": "already_running", "progress": thumbnail_progress}
 
-    thumbnail_progress["status"] = "completed"
-    thumbnail_progress["active"] = False
+    # Esborrar tots els thumbnails existents
+    deleted = await asyncio.to_thread(thumbnail_store.clear)
+    logger.info(f"Thumbnails esborrats: {deleted}")
 
-    logger.info(f"COMPLETAT: {thumbnail_progress['generated']} thumbnails regenerats, {thumbnail_progress['errors']} errors")
-    return {"status": "success", "deleted": deleted, "generated": thumbnail_progress["generated"], "errors": thumbnail_progress["errors"]}
+    background_tasks.add_task(_run_thumbnail_batch, True, trickplay)
+    return {"status": "started", "deleted": deleted}
 
 
 # ============================================================
@@ -9933,17 +10368,19 @@ async def search_anime(q: str, source: str = None):
     - henaojara: HenaoJara (espanyol latino)
     - fansubscat: Fansubs.cat (català)
 
-    Si no s'especifica source, cerca a totes les fonts.
+    Si no s'especifica source, cerca a totes les fonts en paral·lel amb un
+    temps límit global; les fonts lentes o caigudes surten a "sources" amb
+    status timeout, error o skipped i la resposta es marca com a parcial.
     """
     try:
         if source:
             results = await anime_manager.search(q, source)
         else:
-            all_results = await anime_manager.search_all(q)
-            # Organitzar per font
+            # Totes les fonts alhora: el que arribi abans del límit, amb l'estat de cada font
+            detailed = await anime_manager.search_detailed(q)
             return {
                 "query": q,
-                "results": all_results
+                **detailed
             }
 
         return {
@@ -9984,7 +10421,8 @@ async def get_anime_sources():
                 "language_name": "Català",
                 "description": "Anime amb subtítols en català"
             }
-        ]
+        ],
+        "health": anime_manager.health()
     }
 
 
@@ -10785,6 +11223,10 @@ async def daily_sync_job():
         bbc_episodes = bbc_result.get('imported_episodes', 0)
         logger.info(f"BBC: {bbc_films} pel·lícules, {bbc_series} sèries, {bbc_episodes} episodis")
 
+        # Còpia local de l'artwork del contingut importat
+        artwork_added = await artwork_mirror.mirror_library_async()
+        logger.info(f"Artwork: {artwork_added} imatges noves a la cua")
+
         elapsed = (datetime.now() - start_time).total_seconds()
         logger.info(f"=== FI SINCRONITZACIÓ DIÀRIA: {total_imported} items, {titles_fixed} títols corregits, {seasons_cached} temporades cachejades, BBC: {bbc_films}+{bbc_series} en {elapsed:.1f}s ===")
 
@@ -10842,10 +11284,13 @@ async def get_cache_stats(request: Request):
     if not user or not user.get("is_admin"):
         raise HTTPException(status_code=403, detail="Accés només per administradors")
 
+    from backend.auth import get_auth_manager
+
     return {
         "tmdb_cache": tmdb_cache.stats,
         "torrents_cache": torrents_cache.stats,
         "stream_url_cache": stream_url_cache.stats,
+        "token_cache": get_auth_manager().token_cache.stats,
     }
 
 
@@ -10856,9 +11301,12 @@ async def clear_all_caches(request: Request):
     if not user or not user.get("is_admin"):
         raise HTTPException(status_code=403, detail="Accés només per administradors")
 
+    from backend.auth import get_auth_manager
+
     tmdb_cache.clear()
     torrents_cache.clear()
     stream_url_cache.clear()
+    get_auth_manager().token_cache.clear()
 
     return {"status": "success", "message": "Tots els caches netejats"}
 
@@ -11248,7 +11696,8 @@ async def get_debrid_stream(
     magnet: str = Query(..., description="Magnet link complet"),
     file_idx: Optional[int] = Query(None, description="Índex del fitxer (per season packs)"),
     season: Optional[int] = Query(None, description="Número de temporada (per sèries)"),
-    episode: Optional[int] = Query(None, description="Número d'episodi (per sèries)")
+    episode: Optional[int] = Query(None, description="Número d'episodi (per sèries)"),
+    tmdb_id: Optional[int] = Query(None, description="ID de TMDB (per preparar el següent episodi)")
 ):
     """
     Obtenir URL de streaming directa de Real-Debrid
@@ -11259,29 +11708,40 @@ async def get_debrid_stream(
     # Crear clau de cache única (hash + season + episode per assegurar correcte)
     cache_key = f"stream_{info_hash}_s{season}_e{episode}" if season and episode else f"stream_{info_hash}_{file_idx if file_idx is not None else 'auto'}"
 
+    from backend.debrid.rd_session import file_key
+    from backend.streaming.range_cache import range_cache
+    range_key = f"{info_hash.lower()}:{file_key(file_idx, season, episode)}"
+
+    if tmdb_id and season and episode:
+        prefetcher.remember(tmdb_id, "rd", info_hash=info_hash, magnet=magnet, season=season)
+
     # Comprovar cache primer (instantani!)
     cached_result = stream_url_cache.get(cache_key)
     if cached_result:
         logger.info(f"[StreamCache] Hit per {info_hash[:8]}... (instantani)")
+        range_cache.register(cached_result["original_url"], range_key)
         return cached_result
 
     rd_api_key = get_rd_api_key()
     if not rd_api_key:
         raise HTTPException(status_code=400, detail="Real-Debrid no configurat")
 
-    from backend.debrid import RealDebridClient
+    from backend.debrid.rd_session import get_rd_session
     from backend.debrid.realdebrid import RealDebridError
 
-    client = RealDebridClient(rd_api_key)
+    # La sessió reutilitza torrents i links ja presents al compte
+    session = get_rd_session(rd_api_key)
 
     try:
-        result = await client.get_streaming_url(magnet, file_idx=file_idx, season=season, episode=episode)
+        result = await session.get_stream(info_hash, magnet, file_idx=file_idx, season=season, episode=episode)
         if not result:
             raise HTTPException(status_code=500, detail="No s'ha pogut obtenir URL de streaming")
 
-        # Crear URL proxiejada per evitar CORS
+        # Crear URL proxiejada per evitar CORS. El link queda associat al fitxer
+        # del torrent: els links nous del mateix fitxer comparteixen el cache de rangs
         from urllib.parse import quote
         original_url = result["url"]
+        range_cache.register(original_url, range_key)
         proxied_url = f"/api/video/proxy?url={quote(original_url, safe='')}"
 
         response = {
@@ -11365,11 +11825,11 @@ async def proxy_video_stream(
     Proxy per streaming de vídeo (Real-Debrid, etc.)
 
     Això permet reproduir vídeos de Real-Debrid evitant problemes de CORS.
-    Suporta range requests per a seeking.
+    Suporta range requests per a seeking. Els rangs ja descarregats es
+    serveixen des del cache de disc.
     """
-    import httpx
     from starlette.responses import StreamingResponse
-    from starlette.background import BackgroundTask
+    from backend.streaming.range_cache import UpstreamError, range_cache
 
     # Validar que la URL sigui de Real-Debrid (seguretat)
     allowed_domains = [
@@ -11385,61 +11845,54 @@ async def proxy_video_stream(
 
     # Obtenir headers de range del client (per seeking)
     range_header = request.headers.get("range")
+    # La clau del cache la decideix el servidor (link resolt per /api/debrid/stream)
+    entry_key = range_cache.key_for(url)
 
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-    }
-
-    if range_header:
-        headers["Range"] = range_header
+    try:
+        entry = await range_cache.open(url, entry_key)
+    except UpstreamError as e:
+        status = e.status_code if 400 <= e.status_code < 500 else 502
+        raise HTTPException(status_code=status, detail="El servidor de vídeo ha rebutjat la petició")
+    except httpx.RequestError as e:
+        logger.error(f"Error proxy vídeo: {e}")
+        raise HTTPException(status_code=502, detail="Error connectant amb el servidor de vídeo")
 
     try:
-        # Crear client SENSE context manager per mantenir-lo obert durant streaming
-        client = httpx.AsyncClient(timeout=None, follow_redirects=True)
-        response = await client.send(
-            client.build_request("GET", url, headers=headers),
-            stream=True
+        byte_range = parse_range(range_header, entry.size)
+    except ValueError:
+        raise HTTPException(
+            status_code=416,
+            headers={"Content-Range": f"bytes */{entry.size}"}
         )
+    start, end = byte_range if byte_range else (0, entry.size - 1)
+
+    # Headers de resposta
+    response_headers = {
+        "Access-Control-Allow-Origin": "*",
+        "Access-Control-Allow-Methods": "GET, HEAD, OPTIONS",
+        "Access-Control-Allow-Headers": "Range",
+        "Access-Control-Expose-Headers": "Content-Length, Content-Range, Accept-Ranges",
+        "Accept-Ranges": "bytes",
+        "Content-Type": entry.content_type,
+        "Content-Length": str(end - start + 1),
+    }
+    if byte_range:
+        response_headers["Content-Range"] = f"bytes {start}-{end}/{entry.size}"
 
-        # Headers de resposta
-        response_headers = {
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Methods": "GET, HEAD, OPTIONS",
-            "Access-Control-Allow-Headers": "Range",
-            "Access-Control-Expose-Headers": "Content-Length, Content-Range, Accept-Ranges",
-            "Accept-Ranges": "bytes",
-        }
-
-        # Copiar headers rellevants de Real-Debrid
-        if "content-type" in response.headers:
-            response_headers["Content-Type"] = response.headers["content-type"]
-        if "content-length" in response.headers:
-            response_headers["Content-Length"] = response.headers["content-length"]
-        if "content-range" in response.headers:
-            response_headers["Content-Range"] = response.headers["content-range"]
-
-        # Funció generadora per streaming
-        async def stream_content():
-            try:
-                async for chunk in response.aiter_bytes(chunk_size=1024 * 1024):  # 1MB chunks
-                    yield chunk
-            finally:
-                await response.aclose()
-                await client.aclose()
-
-        return StreamingResponse(
-            stream_content(),
-            status_code=response.status_code,
-            headers=response_headers,
-            media_type=response_headers.get("Content-Type", "video/mp4")
-        )
+    async def stream_content():
+        try:
+            async for chunk in range_cache.stream(url, entry_key, entry, start, end):
+                yield chunk
+        except (UpstreamError, httpx.HTTPError) as e:
+            # Ja s'han enviat les capçaleres: només es pot tallar la resposta
+            logger.error(f"Error proxy vídeo a mig stream: {e}")
 
-    except httpx.RequestError as e:
-        logger.error(f"Error proxy vídeo: {e}")
-        raise HTTPException(status_code=502, detail="Error connectant amb el servidor de vídeo")
-    except Exception as e:
-        logger.error(f"Error inesperat proxy vídeo: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return StreamingResponse(
+        stream_content(),
+        status_code=206 if byte_range else 200,
+        headers=response_headers,
+        media_type=entry.content_type
+    )
 
 
 @app.options("/api/video/proxy")
@@ -12607,6 +13060,7 @@ async def get_bbc_episode_stream(
 
     client = BBCiPlayerClient()
     quality_param = "1080" if quality == "1080p" else "best"
+    prefetcher.remember(tmdb_id, "bbc", episode=episode, content_type=content_type, quality=quality_param)
 
     stream_info = await client.get_stream_info(programme_id, quality=quality_param)
 
@@ -14019,6 +14473,21 @@ async def search_subtitles(
         episode: Número d'episodi (per sèries)
         languages: Idiomes a buscar (per defecte: ca,es,en)
     """
+    try:
+        return await _search_subtitles(media_type, tmdb_id, season, episode, languages)
+    except Exception as e:
+        logger.error(f"Error cercant subtítols: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _search_subtitles(media_type: str, tmdb_id: int, season: Optional[int],
+                            episode: Optional[int], languages: str) -> dict:
+    """Cerca de subtítols amb cache (també l'omple el prefetch)."""
+    cache_key = f"{media_type}:{tmdb_id}:{season}:{episode}:{languages}"
+    cached = subtitles_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
     client = get_subtitle_client()
 
     # Obtenir l'IMDB ID des del TMDB
@@ -14042,23 +14511,21 @@ async def search_subtitles(
     # Parsejar idiomes
     lang_list = [l.strip() for l in languages.split(",") if l.strip()]
 
-    try:
-        subtitles = await client.search_subtitles(
-            imdb_id=imdb_id,
-            tmdb_id=tmdb_id if not imdb_id else None,
-            season=season if media_type == "tv" else None,
-            episode=episode if media_type == "tv" else None,
-            languages=lang_list
-        )
-
-        return {
-            "subtitles": [s.to_dict() for s in subtitles[:20]],
-            "total": len(subtitles)
-        }
+    subtitles = await client.search_subtitles(
+        imdb_id=imdb_id,
+        tmdb_id=tmdb_id if not imdb_id else None,
+        season=season if media_type == "tv" else None,
+        episode=episode if media_type == "tv" else None,
+        languages=lang_list
+    )
 
-    except Exception as e:
-        logger.error(f"Error cercant subtítols: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    result = {
+        "subtitles": [s.to_dict() for s in subtitles[:20]],
+        "total": len(subtitles)
+    }
+    if subtitles:
+        subtitles_cache.set(cache_key, result)
+    return result
 
 
 @app.get("/api/subtitles/download/{file_id}")
@@ -14296,6 +14763,14 @@ async def stream_3cat_video(
     )
 
 
+# === FRONTEND ===
+# Muntat al final perquè les rutes /api tinguin prioritat
+frontend_files = None
+if (settings.FRONTEND_BUILD_DIR / "index.html").exists():
+    frontend_files = PrecompressedStaticFiles(directory=settings.FRONTEND_BUILD_DIR, html=True)
+    app.mount("/", frontend_files, name="frontend")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
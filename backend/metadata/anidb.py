@@ -8,18 +8,242 @@ import asyncio
 import gzip
 import json
 import logging
+import os
 import re
+import sqlite3
+import threading
 import time
+import unicodedata
 import xml.etree.ElementTree as ET
 from io import BytesIO
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, Iterable, Iterator, List, Tuple
 from urllib.request import urlopen, Request
 from urllib.error import URLError, HTTPError
 
 logger = logging.getLogger(__name__)
 
 
+# ---------- Índex de títols ----------
+#
+# El dump (uns 60k anime amb diversos títols cadascun) es desa en una base
+# SQLite pròpia al directori de cache: una fila per títol amb la forma
+# normalitzada indexada (exacte i prefix) i una taula FTS5 amb tokenitzador
+# trigram (subcadenes i cerca aproximada). Es reconstrueix només quan es
+# refresca el dump.
+
+XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+TITLES_INDEX_FILE = "anime-titles.db"
+TITLES_MAX_AGE = 24 * 60 * 60  # 24 hores
+# Temps entre intents de descàrrega si el dump no es pot baixar
+TITLES_RETRY_SECONDS = 60 * 60
+# Files candidates que es puntuen per consulta
+SEARCH_CANDIDATES = 500
+# Similitud mínima (trigrames compartits) per a una coincidència aproximada
+FUZZY_THRESHOLD = 0.3
+
+# Una sola reconstrucció alhora (els clients es creen per petició)
+_index_lock = threading.Lock()
+_last_refresh_attempt = 0.0
+
+TitleRow = Tuple[int, str, str, str]  # (aid, type, lang, title)
+
+
+def normalize_title(title: str) -> str:
+    """Forma de comparació: NFKC, sense majúscules i amb els espais col·lapsats."""
+    return " ".join(unicodedata.normalize("NFKC", title or "").casefold().split())
+
+
+def trigrams(text: str) -> set:
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def title_similarity(query: str, title: str) -> float:
+    """Proporció de trigrames compartits (com pg_trgm)."""
+    a, b = trigrams(query), trigrams(title)
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def match_score(query: str, title: str) -> int:
+    """Puntuació d'un títol normalitzat: exacte 100, prefix 90, conté 70, aproximat < 70."""
+    if title == query:
+        return 100
+    if title.startswith(query):
+        return 90
+    if query in title:
+        return 70
+    similarity = title_similarity(query, title)
+    return int(60 * similarity) if similarity >= FUZZY_THRESHOLD else 0
+
+
+def _fts_phrase(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"'
+
+
+def parse_titles_dump(data: bytes) -> Iterator[TitleRow]:
+    """Títols del dump XML, llegit en streaming (no es construeix l'arbre sencer)."""
+    for _, element in ET.iterparse(BytesIO(data), events=("end",)):
+        if element.tag != 'anime':
+            continue
+        aid = int(element.get('aid', 0) or 0)
+        if aid:
+            for title in element.findall('title'):
+                if title.text:
+                    # type: main, official, syn, short
+                    yield aid, title.get('type'), title.get(XML_LANG, 'x-jat'), title.text
+        element.clear()
+
+
+def _legacy_rows(json_file: Path) -> Iterator[TitleRow]:
+    """Títols de l'antic cache JSON (anime_id -> {titles: [...]})."""
+    with open(json_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    for aid, entry in data.items():
+        for t in entry.get('titles', []):
+            if t.get('title'):
+                yield int(aid), t.get('type'), t.get('lang', 'x-jat'), t['title']
+
+
+def build_title_index(rows: Iterable[TitleRow], index_file: Path) -> int:
+    """
+    Construeix l'índex en un fitxer temporal i el substitueix de cop: les
+    cerques en curs continuen amb l'anterior. Retorna el nombre d'anime.
+    """
+    index_file = Path(index_file)
+    partial = index_file.with_name(f"{index_file.name}.{threading.get_ident()}.part")
+    if partial.exists():
+        partial.unlink()
+    conn = sqlite3.connect(str(partial))
+    try:
+        conn.executescript("""
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE titles (
+                id INTEGER PRIMARY KEY,
+                aid INTEGER NOT NULL,
+                type TEXT,
+                lang TEXT,
+                title TEXT NOT NULL,
+                norm TEXT NOT NULL
+            );
+            CREATE VIRTUAL TABLE titles_fts USING fts5(
+                norm, content='titles', content_rowid='id', tokenize='trigram'
+            );
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        batch = []
+        for aid, ttype, lang, title in rows:
+            batch.append((aid, ttype, lang, title, normalize_title(title)))
+            if len(batch) >= 5000:
+                conn.executemany("INSERT INTO titles (aid, type, lang, title, norm) VALUES (?, ?, ?, ?, ?)", batch)
+                batch.clear()
+        if batch:
+            conn.executemany("INSERT INTO titles (aid, type, lang, title, norm) VALUES (?, ?, ?, ?, ?)", batch)
+        conn.executescript("""
+            CREATE INDEX idx_titles_aid ON titles(aid);
+            CREATE INDEX idx_titles_norm ON titles(norm);
+            INSERT INTO titles_fts(titles_fts) VALUES ('rebuild');
+            INSERT INTO titles_fts(titles_fts) VALUES ('optimize');
+        """)
+        count = conn.execute("SELECT COUNT(DISTINCT aid) FROM titles").fetchone()[0]
+        conn.execute("INSERT INTO meta (key, value) VALUES ('anime_count', ?)", (str(count),))
+        conn.commit()
+    except BaseException:
+        conn.close()
+        partial.unlink(missing_ok=True)
+        raise
+    conn.close()
+    os.replace(partial, index_file)
+    return count
+
+
+class TitleIndex:
+    """Consultes a l'índex de títols (només lectura)."""
+
+    def __init__(self, index_file: Path):
+        self.index_file = Path(index_file)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(f"{self.index_file.resolve().as_uri()}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def anime_count(self) -> int:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'anime_count'").fetchone()
+            return int(row[0]) if row else 0
+        except sqlite3.Error:
+            return 0
+        finally:
+            conn.close()
+
+    def _candidates(self, conn: sqlite3.Connection, query: str, limit: int) -> Iterator[sqlite3.Row]:
+        columns = "SELECT aid, title, norm FROM titles"
+        # Exacte i prefix: índex B-tree sobre la forma normalitzada
+        yield from conn.execute(f"{columns} WHERE norm = ?", (query,))
+        yield from conn.execute(
+            f"{columns} WHERE norm > ? AND norm < ? LIMIT ?", (query, query + "\U0010ffff", SEARCH_CANDIDATES)
+        )
+        if len(query) < 3:
+            return  # El tokenitzador trigram no pot cercar menys de 3 caràcters
+        seen = 0
+        for row in conn.execute(
+            f"{columns} WHERE id IN (SELECT rowid FROM titles_fts WHERE titles_fts MATCH ? LIMIT ?)",
+            (_fts_phrase(query), SEARCH_CANDIDATES),
+        ):
+            seen += 1
+            yield row
+        if seen >= limit:
+            return
+        # Aproximada: qualsevol trigrama de la consulta, ordenat per rellevància
+        expression = " OR ".join(_fts_phrase(t) for t in sorted(trigrams(query)) if len(t.strip()) == 3)
+        if expression:
+            yield from conn.execute(
+                f"{columns} WHERE id IN (SELECT rowid FROM titles_fts WHERE titles_fts MATCH ? ORDER BY rank LIMIT ?)",
+                (expression, SEARCH_CANDIDATES),
+            )
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[int, int, str]]:
+        """Millors anime per a la consulta: [(aid, puntuació, títol coincident)]."""
+        query = normalize_title(query)
+        if not query:
+            return []
+        best: Dict[int, Tuple[int, str, str]] = {}
+        conn = self._connect()
+        try:
+            for row in self._candidates(conn, query, limit):
+                score = match_score(query, row["norm"])
+                current = best.get(row["aid"])
+                if score and (current is None or (score, -len(row["norm"])) > (current[0], -len(current[2]))):
+                    best[row["aid"]] = (score, row["title"], row["norm"])
+        finally:
+            conn.close()
+        ranked = sorted(best.items(), key=lambda item: (-item[1][0], len(item[1][2]), item[0]))
+        return [(aid, score, title) for aid, (score, title, _) in ranked[:limit]]
+
+    def titles(self, aids: Iterable[int]) -> Dict[int, List[Dict[str, str]]]:
+        """Títols de cada anime, en l'ordre del dump."""
+        aids = list(aids)
+        result: Dict[int, List[Dict[str, str]]] = {aid: [] for aid in aids}
+        if not aids:
+            return result
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT aid, type, lang, title FROM titles WHERE aid IN ({','.join('?' * len(aids))}) ORDER BY id",
+                aids,
+            )
+            for row in rows:
+                result[row["aid"]].append({'type': row["type"], 'lang': row["lang"], 'title': row["title"]})
+        finally:
+            conn.close()
+        return result
+
+
 class AniDBClient:
     """
     Client per a AniDB.
@@ -46,8 +270,7 @@ class AniDBClient:
         self._last_request_time = 0
         self.cache_dir = Path(cache_dir) if cache_dir else Path("/tmp/anidb_cache")
         self.cache_dir.mkdir(parents=True, exist_ok=True)
-        self._titles_cache = None
-        self._titles_cache_time = 0
+        self.index = TitleIndex(self.cache_dir / TITLES_INDEX_FILE)
 
     def _rate_limit(self):
         """Aplica rate limiting"""
@@ -89,144 +312,102 @@ class AniDBClient:
         """Fa una petició asíncrona"""
         return await asyncio.to_thread(self._sync_request, url, is_gzip)
 
-    async def load_titles_dump(self, force_refresh: bool = False) -> Dict[int, Dict]:
+    def _refresh_index(self, force_refresh: bool) -> int:
+        """Reconstrueix l'índex si cal (bloquejant: s'executa en un fil)."""
+        global _last_refresh_attempt
+        index_file = self.index.index_file
+        with _index_lock:
+            exists = index_file.exists()
+            # Un altre fil pot haver-lo refet mentre s'esperava
+            if not force_refresh and exists and time.time() - index_file.stat().st_mtime < TITLES_MAX_AGE:
+                return self.index.anime_count()
+
+            # L'antic cache JSON es converteix una vegada sense tornar a baixar el dump
+            legacy_file = self.cache_dir / "anime-titles.json"
+            if not force_refresh and not exists and legacy_file.exists():
+                try:
+                    count = build_title_index(_legacy_rows(legacy_file), index_file)
+                    os.utime(index_file, (time.time(), legacy_file.stat().st_mtime))
+                    legacy_file.unlink()
+                    logger.info(f"AniDB titles index built from JSON cache ({count} entries)")
+                    return count
+                except Exception as e:
+                    logger.warning(f"Error converting AniDB JSON cache: {e}")
+
+            # Si l'última descàrrega ha fallat, no es reintenta a cada cerca
+            if not force_refresh and time.time() - _last_refresh_attempt < TITLES_RETRY_SECONDS:
+                return self.index.anime_count() if exists else 0
+
+            _last_refresh_attempt = time.time()
+            logger.info("Downloading AniDB titles dump...")
+            data = self._sync_request(self.TITLES_DUMP_URL, is_gzip=True)
+            if not data:
+                logger.error("Failed to download AniDB titles dump")
+                return self.index.anime_count() if index_file.exists() else 0
+
+            try:
+                count = build_title_index(parse_titles_dump(data), index_file)
+            except (ET.ParseError, sqlite3.Error) as e:
+                logger.error(f"Error indexing AniDB titles: {e}")
+                return self.index.anime_count() if index_file.exists() else 0
+            legacy_file.unlink(missing_ok=True)
+            logger.info(f"AniDB titles indexed ({count} entries)")
+            return count
+
+    async def load_titles_dump(self, force_refresh: bool = False) -> int:
         """
-        Carrega el dump de títols d'AniDB.
-        Es cacheja localment i es refresca cada 24h.
+        Assegura l'índex de títols d'AniDB.
+        El dump es descarrega i s'indexa com a molt cada 24h.
 
         Returns:
-            Dict amb anime_id -> {titles: [...], type: str}
+            Nombre d'anime a l'índex (0 si no n'hi ha)
         """
-        cache_file = self.cache_dir / "anime-titles.json"
-        cache_max_age = 24 * 60 * 60  # 24 hores
-
-        # Intentar carregar del cache
-        if not force_refresh and cache_file.exists():
-            try:
-                cache_age = time.time() - cache_file.stat().st_mtime
-                if cache_age < cache_max_age:
-                    with open(cache_file, 'r', encoding='utf-8') as f:
-                        self._titles_cache = json.load(f)
-                        # Convertir claus a int
-                        self._titles_cache = {
-                            int(k): v for k, v in self._titles_cache.items()
-                        }
-                        logger.debug(f"AniDB titles loaded from cache ({len(self._titles_cache)} entries)")
-                        return self._titles_cache
-            except Exception as e:
-                logger.warning(f"Error loading AniDB cache: {e}")
-
-        # Descarregar dump
-        logger.info("Downloading AniDB titles dump...")
-        data = await self._request(self.TITLES_DUMP_URL, is_gzip=True)
-
-        if not data:
-            logger.error("Failed to download AniDB titles dump")
-            return self._titles_cache or {}
-
-        # Parsejar XML
-        try:
-            root = ET.fromstring(data.decode('utf-8'))
-            titles_dict = {}
-
-            for anime in root.findall('anime'):
-                aid = int(anime.get('aid', 0))
-                if not aid:
-                    continue
-
-                titles = []
-                for title in anime.findall('title'):
-                    titles.append({
-                        'type': title.get('type'),  # main, official, syn, short
-                        'lang': title.get('{http://www.w3.org/XML/1998/namespace}lang', 'x-jat'),
-                        'title': title.text
-                    })
-
-                titles_dict[aid] = {
-                    'titles': titles
-                }
-
-            self._titles_cache = titles_dict
-
-            # Guardar a cache
-            try:
-                with open(cache_file, 'w', encoding='utf-8') as f:
-                    json.dump(titles_dict, f, ensure_ascii=False)
-                logger.info(f"AniDB titles cached ({len(titles_dict)} entries)")
-            except Exception as e:
-                logger.warning(f"Error saving AniDB cache: {e}")
-
-            return titles_dict
-
-        except ET.ParseError as e:
-            logger.error(f"Error parsing AniDB XML: {e}")
-            return self._titles_cache or {}
+        return await asyncio.to_thread(self._refresh_index, force_refresh)
 
     async def search_anime(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
         """
-        Cerca anime per títol usant el dump de títols.
+        Cerca anime per títol a l'índex del dump: exacte, prefix, subcadena i,
+        si no n'hi ha prou, aproximada per trigrames.
 
         Returns:
             Llista d'anime amb seus títols en diferents idiomes
         """
-        titles = await self.load_titles_dump()
-        if not titles:
+        if not await self.load_titles_dump():
             return []
 
-        query_lower = query.lower().strip()
+        def lookup():
+            matches = self.index.search(query, limit)
+            return matches, self.index.titles(aid for aid, _, _ in matches)
+
+        matches, titles = await asyncio.to_thread(lookup)
         results = []
 
-        for aid, data in titles.items():
-            best_score = 0
+        for aid, score, matched_title in matches:
             main_title = None
-            matched_title = None
-
-            for t in data.get('titles', []):
-                title_text = t.get('title', '')
-                title_lower = title_text.lower()
-
-                # Títol principal
-                if t.get('type') == 'main':
-                    main_title = title_text
-
-                # Coincidència exacta
-                if title_lower == query_lower:
-                    best_score = 100
-                    matched_title = title_text
-                # Comença amb query
-                elif title_lower.startswith(query_lower) and best_score < 90:
-                    best_score = 90
-                    matched_title = title_text
-                # Conté query
-                elif query_lower in title_lower and best_score < 70:
-                    best_score = 70
-                    matched_title = title_text
-
-            if best_score > 0:
+            title_by_lang = {}
+            for t in titles[aid]:
+                lang = t.get('lang', '')
+                ttype = t.get('type', '')
+                if ttype == 'main':
+                    main_title = t.get('title')
                 # Obtenir títols per idioma
-                title_by_lang = {}
-                for t in data.get('titles', []):
-                    lang = t.get('lang', '')
-                    ttype = t.get('type', '')
-                    if ttype in ('main', 'official') and lang not in title_by_lang:
-                        title_by_lang[lang] = t.get('title')
-
-                results.append({
-                    'anidb_id': aid,
-                    'title': main_title or matched_title,
-                    'matched_title': matched_title,
-                    'title_en': title_by_lang.get('en'),
-                    'title_ja': title_by_lang.get('ja'),
-                    'title_romaji': title_by_lang.get('x-jat'),  # Japonès romanitzat
-                    'title_es': title_by_lang.get('es'),
-                    'title_ca': title_by_lang.get('ca'),  # Si existeix!
-                    'all_titles': title_by_lang,
-                    'score': best_score
-                })
-
-        # Ordenar per puntuació i limitar
-        results.sort(key=lambda x: x['score'], reverse=True)
-        return results[:limit]
+                if ttype in ('main', 'official') and lang not in title_by_lang:
+                    title_by_lang[lang] = t.get('title')
+
+            results.append({
+                'anidb_id': aid,
+                'title': main_title or matched_title,
+                'matched_title': matched_title,
+                'title_en': title_by_lang.get('en'),
+                'title_ja': title_by_lang.get('ja'),
+                'title_romaji': title_by_lang.get('x-jat'),  # Japonès romanitzat
+                'title_es': title_by_lang.get('es'),
+                'title_ca': title_by_lang.get('ca'),  # Si existeix!
+                'all_titles': title_by_lang,
+                'score': score
+            })
+
+        return results
 
     async def get_anime_titles(self, anidb_id: int) -> Optional[Dict[str, Any]]:
         """
@@ -235,17 +416,18 @@ class AniDBClient:
         Returns:
             Dict amb títols en diferents idiomes
         """
-        titles = await self.load_titles_dump()
-        data = titles.get(anidb_id)
+        if not await self.load_titles_dump():
+            return None
+        titles = (await asyncio.to_thread(self.index.titles, [anidb_id]))[anidb_id]
 
-        if not data:
+        if not titles:
             return None
 
         title_by_lang = {}
         main_title = None
         synonyms = []
 
-        for t in data.get('titles', []):
+        for t in titles:
             lang = t.get('lang', '')
             ttype = t.get('type', '')
             title_text = t.get('title', '')
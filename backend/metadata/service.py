@@ -138,6 +138,10 @@ class MetadataCache:
         self._misses += 1
         return None
 
+    def peek(self, key: str) -> Optional[CacheEntry]:
+        """Obtenir entrada sense comptar a les estadístiques."""
+        return self._cache.get(key)
+
     def set(self, key: str, data: Any, source: MetadataSource, ttl: int = None):
         """Guardar al cache."""
         self._cache[key] = CacheEntry(
@@ -703,6 +707,16 @@ class MetadataService:
         self._background_tasks.add(task)
         task.add_done_callback(self._background_tasks.discard)
 
+    def series_cache_timestamp(self, tmdb_id: int = None, anilist_id: int = None) -> Optional[float]:
+        """
+        Moment en què es va obtenir la metadata en cache d'una sèrie.
+        Retorna None si no hi és o si ja toca refrescar-la.
+        """
+        entry = metadata_cache.peek(f"series:{tmdb_id or ''}:{anilist_id or ''}")
+        if entry and entry.is_valid() and not entry.is_stale():
+            return entry.timestamp
+        return None
+
     def get_cache_stats(self) -> Dict[str, Any]:
         """Retorna estadístiques del cache."""
         return metadata_cache.stats
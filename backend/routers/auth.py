@@ -58,7 +58,7 @@ async def register(data: RegisterRequest):
         raise HTTPException(status_code=400, detail="La contrasenya ha de tenir mínim 4 caràcters")
 
     auth = get_auth_manager()
-    result = auth.register(
+    result = await auth.register_async(
         username=data.username,
         password=data.password,
         email=data.email,
@@ -77,7 +77,7 @@ async def login(data: LoginRequest):
     from backend.auth import get_auth_manager
 
     auth = get_auth_manager()
-    result = auth.login(data.username, data.password)
+    result = await auth.login_async(data.username, data.password)
 
     if result["status"] == "error":
         raise HTTPException(status_code=401, detail=result["message"])
@@ -121,7 +121,7 @@ async def change_password(request: Request, data: PasswordChangeRequest):
 
     user = require_auth(request)
     auth = get_auth_manager()
-    result = auth.change_password(
+    result = await auth.change_password_async(
         user_id=user["id"],
         old_password=data.old_password,
         new_password=data.new_password
@@ -139,7 +139,7 @@ async def register_with_invitation(data: RegisterWithInviteRequest):
     from backend.auth import get_auth_manager
 
     auth = get_auth_manager()
-    result = auth.register_with_invitation(
+    result = await auth.register_with_invitation_async(
         username=data.username,
         password=data.password,
         invitation_code=data.invitation_code,
@@ -9,7 +9,6 @@ import sys
 import json
 import sqlite3
 import hashlib
-import subprocess
 import logging
 import asyncio
 from pathlib import Path
@@ -652,28 +651,12 @@ class HermesScanner:
             logger.info(msg)
             
     def probe_file(self, file_path: Path) -> Optional[Dict]:
-        """Obté metadata amb ffprobe"""
+        """Obté metadata amb ffprobe (des del cache si el fitxer no ha canviat)"""
         try:
-            cmd = [
-                'ffprobe', '-v', 'quiet',
-                '-print_format', 'json',
-                '-show_format', '-show_streams',
-                str(file_path)
-            ]
-            
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=10,
-                encoding="utf-8",
-                errors="ignore"
-            )
-
-            if result.returncode != 0:
+            from backend.services.probe_cache import probe_media
+            data = probe_media(file_path, timeout=10)
+            if data is None:
                 return None
-                
-            data = json.loads(result.stdout)
             
             # Processar info
             video_info = {}
@@ -0,0 +1,467 @@
+"""
+Hermes Media Server - Còpia local de l'artwork
+Descarrega en segon pla els pòsters, fons i logos de TMDB i Fanart.tv que
+fa servir la biblioteca i els guarda a METADATA_DIR/artwork, adreçats pel
+hash del contingut (una imatge repetida només es guarda una vegada).
+Hermes els serveix des del disc i només redirigeix a l'origen si encara
+no s'han descarregat. La base de dades es toca sempre fora del bucle.
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+import httpx
+
+from backend.services.disk_quota import DiskQuota
+
+logger = logging.getLogger(__name__)
+
+
+TMDB_IMAGE_BASE = "https://image.tmdb.org/t/p"
+# Orígens que es poden copiar (la resta no passen pel mirall)
+MIRROR_HOSTS = {"image.tmdb.org", "assets.fanart.tv"}
+# Mides de TMDB que es copien per a les referències guardades com a camí
+DEFAULT_SIZES = {"poster": "w500", "backdrop": "w1280", "still": "w300"}
+# Descàrregues simultànies
+ARTWORK_CONCURRENCY = int(os.environ.get("HERMES_ARTWORK_CONCURRENCY", "4"))
+# Intents per imatge i temps entre intents (segons)
+MAX_ATTEMPTS = 3
+RETRY_AFTER = 6 * 3600
+# Vigència de la resposta de Fanart.tv guardada (segons)
+FALLBACK_TTL = 30 * 24 * 3600
+# Mida màxima d'una imatge i de tota la còpia local
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+ARTWORK_CACHE_BYTES = int(os.environ.get("HERMES_ARTWORK_CACHE_BYTES", str(2 * 1024 ** 3)))
+
+EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+    "image/svg+xml": ".svg",
+}
+
+TMDB_URL_RE = re.compile(r"^https?://image\.tmdb\.org/t/p/([a-z0-9]+)(/[^/?#]+)$")
+
+
+def init_artwork_tables(conn: sqlite3.Connection):
+    """Crea les taules del mirall d'artwork."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS artwork_mirror (
+            url TEXT PRIMARY KEY,
+            ref TEXT,
+            digest TEXT,
+            content_type TEXT,
+            size INTEGER,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            updated_at REAL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_artwork_mirror_ref ON artwork_mirror(ref)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_artwork_mirror_status ON artwork_mirror(status)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS artwork_fallback (
+            media_type TEXT NOT NULL,
+            tmdb_id INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            fetched_at REAL NOT NULL,
+            PRIMARY KEY (media_type, tmdb_id)
+        )
+    """)
+    conn.commit()
+
+
+def tmdb_url(path: Optional[str], size: str) -> Optional[str]:
+    """URL de TMDB per a un camí ('/abc.jpg'). Les URLs completes es retornen tal qual."""
+    if not path:
+        return None
+    if path.startswith("http"):
+        return path
+    return f"{TMDB_IMAGE_BASE}/{size}{path}"
+
+
+def split_tmdb_url(url: str) -> Optional[Tuple[str, str]]:
+    """(mida, camí) d'una URL d'imatge de TMDB."""
+    match = TMDB_URL_RE.match(url or "")
+    return (match.group(1), match.group(2)) if match else None
+
+
+def is_mirrorable(url: Optional[str]) -> bool:
+    return bool(url) and urlparse(url).hostname in MIRROR_HOSTS
+
+
+def _ref(url: str) -> Optional[str]:
+    """Mateixa imatge a qualsevol mida (només TMDB)."""
+    parts = split_tmdb_url(url)
+    return f"tmdb:{parts[1]}" if parts else None
+
+
+def _size_rank(url: str) -> int:
+    parts = split_tmdb_url(url)
+    if not parts:
+        return 0
+    size = parts[0]
+    return 100_000 if size == "original" else int(size[1:]) if size[1:].isdigit() else 0
+
+
+class ArtworkMirror:
+    """Cua de descàrregues i índex (URL → fitxer local)."""
+
+    def __init__(self, root: Union[str, Path] = None, db_path: Union[str, Path] = None,
+                 concurrency: int = ARTWORK_CONCURRENCY, client_factory=None,
+                 quota_bytes: int = ARTWORK_CACHE_BYTES):
+        self._root = Path(root) if root else None
+        self.quota = DiskQuota(lambda: self.root, quota_bytes, pattern="*/*", label="Artwork")
+        self._db_path = db_path
+        self._tables_ready = False
+        self._concurrency = max(concurrency, 1)
+        self._client_factory = client_factory
+        self._client: Optional[httpx.AsyncClient] = None
+        self._drain_task: Optional[asyncio.Task] = None
+        self.downloaded = 0
+        self.failed = 0
+
+    @property
+    def root(self) -> Path:
+        if self._root is None:
+            from config import settings
+            self._root = Path(settings.METADATA_DIR) / "artwork"
+        return self._root
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db_path is None:
+            from config import settings
+            self._db_path = settings.DATABASE_PATH
+        conn = sqlite3.connect(str(self._db_path), timeout=30)
+        if not self._tables_ready:
+            init_artwork_tables(conn)
+            self._tables_ready = True
+        return conn
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            if self._client_factory:
+                self._client = self._client_factory()
+            else:
+                self._client = httpx.AsyncClient(
+                    timeout=httpx.Timeout(30.0, connect=10.0),
+                    follow_redirects=True,
+                    headers={"User-Agent": "Hermes Media Server/1.0"},
+                    limits=httpx.Limits(max_connections=self._concurrency,
+                                        max_keepalive_connections=self._concurrency),
+                )
+        return self._client
+
+    async def close(self):
+        if self._drain_task is not None and not self._drain_task.done():
+            self._drain_task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def file_path(self, digest: str, content_type: str) -> Path:
+        return self.root / digest[:2] / f"{digest}{EXTENSIONS.get(content_type, '.img')}"
+
+    # ---------- Cua ----------
+
+    def enqueue(self, urls: Iterable[Optional[str]]) -> int:
+        """Afegeix URLs a la cua (les ja conegudes s'ignoren). Retorna les noves."""
+        added = self._insert(urls)
+        if added:
+            self.kick()
+        return added
+
+    async def enqueue_async(self, urls: Iterable[Optional[str]]) -> int:
+        """Com enqueue(), però l'escriptura a la BD es fa en un fil."""
+        added = await asyncio.to_thread(self._insert, list(urls))
+        if added:
+            self.kick()
+        return added
+
+    def _insert(self, urls: Iterable[Optional[str]]) -> int:
+        rows =[(url, _ref(url), time.time()) for url in set(urls) if is_mirrorable(url)]
+        if not rows:
+            return 0
+        try:
+            conn = self._connect()
+            try:
+                before = conn.total_changes
+                conn.executemany(
+                    "INSERT OR IGNORE INTO artwork_mirror (url, ref, updated_at) VALUES (?, ?, ?)", rows
+                )
+                conn.commit()
+                added = conn.total_changes - before
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"[Artwork] No s'ha pogut encuar: {e}")
+            return 0
+        return added
+
+    def kick(self):
+        """Engega el buidat de la cua si no està en marxa."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # Sense bucle (p. ex. fil de fons): ho farà el pròxim kick
+        if self._drain_task is None or self._drain_task.done():
+            self._drain_task = loop.create_task(self.drain())
+
+    def _next_batch(self, limit: int) -> List[str]:
+        conn = self._connect()
+        try:
+            return [row[0] for row in conn.execute("""
+                SELECT url FROM artwork_mirror
+                WHERE status = 'pending'
+                   OR (status = 'failed' AND attempts < ? AND updated_at < ?)
+                ORDER BY updated_at
+                LIMIT ?
+            """, (MAX_ATTEMPTS, time.time() - RETRY_AFTER, limit))]
+        finally:
+            conn.close()
+
+    async def drain(self) -> int:
+        """Descarrega tot el que hi ha pendent, amb concurrència limitada."""
+        semaphore = asyncio.Semaphore(self._concurrency)
+        done = 0
+
+        async def fetch(url: str):
+            async with semaphore:
+                await self._fetch(url)
+
+        while True:
+            try:
+                batch = await asyncio.to_thread(self._next_batch, self._concurrency * 8)
+            except sqlite3.Error as e:
+                logger.warning(f"[Artwork] No s'ha pogut llegir la cua: {e}")
+                break
+            if not batch:
+                break
+            await asyncio.gather(*(fetch(url) for url in batch))
+            done += len(batch)
+        if done:
+            logger.info(f"[Artwork] Cua buidada: {self.downloaded} descarregades, {self.failed} errors")
+        return done
+
+    async def _fetch(self, url: str):
+        try:
+            data, content_type = await self._download(url)
+            digest = hashlib.sha1(data).hexdigest()
+            path = self.file_path(digest, content_type)
+            await asyncio.to_thread(self._store, path, data)
+            await asyncio.to_thread(self._update, url, status="ok", digest=digest,
+                                    content_type=content_type, size=len(data), last_error=None)
+            self.downloaded += 1
+        except Exception as e:
+            self.failed += 1
+            await asyncio.to_thread(self._update, url, status="failed", last_error=str(e)[:200], failed=True)
+            logger.debug(f"[Artwork] {url}: {e}")
+
+    async def _download(self, url: str) -> Tuple[bytes, str]:
+        """Baixa una imatge (com a molt MAX_IMAGE_BYTES)."""
+        async with self._get_client().stream("GET", url) as response:
+            content_type = response.headers.get("content-type", "").split(";")[0].strip()
+            if response.status_code != 200:
+                raise ValueError(f"HTTP {response.status_code}")
+            if not content_type.startswith("image/"):
+                raise ValueError(f"tipus {content_type or 'desconegut'}")
+            length = response.headers.get("content-length", "")
+            if length.isdigit() and int(length) > MAX_IMAGE_BYTES:
+                raise ValueError(f"massa gran ({length} bytes)")
+            data = bytearray()
+            async for chunk in response.aiter_bytes():
+                data += chunk
+                if len(data) > MAX_IMAGE_BYTES:
+                    raise ValueError("massa gran")
+        return bytes(data), content_type
+
+    def _store(self, path: Path, data: bytes):
+        if path.exists():
+            self.quota.touch(path)
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        self.quota.added(path, len(data))
+
+    def _update(self, url: str, failed: bool = False, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        if failed:
+            assignments += ", attempts = attempts + 1"
+        try:
+            conn = self._connect()
+            try:
+                conn.execute(f"UPDATE artwork_mirror SET {assignments} WHERE url = ?", (*fields.values(), url))
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"[Artwork] No s'ha pogut actualitzar {url}: {e}")
+
+    # ---------- Consulta ----------
+
+    def find(self, url: str) -> Optional[Path]:
+        """
+        Fitxer local per a una URL: la mateixa URL o, per a TMDB, la
+        mateixa imatge a una altra mida (la més gran).
+        """
+        try:
+            conn = self._connect()
+            try:
+                rows = conn.execute("""
+                    SELECT url, digest, content_type FROM artwork_mirror
+                    WHERE status = 'ok' AND (url = ? OR (ref IS NOT NULL AND ref = ?))
+                """, (url, _ref(url))).fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return None
+        rows.sort(key=lambda row: (row[0] != url, -_size_rank(row[0])))
+        for _, digest, content_type in rows:
+            path = self.file_path(digest, content_type)
+            if path.exists():
+                self.quota.touch(path)
+                return path
+        return None
+
+    def lookup(self, url: str, allow_new: bool = False) -> Tuple[Optional[Path], bool]:
+        """
+        (fitxer local, s'ha encuat) per a una petició del navegador. Una URL
+        que la biblioteca no coneix (ni a una altra mida) només s'encua amb
+        allow_new: qualsevol no pot omplir el disc amb imatges qualssevol.
+        """
+        path = self.find(url)
+        if path is not None or not is_mirrorable(url):
+            return path, False
+        try:
+            conn = self._connect()
+            try:
+                known = conn.execute(
+                    "SELECT 1 FROM artwork_mirror WHERE url = ? OR (ref IS NOT NULL AND ref = ?) LIMIT 1",
+                    (url, _ref(url))
+                ).fetchone()
+                if not known and not allow_new:
+                    return None, False
+                # Imatge esborrada per la quota: es torna a baixar
+                conn.execute(
+                    "UPDATE artwork_mirror SET status = 'pending', attempts = 0 WHERE url = ? AND status = 'ok'",
+                    (url,)
+                )
+                conn.execute(
+                    "INSERT OR IGNORE INTO artwork_mirror (url, ref, updated_at) VALUES (?, ?, ?)",
+                    (url, _ref(url), time.time())
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return None, False
+        return None, True
+
+    def stats(self) -> Dict[str, int]:
+        try:
+            conn = self._connect()
+            try:
+                counts = dict(conn.execute("SELECT status, COUNT(*) FROM artwork_mirror GROUP BY status").fetchall())
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            counts = {}
+        return {"ok": counts.get("ok", 0), "pending": counts.get("pending", 0),
+                "failed": counts.get("failed", 0), "running": bool(self._drain_task and not self._drain_task.done())}
+
+    # ---------- Biblioteca ----------
+
+    def library_urls(self) -> List[str]:
+        """Totes les imatges remotes a què fa referència la base de dades."""
+        queries = [
+            ("SELECT poster, backdrop FROM series WHERE poster LIKE 'http%' OR backdrop LIKE 'http%'", None),
+            ("SELECT poster_path, backdrop_path FROM watchlist", ("poster", "backdrop")),
+            ("SELECT poster_path, backdrop_path, still_path FROM streaming_progress", ("poster", "backdrop", "still")),
+        ]
+        urls = []
+        conn = self._connect()
+        try:
+            for sql, kinds in queries:
+                try:
+                    rows = conn.execute(sql).fetchall()
+                except sqlite3.OperationalError:
+                    continue  # Taula que encara no existeix
+                for row in rows:
+                    for i, value in enumerate(row):
+                        if not value:
+                            continue
+                        urls.append(tmdb_url(value, DEFAULT_SIZES[kinds[i]]) if kinds else value)
+        finally:
+            conn.close()
+        return urls
+
+    def mirror_library(self) -> int:
+        """Encua l'artwork de tota la biblioteca que encara no es té."""
+        try:
+            added = self.enqueue(self.library_urls())
+        except sqlite3.Error as e:
+            logger.warning(f"[Artwork] No s'ha pogut llegir la biblioteca: {e}")
+            return 0
+        if added:
+            logger.info(f"[Artwork] {added} imatges noves a la cua")
+        return added
+
+    async def mirror_library_async(self) -> int:
+        """Com mirror_library(), però llegint la biblioteca en un fil."""
+        added = await asyncio.to_thread(self.mirror_library)
+        if added:
+            self.kick()
+        return added
+
+    # ---------- Fanart.tv ----------
+
+    def get_fallback(self, media_type: str, tmdb_id: int) -> Optional[Tuple[Dict, bool]]:
+        """Resposta de Fanart.tv guardada: (dades, encara vigent)."""
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    "SELECT data, fetched_at FROM artwork_fallback WHERE media_type = ? AND tmdb_id = ?",
+                    (media_type, tmdb_id)
+                ).fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return None
+        if not row:
+            return None
+        return json.loads(row[0]), row[1] > time.time() - FALLBACK_TTL
+
+    def save_fallback(self, media_type: str, tmdb_id: int, data: Dict) -> int:
+        """Guarda la resposta de Fanart.tv i encua les seves imatges."""
+        try:
+            conn = self._connect()
+            try:
+                conn.execute("""
+                    INSERT OR REPLACE INTO artwork_fallback (media_type, tmdb_id, data, fetched_at)
+                    VALUES (?, ?, ?, ?)
+                """, (media_type, tmdb_id, json.dumps(data), time.time()))
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"[Artwork] No s'ha pogut guardar l'artwork de Fanart.tv: {e}")
+        return self.enqueue(value for value in data.values() if isinstance(value, str))
+
+
+# Instància global
+artwork_mirror = ArtworkMirror()
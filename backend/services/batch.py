@@ -0,0 +1,125 @@
+"""
+Hermes Media Server - Batch de peticions
+Executa diverses rutes GET internes dins d'una sola petició HTTP
+"""
+
+import json
+import asyncio
+import logging
+import urllib.parse
+from typing import Dict, List, Optional
+
+from fastapi.exceptions import RequestValidationError
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.requests import Request
+
+logger = logging.getLogger(__name__)
+
+
+MAX_BATCH_REQUESTS = 20
+# Mida màxima del cos JSON d'una subpetició
+MAX_BATCH_RESPONSE_BYTES = 2 * 1024 * 1024
+# Capçaleres de la petició original que es passen a les subpeticions
+FORWARDED_HEADERS = (b"authorization", b"accept-language", b"user-agent")
+
+
+class _BatchAbort(Exception):
+    """La subpetició s'atura abans de llegir-ne tot el cos."""
+
+    def __init__(self, status: int, detail: str):
+        self.status = status
+        self.detail = detail
+
+
+def _error(path: str, status: int, detail) -> Dict:
+    return {"path": path, "status": status, "body": {"detail": detail}}
+
+
+async def run_subrequest(request: Request, path: str, user: Optional[Dict]) -> Dict:
+    """
+    Executa una ruta GET interna directament sobre el router (sense middlewares).
+    Cada subpetició obre les seves pròpies connexions a la BD, com una petició
+    normal. Les respostes que no són JSON s'aturen a la capçalera.
+    """
+    parsed = urllib.parse.urlsplit(path)
+    route_path = parsed.path
+
+    if not route_path.startswith("/api/") or route_path.startswith("/api/batch"):
+        return _error(path, 400, "Ruta no permesa en un batch")
+
+    app = request.scope["app"]
+    headers = [(key, value) for key, value in request.scope["headers"] if key in FORWARDED_HEADERS]
+    headers.append((b"accept", b"application/json"))
+
+    scope = {
+        "type": "http",
+        "asgi": request.scope.get("asgi", {"version": "3.0"}),
+        "http_version": request.scope.get("http_version", "1.1"),
+        "method": "GET",
+        "scheme": request.scope.get("scheme", "http"),
+        "server": request.scope.get("server"),
+        "client": request.scope.get("client"),
+        "root_path": request.scope.get("root_path", ""),
+        "path": route_path,
+        "raw_path": route_path.encode(),
+        "query_string": parsed.query.encode(),
+        "headers": headers,
+        "app": app,
+        # L'usuari ja verificat (get_current_user no torna a validar el token)
+        "hermes_user": user,
+    }
+
+    status = 500
+    chunks: List[bytes] = []
+    size = 0
+    request_sent = False
+    finished = asyncio.Event()
+
+    async def receive():
+        # Com una connexió real: el cos (buit) una vegada i després la
+        # desconnexió quan s'acaba la resposta (StreamingResponse l'escolta)
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status, size
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            content_type = ""
+            for key, value in message.get("headers", []):
+                if key.lower() == b"content-type":
+                    content_type = value.decode("latin-1")
+            if "application/json" not in content_type and status != 204:
+                raise _BatchAbort(415, "La resposta no és JSON")
+        elif message["type"] == "http.response.body":
+            body = message.get("body", b"")
+            size += len(body)
+            if size > MAX_BATCH_RESPONSE_BYTES:
+                raise _BatchAbort(413, "Resposta massa gran per a un batch")
+            chunks.append(body)
+
+    try:
+        await app.router(scope, receive, send)
+    except _BatchAbort as e:
+        return _error(path, e.status, e.detail)
+    except StarletteHTTPException as e:
+        return _error(path, e.status_code, e.detail)
+    except RequestValidationError as e:
+        return _error(path, 422, e.errors())
+    except Exception as e:
+        logger.error(f"Error a la subpetició {path} del batch: {e}")
+        return _error(path, 500, str(e))
+    finally:
+        finished.set()
+
+    raw = b"".join(chunks)
+    return {"path": path, "status": status, "body": json.loads(raw) if raw else None}
+
+
+async def run_batch(request: Request, paths: List[str], user: Optional[Dict]) -> List[Dict]:
+    """Executa les subpeticions concurrentment i retorna les respostes en ordre."""
+    return list(await asyncio.gather(*(run_subrequest(request, path, user) for path in paths)))
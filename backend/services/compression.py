@@ -0,0 +1,286 @@
+"""
+Hermes Media Server - Compressió de respostes
+Política segons el tipus de contingut (zstd/brotli/gzip) i fitxers precomprimits
+"""
+
+import os
+import zlib
+import mimetypes
+import logging
+from typing import List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Codificadors opcionals: sense ells es fa servir gzip
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+
+# Tipus que val la pena comprimir (la resta: vídeo, àudio, imatges, binaris)
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "application/vnd.apple.mpegurl",
+    "application/x-mpegurl",
+    "image/svg+xml",
+}
+# Els streams d'esdeveniments s'han d'enviar sense buffer
+NEVER_COMPRESS = {"text/event-stream"}
+
+# Ordre de preferència del servidor quan el client accepta diverses
+ENCODING_PREFERENCE = ["zstd", "br", "gzip"]
+
+# Variants precomprimides del frontend (codificació, extensió)
+PRECOMPRESSED = [("br", ".br"), ("gzip", ".gz")]
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4   # Qualitat baixa: compressió en temps real
+ZSTD_LEVEL = 3
+
+
+def available_encodings() -> List[str]:
+    """Codificacions suportades per aquest servidor, per ordre de preferència."""
+    available = {"gzip"}
+    if BROTLI_AVAILABLE:
+        available.add("br")
+    if ZSTD_AVAILABLE:
+        available.add("zstd")
+    return [e for e in ENCODING_PREFERENCE if e in available]
+
+
+def negotiate_encoding(accept_encoding: str, supported: List[str]) -> Optional[str]:
+    """
+    Tria la codificació segons Accept-Encoding (amb valors q).
+    A igual q, guanya l'ordre de 'supported'.
+    """
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[token] = q
+
+    best, best_q = None, 0.0
+    for encoding in supported:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    """Comprova si un Content-Type és text comprimible."""
+    if not content_type:
+        return False
+    base = content_type.split(";", 1)[0].strip().lower()
+    if base in NEVER_COMPRESS:
+        return False
+    return (
+        base in COMPRESSIBLE_TYPES
+        or base.startswith("text/")
+        or base.endswith("+json")
+        or base.endswith("+xml")
+    )
+
+
+class _Encoder:
+    """Interfície comuna per als compressors en streaming."""
+
+    def __init__(self, encoding: str):
+        if encoding == "zstd":
+            obj = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+            self._compress, self._finish = obj.compress, obj.flush
+        elif encoding == "br":
+            obj = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._compress, self._finish = obj.process, obj.finish
+        else:
+            obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: capçalera gzip
+            self._compress, self._finish = obj.compress, obj.flush
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compress(data) if data else b""
+
+    def finish(self) -> bytes:
+        return self._finish()
+
+
+class CompressionMiddleware:
+    """
+    Substitut de GZipMiddleware amb política per tipus de contingut:
+    - No toca vídeo, àudio, imatges ni respostes parcials (Range / 206)
+    - Negocia zstd o brotli amb gzip com a alternativa per a JSON, VTT, m3u8...
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1000):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = available_encodings()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        encoding = None
+        if "range" not in headers:
+            encoding = negotiate_encoding(headers.get("accept-encoding", ""), self.encodings)
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self.app, encoding, self.minimum_size)
+        await responder(scope, receive, send)
+
+
+class _CompressionResponder:
+    """Decideix amb les capçaleres de la resposta si es comprimeix o no."""
+
+    def __init__(self, app: ASGIApp, encoding: str, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.send: Send = None
+        self.initial_message: Message = {}
+        self.started = False
+        self.encoder: Optional[_Encoder] = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        self.send = send
+        await self.app(scope, receive, self.send_with_compression)
+
+    def _should_compress(self, headers: MutableHeaders) -> bool:
+        status = self.initial_message["status"]
+        if status < 200 or status in (204, 206, 304):
+            return False
+        if "content-encoding" in headers or "content-range" in headers:
+            return False
+        return is_compressible(headers.get("content-type"))
+
+    async def send_with_compression(self, message: Message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            # Esperar el primer bloc per saber la mida
+            self.initial_message = message
+            return
+        if message_type != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if not self.started:
+            self.started = True
+            headers = MutableHeaders(raw=self.initial_message["headers"])
+            small = not more_body and len(body) < self.minimum_size
+            if small or not self._should_compress(headers):
+                await self.send(self.initial_message)
+                await self.send(message)
+                return
+
+            self.encoder = _Encoder(self.encoding)
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            data = self.encoder.compress(body)
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                data += self.encoder.finish()
+                headers["Content-Length"] = str(len(data))
+            await self.send(self.initial_message)
+            await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
+            return
+
+        if self.encoder is None:
+            await self.send(message)
+            return
+
+        data = self.encoder.compress(body)
+        if not more_body:
+            data += self.encoder.finish()
+        await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    Serveix el build del frontend:
+    - Variants .br/.gz generades en el build si el client les accepta
+    - Assets amb hash (static/) immutables, la resta es revalida
+    - index.html per a les rutes de la SPA
+    """
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        try:
+            return await super().get_response(path, scope)
+        except StarletteHTTPException as e:
+            # Rutes del client (React Router): servir index.html
+            spa_route = not path.startswith("api") and not os.path.splitext(path)[1]
+            if e.status_code != 404 or not spa_route:
+                raise
+            full_path, stat_result = self.lookup_path("index.html")
+            if stat_result is None:
+                raise
+            return self.file_response(full_path, stat_result, scope)
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        accept_encoding = request_headers.get("accept-encoding", "")
+        encoding = negotiate_encoding(accept_encoding, [e for e, _ in PRECOMPRESSED])
+
+        response = None
+        if encoding and "range" not in request_headers:
+            extension = dict(PRECOMPRESSED)[encoding]
+            compressed_path = f"{full_path}{extension}"
+            try:
+                compressed_stat = os.stat(compressed_path)
+            except OSError:
+                compressed_stat = None
+            if compressed_stat is not None and compressed_stat.st_mtime >= stat_result.st_mtime:
+                response = FileResponse(
+                    compressed_path,
+                    status_code=status_code,
+                    stat_result=compressed_stat,
+                    method=scope["method"],
+                    media_type=mimetypes.guess_type(str(full_path))[0] or "text/plain",
+                )
+                response.headers["Content-Encoding"] = encoding
+
+        if response is None:
+            response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, method=scope["method"])
+
+        response.headers.add_vary_header("Accept-Encoding")
+        if os.path.relpath(full_path, self.directory).startswith("static" + os.sep):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        else:
+            response.headers["Cache-Control"] = "no-cache"
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
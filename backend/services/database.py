@@ -598,11 +598,97 @@ def migration_v4_add_indexes(conn: sqlite3.Connection):
     logger.info(f"Migració v4: {created_count} índexs creats/verificats")
 
 
+def migration_v5_sort_keys(conn: sqlite3.Connection):
+    """Migració v5: Claus d'ordenació sense accents (series, books, authors, audiobooks)."""
+    from backend.services.sorting import install_sort_keys
+    install_sort_keys(conn)
+
+
+def migration_v6_home_feed(conn: sqlite3.Connection):
+    """Migració v6: Feed materialitzat de la pàgina d'inici."""
+    from backend.services.home_feed import init_home_feed_tables
+    init_home_feed_tables(conn)
+
+
+def migration_v7_change_counters(conn: sqlite3.Connection):
+    """Migració v7: Comptadors de canvis per taula (ETags)."""
+    from backend.services.validators import install_change_counters
+    install_change_counters(conn)
+
+
+def migration_v8_extractor_health(conn: sqlite3.Connection):
+    """Migració v8: Salut dels extractors d'streams i cache negatiu."""
+    from backend.streaming.source_race import init_extractor_tables
+    init_extractor_tables(conn)
+
+
+def migration_v9_rd_links(conn: sqlite3.Connection):
+    """Migració v9: Links resolts de Real-Debrid per hash i fitxer."""
+    from backend.debrid.rd_session import init_rd_tables
+    init_rd_tables(conn)
+
+
+def migration_v10_probe_cache(conn: sqlite3.Connection):
+    """Migració v10: Cache persistent de ffprobe per identitat de fitxer."""
+    from backend.services.probe_cache import init_probe_tables
+    init_probe_tables(conn)
+
+
+def migration_v11_keyframe_index(conn: sqlite3.Connection):
+    """Migració v11: Índex de keyframes per fitxer."""
+    from backend.streaming.keyframes import init_keyframe_tables
+    init_keyframe_tables(conn)
+
+
+def migration_v12_artwork_mirror(conn: sqlite3.Connection):
+    """Migració v12: Còpia local de l'artwork de TMDB i Fanart.tv."""
+    from backend.services.artwork import init_artwork_tables
+    init_artwork_tables(conn)
+
+
+def migration_v13_book_conversions(conn: sqlite3.Connection):
+    """Migració v13: Cua de conversions de llibres a EPUB."""
+    from backend.books.conversion import init_conversion_tables
+    init_conversion_tables(conn)
+
+
+def migration_v14_book_pages(conn: sqlite3.Connection):
+    """Migració v14: Índex de pàgines de PDFs i còmics."""
+    from backend.books.pages import init_page_tables
+    init_page_tables(conn)
+
+
+def migration_v15_audiobook_file_journal(conn: sqlite3.Connection):
+    """Migració v15: mtime dels fitxers d'audiollibres (escaneig incremental)."""
+    cursor = conn.cursor()
+    _safe_add_column(cursor, "audiobook_files", "mtime_ns", "INTEGER")
+    conn.commit()
+
+
+def migration_v16_home_feed_library_version(conn: sqlite3.Connection):
+    """Migració v16: Versió de la biblioteca amb què es va construir cada feed."""
+    cursor = conn.cursor()
+    _safe_add_column(cursor, "home_feed_state", "library_version", "TEXT")
+    conn.commit()
+
+
 # Registrar migracions
 migration_manager.register_migration(1, migration_v1_initial_schema)
 migration_manager.register_migration(2, migration_v2_series_columns)
 migration_manager.register_migration(3, migration_v3_cleanup_duplicates)
 migration_manager.register_migration(4, migration_v4_add_indexes)
+migration_manager.register_migration(5, migration_v5_sort_keys)
+migration_manager.register_migration(6, migration_v6_home_feed)
+migration_manager.register_migration(7, migration_v7_change_counters)
+migration_manager.register_migration(8, migration_v8_extractor_health)
+migration_manager.register_migration(9, migration_v9_rd_links)
+migration_manager.register_migration(10, migration_v10_probe_cache)
+migration_manager.register_migration(11, migration_v11_keyframe_index)
+migration_manager.register_migration(12, migration_v12_artwork_mirror)
+migration_manager.register_migration(13, migration_v13_book_conversions)
+migration_manager.register_migration(14, migration_v14_book_pages)
+migration_manager.register_migration(15, migration_v15_audiobook_file_journal)
+migration_manager.register_migration(16, migration_v16_home_feed_library_version)
 
 
 def init_all_tables():
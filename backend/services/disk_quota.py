@@ -0,0 +1,131 @@
+"""
+Hermes Media Server - Quota dels caches a disc
+Mida màxima d'un directori de cache amb expulsió LRU. L'últim accés el
+porta el servidor (no l'atime del sistema de fitxers, que sovint està
+desactivat amb noatime/relatime); els fitxers que encara no s'han servit
+des de l'arrencada compten amb la data de creació.
+"""
+
+import os
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Fracció de la quota on es para d'esborrar
+PRUNE_TARGET = 0.9
+# Els fitxers més nous que això poden estar a mig escriure
+PRUNE_MIN_AGE = 60
+
+
+class DiskQuota:
+    """Quota d'un directori de cache (LRU per l'últim accés registrat)."""
+
+    def __init__(self, root: Union[str, Path, Callable[[], Path]], quota_bytes: int,
+                 pattern: str = "**/*", label: str = "Cache",
+                 clock: Callable[[], float] = time.time):
+        self._root = root
+        self.quota_bytes = quota_bytes
+        self.pattern = pattern
+        self.label = label
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._access: Dict[str, float] = {}
+        self._usage: Optional[int] = None
+
+    @property
+    def root(self) -> Path:
+        return Path(self._root() if callable(self._root) else self._root)
+
+    def touch(self, path: Union[str, Path]):
+        """Registra un accés al fitxer (sense tocar el disc)."""
+        now = self._clock()
+        with self._lock:
+            self._access[str(path)] = now
+
+    def added(self, path: Union[str, Path], size: int = None):
+        """Suma un fitxer nou al cache i fa neteja si se supera la quota."""
+        if size is None:
+            try:
+                size = os.stat(path).st_size
+            except OSError:
+                return
+        self.touch(path)
+        with self._lock:
+            if self._usage is not None:
+                self._usage += size
+            usage = self._usage
+        if usage is None:
+            usage = self.usage()
+        if usage > self.quota_bytes:
+            self.prune()
+
+    def usage(self) -> int:
+        """Bytes ocupats (es compta el directori la primera vegada)."""
+        with self._lock:
+            if self._usage is not None:
+                return self._usage
+        total = 0
+        for path in self.root.glob(self.pattern):
+            try:
+                if path.is_file():
+                    total += path.stat().st_size
+            except OSError:
+                continue
+        with self._lock:
+            self._usage = total
+        return total
+
+    def invalidate(self):
+        """S'han esborrat fitxers per un altre camí: es tornarà a comptar."""
+        with self._lock:
+            self._usage = None
+
+    def prune(self) -> int:
+        """Esborra els fitxers menys usats fins quedar al 90% de la quota."""
+        now = self._clock()
+        with self._lock:
+            access = dict(self._access)
+        files = []
+        for path in self.root.glob(self.pattern):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            if not path.is_file():
+                continue
+            files.append((access.get(str(path), st.st_mtime), st.st_size, st.st_mtime, path))
+        files.sort(key=lambda f: f[0])
+        usage = sum(f[1] for f in files)
+        target = self.quota_bytes * PRUNE_TARGET
+        removed = set()
+        for last_access, size, mtime, path in files:
+            if usage <= target:
+                break
+            if now - max(last_access, mtime) < PRUNE_MIN_AGE:
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            usage -= size
+            removed.add(str(path))
+            # Carpetes buides (pàgines d'un llibre, segments d'un perfil)
+            parent = path.parent
+            if parent != self.root:
+                try:
+                    parent.rmdir()
+                except OSError:
+                    pass
+
+        existing = {str(f[3]) for f in files} - removed
+        with self._lock:
+            self._usage = usage
+            # Només es recorden els fitxers que encara hi són
+            self._access = {p: t for p, t in self._access.items() if p in existing or t > now}
+        if removed:
+            logger.info(f"[{self.label}] {len(removed)} fitxers esborrats del cache")
+        return len(removed)
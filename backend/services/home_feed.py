@@ -0,0 +1,419 @@
+"""
+Hermes Media Server - Home Feed
+Feed materialitzat per usuari: "continuar veient" i "vist recentment"
+"""
+
+import json
+import sqlite3
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+KIND_CONTINUE = "continue"
+KIND_RECENT = "recent"
+
+# Elements visibles que es guarden al cache en memòria per tipus
+CACHE_ITEMS_PER_KIND = 100
+# Usuaris actius amb el feed en memòria
+MAX_CACHED_USERS = 256
+# Comptadors de canvis (triggers SQL) de les taules que alimenten el feed:
+# qualsevol alta, baixa o canvi de metadades o pòster, des de qualsevol
+# connexió, fa que el feed es reconstrueixi a la lectura següent
+LIBRARY_COUNTERS = ("series", "media_files")
+
+
+def init_home_feed_tables(conn: sqlite3.Connection):
+    """Crea les taules del feed materialitzat."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS home_feed (
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            item_key TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            last_watched TEXT,
+            visible INTEGER DEFAULT 1,
+            seq INTEGER NOT NULL,
+            PRIMARY KEY (user_id, kind, item_key)
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_home_feed_visible
+        ON home_feed(user_id, kind, visible, last_watched DESC)
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_home_feed_seq ON home_feed(user_id, seq)")
+    # Usuaris amb el feed construït (si no hi són, es reconstrueix a la primera lectura)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS home_feed_state (
+            user_id INTEGER PRIMARY KEY,
+            built_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            library_version TEXT
+        )
+    """)
+    conn.commit()
+
+
+def library_version(conn: sqlite3.Connection) -> Optional[str]:
+    """Versió de la biblioteca segons els comptadors de canvis (None si no n'hi ha)."""
+    from backend.services.validators import get_versions
+    try:
+        versions = get_versions(conn, LIBRARY_COUNTERS)
+    except sqlite3.OperationalError:
+        return None
+    return ",".join(f"{name}:{versions[name]}" for name in LIBRARY_COUNTERS)
+
+
+# === CACHE EN MEMÒRIA ===
+
+# user_id -> {"cursor": int, "library_version": str, KIND_CONTINUE: [...], KIND_RECENT: [...]}
+_cache: "OrderedDict[int, Dict]" = OrderedDict()
+
+
+def _cache_get(user_id: int) -> Optional[Dict]:
+    entry = _cache.get(user_id)
+    if entry is not None:
+        _cache.move_to_end(user_id)
+    return entry
+
+
+def _cache_drop(user_id: int):
+    _cache.pop(user_id, None)
+
+
+def clear_cache():
+    """Buida el cache en memòria de tots els usuaris."""
+    _cache.clear()
+
+
+# === CONSTRUCCIÓ D'ELEMENTS ===
+
+_LOCAL_SELECT = """
+    SELECT
+        wp.media_id,
+        wp.progress_seconds,
+        wp.total_seconds,
+        wp.updated_date,
+        mf.title as episode_title,
+        mf.season_number,
+        mf.episode_number,
+        mf.duration,
+        s.id as series_id,
+        s.name as series_name,
+        s.media_type,
+        s.poster,
+        s.backdrop,
+        s.tmdb_id
+    FROM watch_progress wp
+    JOIN media_files mf ON wp.media_id = mf.id
+    LEFT JOIN series s ON mf.series_id = s.id
+"""
+
+_STREAMING_SELECT = """
+    SELECT
+        id, tmdb_id, media_type, season_number, episode_number,
+        progress_percent, progress_seconds, total_seconds, completed,
+        title, poster_path, backdrop_path, still_path, updated_date
+    FROM streaming_progress
+"""
+
+
+def _local_is_visible(row) -> bool:
+    """Contingut local en progrés: més de 30s vistos i menys del 90%."""
+    progress = row["progress_seconds"] or 0
+    total = row["total_seconds"]
+    return progress > 30 and (total is None or progress < total * 0.9)
+
+
+def _local_item(row) -> Tuple[str, Dict]:
+    progress_pct = 0
+    if row["total_seconds"] and row["total_seconds"] > 0:
+        progress_pct = (row["progress_seconds"] / row["total_seconds"]) * 100
+
+    media_type = row["media_type"] if row["media_type"] else "series"
+    item_type = "movie" if media_type == "movie" else "episode"
+
+    key = f"local:{row['media_id']}"
+    return key, {
+        "id": row["media_id"],
+        "type": item_type,
+        "series_id": row["series_id"],
+        "series_name": row["series_name"],
+        "title": row["episode_title"],
+        "season_number": row["season_number"],
+        "episode_number": row["episode_number"],
+        "poster": row["poster"],
+        "backdrop": row["backdrop"],
+        "progress_seconds": row["progress_seconds"],
+        "total_seconds": row["total_seconds"],
+        "progress_percentage": round(progress_pct, 1),
+        "last_watched": row["updated_date"],
+        "tmdb_id": row["tmdb_id"],
+        "source": "local",
+        "feed_key": key,
+    }
+
+
+def _streaming_key(media_type: str, tmdb_id: int) -> str:
+    # Per sèries només hi ha una entrada (l'episodi més recent)
+    return f"streaming:{'movie' if media_type == 'movie' else 'series'}:{tmdb_id}"
+
+
+def _streaming_item(row) -> Tuple[str, Dict]:
+    item_type = "movie" if row["media_type"] == "movie" else "series"
+
+    # Usar valors reals si disponibles, si no estimar
+    progress_secs = row["progress_seconds"]
+    total_secs = row["total_seconds"]
+    if progress_secs is None or total_secs is None:
+        # Fallback per entrades antigues sense segons reals
+        total_secs = 6000  # 100 min estimat
+        progress_secs = int((row["progress_percent"] / 100) * total_secs)
+
+    key = _streaming_key(row["media_type"], row["tmdb_id"])
+    return key, {
+        "id": row["id"],
+        "type": item_type,
+        "tmdb_id": row["tmdb_id"],
+        "series_name": row["title"],
+        "title": row["title"],
+        "season_number": row["season_number"],
+        "episode_number": row["episode_number"],
+        "poster": row["poster_path"],
+        "backdrop": row["backdrop_path"],
+        "still_path": row["still_path"],
+        "progress_seconds": progress_secs,
+        "total_seconds": total_secs,
+        "progress_percentage": row["progress_percent"],
+        "last_watched": row["updated_date"],
+        "source": "streaming",
+        "feed_key": key,
+    }
+
+
+def _recent_item(series_id: int, series_name: str, poster: str, last_watched: str) -> Tuple[str, Dict]:
+    key = f"series:{series_id}"
+    return key, {
+        "series_id": series_id,
+        "series_name": series_name,
+        "poster": poster,
+        "last_watched": last_watched,
+        "feed_key": key,
+    }
+
+
+# === ESCRIPTURA ===
+
+def _next_seq(cursor: sqlite3.Cursor, user_id: int) -> int:
+    cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM home_feed WHERE user_id = ?", (user_id,))
+    return cursor.fetchone()[0] + 1
+
+
+def _upsert(cursor: sqlite3.Cursor, user_id: int, kind: str, key: str,
+            item: Optional[Dict], visible: bool) -> bool:
+    """
+    Escriu una entrada del feed si ha canviat. Si visible és False es
+    deixa com a 'tombstone' perquè els clients amb cursor vegin l'eliminació.
+    Retorna True si s'ha escrit alguna cosa.
+    """
+    cursor.execute("""
+        SELECT payload, visible FROM home_feed
+        WHERE user_id = ? AND kind = ? AND item_key = ?
+    """, (user_id, kind, key))
+    existing = cursor.fetchone()
+
+    if not visible:
+        if existing is None or not existing[1]:
+            return False
+        cursor.execute("""
+            UPDATE home_feed SET visible = 0, seq = ?
+            WHERE user_id = ? AND kind = ? AND item_key = ?
+        """, (_next_seq(cursor, user_id), user_id, kind, key))
+        return True
+
+    payload = json.dumps(item, ensure_ascii=False)
+    if existing is not None and existing[1] and existing[0] == payload:
+        return False
+
+    cursor.execute("""
+        INSERT INTO home_feed (user_id, kind, item_key, payload, last_watched, visible, seq)
+        VALUES (?, ?, ?, ?, ?, 1, ?)
+        ON CONFLICT(user_id, kind, item_key) DO UPDATE SET
+            payload = excluded.payload,
+            last_watched = excluded.last_watched,
+            visible = 1,
+            seq = excluded.seq
+    """, (user_id, kind, key, payload, item.get("last_watched"), _next_seq(cursor, user_id)))
+    return True
+
+
+def on_watch_progress(conn: sqlite3.Connection, user_id: int, media_id: int):
+    """Actualitza el feed després de guardar el progrés d'un fitxer local."""
+    cursor = conn.cursor()
+    cursor.execute(_LOCAL_SELECT + " WHERE wp.user_id = ? AND wp.media_id = ?", (user_id, media_id))
+    row = cursor.fetchone()
+    if not row:
+        return
+
+    key, item = _local_item(row)
+    _upsert(cursor, user_id, KIND_CONTINUE, key, item, _local_is_visible(row))
+
+    if row["series_id"] is not None:
+        key, item = _recent_item(row["series_id"], row["series_name"], row["poster"], row["updated_date"])
+        _upsert(cursor, user_id, KIND_RECENT, key, item, True)
+
+    conn.commit()
+    _cache_drop(user_id)
+
+
+def on_streaming_progress(conn: sqlite3.Connection, user_id: int, tmdb_id: int, media_type: str):
+    """
+    Actualitza el feed després de guardar progrés de streaming.
+    Per sèries l'entrada és l'episodi no acabat més recent.
+    """
+    cursor = conn.cursor()
+    type_filter = "media_type = 'movie'" if media_type == "movie" else "media_type != 'movie'"
+    cursor.execute(_STREAMING_SELECT + f"""
+        WHERE user_id = ? AND tmdb_id = ? AND {type_filter}
+        AND completed = 0 AND progress_percent > 0
+        ORDER BY updated_date DESC
+        LIMIT 1
+    """, (user_id, tmdb_id))
+    row = cursor.fetchone()
+
+    if row:
+        key, item = _streaming_item(row)
+        _upsert(cursor, user_id, KIND_CONTINUE, key, item, True)
+    else:
+        _upsert(cursor, user_id, KIND_CONTINUE, _streaming_key(media_type, tmdb_id), None, False)
+
+    conn.commit()
+    _cache_drop(user_id)
+
+
+def rebuild(conn: sqlite3.Connection, user_id: int, version: Optional[str] = None):
+    """
+    Reconstrueix el feed d'un usuari a partir de les taules de progrés.
+    Només escriu les diferències, així el cursor 'since' continua sent vàlid.
+    """
+    cursor = conn.cursor()
+    fresh: Dict[Tuple[str, str], Dict] = {}
+
+    cursor.execute(_LOCAL_SELECT + """
+        WHERE wp.user_id = ?
+        AND wp.progress_seconds > 30
+        AND (wp.total_seconds IS NULL OR wp.progress_seconds < wp.total_seconds * 0.9)
+    """, (user_id,))
+    for row in cursor.fetchall():
+        key, item = _local_item(row)
+        fresh[(KIND_CONTINUE, key)] = item
+
+    cursor.execute(_STREAMING_SELECT + """
+        WHERE user_id = ? AND completed = 0 AND progress_percent > 0
+        ORDER BY updated_date DESC
+    """, (user_id,))
+    for row in cursor.fetchall():
+        key, item = _streaming_item(row)
+        fresh.setdefault((KIND_CONTINUE, key), item)
+
+    cursor.execute("""
+        SELECT s.id as series_id, s.name as series_name, s.poster,
+               MAX(wp.updated_date) as last_watched
+        FROM watch_progress wp
+        JOIN media_files mf ON wp.media_id = mf.id
+        JOIN series s ON mf.series_id = s.id
+        WHERE wp.user_id = ?
+        GROUP BY s.id
+    """, (user_id,))
+    for row in cursor.fetchall():
+        key, item = _recent_item(row["series_id"], row["series_name"], row["poster"], row["last_watched"])
+        fresh[(KIND_RECENT, key)] = item
+
+    cursor.execute("SELECT kind, item_key FROM home_feed WHERE user_id = ? AND visible = 1", (user_id,))
+    stale = [(kind, key) for kind, key in cursor.fetchall() if (kind, key) not in fresh]
+
+    for (kind, key), item in fresh.items():
+        _upsert(cursor, user_id, kind, key, item, True)
+    for kind, key in stale:
+        _upsert(cursor, user_id, kind, key, None, False)
+
+    cursor.execute(
+        "INSERT OR REPLACE INTO home_feed_state (user_id, library_version) VALUES (?, ?)",
+        (user_id, version if version is not None else library_version(conn)),
+    )
+    conn.commit()
+    _cache_drop(user_id)
+    logger.debug(f"Feed de l'usuari {user_id} reconstruït ({len(fresh)} elements, {len(stale)} eliminats)")
+
+
+# === LECTURA ===
+
+def _load(conn: sqlite3.Connection, user_id: int) -> Dict:
+    """
+    Retorna el feed de l'usuari des de memòria o amb una lectura indexada.
+    Si la biblioteca ha canviat des que es va construir, es reconstrueix.
+    """
+    version = library_version(conn)
+    entry = _cache_get(user_id)
+    if entry is not None and entry["library_version"] == version:
+        return entry
+
+    cursor = conn.cursor()
+    cursor.execute("SELECT library_version FROM home_feed_state WHERE user_id = ?", (user_id,))
+    state = cursor.fetchone()
+    if state is None or state[0] != version:
+        rebuild(conn, user_id, version)
+
+    entry = {"cursor": get_cursor(conn, user_id), "library_version": version}
+    for kind in (KIND_CONTINUE, KIND_RECENT):
+        cursor.execute("""
+            SELECT payload FROM home_feed
+            WHERE user_id = ? AND kind = ? AND visible = 1
+            ORDER BY last_watched DESC
+            LIMIT ?
+        """, (user_id, kind, CACHE_ITEMS_PER_KIND))
+        entry[kind] = [json.loads(row[0]) for row in cursor.fetchall()]
+
+    _cache[user_id] = entry
+    while len(_cache) > MAX_CACHED_USERS:
+        _cache.popitem(last=False)
+    return entry
+
+
+def get_cursor(conn: sqlite3.Connection, user_id: int) -> int:
+    """Cursor actual del feed (seqüència més alta)."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM home_feed WHERE user_id = ?", (user_id,))
+    return cursor.fetchone()[0]
+
+
+def get_items(conn: sqlite3.Connection, user_id: int, kind: str, limit: int) -> Tuple[List[Dict], int]:
+    """Retorna (elements visibles, cursor) d'un tipus de feed."""
+    entry = _load(conn, user_id)
+    return [dict(item) for item in entry[kind][:limit]], entry["cursor"]
+
+
+def get_changes(conn: sqlite3.Connection, user_id: int, kind: str, since: int) -> Dict:
+    """
+    Retorna els canvis posteriors a un cursor: elements nous o actualitzats
+    i claus eliminades.
+    """
+    cursor_value = _load(conn, user_id)["cursor"]
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT item_key, payload, visible FROM home_feed
+        WHERE user_id = ? AND kind = ? AND seq > ?
+        ORDER BY seq
+    """, (user_id, kind, since))
+
+    items = []
+    removed = []
+    for key, payload, visible in cursor.fetchall():
+        if visible:
+            items.append(json.loads(payload))
+        else:
+            removed.append(key)
+
+    return {"cursor": cursor_value, "items": items, "removed": removed}
@@ -0,0 +1,223 @@
+"""
+Hermes Media Server - Variants d'imatges
+Pòsters, fons i portades redimensionats a amplades fixes i en el format
+més lleuger que accepti el navegador (AVIF/WebP/JPEG). Cada variant es
+genera una sola vegada i es guarda a disc amb una clau derivada del
+contingut de l'original.
+"""
+
+import os
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Union
+
+from fastapi import Request
+from starlette.responses import FileResponse, Response
+
+from backend.services.disk_quota import DiskQuota
+from backend.services.probe_cache import FileIdentity, file_identity
+from backend.services.thumbnails import ThumbnailPool, available_cores
+from backend.services.validators import (
+    ARTWORK_CACHE_CONTROL, IMMUTABLE_CACHE_CONTROL, etag_matches, file_response
+)
+
+logger = logging.getLogger(__name__)
+
+# Pillow és opcional: sense ell es serveixen els originals
+try:
+    from PIL import Image, ImageOps, features
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+
+# Amplades que es generen (la petició s'arrodoneix a la següent)
+WIDTH_BUCKETS = (160, 240, 342, 500, 780, 1280, 1920)
+# Qualitat per format
+QUALITY = {"avif": 55, "webp": 80, "jpeg": 82}
+MEDIA_TYPES = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg"}
+# Mida màxima del cache de variants
+DEFAULT_QUOTA_BYTES = int(os.environ.get("HERMES_IMAGE_CACHE_BYTES", str(2 * 1024 ** 3)))
+IMAGE_WORKERS = int(os.environ.get("HERMES_IMAGE_WORKERS", "0")) or available_cores()
+# Hashos d'originals que es recorden (per identitat del fitxer)
+MAX_DIGESTS = 20000
+
+
+def _encoder_available(fmt: str) -> bool:
+    if not PIL_AVAILABLE:
+        return False
+    if fmt == "jpeg":
+        return True
+    try:
+        return bool(features.check(fmt))
+    except Exception:
+        return False
+
+
+ENCODERS = {fmt: _encoder_available(fmt) for fmt in ("avif", "webp", "jpeg")}
+
+
+def pick_width(requested: Optional[int]) -> Optional[int]:
+    """Amplada del bucket per a la petició (None = mida original)."""
+    if not requested or requested <= 0:
+        return None
+    for width in WIDTH_BUCKETS:
+        if width >= requested:
+            return width
+    return WIDTH_BUCKETS[-1]
+
+
+def negotiate_format(accept: Optional[str], requested: Optional[str] = None) -> str:
+    """Format de sortida segons ?format= o la capçalera Accept."""
+    if requested:
+        requested = "jpeg" if requested.lower() == "jpg" else requested.lower()
+        if ENCODERS.get(requested):
+            return requested
+    accept = (accept or "").lower()
+    for fmt in ("avif", "webp"):
+        if f"image/{fmt}" in accept and ENCODERS[fmt]:
+            return fmt
+    return "jpeg"
+
+
+def render_variant(source: Union[str, Path], dest: Path, width: int, fmt: str):
+    """Redimensiona (sense ampliar) i codifica una imatge amb Pillow."""
+    with Image.open(source) as image:
+        # Els JPEG es poden descodificar directament a una mida reduïda
+        image.draft("RGB", (width, width * 4))
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.LANCZOS)
+
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        if fmt == "jpeg" or not has_alpha:
+            image = image.convert("RGB")
+        else:
+            image = image.convert("RGBA")
+
+        options = {"quality": QUALITY[fmt]}
+        if fmt == "jpeg":
+            options.update(progressive=True, optimize=True)
+        elif fmt == "webp":
+            options["method"] = 4
+
+        tmp = dest.with_name(dest.name + ".tmp")
+        image.save(tmp, format=fmt.upper(), **options)
+    os.replace(tmp, dest)
+
+
+class ImageVariantCache:
+    """Cache a disc de variants, adreçat pel hash de l'original."""
+
+    def __init__(self, root: Union[str, Path] = None, quota_bytes: int = DEFAULT_QUOTA_BYTES,
+                 workers: int = IMAGE_WORKERS):
+        self._root = Path(root) if root else None
+        self.quota = DiskQuota(lambda: self.root, quota_bytes, "*/*", "Images")
+        self.pool = ThumbnailPool(workers)
+        self._digests: "OrderedDict[FileIdentity, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def root(self) -> Path:
+        if self._root is None:
+            from config import settings
+            self._root = Path(settings.CACHE_DIR) / "images"
+        return self._root
+
+    def cached_digest(self, path: Union[str, Path]) -> Optional[str]:
+        """Hash ja calculat de l'original, si el fitxer no ha canviat (només un stat)."""
+        identity = file_identity(path)
+        with self._lock:
+            digest = self._digests.get(identity)
+            if digest is not None:
+                self._digests.move_to_end(identity)
+        return digest
+
+    def source_digest(self, path: Union[str, Path]) -> str:
+        """
+        Hash del contingut de l'original. Es recorda per identitat del fitxer
+        (dispositiu, inode, mida, mtime) en un LRU limitat: només es torna a
+        llegir el fitxer si canvia. Llegeix el fitxer sencer: fora del bucle.
+        """
+        identity = file_identity(path)
+        with self._lock:
+            digest = self._digests.get(identity)
+            if digest is not None:
+                self._digests.move_to_end(identity)
+                return digest
+
+        sha = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(block)
+        digest = sha.hexdigest()[:24]
+        with self._lock:
+            self._digests[identity] = digest
+            while len(self._digests) > MAX_DIGESTS:
+                self._digests.popitem(last=False)
+        return digest
+
+    def variant_path(self, digest: str, width: int, fmt: str) -> Path:
+        return self.root / digest[:2] / f"{digest}_{width}.{fmt}"
+
+    def _render(self, source: Path, dest: Path, width: int, fmt: str) -> Path:
+        if dest.exists():
+            return dest
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        render_variant(source, dest, width, fmt)
+        self.quota.added(dest)
+        return dest
+
+    async def get(self, source: Union[str, Path], width: int, fmt: str,
+                  digest: str = None) -> Path:
+        """Camí de la variant, generant-la al pool si encara no existeix."""
+        digest = digest or await asyncio.to_thread(self.source_digest, source)
+        dest = self.variant_path(digest, width, fmt)
+        if dest.exists():
+            self.quota.touch(dest)
+            return dest
+        return await self.pool.run(f"{digest}_{width}.{fmt}", self._render, Path(source), dest, width, fmt)
+
+    def prune(self) -> int:
+        """Esborra les variants menys usades fins quedar al 90% de la quota."""
+        return self.quota.prune()
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+
+# Instància global
+image_cache = ImageVariantCache()
+
+
+async def image_response(request: Request, path: Union[str, Path], media_type: str = None,
+                         width: int = None, fmt: str = None) -> Response:
+    """
+    Serveix una imatge local: l'original si no es demana amplada (o no hi
+    ha Pillow), o la variant redimensionada i en el format negociat.
+    """
+    bucket = pick_width(width)
+    if bucket is None or not PIL_AVAILABLE:
+        return file_response(request, path, media_type=media_type)
+
+    fmt = negotiate_format(request.headers.get("accept"), fmt)
+    # El primer cop es llegeix l'original sencer: fora del bucle d'events
+    digest = image_cache.cached_digest(path) or await asyncio.to_thread(image_cache.source_digest, path)
+    etag = f'"{digest}-{bucket}-{fmt}"'
+    cache_control = IMMUTABLE_CACHE_CONTROL if request.query_params.get("v") else ARTWORK_CACHE_CONTROL
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        variant = await image_cache.get(path, bucket, fmt, digest)
+    except Exception as e:
+        # Imatge que Pillow no sap llegir: l'original
+        logger.warning(f"[Images] No s'ha pogut generar la variant de {path}: {e}")
+        return file_response(request, path, media_type=media_type)
+    return FileResponse(variant, media_type=MEDIA_TYPES[fmt], headers=headers)
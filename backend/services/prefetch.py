@@ -0,0 +1,239 @@
+"""
+Hermes Media Server - Prefetch del següent episodi
+Quan la reproducció arriba als crèdits, prepara el que necessitarà el
+següent episodi (fitxer, link de Real-Debrid, stream de BBC, subtítols).
+"""
+
+import os
+import re
+import time
+import asyncio
+import logging
+import threading
+from typing import Awaitable, Callable, Dict, Optional
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+
+# Fracció de l'episodi a partir de la qual es fa el prefetch (si no hi ha outro detectat)
+PREFETCH_THRESHOLD = float(os.environ.get("HERMES_PREFETCH_THRESHOLD", "0.85"))
+# Treballs de prefetch simultanis i pendents com a màxim
+PREFETCH_MAX_CONCURRENT = 1
+PREFETCH_MAX_PENDING = 4
+# Temps màxim per treball (segons)
+PREFETCH_TIMEOUT = 60.0
+# Un mateix element no es torna a preparar durant aquest temps (segons)
+PREFETCH_DEDUPE_TTL = 1800
+# Quant recordem com s'ha resolt l'últim episodi d'un contingut (segons)
+RESOLUTION_TTL = 6 * 3600
+
+# Un client compta com a reproduint fins aquests segons després de l'última
+# petició de stream (els reproductors HLS demanen un segment cada pocs segons)
+LIVE_GRACE = 15.0
+# Clients reproduint a partir dels quals el prefetch s'espera: el que ha
+# disparat el prefetch ja n'és un
+LIVE_BUSY_CLIENTS = int(os.environ.get("HERMES_PREFETCH_BUSY_CLIENTS", "2"))
+
+# Bytes a portar al page cache: inici (capçaleres i primers segons) i final (índex MP4/MKV)
+WARM_HEAD_BYTES = 16 * 1024 * 1024
+WARM_TAIL_BYTES = 4 * 1024 * 1024
+
+Job = Callable[[], Awaitable[None]]
+
+
+def should_prefetch(position: Optional[float], duration: Optional[float],
+                    outro_start: Optional[float] = None,
+                    threshold: float = None) -> bool:
+    """
+    Comprova si la reproducció ha arribat al punt de preparar el següent.
+    outro_start pot ser negatiu (segons des del final).
+    """
+    if not position or not duration or duration <= 0:
+        return False
+    threshold = PREFETCH_THRESHOLD if threshold is None else threshold
+    trigger = duration * threshold
+    if outro_start is not None:
+        outro = duration + outro_start if outro_start < 0 else outro_start
+        if 0 < outro < duration:
+            trigger = min(trigger, outro)
+    return position >= trigger
+
+
+def system_busy() -> bool:
+    """La màquina ja està ocupada (transcodificacions, miniatures...)."""
+    try:
+        load = os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return False
+    return load >= (os.cpu_count() or 1)
+
+
+class LiveStreams:
+    """Clients que estan reproduint (amb una petició de stream en curs o recent)."""
+
+    def __init__(self, grace: float = LIVE_GRACE, busy_clients: int = LIVE_BUSY_CLIENTS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.grace = grace
+        self.busy_clients = max(busy_clients, 1)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, int] = {}
+        self._last: Dict[str, float] = {}
+
+    def begin(self, client: str):
+        with self._lock:
+            self._inflight[client] = self._inflight.get(client, 0) + 1
+
+    def end(self, client: str):
+        with self._lock:
+            count = self._inflight.get(client, 0) - 1
+            if count > 0:
+                self._inflight[client] = count
+            else:
+                self._inflight.pop(client, None)
+            self._last[client] = self._clock()
+
+    def clients(self) -> int:
+        """Clients reproduint ara mateix."""
+        horizon = self._clock() - self.grace
+        with self._lock:
+            self._last = {client: t for client, t in self._last.items() if t > horizon}
+            return len(set(self._inflight) | set(self._last))
+
+    def busy(self) -> bool:
+        return self.clients() >= self.busy_clients
+
+
+class LiveStreamMiddleware:
+    """Apunta a LiveStreams les peticions de reproducció (fins que s'ha enviat tota la resposta)."""
+
+    def __init__(self, app: ASGIApp, streams: LiveStreams, pattern: str):
+        self.app = app
+        self.streams = streams
+        self.pattern = re.compile(pattern)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self.pattern.match(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        client = (scope.get("client") or ("?",))[0]
+        self.streams.begin(client)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.streams.end(client)
+
+
+def warm_file(path: str) -> int:
+    """
+    Porta l'inici i el final d'un fitxer al page cache.
+    Amb posix_fadvise el kernel ho llegeix en segon pla; si no, es llegeix.
+    Retorna els bytes demanats.
+    """
+    size = os.path.getsize(path)
+    head = min(size, WARM_HEAD_BYTES)
+    tail_start = max(head, size - WARM_TAIL_BYTES)
+    ranges = [(0, head)]
+    if tail_start < size:
+        ranges.append((tail_start, size - tail_start))
+
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        for offset, length in ranges:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(fd, offset, length, os.POSIX_FADV_WILLNEED)
+            else:
+                os.lseek(fd, offset, os.SEEK_SET)
+                remaining = length
+                while remaining > 0:
+                    chunk = os.read(fd, min(remaining, 1024 * 1024))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+    finally:
+        os.close(fd)
+    return sum(length for _, length in ranges)
+
+
+class Prefetcher:
+    """
+    Cua de prefetch amb pressupost:
+    - Un sol treball alhora i pocs pendents (la resta es descarten)
+    - No s'executa si la reproducció en directe necessita els recursos
+    - Cada element es prepara com a molt una vegada cada PREFETCH_DEDUPE_TTL
+    """
+
+    def __init__(self, is_busy: Callable[[], bool] = None,
+                 max_concurrent: int = PREFETCH_MAX_CONCURRENT):
+        self._is_busy = is_busy or system_busy
+        self._max_concurrent = max_concurrent
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._seen: Dict[str, float] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._resolutions: Dict[int, Dict[str, tuple]] = {}
+        self._stats = {"scheduled": 0, "completed": 0, "failed": 0, "skipped_busy": 0}
+
+    def _busy(self) -> bool:
+        try:
+            return self._is_busy()
+        except Exception:
+            return False
+
+    def schedule(self, key: str, job: Job) -> bool:
+        """
+        Programa un treball de prefetch en segon pla.
+        Retorna False si s'ha descartat (repetit, cua plena o servidor ocupat).
+        """
+        now = time.time()
+        if self._seen.get(key, 0) > now:
+            return False
+        if key in self._tasks or len(self._tasks) >= PREFETCH_MAX_PENDING:
+            return False
+        if self._busy():
+            self._stats["skipped_busy"] += 1
+            return False
+
+        self._seen[key] = now + PREFETCH_DEDUPE_TTL
+        if len(self._seen) > 1000:
+            self._seen = {k: v for k, v in self._seen.items() if v > now}
+
+        self._stats["scheduled"] += 1
+        self._tasks[key] = asyncio.create_task(self._run(key, job))
+        return True
+
+    async def _run(self, key: str, job: Job):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrent)
+        try:
+            async with self._semaphore:
+                # La situació pot haver canviat mentre esperàvem torn
+                if self._busy():
+                    self._stats["skipped_busy"] += 1
+                    self._seen.pop(key, None)
+                    return
+                started = time.monotonic()
+                await asyncio.wait_for(job(), timeout=PREFETCH_TIMEOUT)
+                self._stats["completed"] += 1
+                logger.info(f"[Prefetch] {key} preparat en {time.monotonic() - started:.1f}s")
+        except Exception as e:
+            self._stats["failed"] += 1
+            logger.debug(f"[Prefetch] {key} ha fallat: {e!r}")
+        finally:
+            self._tasks.pop(key, None)
+
+    def remember(self, tmdb_id: int, kind: str, **data):
+        """Recorda com s'ha resolt l'últim episodi d'un contingut ('rd', 'bbc', 'extract')."""
+        entries = self._resolutions.setdefault(tmdb_id, {})
+        entries[kind] = (time.time() + RESOLUTION_TTL, data)
+
+    def resolutions(self, tmdb_id: int) -> Dict[str, dict]:
+        """Resolucions vigents d'un contingut."""
+        now = time.time()
+        entries = self._resolutions.get(tmdb_id, {})
+        return {kind: data for kind, (expires, data) in entries.items() if expires > now}
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {**self._stats, "pending": len(self._tasks)}
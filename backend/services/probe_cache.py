@@ -0,0 +1,212 @@
+"""
+Hermes Media Server - Cache de ffprobe
+Guarda el JSON de format i streams de cada fitxer, identificat per
+(dispositiu, inode, mida, mtime_ns). Només es torna a executar ffprobe
+si el fitxer canvia.
+"""
+
+import os
+import json
+import sqlite3
+import logging
+import threading
+import subprocess
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+
+# Entrades guardades en memòria (la resta es llegeixen de la BD)
+MEMORY_ENTRIES = 2048
+PROBE_TIMEOUT = 30
+
+FileIdentity = Tuple[int, int, int, int]
+
+
+def init_probe_tables(conn: sqlite3.Connection):
+    """Crea la taula del cache de ffprobe."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS probe_cache (
+            device INTEGER NOT NULL,
+            inode INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            path TEXT,
+            data TEXT NOT NULL,
+            probed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (device, inode)
+        )
+    """)
+    conn.commit()
+
+
+def file_identity(path: Union[str, Path]) -> FileIdentity:
+    """Identitat d'un fitxer: canvia si es modifica o es substitueix."""
+    st = os.stat(path)
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def run_ffprobe(path: Union[str, Path], timeout: int = PROBE_TIMEOUT) -> Optional[Dict]:
+    """Executa ffprobe i retorna el JSON de format, streams i capítols."""
+    cmd = [
+        'ffprobe', '-v', 'quiet',
+        '-print_format', 'json',
+        '-show_format', '-show_streams', '-show_chapters',
+        str(path)
+    ]
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, text=True, timeout=timeout,
+            encoding="utf-8", errors="ignore"
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.debug(f"ffprobe ha fallat per {path}: {e}")
+        return None
+    if result.returncode != 0:
+        return None
+    try:
+        return json.loads(result.stdout)
+    except json.JSONDecodeError:
+        return None
+
+
+class ProbeCache:
+    """Cache persistent (SQLite) amb un LRU en memòria al davant."""
+
+    def __init__(self, db_path: Union[str, Path] = None):
+        self._db_path = db_path
+        self._memory: "OrderedDict[Tuple[int, int], Tuple[FileIdentity, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._tables_ready = False
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db_path is None:
+            from config import settings
+            self._db_path = settings.DATABASE_PATH
+        conn = sqlite3.connect(str(self._db_path), timeout=30)
+        if not self._tables_ready:
+            init_probe_tables(conn)
+            self._tables_ready = True
+        return conn
+
+    def _remember(self, identity: FileIdentity, data: Dict):
+        with self._lock:
+            key = identity[:2]
+            self._memory[key] = (identity, data)
+            self._memory.move_to_end(key)
+            while len(self._memory) > MEMORY_ENTRIES:
+                self._memory.popitem(last=False)
+
+    def get(self, path: Union[str, Path], identity: FileIdentity = None) -> Optional[Dict]:
+        """Resultat guardat si el fitxer no ha canviat."""
+        identity = identity or file_identity(path)
+        with self._lock:
+            entry = self._memory.get(identity[:2])
+        if entry and entry[0] == identity:
+            return entry[1]
+
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    "SELECT size, mtime_ns, data FROM probe_cache WHERE device = ? AND inode = ?",
+                    identity[:2]
+                ).fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.debug(f"No s'ha pogut llegir probe_cache: {e}")
+            return None
+
+        if not row or (row[0], row[1]) != identity[2:]:
+            return None
+        data = json.loads(row[2])
+        self._remember(identity, data)
+        return data
+
+    def put(self, path: Union[str, Path], identity: FileIdentity, data: Dict):
+        """Guarda el resultat (substitueix el d'una versió anterior del fitxer)."""
+        self._remember(identity, data)
+        try:
+            conn = self._connect()
+            try:
+                conn.execute("""
+                    INSERT OR REPLACE INTO probe_cache (device, inode, size, mtime_ns, path, data)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (*identity, str(path), json.dumps(data, separators=(",", ":"))))
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.debug(f"No s'ha pogut guardar probe_cache: {e}")
+
+    def probe(self, path: Union[str, Path], timeout: int = PROBE_TIMEOUT) -> Optional[Dict]:
+        """JSON de ffprobe (format i streams), des del cache si és possible."""
+        try:
+            identity = file_identity(path)
+        except OSError:
+            # URLs remotes o fitxers inexistents: sense cache
+            return run_ffprobe(path, timeout)
+
+        data = self.get(path, identity)
+        if data is not None:
+            self.hits += 1
+            return data
+
+        self.misses += 1
+        data = run_ffprobe(path, timeout)
+        if data is not None:
+            self.put(path, identity, data)
+        return data
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+
+
+# Instància global
+probe_cache = ProbeCache()
+
+
+def probe_media(path: Union[str, Path], timeout: int = PROBE_TIMEOUT) -> Optional[Dict]:
+    """Drecera a probe_cache.probe()."""
+    return probe_cache.probe(path, timeout)
+
+
+def probe_chapters(path: Union[str, Path]) -> List[Dict]:
+    """
+    Capítols incrustats (m4b, mkv...). Les entrades del cache anteriors a
+    -show_chapters no en tenen la clau i es tornen a provar una vegada.
+    """
+    data = probe_media(path)
+    if data is not None and "chapters" not in data:
+        fresh = run_ffprobe(path)
+        if fresh is not None:
+            fresh.setdefault("chapters", [])
+            try:
+                probe_cache.put(path, file_identity(path), fresh)
+            except OSError:
+                pass
+            data = fresh
+    return (data or {}).get("chapters") or []
+
+
+def probe_duration(path: Union[str, Path]) -> Optional[float]:
+    """Durada en segons (del format o del primer stream que la tingui)."""
+    data = probe_media(path)
+    if not data:
+        return None
+    duration = data.get("format", {}).get("duration")
+    if duration is None:
+        for stream in data.get("streams", []):
+            if stream.get("duration"):
+                duration = stream["duration"]
+                break
+    try:
+        return float(duration) if duration is not None else None
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,101 @@
+"""
+Hermes Media Server - Projeccions de llistats
+Selecció de camps (fields=), format compacte i resposta JSON ràpida
+"""
+
+import sqlite3
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# orjson serialitza directament sense passar per jsonable_encoder
+try:
+    import orjson  # noqa: F401
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+    ORJSON_AVAILABLE = True
+except ImportError:
+    from fastapi.responses import JSONResponse as FastJSONResponse
+    ORJSON_AVAILABLE = False
+    logger.warning(
+        "orjson no instal·lat. Els llistats es serialitzaran amb json estàndard. "
+        "Instal·la amb: pip install orjson"
+    )
+
+
+# Cache de columnes per taula (l'esquema només canvia amb migracions)
+_table_columns: Dict[str, List[str]] = {}
+
+
+class FieldError(ValueError):
+    """Camp demanat que no existeix al llistat."""
+
+
+def parse_fields(fields: Optional[str], available: Iterable[str]) -> Optional[List[str]]:
+    """
+    Converteix 'id,title,cover' en una llista de camps vàlids.
+    Retorna None si no s'ha demanat cap camp (llistat complet).
+    """
+    if not fields:
+        return None
+    available = list(available)
+    requested = []
+    for name in fields.split(","):
+        name = name.strip()
+        if not name or name in requested:
+            continue
+        if name not in available:
+            raise FieldError(f"Camp desconegut: {name}. Disponibles: {', '.join(available)}")
+        requested.append(name)
+    return requested or None
+
+
+def table_columns(cursor: sqlite3.Cursor, table: str) -> List[str]:
+    """Columnes d'una taula en l'ordre de l'esquema."""
+    columns = _table_columns.get(table)
+    if not columns:
+        cursor.execute(f"PRAGMA table_info({table})")
+        columns = [row[1] for row in cursor.fetchall()]
+        if columns:
+            _table_columns[table] = columns
+    return columns
+
+
+def clear_columns_cache():
+    """Oblida l'esquema guardat (després de migracions)."""
+    _table_columns.clear()
+
+
+def select_list(names: Sequence[str], columns: Dict[str, Sequence[str]]) -> str:
+    """
+    Construeix la llista del SELECT amb les expressions SQL que calen
+    per als camps demanats, sense duplicats.
+    """
+    exprs: List[str] = []
+    for name in names:
+        for expr in columns[name]:
+            if expr not in exprs:
+                exprs.append(expr)
+    return ", ".join(exprs)
+
+
+def project(items: List[Dict[str, Any]], names: Optional[List[str]], compact: bool = False,
+            available: Optional[Iterable[str]] = None) -> Any:
+    """
+    Aplica la projecció a una llista d'elements.
+    - compact: {"fields": [...], "items": [[v1, v2, ...], ...]}
+    - names: llista de dicts només amb els camps demanats
+    - sense res: la llista tal qual
+    available: camps del llistat complet, per al format compacte sense
+    fields= (així una llista buida també porta els noms de les columnes)
+    """
+    if compact:
+        if names is None:
+            if available is not None:
+                names = list(available)
+            else:
+                names = list(items[0].keys()) if items else []
+        return {"fields": names, "items": [[item.get(n) for n in names] for item in items]}
+    if names is None:
+        return items
+    return [{n: item.get(n) for n in names} for item in items]
@@ -0,0 +1,169 @@
+"""
+Hermes Media Server - Sort Keys
+Claus d'ordenació precalculades (sense accents, criteri català)
+"""
+
+import sqlite3
+import logging
+import unicodedata
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# Caràcters que s'ignoren a l'inici d'un títol ('"¡Hola!"' s'ordena a la H)
+LEADING_IGNORED = " \"'¡¿([{-.«»“”‘’"
+
+# Taules amb clau d'ordenació: (taula, columna d'origen, columna clau)
+SORT_KEY_COLUMNS: List[Tuple[str, str, str]] = [
+    ("series", "name", "sort_name"),
+    ("books", "title", "sort_title"),
+    ("authors", "name", "sort_name"),
+    ("audiobooks", "title", "sort_title"),
+    ("audiobook_authors", "name", "sort_name"),
+]
+
+# Substitucions que la descomposició Unicode no resol
+_SPECIAL_FOLDS = {
+    "·": "",    # l·l → ll (ela geminada)
+    "ß": "ss",
+    "Æ": "ae", "æ": "ae",
+    "Œ": "oe", "œ": "oe",
+    "Ø": "o", "ø": "o",
+    "Đ": "d", "đ": "d",
+    "Ł": "l", "ł": "l",
+    "Þ": "th", "þ": "th",
+    "Ð": "d", "ð": "d",
+    "ı": "i",
+}
+
+
+def _build_fold_map() -> Dict[str, str]:
+    """
+    Construeix el mapa de plegat per Latin-1 i Latin Extended-A.
+    Tant la versió Python com l'expressió SQL fan servir aquest mapa,
+    així el resultat és idèntic en els dos costats.
+    """
+    fold = {}
+    for codepoint in range(0x00C0, 0x0180):
+        char = chr(codepoint)
+        if char in _SPECIAL_FOLDS:
+            continue
+        decomposed = unicodedata.normalize("NFKD", char)
+        base = "".join(c for c in decomposed if unicodedata.category(c) != "Mn")
+        if base and base != char and base.isascii():
+            fold[char] = base.lower()
+    fold.update(_SPECIAL_FOLDS)
+    return fold
+
+
+_FOLD_MAP = _build_fold_map()
+
+# Nombre de REPLACE niats per sentència SQL
+_REPLACE_BATCH = 20
+
+# Taula per str.translate: plegat d'accents + minúscules ASCII (com LOWER() de SQLite)
+_TRANSLATE_TABLE = str.maketrans({
+    **{chr(c): chr(c + 32) for c in range(ord("A"), ord("Z") + 1)},
+    **_FOLD_MAP,
+})
+
+
+def sort_key(text: str) -> str:
+    """
+    Retorna la clau d'ordenació d'un text.
+    'Èxit' → 'exit', 'Col·lecció' → 'colleccio', '¿Quién?' → 'quien?'
+    """
+    if not text:
+        return ""
+    return text.translate(_TRANSLATE_TABLE).lstrip(LEADING_IGNORED).rstrip(" ")
+
+
+def sql_sort_key_statements(table: str, source: str, key: str) -> List[str]:
+    """
+    Genera les sentències SQL equivalents a sort_key() per a una fila.
+    Només fa servir funcions natives de SQLite, de manera que els triggers
+    funcionen des de qualsevol connexió (scanner, auth, scripts...).
+    Els REPLACE s'agrupen en blocs perquè el parser de SQLite té un límit
+    de profunditat d'expressions niades. Un text només ASCII (la majoria)
+    es resol amb la primera sentència; la resta només escriuen si cal plegar.
+    """
+    value = f"NEW.{source}"
+    ignored = LEADING_IGNORED.replace("'", "''")
+    ascii_only = f"{value} NOT GLOB '*[^ -~]*'"
+    statements = [
+        f"UPDATE {table} SET {key} = RTRIM(LTRIM(LOWER({value}), '{ignored}'), ' ') "
+        f"WHERE id = NEW.id AND {ascii_only}",
+        f"UPDATE {table} SET {key} = LOWER({value}) WHERE id = NEW.id AND NOT ({ascii_only})",
+    ]
+    items = list(_FOLD_MAP.items())
+    for i in range(0, len(items), _REPLACE_BATCH):
+        batch = items[i:i + _REPLACE_BATCH]
+        expr = key
+        for char, replacement in batch:
+            expr = f"REPLACE({expr}, '{char}', '{replacement}')"
+        chars = "".join(char for char, _ in batch)
+        statements.append(f"UPDATE {table} SET {key} = {expr} WHERE id = NEW.id AND {key} GLOB '*[{chars}]*'")
+    trimmed = f"RTRIM(LTRIM({key}, '{ignored}'), ' ')"
+    statements.append(
+        f"UPDATE {table} SET {key} = {trimmed} WHERE id = NEW.id AND NOT ({ascii_only}) AND {key} IS NOT {trimmed}"
+    )
+    return statements
+
+
+def _table_exists(cursor: sqlite3.Cursor, table: str) -> bool:
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    return cursor.fetchone() is not None
+
+
+def install_sort_keys(conn: sqlite3.Connection):
+    """
+    Crea les columnes de clau d'ordenació, els índexs i els triggers que
+    les mantenen actualitzades, i omple els registres que no en tenen.
+    És idempotent: es pot cridar a cada arrencada.
+    """
+    cursor = conn.cursor()
+
+    for table, source, key in SORT_KEY_COLUMNS:
+        if not _table_exists(cursor, table):
+            logger.debug(f"Taula {table} inexistent, s'omet la clau d'ordenació")
+            continue
+
+        try:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {key} TEXT")
+        except sqlite3.OperationalError as e:
+            if "duplicate column" not in str(e).lower():
+                raise
+
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{key} ON {table}({key})")
+
+        body = ";\n".join(sql_sort_key_statements(table, source, key))
+        cursor.execute(f"DROP TRIGGER IF EXISTS {table}_{key}_insert")
+        cursor.execute(f"""
+            CREATE TRIGGER {table}_{key}_insert AFTER INSERT ON {table}
+            WHEN NEW.{source} IS NOT NULL BEGIN
+                {body};
+            END
+        """)
+        cursor.execute(f"DROP TRIGGER IF EXISTS {table}_{key}_update")
+        cursor.execute(f"""
+            CREATE TRIGGER {table}_{key}_update AFTER UPDATE OF {source} ON {table}
+            WHEN NEW.{source} IS NOT OLD.{source} BEGIN
+                {body};
+            END
+        """)
+
+        # Omplir registres anteriors als triggers amb la mateixa funció que Python
+        cursor.execute(f"SELECT id, {source} FROM {table} WHERE {key} IS NULL AND {source} IS NOT NULL")
+        rows = [(sort_key(value), row_id) for row_id, value in cursor.fetchall()]
+        cursor.executemany(f"UPDATE {table} SET {key} = ? WHERE id = ?", rows)
+        if rows:
+            logger.info(f"Claus d'ordenació {table}.{key}: {len(rows)} registres omplerts")
+
+    # Índexs compostos per llistats d'un autor
+    if _table_exists(cursor, "books"):
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_books_author_sort ON books(author_id, sort_title)")
+    if _table_exists(cursor, "audiobooks"):
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_audiobooks_author_sort ON audiobooks(author_id, sort_title)")
+
+    conn.commit()
@@ -0,0 +1,514 @@
+"""
+Hermes Media Server - Miniatures i trickplay
+Pòsters WebP i fulls de sprites per a la previsualització del seek
+(amb índex WebVTT), generats amb un nombre limitat de processos ffmpeg.
+Només es regeneren si el fitxer de vídeo ha canviat.
+
+El límit de processos ffmpeg (ffmpeg_budget) és el de tot el servidor:
+també hi passen els segments dels audiollibres, per davant de les tandes.
+"""
+
+import os
+import re
+import json
+import math
+import shutil
+import asyncio
+import logging
+import threading
+import subprocess
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from backend.services.probe_cache import file_identity, probe_media
+from backend.streaming.keyframes import keyframe_store
+
+logger = logging.getLogger(__name__)
+
+
+def available_cores() -> int:
+    """Nuclis que pot fer servir aquest procés (respecta l'afinitat i els contenidors)."""
+    try:
+        return max(len(os.sched_getaffinity(0)), 1)
+    except (AttributeError, OSError):
+        return os.cpu_count() or 1
+
+
+# Processos ffmpeg simultanis
+THUMBNAIL_WORKERS = int(os.environ.get("HERMES_THUMBNAIL_WORKERS", "0")) or available_cores()
+
+# Pòster
+POSTER_WIDTH = 480
+POSTER_QUALITY = 80
+POSTER_TIME_PERCENT = 20
+POSTER_TIMEOUT = 60
+
+# Trickplay: una miniatura cada TRICKPLAY_INTERVAL segons, en fulls de COLUMNS x ROWS
+TRICKPLAY_INTERVAL = 10
+TRICKPLAY_WIDTH = 160
+TRICKPLAY_COLUMNS = 10
+TRICKPLAY_ROWS = 10
+TRICKPLAY_QUALITY = 60
+TRICKPLAY_TIMEOUT = 1800
+
+SHEET_NAME_RE = re.compile(r"^sheet_\d{3}\.webp$")
+
+
+def _video_stream(probe: Dict) -> Optional[Dict]:
+    """Primer stream de vídeo que no sigui una caràtula adjunta."""
+    for stream in probe.get("streams", []):
+        if stream.get("codec_type") == "video" and not stream.get("disposition", {}).get("attached_pic"):
+            return stream
+    return None
+
+
+def _duration(probe: Dict) -> Optional[float]:
+    duration = probe.get("format", {}).get("duration")
+    if duration is None:
+        stream = _video_stream(probe) or {}
+        duration = stream.get("duration")
+    try:
+        return float(duration) if duration is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _run_ffmpeg(cmd: List[str], timeout: int, errors: List[str] = None) -> bool:
+    """Executa ffmpeg. Si es passa errors, s'hi afegeix el stderr quan falla."""
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"ffmpeg ha fallat: {e}")
+        return False
+    if result.returncode != 0:
+        logger.debug(f"ffmpeg ha retornat {result.returncode}: {result.stderr[-500:]!r}")
+        if errors is not None:
+            errors.append(result.stderr.decode("utf-8", "replace"))
+        return False
+    return True
+
+
+def _webp_encoder_missing(stderr: str) -> bool:
+    """L'error és perquè l'ffmpeg no té l'encoder libwebp"""
+    stderr = stderr.lower()
+    return "libwebp" in stderr and ("unknown encoder" in stderr or "encoder not found" in stderr)
+
+
+def _timestamp(seconds: float) -> str:
+    ms = int(round(seconds * 1000))
+    hours, ms = divmod(ms, 3_600_000)
+    minutes, ms = divmod(ms, 60_000)
+    secs, ms = divmod(ms, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{ms:03d}"
+
+
+def build_vtt(count: int, duration: float, width: int, height: int,
+              interval: int = TRICKPLAY_INTERVAL,
+              columns: int = TRICKPLAY_COLUMNS, rows: int = TRICKPLAY_ROWS) -> str:
+    """Índex WebVTT: cada interval apunta a la seva cel·la dins del full (#xywh)."""
+    per_sheet = columns * rows
+    lines = ["WEBVTT", ""]
+    for i in range(count):
+        start = i * interval
+        end = min((i + 1) * interval, duration) if duration > start else start + interval
+        position = i % per_sheet
+        x = (position % columns) * width
+        y = (position // columns) * height
+        lines.append(f"{_timestamp(start)} --> {_timestamp(end)}")
+        lines.append(f"trickplay/sheet_{i // per_sheet:03d}.webp#xywh={x},{y},{width},{height}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def generate_thumbnail(video_path: Path, output_path: Path,
+                       time_percent: int = POSTER_TIME_PERCENT, duration: float = None,
+                       errors: List[str] = None) -> bool:
+    """
+    Extreu un frame al percentatge indicat de la durada (al keyframe més
+    proper, sense descodificar la resta). El format surt de l'extensió.
+    """
+    if duration is None:
+        probe = probe_media(video_path)
+        duration = _duration(probe) if probe else None
+    if duration is None:
+        logger.warning(f"No s'ha pogut obtenir la durada de {video_path}")
+        return False
+
+    seek_time = (duration * time_percent) / 100
+    keyframes = keyframe_store.get(video_path)
+    if keyframes:
+        seek_time = keyframes.nearest(seek_time)
+    else:
+        # L'índex es fa la primera vegada que cal, en segon pla; aquesta
+        # miniatura es fa al temps exacte
+        thumbnail_pool.submit(f"keyframes:{video_path}", keyframe_store.ensure, video_path)
+
+    if output_path.suffix == ".webp":
+        codec = ['-c:v', 'libwebp', '-quality', str(POSTER_QUALITY)]
+    else:
+        codec = ['-q:v', '3']
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    cmd = [
+        'ffmpeg', '-y', '-v', 'error',
+        '-ss', str(seek_time),
+        '-i', str(video_path),
+        '-frames:v', '1',
+        '-vf', f'scale={POSTER_WIDTH}:-2',
+        *codec,
+        str(output_path)
+    ]
+    return _run_ffmpeg(cmd, POSTER_TIMEOUT, errors) and output_path.exists()
+
+
+class ThumbnailStore:
+    """
+    Miniatures a disc, una entrada per media_id:
+      {id}.webp (o .jpg si l'ffmpeg no té libwebp)
+      {id}.json amb la identitat del vídeo de cada element generat
+      trickplay/{id}/sheet_NNN.webp + index.vtt
+    """
+
+    def __init__(self, root: Union[str, Path] = None):
+        self._root = Path(root) if root else None
+        self._lock = threading.Lock()
+
+    @property
+    def root(self) -> Path:
+        if self._root is None:
+            from config import settings
+            self._root = Path(settings.METADATA_DIR) / "thumbnails"
+        return self._root
+
+    # ---------- Camins ----------
+
+    def poster_path(self, media_id: int) -> Optional[Path]:
+        """Pòster existent (WebP primer, JPEG antic si no n'hi ha)."""
+        for suffix in (".webp", ".jpg"):
+            path = self.root / f"{media_id}{suffix}"
+            if path.exists():
+                return path
+        return None
+
+    def trickplay_dir(self, media_id: int) -> Path:
+        return self.root / "trickplay" / str(media_id)
+
+    def trickplay_vtt(self, media_id: int) -> Optional[Path]:
+        path = self.trickplay_dir(media_id) / "index.vtt"
+        return path if path.exists() else None
+
+    def trickplay_sheet(self, media_id: int, name: str) -> Optional[Path]:
+        if not SHEET_NAME_RE.match(name):
+            return None
+        path = self.trickplay_dir(media_id) / name
+        return path if path.exists() else None
+
+    # ---------- Manifest ----------
+
+    def _manifest_path(self, media_id: int) -> Path:
+        return self.root / f"{media_id}.json"
+
+    def _load_manifest(self, media_id: int) -> Dict:
+        try:
+            return json.loads(self._manifest_path(media_id).read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def _update_manifest(self, media_id: int, kind: str, data: Optional[Dict]):
+        with self._lock:
+            manifest = self._load_manifest(media_id)
+            if data is None:
+                manifest.pop(kind, None)
+            else:
+                manifest[kind] = data
+            path = self._manifest_path(media_id)
+            tmp = path.with_suffix(".json.tmp")
+            tmp.write_text(json.dumps(manifest))
+            os.replace(tmp, path)
+
+    def is_current(self, media_id: int, kind: str, identity: Tuple) -> bool:
+        """L'element existeix i es va generar a partir d'aquesta versió del vídeo."""
+        entry = self._load_manifest(media_id).get(kind)
+        if not entry or entry.get("identity") != list(identity):
+            return False
+        if kind == "poster":
+            return (self.root / entry.get("file", "")).is_file()
+        return self.trickplay_vtt(media_id) is not None
+
+    # ---------- Generació ----------
+
+    def generate_poster(self, media_id: int, video_path: Union[str, Path],
+                        force: bool = False) -> Optional[Path]:
+        """Pòster WebP del vídeo. Retorna el camí, o None si ha fallat."""
+        video_path = Path(video_path)
+        identity = file_identity(video_path)
+        if not force and self.is_current(media_id, "poster", identity):
+            return self.poster_path(media_id)
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        for suffix in (".webp", ".jpg"):
+            part = self.root / f"{media_id}.part{suffix}"
+            errors: List[str] = []
+            if generate_thumbnail(video_path, part, errors=errors):
+                final = self.root / f"{media_id}{suffix}"
+                os.replace(part, final)
+                # Treure el pòster de l'altre format perquè no es serveixi
+                for other in (".webp", ".jpg"):
+                    if other != suffix:
+                        (self.root / f"{media_id}{other}").unlink(missing_ok=True)
+                self._update_manifest(media_id, "poster", {"identity": list(identity), "file": final.name})
+                return final
+            part.unlink(missing_ok=True)
+            # Només es prova JPEG si falta l'encoder WebP; un vídeo il·legible
+            # o un timeout fallaria igual i costaria una segona passada
+            if not any(_webp_encoder_missing(e) for e in errors):
+                break
+        return None
+
+    def generate_trickplay(self, media_id: int, video_path: Union[str, Path],
+                           force: bool = False) -> Optional[Path]:
+        """
+        Fulls de sprites i índex WebVTT en una sola passada de ffmpeg:
+        només es descodifiquen els keyframes, a baixa resolució.
+        Retorna el camí de l'index.vtt, o None si ha fallat.
+        """
+        video_path = Path(video_path)
+        identity = file_identity(video_path)
+        if not force and self.is_current(media_id, "trickplay", identity):
+            return self.trickplay_vtt(media_id)
+
+        probe = probe_media(video_path)
+        stream = _video_stream(probe) if probe else None
+        duration = _duration(probe) if probe else None
+        if not stream or not duration or not stream.get("width") or not stream.get("height"):
+            logger.warning(f"Trickplay: no s'han pogut llegir les dimensions de {video_path}")
+            return None
+
+        width = TRICKPLAY_WIDTH
+        height = max(2, int(round(stream["height"] * width / stream["width"] / 2)) * 2)
+        per_sheet = TRICKPLAY_COLUMNS * TRICKPLAY_ROWS
+
+        final_dir = self.trickplay_dir(media_id)
+        part_dir = final_dir.with_name(f"{media_id}.part")
+        shutil.rmtree(part_dir, ignore_errors=True)
+        part_dir.mkdir(parents=True, exist_ok=True)
+
+        cmd = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-skip_frame', 'nokey',
+            '-threads', '1',
+            '-i', str(video_path),
+            '-an', '-sn', '-dn',
+            '-vf', (f'fps=1/{TRICKPLAY_INTERVAL},scale={width}:{height},'
+                    f'tile={TRICKPLAY_COLUMNS}x{TRICKPLAY_ROWS}'),
+            '-c:v', 'libwebp', '-quality', str(TRICKPLAY_QUALITY),
+            '-start_number', '0',
+            str(part_dir / 'sheet_%03d.webp')
+        ]
+        sheets = 0
+        if _run_ffmpeg(cmd, TRICKPLAY_TIMEOUT):
+            sheets = len(list(part_dir.glob("sheet_*.webp")))
+        if not sheets:
+            shutil.rmtree(part_dir, ignore_errors=True)
+            return None
+
+        count = min(math.ceil(duration / TRICKPLAY_INTERVAL), sheets * per_sheet)
+        (part_dir / "index.vtt").write_text(build_vtt(count, duration, width, height))
+
+        shutil.rmtree(final_dir, ignore_errors=True)
+        os.replace(part_dir, final_dir)
+        self._update_manifest(media_id, "trickplay", {
+            "identity": list(identity), "interval": TRICKPLAY_INTERVAL,
+            "width": width, "height": height, "count": count, "sheets": sheets,
+        })
+        return final_dir / "index.vtt"
+
+    def generate(self, media_id: int, video_path: Union[str, Path],
+                 force: bool = False, trickplay: bool = True) -> bool:
+        """Pòster i (opcionalment) trickplay d'un vídeo."""
+        ok = self.generate_poster(media_id, video_path, force) is not None
+        if trickplay:
+            ok = self.generate_trickplay(media_id, video_path, force) is not None and ok
+        return ok
+
+    def is_complete(self, media_id: int, video_path: Union[str, Path], trickplay: bool = True) -> bool:
+        """Tot el que caldria generar ja és vigent."""
+        try:
+            identity = file_identity(video_path)
+        except OSError:
+            return False
+        return (self.is_current(media_id, "poster", identity)
+                and (not trickplay or self.is_current(media_id, "trickplay", identity)))
+
+    def clear(self) -> int:
+        """Esborra totes les miniatures. Retorna els pòsters esborrats."""
+        deleted = 0
+        if not self.root.exists():
+            return 0
+        for path in self.root.iterdir():
+            if path.is_file() and path.suffix in (".webp", ".jpg"):
+                path.unlink(missing_ok=True)
+                deleted += 1
+            elif path.is_file() and path.suffix == ".json":
+                path.unlink(missing_ok=True)
+        shutil.rmtree(self.root / "trickplay", ignore_errors=True)
+        return deleted
+
+
+class FfmpegBudget:
+    """
+    Processos ffmpeg simultanis de tot el servidor. Les peticions de la
+    reproducció (interactive) passen per davant de les que esperen d'una
+    tanda, i les tandes no poden ocupar l'última plaça: un trickplay de
+    mitja hora no deixa mai sense ffmpeg qui està escoltant o mirant.
+    """
+
+    def __init__(self, slots: int = THUMBNAIL_WORKERS):
+        self.slots = max(slots, 1)
+        self._condition = threading.Condition()
+        self._in_use = 0
+        self._interactive = 0
+        self._waiting_interactive = 0
+
+    def _background_limit(self) -> int:
+        return max(self.slots - 1, 1)
+
+    def acquire(self, interactive: bool = False, timeout: Optional[float] = None) -> bool:
+        """Ocupa una plaça. Retorna False si no n'hi ha hagut cap abans de timeout."""
+        with self._condition:
+            if interactive:
+                self._waiting_interactive += 1
+                try:
+                    ok = self._condition.wait_for(lambda: self._in_use < self.slots, timeout)
+                finally:
+                    self._waiting_interactive -= 1
+            else:
+                ok = self._condition.wait_for(
+                    lambda: self._in_use < self._background_limit() and not self._waiting_interactive, timeout
+                )
+            if ok:
+                self._in_use += 1
+                self._interactive += interactive
+            return ok
+
+    def release(self, interactive: bool = False):
+        with self._condition:
+            self._in_use -= 1
+            self._interactive -= interactive
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, interactive: bool = False):
+        self.acquire(interactive)
+        try:
+            yield
+        finally:
+            self.release(interactive)
+
+    @property
+    def interactive(self) -> int:
+        """Processos ffmpeg de la reproducció en marxa (o esperant plaça)."""
+        with self._condition:
+            return self._interactive + self._waiting_interactive
+
+
+class ThumbnailPool:
+    """
+    Pool limitat de treballs. Un mateix element no es genera dues vegades
+    alhora: les peticions repetides esperen el mateix resultat. Amb budget,
+    cada treball ocupa una plaça d'ffmpeg (els de run(), amb prioritat).
+    """
+
+    def __init__(self, workers: int = THUMBNAIL_WORKERS, budget: Optional[FfmpegBudget] = None):
+        self.workers = max(workers, 1)
+        self.budget = budget
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            # Amb budget, els fils de més esperen plaça: una petició interactiva
+            # no queda a la cua de l'executor darrere d'una tanda
+            threads = self.workers * 2 if self.budget else self.workers
+            self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="thumbnail")
+        return self._executor
+
+    def _call(self, interactive: bool, fn: Callable, *args, **kwargs):
+        with self.budget.slot(interactive):
+            return fn(*args, **kwargs)
+
+    def submit(self, key: str, fn: Callable, *args, interactive: bool = False, **kwargs) -> Future:
+        """Programa un treball (o retorna el que ja hi ha en curs amb la mateixa clau)."""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            if self.budget:
+                future = self._get_executor().submit(self._call, interactive, fn, *args, **kwargs)
+            else:
+                future = self._get_executor().submit(fn, *args, **kwargs)
+            self._inflight[key] = future
+        future.add_done_callback(lambda f: self._done(key, f))
+        return future
+
+    def _done(self, key: str, future: Future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    async def run(self, key: str, fn: Callable, *args, **kwargs):
+        """Com submit, però esperant el resultat des d'un handler async (amb prioritat)."""
+        return await asyncio.wrap_future(self.submit(key, fn, *args, interactive=True, **kwargs))
+
+    @property
+    def inflight(self) -> int:
+        with self._lock:
+            return len(self._inflight)
+
+    def run_batch(self, jobs: Iterable[Tuple[str, Callable, tuple]],
+                  on_done: Callable[[str, bool], None] = None) -> Tuple[int, int]:
+        """
+        Executa una llista de treballs mantenint com a molt `workers` en
+        cua alhora, perquè les peticions interactives no esperin tota la tanda.
+        Retorna (correctes, errors).
+        """
+        ok = errors = 0
+        pending: Dict[Future, str] = {}
+
+        def collect(done):
+            nonlocal ok, errors
+            for future in done:
+                key = pending.pop(future)
+                try:
+                    success = bool(future.result())
+                except Exception as e:
+                    logger.warning(f"[Thumbnails] {key} ha fallat: {e}")
+                    success = False
+                ok += success
+                errors += not success
+                if on_done:
+                    on_done(key, success)
+
+        for key, fn, args in jobs:
+            if len(pending) >= self.workers:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                collect(done)
+            pending[self.submit(key, fn, *args)] = key
+        while pending:
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            collect(done)
+        return ok, errors
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Instàncies globals
+ffmpeg_budget = FfmpegBudget()
+thumbnail_store = ThumbnailStore()
+thumbnail_pool = ThumbnailPool(budget=ffmpeg_budget)
@@ -0,0 +1,261 @@
+"""
+Hermes Media Server - Validators HTTP
+ETags basats en comptadors de canvis per taula, caching d'artwork i
+fitxers servits per rangs de bytes
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+from backend.services.sorting import SORT_KEY_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+
+# Taules amb comptador global de canvis
+TRACKED_TABLES = ["series", "media_files", "books", "authors", "audiobooks", "audiobook_authors"]
+
+# Taules amb comptador per usuari ('watch_progress:<user_id>')
+PER_USER_TABLES = ["watch_progress"]
+
+# Les respostes JSON es poden guardar però s'han de revalidar sempre
+REVALIDATE = "private, no-cache"
+# Artwork per id: pot canviar si es refresca la metadata
+ARTWORK_CACHE_CONTROL = "public, max-age=86400, stale-while-revalidate=604800"
+# Artwork amb versió a la URL (?v=...): no canvia mai
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Canvia a cada arrencada: un canvi de codi pot canviar la forma de les respostes
+_BOOT_ID = str(time.time_ns())
+
+
+def _table_exists(cursor: sqlite3.Cursor, table: str) -> bool:
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    return cursor.fetchone() is not None
+
+
+def install_change_counters(conn: sqlite3.Connection):
+    """
+    Crea la taula de comptadors i els triggers que els incrementen.
+    Els triggers són SQL pur, així compten els canvis de qualsevol connexió.
+    És idempotent.
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS change_counters (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+    for table in TRACKED_TABLES:
+        if not _table_exists(cursor, table):
+            continue
+        cursor.execute("INSERT OR IGNORE INTO change_counters (name, version) VALUES (?, 0)", (table,))
+        for event in ("INSERT", "DELETE"):
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_changes_{event.lower()} AFTER {event} ON {table} BEGIN
+                    UPDATE change_counters SET version = version + 1 WHERE name = '{table}';
+                END
+            """)
+        # Les claus d'ordenació les escriuen triggers just després d'un canvi
+        # que ja ha comptat: aquests UPDATE no tornen a incrementar el comptador
+        cursor.execute(f"PRAGMA table_info({table})")
+        columns = {row[1] for row in cursor.fetchall()}
+        derived = [key for sort_table, _, key in SORT_KEY_COLUMNS if sort_table == table and key in columns]
+        when = " AND ".join(f"NEW.{key} IS OLD.{key}" for key in derived)
+        cursor.execute(f"DROP TRIGGER IF EXISTS {table}_changes_update")
+        cursor.execute(f"""
+            CREATE TRIGGER {table}_changes_update AFTER UPDATE ON {table}
+            {f"WHEN {when}" if when else ""} BEGIN
+                UPDATE change_counters SET version = version + 1 WHERE name = '{table}';
+            END
+        """)
+
+    for table in PER_USER_TABLES:
+        if not _table_exists(cursor, table):
+            continue
+        for event, ref in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_changes_{event.lower()} AFTER {event} ON {table} BEGIN
+                    INSERT INTO change_counters (name, version) VALUES ('{table}:' || {ref}.user_id, 1)
+                    ON CONFLICT(name) DO UPDATE SET version = version + 1;
+                END
+            """)
+
+    conn.commit()
+
+
+def get_versions(conn: sqlite3.Connection, names: Iterable[str]) -> Dict[str, int]:
+    """Versió actual de cada comptador (0 si no existeix)."""
+    names = list(names)
+    placeholders = ",".join("?" for _ in names)
+    cursor = conn.execute(
+        f"SELECT name, version FROM change_counters WHERE name IN ({placeholders})", names
+    )
+    versions = {name: 0 for name in names}
+    versions.update({row[0]: row[1] for row in cursor.fetchall()})
+    return versions
+
+
+def make_etag(*parts) -> str:
+    """ETag feble a partir de les parts que determinen la resposta."""
+    raw = "|".join(str(p) for p in (_BOOT_ID,) + parts)
+    return f'W/"{hashlib.md5(raw.encode()).hexdigest()}"'
+
+
+def table_etag(conn: sqlite3.Connection, counters: Iterable[str], *parts) -> str:
+    """
+    ETag d'una resposta que depèn de les taules indicades.
+    Si la taula de comptadors no existeix, l'ETag no coincidirà mai.
+    """
+    try:
+        versions = get_versions(conn, counters)
+    except sqlite3.OperationalError as e:
+        logger.debug(f"Comptadors de canvis no disponibles: {e}")
+        return make_etag(time.time_ns(), *parts)
+    return make_etag(*sorted(versions.items()), *parts)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comprova If-None-Match (admet llistes i '*', comparació feble)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def check_not_modified(request: Request, etag: str, cache_control: str = REVALIDATE) -> Dict[str, str]:
+    """
+    Retorna les capçaleres de cache per a la resposta, o llença un 304
+    si el client ja té aquesta versió.
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        raise HTTPException(status_code=304, headers=headers)
+    return headers
+
+
+def file_response(request: Request, path, media_type: str = None) -> Response:
+    """
+    Serveix un fitxer d'artwork amb ETag, Last-Modified i Cache-Control.
+    Respon 304 sense obrir el fitxer si el client ja el té.
+    """
+    stat_result = os.stat(path)
+    etag = '"' + hashlib.md5(f"{stat_result.st_mtime}-{stat_result.st_size}".encode()).hexdigest() + '"'
+    cache_control = IMMUTABLE_CACHE_CONTROL if request.query_params.get("v") else ARTWORK_CACHE_CONTROL
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        not_modified = etag_matches(if_none_match, etag)
+    else:
+        not_modified = False
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+                not_modified = int(stat_result.st_mtime) <= since
+            except (TypeError, ValueError):
+                pass
+
+    if not_modified:
+        headers["Last-Modified"] = formatdate(stat_result.st_mtime, usegmt=True)
+        return Response(status_code=304, headers=headers)
+
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat_result)
+
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Rang d'una capçalera Range ('bytes=a-b', 'bytes=a-', 'bytes=-n').
+    Retorna None si no n'hi ha, no s'entén o en demana diversos (es respon
+    el fitxer sencer, com permet l'RFC 9110); ValueError si no es pot servir.
+    """
+    if not range_header or not range_header.strip().startswith("bytes="):
+        return None
+    spec = range_header.strip()[6:]
+    if "," in spec:
+        return None
+    start_text, sep, end_text = spec.strip().partition("-")
+    if not sep or not (start_text or end_text).isdigit() or (end_text and not end_text.isdigit()):
+        return None
+    if not start_text:
+        # Sufix: els últims n bytes
+        length = int(end_text)
+        if length == 0 or size == 0:
+            raise ValueError("Rang buit")
+        return max(size - length, 0), size - 1
+    start = int(start_text)
+    end = int(end_text) if end_text else size - 1
+    if start >= size or end < start:
+        raise ValueError("Rang fora del fitxer")
+    return start, min(end, size - 1)
+
+
+def _iter_file(path, start: int, end: int, chunk_size: int = 256 * 1024) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def ranged_file_response(request: Request, path, media_type: str = None, filename: str = None,
+                         cache_control: str = "private, max-age=86400") -> Response:
+    """
+    Serveix un fitxer local amb suport de Range i If-Range, perquè un
+    visor (PDF.js, el del navegador) pugui començar sense baixar-lo sencer.
+    """
+    stat_result = os.stat(path)
+    size = stat_result.st_size
+    etag = '"' + hashlib.md5(f"{stat_result.st_mtime_ns}-{size}".encode()).hexdigest() + '"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+    }
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # Si el fitxer ha canviat des de la primera petició, es torna sencer
+    if range_header and if_range and if_range.strip() not in (etag, headers["Last-Modified"]):
+        range_header = None
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    if byte_range is None:
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return FileResponse(path, media_type=media_type, headers=headers, filename=filename,
+                            stat_result=stat_result, content_disposition_type="inline")
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(_iter_file(path, start, end), status_code=206,
+                             media_type=media_type, headers=headers)
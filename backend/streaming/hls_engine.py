@@ -14,6 +14,8 @@ from pathlib import Path
 from typing import Optional, Union
 import logging
 
+from backend.streaming.range_cache import local_proxy_url
+
 logger = logging.getLogger(__name__)
 
 
@@ -43,22 +45,19 @@ class HermesStreamer:
 
     def _detect_video_codec(self, file_path: str) -> Optional[str]:
         """
-        Detecta el codec del vídeo amb ffprobe.
+        Detecta el codec del vídeo amb ffprobe (cache per identitat del fitxer).
         Retorna el nom del codec (ex: 'h264', 'hevc', 'vp9') o None si falla.
         """
         try:
-            cmd = [
-                'ffprobe', '-v', 'quiet',
-                '-select_streams', 'v:0',
-                '-show_entries', 'stream=codec_name',
-                '-of', 'default=noprint_wrappers=1:nokey=1',
-                file_path
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                codec = result.stdout.strip()
-                logger.debug(f"Codec detectat: {codec}")
-                return codec
+            from backend.services.probe_cache import probe_media
+            data = probe_media(file_path, timeout=10)
+            if data is None:
+                return None
+            for stream in data.get('streams', []):
+                if stream.get('codec_type') == 'video':
+                    codec = stream.get('codec_name')
+                    logger.debug(f"Codec detectat: {codec}")
+                    return codec
             return None
         except Exception as e:
             logger.warning(f"Error detectant codec: {e}")
@@ -303,7 +302,8 @@ class HermesStreamer:
         stream_url: str,
         stream_key: str,
         quality: str = "1080p",
-        force_transcode: bool = True
+        force_transcode: bool = True,
+        use_range_cache: bool = True
     ) -> dict:
         """
         Inicia un stream HLS des d'una URL remota (Real-Debrid, etc.)
@@ -313,6 +313,7 @@ class HermesStreamer:
             stream_key: Clau única per identificar el stream
             quality: Qualitat de sortida (1080p, 720p, 480p)
             force_transcode: Si True, sempre transcodifica a H.264
+            use_range_cache: Llegir a través del proxy local amb cache de rangs
 
         Returns:
             dict amb playlist_url i stream_id, o error si FFmpeg no disponible
@@ -359,6 +360,10 @@ class HermesStreamer:
 
         q = quality_settings.get(quality, quality_settings["1080p"])
 
+        # ffmpeg llegeix del proxy local: comparteix els rangs ja descarregats
+        # amb el reproductor i no torna a baixar el que ja és al cache
+        input_url = local_proxy_url(stream_url) if use_range_cache else stream_url
+
         # Construir comanda FFmpeg per URL remota
         cmd = [
             'ffmpeg', '-y',
@@ -366,7 +371,7 @@ class HermesStreamer:
             '-reconnect_streamed', '1',
             '-reconnect_delay_max', '5',
             '-timeout', '30000000',               # Timeout de 30 segons
-            '-i', stream_url,                     # URL del stream
+            '-i', input_url,                      # URL del stream
             '-map', '0:v:0',                      # Primer stream de vídeo
             '-map', '0:a:0?',                     # Primer stream d'àudio (opcional)
         ]
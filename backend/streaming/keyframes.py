@@ -0,0 +1,255 @@
+"""
+Índex de keyframes per Hermes
+Temps i posicions en bytes dels keyframes de cada fitxer, extrets una sola
+vegada i guardats a SQLite com a deltes comprimits. Serveix per fer els
+seeks i les miniatures exactament sobre un keyframe.
+"""
+
+import zlib
+import sqlite3
+import logging
+import threading
+import subprocess
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from backend.services.probe_cache import file_identity
+
+logger = logging.getLogger(__name__)
+
+
+# Temps màxim per indexar un fitxer (llegeix tots els paquets de vídeo)
+INDEX_TIMEOUT = 600
+
+
+def init_keyframe_tables(conn: sqlite3.Connection):
+    """Crea la taula de l'índex de keyframes."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS keyframe_index (
+            device INTEGER NOT NULL,
+            inode INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            path TEXT,
+            count INTEGER NOT NULL,
+            times BLOB NOT NULL,
+            offsets BLOB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (device, inode)
+        )
+    """)
+    conn.commit()
+
+
+def encode_deltas(values: Iterable[int]) -> bytes:
+    """Llista creixent d'enters → deltes comprimits."""
+    deltas = array("q")
+    previous = 0
+    for value in values:
+        deltas.append(value - previous)
+        previous = value
+    return zlib.compress(deltas.tobytes())
+
+
+def decode_deltas(blob: bytes) -> List[int]:
+    """Invers d'encode_deltas."""
+    deltas = array("q")
+    deltas.frombytes(zlib.decompress(blob))
+    values = []
+    total = 0
+    for delta in deltas:
+        total += delta
+        values.append(total)
+    return values
+
+
+class KeyframeIndex:
+    """Keyframes d'un fitxer: temps (ms) i posició en bytes (-1 si desconeguda)."""
+
+    def __init__(self, times_ms: List[int], offsets: List[int]):
+        self.times_ms = times_ms
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.times_ms)
+
+    def snap(self, seconds: float) -> Tuple[float, int]:
+        """Últim keyframe a o abans del temps demanat: (segons, offset)."""
+        if not self.times_ms:
+            return 0.0, 0
+        i = max(bisect_right(self.times_ms, int(seconds * 1000)) - 1, 0)
+        return self.times_ms[i] / 1000, self.offsets[i]
+
+    def nearest(self, seconds: float) -> float:
+        """Keyframe més proper (abans o després) al temps demanat."""
+        if not self.times_ms:
+            return seconds
+        target = int(seconds * 1000)
+        i = bisect_right(self.times_ms, target)
+        candidates = self.times_ms[max(i - 1, 0):i + 1]
+        return min(candidates, key=lambda t: abs(t - target)) / 1000
+
+
+def extract_keyframes(path: Union[str, Path], timeout: int = INDEX_TIMEOUT) -> Optional[KeyframeIndex]:
+    """
+    Llegeix els paquets de vídeo amb ffprobe (sense descodificar)
+    i es queda amb els keyframes.
+    """
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,pos,flags',
+        '-of', 'csv=p=0',
+        str(path)
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"No s'han pogut extreure keyframes de {path}: {e}")
+        return None
+    if result.returncode != 0:
+        return None
+
+    keyframes = []
+    for line in result.stdout.splitlines():
+        parts = line.strip().split(",")
+        if len(parts) < 3 or "K" not in parts[2]:
+            continue
+        try:
+            time_ms = int(round(float(parts[0]) * 1000))
+        except ValueError:
+            continue  # pts desconegut
+        try:
+            offset = int(parts[1])
+        except ValueError:
+            offset = -1
+        keyframes.append((time_ms, offset))
+
+    if not keyframes:
+        return None
+    # L'ordre de descodificació no sempre és l'ordre de presentació
+    keyframes.sort()
+    return KeyframeIndex([t for t, _ in keyframes], [o for _, o in keyframes])
+
+
+class KeyframeStore:
+    """Índexs persistents per identitat de fitxer (com el cache de ffprobe)."""
+
+    def __init__(self, db_path: Union[str, Path] = None):
+        self._db_path = db_path
+        self._tables_ready = False
+        self._lock = threading.Lock()
+        # camí → [lock, fils que l'esperen]
+        self._building: Dict[str, list] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db_path is None:
+            from config import settings
+            self._db_path = settings.DATABASE_PATH
+        conn = sqlite3.connect(str(self._db_path), timeout=30)
+        if not self._tables_ready:
+            init_keyframe_tables(conn)
+            self._tables_ready = True
+        return conn
+
+    def get(self, path: Union[str, Path]) -> Optional[KeyframeIndex]:
+        """Índex guardat, si el fitxer no ha canviat."""
+        try:
+            identity = file_identity(path)
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    "SELECT size, mtime_ns, times, offsets FROM keyframe_index WHERE device = ? AND inode = ?",
+                    identity[:2]
+                ).fetchone()
+            finally:
+                conn.close()
+        except (OSError, sqlite3.Error) as e:
+            logger.debug(f"Índex de keyframes no disponible per {path}: {e}")
+            return None
+        if not row or (row[0], row[1]) != identity[2:]:
+            return None
+        return KeyframeIndex(decode_deltas(row[2]), decode_deltas(row[3]))
+
+    def build(self, path: Union[str, Path]) -> Optional[KeyframeIndex]:
+        """Extreu i guarda l'índex d'un fitxer."""
+        identity = file_identity(path)
+        index = extract_keyframes(path)
+        if index is None:
+            return None
+        try:
+            conn = self._connect()
+            try:
+                conn.execute("""
+                    INSERT OR REPLACE INTO keyframe_index
+                        (device, inode, size, mtime_ns, path, count, times, offsets)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, (*identity, str(path), len(index),
+                      encode_deltas(index.times_ms), encode_deltas(index.offsets)))
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"No s'ha pogut guardar l'índex de keyframes: {e}")
+        return index
+
+    def has_current(self, path: Union[str, Path]) -> bool:
+        """Comprova si hi ha un índex vigent sense descomprimir-lo."""
+        try:
+            identity = file_identity(path)
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    "SELECT 1 FROM keyframe_index WHERE device = ? AND inode = ? AND size = ? AND mtime_ns = ?",
+                    identity
+                ).fetchone()
+            finally:
+                conn.close()
+        except (OSError, sqlite3.Error):
+            return False
+        return row is not None
+
+    def ensure(self, path: Union[str, Path]) -> Optional[KeyframeIndex]:
+        """
+        Índex vigent del fitxer, construint-lo si cal. Una sola extracció
+        per fitxer encara que es demani des de diversos fils alhora.
+        """
+        index = self.get(path)
+        if index is not None:
+            return index
+        key = str(path)
+        with self._lock:
+            entry = self._building.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                # Un altre fil pot haver-lo acabat mentre esperàvem
+                index = self.get(path)
+                if index is None:
+                    index = self.build(path)
+                return index
+        except OSError as e:
+            logger.debug(f"No s'ha pogut indexar {path}: {e}")
+            return None
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._building[key]
+
+    def index_missing(self, paths: Iterable[str]) -> int:
+        """Indexa els fitxers que no tenen índex vigent."""
+        built = 0
+        for path in paths:
+            if not path or not Path(path).is_file() or self.has_current(path):
+                continue
+            if self.ensure(path) is not None:
+                built += 1
+        if built:
+            logger.info(f"Índex de keyframes: {built} fitxers indexats")
+        return built
+
+# Instància global
+keyframe_store = KeyframeStore()
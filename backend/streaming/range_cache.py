@@ -0,0 +1,453 @@
+"""
+Cache de rangs per streams remots (Real-Debrid)
+Guarda a disc els trossos del fitxer remot que ja s'han descarregat, en
+blocs de mida fixa. Els blocs presents se serveixen localment i els que
+falten es demanen a l'origen amb lectura anticipada. Mida total limitada
+amb expulsió LRU.
+"""
+
+import os
+import json
+import time
+import shutil
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional, Tuple
+from urllib.parse import quote
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+# Mida de cada bloc a disc
+CHUNK_SIZE = 4 * 1024 * 1024
+# Blocs que es demanen de més després del rang del client
+READ_AHEAD_CHUNKS = 2
+# Blocs màxims per petició a l'origen (rangs oberts 'bytes=N-')
+MAX_RUN_CHUNKS = 16
+# Quota total del cache a disc
+DEFAULT_QUOTA_BYTES = int(os.environ.get("HERMES_RANGE_CACHE_BYTES", str(20 * 1024 ** 3)))
+# Segons que s'espera un bloc que baixa un altre client abans d'anar a l'origen
+WAIT_TIMEOUT = 10.0
+# Links resolts pel servidor que es recorden (URL → fitxer del torrent)
+MAX_REGISTERED_URLS = 1024
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+
+class UpstreamError(Exception):
+    """L'origen ha respost amb un error."""
+
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        super().__init__(f"Error HTTP {status_code} de l'origen")
+
+
+class SizeMismatch(UpstreamError):
+    """L'origen ha canviat de fitxer: la mida no és la de l'entrada del cache."""
+
+    def __init__(self):
+        super().__init__(502)
+
+
+def cache_key(url: str, key: Optional[str] = None) -> str:
+    """
+    Clau estable del fitxer remot: la del fitxer del torrent (hash i fitxer)
+    o el camí de la URL (els hosts de RD canvien entre peticions).
+    """
+    if not key:
+        from urllib.parse import urlparse
+        key = urlparse(url).path
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+class RangeEntry:
+    """Un fitxer remot al cache: mida, tipus i mapa de blocs presents."""
+
+    def __init__(self, directory: Path, size: int, content_type: str):
+        self.directory = directory
+        self.size = size
+        self.content_type = content_type
+        self.chunk_count = (size + CHUNK_SIZE - 1) // CHUNK_SIZE
+        self.bitmap = bytearray((self.chunk_count + 7) // 8)
+        self.active = 0
+
+    def has(self, index: int) -> bool:
+        return bool(self.bitmap[index >> 3] & (1 << (index & 7)))
+
+    def mark(self, index: int):
+        self.bitmap[index >> 3] |= 1 << (index & 7)
+
+    def chunk_path(self, index: int) -> Path:
+        return self.directory / f"{index:06d}.bin"
+
+    def chunk_length(self, index: int) -> int:
+        return min(CHUNK_SIZE, self.size - index * CHUNK_SIZE)
+
+    def load_bitmap(self) -> int:
+        """Reconstrueix el mapa a partir dels blocs complets a disc. Retorna els bytes."""
+        total = 0
+        for path in self.directory.glob("*.bin"):
+            try:
+                index = int(path.stem)
+            except ValueError:
+                continue
+            if index < self.chunk_count and path.stat().st_size == self.chunk_length(index):
+                self.mark(index)
+                total += path.stat().st_size
+        return total
+
+
+class RangeCache:
+    """Cache de rangs per URL remota amb quota LRU."""
+
+    def __init__(self, root: Path = None, quota_bytes: int = DEFAULT_QUOTA_BYTES,
+                 client_factory=None):
+        self._root = root
+        self.quota_bytes = quota_bytes
+        self._client_factory = client_factory
+        self._client: Optional[httpx.AsyncClient] = None
+        self._entries: Dict[str, RangeEntry] = {}
+        self._usage: Dict[str, int] = {}
+        self._access: Dict[str, float] = {}
+        self._inflight: Dict[Tuple[str, int], asyncio.Event] = {}
+        self._registered: "OrderedDict[str, str]" = OrderedDict()
+        self._open_locks: Dict[str, asyncio.Lock] = {}
+        self._load_lock: Optional[asyncio.Lock] = None
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def root(self) -> Path:
+        if self._root is None:
+            from config import settings
+            self._root = Path(settings.CACHE_DIR) / "ranges"
+        return self._root
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            if self._client_factory:
+                self._client = self._client_factory()
+            else:
+                self._client = httpx.AsyncClient(
+                    timeout=httpx.Timeout(60.0, connect=10.0),
+                    follow_redirects=True,
+                    limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _load_usage(self):
+        """Ocupació de cada entrada a disc (una vegada, a l'inici)."""
+        if self._loaded:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        for directory in self.root.iterdir():
+            if not directory.is_dir():
+                continue
+            meta = directory / "meta.json"
+            size = sum(p.stat().st_size for p in directory.glob("*.bin"))
+            self._usage.setdefault(directory.name, size)
+            self._access.setdefault(directory.name, meta.stat().st_mtime if meta.exists() else 0)
+        self._loaded = True
+
+    async def _ensure_loaded(self):
+        """_load_usage fora del bucle, una sola vegada encara que hi hagi peticions alhora."""
+        if self._loaded:
+            return
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+        async with self._load_lock:
+            if not self._loaded:
+                await asyncio.to_thread(self._load_usage)
+
+    @property
+    def usage_bytes(self) -> int:
+        self._load_usage()
+        return sum(self._usage.values())
+
+    # ---------- Claus ----------
+
+    def register(self, url: str, stable_key: str):
+        """
+        Recorda que el servidor ha resolt aquesta URL per a un fitxer concret
+        (hash:fitxer), perquè els links nous del mateix fitxer comparteixin blocs.
+        La clau mai ve del client: no es pot fer servir per enverinar el cache.
+        """
+        self._registered[url] = stable_key
+        self._registered.move_to_end(url)
+        while len(self._registered) > MAX_REGISTERED_URLS:
+            self._registered.popitem(last=False)
+
+    def key_for(self, url: str) -> str:
+        """Clau de l'entrada per a una URL (la registrada, o el camí de la URL)."""
+        return cache_key(url, self._registered.get(url))
+
+    # ---------- Entrades ----------
+
+    async def open(self, url: str, key: str) -> RangeEntry:
+        """Entrada del fitxer remot (demana la mida a l'origen la primera vegada)."""
+        await self._ensure_loaded()
+        self._access[key] = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            return entry
+
+        lock = self._open_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                return entry
+
+            directory = self.root / key
+            meta = await asyncio.to_thread(self._read_meta, directory)
+            if meta is None:
+                size, content_type = await self._probe_upstream(url)
+                meta = {"size": size, "content_type": content_type}
+                await asyncio.to_thread(self._create_entry, directory, meta)
+
+            entry = RangeEntry(directory, meta["size"], meta["content_type"])
+            self._usage[key] = await asyncio.to_thread(entry.load_bitmap)
+            self._entries[key] = entry
+            return entry
+
+    @staticmethod
+    def _read_meta(directory: Path) -> Optional[dict]:
+        """meta.json de l'entrada (i en marca l'accés), o None si no n'hi ha."""
+        meta_path = directory / "meta.json"
+        if not meta_path.exists():
+            return None
+        try:
+            meta = json.loads(meta_path.read_text())
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            return None
+        return meta
+
+    @staticmethod
+    def _create_entry(directory: Path, meta: dict):
+        """Directori nou per a l'entrada (fora el que hi pogués haver)."""
+        if directory.exists():
+            shutil.rmtree(directory, ignore_errors=True)
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / "meta.json").write_text(json.dumps(meta))
+
+    async def _probe_upstream(self, url: str) -> Tuple[int, str]:
+        """Mida total i tipus del fitxer remot."""
+        client = self._get_client()
+        request = client.build_request("GET", url, headers={"User-Agent": USER_AGENT, "Range": "bytes=0-0"})
+        response = await client.send(request, stream=True)
+        try:
+            if response.status_code >= 400:
+                raise UpstreamError(response.status_code)
+            content_range = response.headers.get("content-range", "")
+            if "/" in content_range and not content_range.endswith("/*"):
+                size = int(content_range.rsplit("/", 1)[1])
+            else:
+                size = int(response.headers.get("content-length", 0))
+            content_type = response.headers.get("content-type", "video/mp4")
+        finally:
+            await response.aclose()
+        if size <= 0:
+            raise UpstreamError(502)
+        return size, content_type
+
+    # ---------- Lectura ----------
+
+    async def stream(self, url: str, key: str, entry: RangeEntry,
+                     start: int, end: int) -> AsyncIterator[bytes]:
+        """Bytes [start, end] del fitxer: del disc si hi són, si no de l'origen."""
+        entry.active += 1
+        try:
+            first = start // CHUNK_SIZE
+            last = end // CHUNK_SIZE
+            index = first
+            while index <= last:
+                lo = start - index * CHUNK_SIZE if index == first else 0
+                hi = end - index * CHUNK_SIZE + 1 if index == last else entry.chunk_length(index)
+                event = self._inflight.get((key, index))
+                if event is not None:
+                    # Un altre client ja el descarrega: esperar-lo, però no
+                    # més del que cal (la descàrrega va al ritme d'aquell client)
+                    try:
+                        await asyncio.wait_for(event.wait(), WAIT_TIMEOUT)
+                    except asyncio.TimeoutError:
+                        base = index * CHUNK_SIZE
+                        async for piece in self._fetch_direct(url, entry, base + lo, base + hi - 1):
+                            yield piece
+                        index += 1
+                        continue
+
+                if entry.has(index):
+                    self.hits += 1
+                    yield await asyncio.to_thread(self._read_chunk, entry, index, lo, hi)
+                    index += 1
+                    continue
+
+                # Tros contigu de blocs que falten (amb lectura anticipada)
+                self.misses += 1
+                run_end = index
+                limit = min(entry.chunk_count - 1, max(last, index) + READ_AHEAD_CHUNKS, index + MAX_RUN_CHUNKS - 1)
+                while (run_end + 1 <= limit and not entry.has(run_end + 1)
+                       and (key, run_end + 1) not in self._inflight):
+                    run_end += 1
+
+                served_until = min(last, run_end)
+                skip = start - index * CHUNK_SIZE if index == first else 0
+                remaining = end - max(start, index * CHUNK_SIZE) + 1
+                async for piece in self._fetch_run(url, key, entry, index, run_end):
+                    if remaining <= 0:
+                        continue  # Lectura anticipada: es guarda però no s'envia
+                    if skip:
+                        if len(piece) <= skip:
+                            skip -= len(piece)
+                            continue
+                        piece = piece[skip:]
+                        skip = 0
+                    piece = piece[:remaining]
+                    remaining -= len(piece)
+                    yield piece
+                index = served_until + 1
+        finally:
+            entry.active -= 1
+            self._access[key] = time.time()
+
+    async def _fetch_direct(self, url: str, entry: RangeEntry, start: int, end: int) -> AsyncIterator[bytes]:
+        """Bytes [start, end] directament de l'origen, sense passar pel cache."""
+        client = self._get_client()
+        request = client.build_request("GET", url, headers={
+            "User-Agent": USER_AGENT, "Range": f"bytes={start}-{end}"
+        })
+        response = await client.send(request, stream=True)
+        try:
+            self._check_partial(response, entry)
+            async for data in response.aiter_bytes(chunk_size=256 * 1024):
+                yield data
+        finally:
+            await response.aclose()
+
+    @staticmethod
+    def _check_partial(response: httpx.Response, entry: RangeEntry):
+        """Resposta 206 del mateix fitxer (la mida total ha de coincidir amb l'entrada)."""
+        if response.status_code != 206:
+            raise UpstreamError(response.status_code if response.status_code >= 400 else 502)
+        total = response.headers.get("content-range", "").rsplit("/", 1)[-1]
+        if total.isdigit() and int(total) != entry.size:
+            raise SizeMismatch()
+
+    def _read_chunk(self, entry: RangeEntry, index: int, lo: int, hi: int) -> bytes:
+        with open(entry.chunk_path(index), "rb") as f:
+            f.seek(lo)
+            return f.read(hi - lo)
+
+    async def _fetch_run(self, url: str, key: str, entry: RangeEntry,
+                         first: int, last: int) -> AsyncIterator[bytes]:
+        """Descarrega els blocs [first, last] de l'origen, els guarda i els va retornant."""
+        events = {}
+        for index in range(first, last + 1):
+            events[index] = asyncio.Event()
+            self._inflight[(key, index)] = events[index]
+
+        range_start = first * CHUNK_SIZE
+        range_end = min((last + 1) * CHUNK_SIZE, entry.size) - 1
+        client = self._get_client()
+        request = client.build_request("GET", url, headers={
+            "User-Agent": USER_AGENT, "Range": f"bytes={range_start}-{range_end}"
+        })
+
+        index = first
+        # El bloc en curs es va omplint en memòria i s'escriu sencer fora del bucle
+        buffer = bytearray()
+        try:
+            response = await client.send(request, stream=True)
+            try:
+                try:
+                    self._check_partial(response, entry)
+                except SizeMismatch:
+                    # Els blocs guardats no són d'aquest fitxer: fora l'entrada
+                    logger.warning(f"[RangeCache] Mida diferent per {key[:8]}, s'esborra l'entrada")
+                    await self._discard(key)
+                    raise
+                async for data in response.aiter_bytes(chunk_size=256 * 1024):
+                    yield data
+                    while data and index <= last:
+                        room = entry.chunk_length(index) - len(buffer)
+                        buffer += data[:room]
+                        data = data[room:]
+                        if len(buffer) == entry.chunk_length(index):
+                            await self._finish_chunk(key, entry, index, bytes(buffer))
+                            events.pop(index).set()
+                            self._inflight.pop((key, index), None)
+                            buffer.clear()
+                            index += 1
+            finally:
+                await response.aclose()
+        finally:
+            for i, event in events.items():
+                self._inflight.pop((key, i), None)
+                event.set()
+
+    @staticmethod
+    def _write_chunk(entry: RangeEntry, index: int, data: bytes):
+        """Escriu un bloc complet (via .part, perquè mai n'hi hagi cap de mig fer)."""
+        path = entry.chunk_path(index)
+        part = path.with_suffix(".part")
+        try:
+            part.write_bytes(data)
+            os.replace(part, path)
+        except OSError:
+            try:
+                os.remove(part)
+            except OSError:
+                pass
+            raise
+
+    async def _finish_chunk(self, key: str, entry: RangeEntry, index: int, data: bytes):
+        await asyncio.to_thread(self._write_chunk, entry, index, data)
+        entry.mark(index)
+        self._usage[key] = self._usage.get(key, 0) + entry.chunk_length(index)
+        if self.usage_bytes > self.quota_bytes:
+            await self._evict(protect=key)
+
+    async def _discard(self, key: str):
+        """Esborra una entrada del cache (disc i memòria)."""
+        self._usage.pop(key, None)
+        self._access.pop(key, None)
+        self._entries.pop(key, None)
+        # Amb el lock d'obertura: ningú no torna a crear l'entrada mentre s'esborra
+        async with self._open_locks.setdefault(key, asyncio.Lock()):
+            await asyncio.to_thread(shutil.rmtree, self.root / key, True)
+
+    async def _evict(self, protect: str = None):
+        """Esborra les entrades menys usades fins tornar a la quota."""
+        candidates = sorted(
+            (k for k in self._usage if k != protect
+             and not (k in self._entries and self._entries[k].active)),
+            key=lambda k: self._access.get(k, 0),
+        )
+        for key in candidates:
+            if self.usage_bytes <= self.quota_bytes:
+                break
+            if key not in self._usage:
+                continue  # Ja esborrada per una altra petició mentre esperàvem
+            await self._discard(key)
+            logger.info(f"[RangeCache] Expulsada entrada {key[:8]}")
+
+
+# Instància global
+range_cache = RangeCache()
+
+
+def local_proxy_url(url: str) -> str:
+    """URL del proxy local amb cache (per a processos com ffmpeg)."""
+    from config import settings
+    return f"http://127.0.0.1:{settings.API_PORT}/api/video/proxy?url={quote(url, safe='')}"
@@ -0,0 +1,301 @@
+"""
+Hermes Media Server - Cursa d'extractors
+Llança els extractors d'embeds en paral·lel esglaonat (hedged race),
+ordenats per l'historial d'èxit i latència de cada font.
+"""
+
+import time
+import asyncio
+import sqlite3
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+# Temps màxim de tota la cursa (segons)
+RACE_DEADLINE = 25.0
+# Espera abans de llançar la resta d'extractors (segons)
+HEDGE_DELAY_MIN = 0.5
+HEDGE_DELAY_MAX = 3.0
+# Resultats negatius per (contingut, font): no es tornen a provar durant aquest temps
+NEGATIVE_TTL = 3 * 3600
+# Pes de l'última mostra a la mitjana mòbil exponencial
+EWMA_ALPHA = 0.2
+# Valors inicials per a fonts sense historial
+DEFAULT_SUCCESS_RATE = 0.5
+DEFAULT_LATENCY = 5.0
+
+Extractor = Callable[[], Awaitable[Optional[dict]]]
+
+
+def init_extractor_tables(conn: sqlite3.Connection):
+    """Crea les taules de salut dels extractors i del cache negatiu."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS extractor_health (
+            source TEXT PRIMARY KEY,
+            success_rate REAL NOT NULL,
+            latency REAL NOT NULL,
+            attempts INTEGER DEFAULT 0,
+            updated_at REAL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS extractor_negative_cache (
+            content_key TEXT NOT NULL,
+            source TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (content_key, source)
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_extractor_negative_expires
+        ON extractor_negative_cache(expires_at)
+    """)
+    conn.commit()
+
+
+def _default_db():
+    from backend.services.database import get_db
+    return get_db()
+
+
+class ExtractorHealth:
+    """
+    Puntuació de cada extractor (taxa d'èxit i latència, mitjanes mòbils)
+    i cache negatiu per contingut. Es carrega de la BD la primera vegada
+    i els canvis s'escriuen en acabar cada cursa.
+    """
+
+    def __init__(self, db_factory: Callable = None):
+        self._db_factory = db_factory or _default_db
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._negative: Dict[Tuple[str, str], float] = {}
+        self._dirty_stats: set = set()
+        self._dirty_negative: set = set()
+        self._loaded = False
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with self._db_factory() as conn:
+                init_extractor_tables(conn)
+                cursor = conn.cursor()
+                cursor.execute("SELECT source, success_rate, latency, attempts FROM extractor_health")
+                for source, success_rate, latency, attempts in cursor.fetchall():
+                    self._stats[source] = {
+                        "success_rate": success_rate, "latency": latency, "attempts": attempts
+                    }
+                cursor.execute("DELETE FROM extractor_negative_cache WHERE expires_at < ?", (time.time(),))
+                cursor.execute("SELECT content_key, source, expires_at FROM extractor_negative_cache")
+                for content_key, source, expires_at in cursor.fetchall():
+                    self._negative[(content_key, source)] = expires_at
+                conn.commit()
+        except Exception as e:
+            logger.warning(f"No s'ha pogut carregar la salut dels extractors: {e}")
+
+    def _get(self, name: str) -> Dict[str, float]:
+        return self._stats.get(name) or {
+            "success_rate": DEFAULT_SUCCESS_RATE, "latency": DEFAULT_LATENCY, "attempts": 0
+        }
+
+    def expected_time(self, name: str) -> float:
+        """Temps esperat fins a obtenir un stream vàlid amb aquesta font."""
+        stats = self._get(name)
+        return stats["latency"] / max(stats["success_rate"], 0.05)
+
+    def rank(self, names) -> List[str]:
+        """Fonts ordenades de més a menys prometedora."""
+        self._ensure_loaded()
+        return sorted(names, key=self.expected_time)
+
+    def hedge_delay(self, name: str) -> float:
+        """Quant esperar la font principal abans de llançar la resta."""
+        latency = self._get(name)["latency"]
+        return min(max(latency, HEDGE_DELAY_MIN), HEDGE_DELAY_MAX)
+
+    def record(self, name: str, success: bool, latency: float):
+        """Actualitza la puntuació d'una font amb el resultat d'un intent."""
+        stats = dict(self._get(name))
+        stats["success_rate"] += EWMA_ALPHA * ((1.0 if success else 0.0) - stats["success_rate"])
+        if success:
+            # La latència només es mesura amb èxits (un error ràpid no és una font ràpida)
+            stats["latency"] += EWMA_ALPHA * (latency - stats["latency"])
+        stats["attempts"] += 1
+        self._stats[name] = stats
+        self._dirty_stats.add(name)
+
+    def is_negative(self, content_key: str, name: str) -> bool:
+        """Comprova si la font ja ha fallat recentment per aquest contingut."""
+        self._ensure_loaded()
+        expires_at = self._negative.get((content_key, name))
+        if expires_at is None:
+            return False
+        if expires_at < time.time():
+            del self._negative[(content_key, name)]
+            return False
+        return True
+
+    def mark_negative(self, content_key: str, name: str):
+        """Recorda que la font no té stream per aquest contingut."""
+        self._negative[(content_key, name)] = time.time() + NEGATIVE_TTL
+        self._dirty_negative.add((content_key, name))
+
+    def flush(self):
+        """Escriu a la BD els canvis pendents."""
+        if not self._dirty_stats and not self._dirty_negative:
+            return
+        try:
+            with self._db_factory() as conn:
+                now = time.time()
+                conn.executemany("""
+                    INSERT INTO extractor_health (source, success_rate, latency, attempts, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(source) DO UPDATE SET
+                        success_rate = excluded.success_rate,
+                        latency = excluded.latency,
+                        attempts = excluded.attempts,
+                        updated_at = excluded.updated_at
+                """, [
+                    (name, s["success_rate"], s["latency"], s["attempts"], now)
+                    for name, s in ((n, self._stats[n]) for n in self._dirty_stats)
+                ])
+                conn.executemany("""
+                    INSERT OR REPLACE INTO extractor_negative_cache (content_key, source, expires_at)
+                    VALUES (?, ?, ?)
+                """, [
+                    (key, name, self._negative[(key, name)])
+                    for key, name in self._dirty_negative if (key, name) in self._negative
+                ])
+                conn.commit()
+            self._dirty_stats.clear()
+            self._dirty_negative.clear()
+        except Exception as e:
+            logger.warning(f"No s'ha pogut guardar la salut dels extractors: {e}")
+
+    @property
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Puntuacions actuals (per a l'admin)."""
+        self._ensure_loaded()
+        return {
+            name: {**stats, "expected_time": round(self.expected_time(name), 2)}
+            for name, stats in self._stats.items()
+        }
+
+
+# Instància global
+extractor_health = ExtractorHealth()
+
+# Client compartit per a tots els extractors (keep-alive entre peticions)
+_scrape_client: Optional[httpx.AsyncClient] = None
+
+
+def get_scrape_client() -> httpx.AsyncClient:
+    """Client HTTP per scrapejar embeds (sense verificació SSL, com els extractors)."""
+    global _scrape_client
+    if _scrape_client is None or _scrape_client.is_closed:
+        _scrape_client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=httpx.Timeout(15.0, connect=5.0),
+            verify=False,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=10),
+        )
+    return _scrape_client
+
+
+async def close_scrape_client():
+    """Tanca el client compartit (shutdown)."""
+    global _scrape_client
+    if _scrape_client is not None:
+        await _scrape_client.aclose()
+        _scrape_client = None
+
+
+async def hedged_race(
+    extractors: Dict[str, Extractor],
+    content_key: str,
+    preferred: str = None,
+    health: ExtractorHealth = None,
+) -> Optional[dict]:
+    """
+    Executa els extractors com una cursa esglaonada:
+    1. Llança la font amb millor historial (o la preferida)
+    2. Si no respon en el seu temps habitual, llança la resta
+    3. Retorna el primer resultat vàlid i cancel·la els altres
+
+    Un extractor retorna None quan la font respon però no té stream (va al
+    cache negatiu) i llança una excepció quan falla (no hi va).
+    """
+    health = health or extractor_health
+    names = [n for n in health.rank(extractors) if not health.is_negative(content_key, n)]
+    if preferred in names:
+        names.remove(preferred)
+        names.insert(0, preferred)
+    if not names:
+        logger.info(f"Cap extractor disponible per {content_key} (cache negatiu)")
+        return None
+
+    loop = asyncio.get_running_loop()
+    started: Dict[asyncio.Task, Tuple[str, float]] = {}
+    pending: set = set()
+
+    def launch(name: str):
+        task = asyncio.create_task(extractors[name]())
+        started[task] = (name, loop.time())
+        pending.add(task)
+
+    launch(names[0])
+    waiting = names[1:]
+    hedge_at = loop.time() + health.hedge_delay(names[0])
+    deadline = loop.time() + RACE_DEADLINE
+
+    try:
+        while pending or waiting:
+            now = loop.time()
+            if now >= deadline:
+                # Els que no han acabat compten com a fallada (sense cache negatiu)
+                for task in pending:
+                    name, t0 = started[task]
+                    health.record(name, False, now - t0)
+                logger.info(f"Cursa d'extractors esgotada per {content_key}")
+                return None
+
+            if waiting and (not pending or now >= hedge_at):
+                logger.debug(f"Llançant extractors de reserva: {waiting}")
+                for name in waiting:
+                    launch(name)
+                waiting = []
+
+            timeout = (hedge_at if waiting else deadline) - now
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                pending.discard(task)
+                name, t0 = started[task]
+                latency = loop.time() - t0
+                try:
+                    result = task.result()
+                except Exception as e:
+                    # Error de xarxa o de la font: pot ser transitori, no va al cache negatiu
+                    logger.debug(f"Extractor {name} ha fallat: {e}")
+                    health.record(name, False, latency)
+                    continue
+
+                if result and result.get("url"):
+                    health.record(name, True, latency)
+                    logger.info(f"Extracció exitosa amb {name} en {latency:.2f}s")
+                    return result
+
+                health.record(name, False, latency)
+                if result is None:
+                    # La font ha respost però no té stream per aquest contingut
+                    health.mark_negative(content_key, name)
+        return None
+    finally:
+        for task in pending:
+            task.cancel()
+        health.flush()
@@ -0,0 +1,138 @@
+"""
+Tests per a l'índex de títols d'AniDB
+"""
+import json
+import asyncio
+
+import pytest
+
+from backend.metadata import anidb
+from backend.metadata.anidb import AniDBClient, TitleIndex, build_title_index, match_score, parse_titles_dump
+
+DUMP = """<?xml version="1.0" encoding="UTF-8"?>
+<animetitles>
+  <anime aid="1">
+    <title xml:lang="x-jat" type="main">Shingeki no Kyojin</title>
+    <title xml:lang="en" type="official">Attack on Titan</title>
+    <title xml:lang="ca" type="official">L'Atac dels Titans</title>
+  </anime>
+  <anime aid="2">
+    <title xml:lang="x-jat" type="main">Shingeki no Kyojin Season 2</title>
+    <title xml:lang="en" type="official">Attack on Titan Season 2</title>
+  </anime>
+  <anime aid="3">
+    <title xml:lang="x-jat" type="main">Naruto</title>
+    <title xml:lang="ja" type="official">ナルト</title>
+    <title xml:lang="en" type="syn">Naruto Ninja</title>
+  </anime>
+  <anime aid="4">
+    <title xml:lang="x-jat" type="main">Boruto: Naruto Next Generations</title>
+  </anime>
+  <anime aid="0"><title type="main">Sense id</title></anime>
+</animetitles>
+""".encode("utf-8")
+
+
+@pytest.fixture
+def index(tmp_path):
+    build_title_index(parse_titles_dump(DUMP), tmp_path / "titles.db")
+    return TitleIndex(tmp_path / "titles.db")
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Client sense xarxa: el dump es 'descarrega' de DUMP"""
+    monkeypatch.setattr(anidb, "_last_refresh_attempt", 0.0)
+    client = AniDBClient(cache_dir=str(tmp_path))
+    client.downloads = 0
+
+    def fake_request(url, is_gzip=False):
+        client.downloads += 1
+        return DUMP
+
+    monkeypatch.setattr(client, "_sync_request", fake_request)
+    return client
+
+
+class TestTitleIndex:
+    """Tests de l'índex i la puntuació"""
+
+    @pytest.mark.unit
+    def test_scores(self):
+        assert match_score("naruto", "naruto") == 100
+        assert match_score("naruto", "naruto ninja") == 90
+        assert match_score("naruto", "boruto: naruto next generations") == 70
+        assert 0 < match_score("narutto", "naruto") < 70
+        assert match_score("bleach", "naruto") == 0
+
+    @pytest.mark.unit
+    def test_ranking(self, index):
+        """Exacte, després prefix (el més curt primer), després subcadena"""
+        matches = index.search("Naruto", limit=10)
+        assert [aid for aid, _, _ in matches] == [3, 4]
+        assert matches[0][1] == 100
+        assert index.search("attack on", limit=10)[0][:2] == (1, 90)
+        assert [aid for aid, _, _ in index.search("titan season", limit=10)] == [2]
+        assert index.search("ナル")[0][0] == 3  # Menys de 3 caràcters: prefix
+
+    @pytest.mark.unit
+    def test_fuzzy(self, index):
+        """Una errada tipogràfica encara troba l'anime"""
+        matches = index.search("Shingeki no Kyojn", limit=10)
+        assert matches[0][0] == 1
+        assert matches[0][1] < 70
+        assert index.search("zzzzzz") == []
+
+    @pytest.mark.unit
+    def test_titles_in_dump_order(self, index):
+        titles = index.titles([3, 99])
+        assert [t["title"] for t in titles[3]] == ["Naruto", "ナルト", "Naruto Ninja"]
+        assert titles[99] == []
+        assert index.anime_count() == 4
+
+
+class TestAniDBClient:
+    """Tests del client sobre l'índex"""
+
+    @pytest.mark.integration
+    def test_search_and_titles(self, client):
+        results = asyncio.run(client.search_anime("attack on titan", limit=5))
+        assert results[0]["anidb_id"] == 1
+        assert results[0]["title"] == "Shingeki no Kyojin"
+        assert results[0]["title_ca"] == "L'Atac dels Titans"
+        assert results[0]["score"] == 100
+
+        titles = asyncio.run(client.get_anime_titles(3))
+        assert titles["main_title"] == "Naruto"
+        assert titles["synonyms"] == ["Naruto Ninja"]
+        assert asyncio.run(client.get_anime_titles(99)) is None
+
+    @pytest.mark.integration
+    def test_built_once(self, client):
+        """El dump es baixa i s'indexa una vegada; les cerques no el tornen a llegir"""
+        asyncio.run(client.search_anime("naruto"))
+        asyncio.run(client.search_anime("titan"))
+        assert client.downloads == 1
+        assert asyncio.run(client.load_titles_dump(force_refresh=True)) == 4
+        assert client.downloads == 2
+
+    @pytest.mark.integration
+    def test_failed_download_not_retried(self, client, monkeypatch):
+        def failing(url, is_gzip=False):
+            client.downloads += 1
+            return None
+
+        monkeypatch.setattr(client, "_sync_request", failing)
+        assert asyncio.run(client.search_anime("naruto")) == []
+        assert asyncio.run(client.search_anime("naruto")) == []
+        assert client.downloads == 1
+
+    @pytest.mark.integration
+    def test_legacy_json_cache(self, client, tmp_path):
+        """L'antic cache JSON es converteix a índex sense descarregar res"""
+        legacy = {"3": {"titles": [{"type": "main", "lang": "x-jat", "title": "Naruto"}]}}
+        (tmp_path / "anime-titles.json").write_text(json.dumps(legacy), encoding="utf-8")
+        results = asyncio.run(client.search_anime("naruto"))
+        assert results[0]["anidb_id"] == 3
+        assert client.downloads == 0
+        assert not (tmp_path / "anime-titles.json").exists()
@@ -0,0 +1,234 @@
+"""
+Tests per a l'orquestració dels scrapers d'anime
+"""
+import time
+import asyncio
+
+import httpx
+import pytest
+
+from backend.anime.orchestrator import CircuitBreaker, PageCache, SourceClient, SourceOrchestrator
+from backend.anime.scraper import AnimeScraperManager
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def mock_client(handler):
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def make_manager(handlers):
+    """Manager amb transports falsos per font (handler async per petició)"""
+    manager = AnimeScraperManager()
+    for name, handler in handlers.items():
+        manager.scrapers[name].client.client = mock_client(handler)
+    return manager
+
+
+FLV_SEARCH = '<article class="Anime"><a href="/anime/one-piece"><img src="/c.jpg"><h3>One Piece</h3></a></article>'
+
+
+class TestCircuitBreaker:
+    """Tests del circuit breaker"""
+
+    @pytest.mark.unit
+    def test_opens_and_recovers(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker("x", threshold=2, cooldown=60, clock=clock)
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open" and not breaker.allow()
+
+        # Passat el temps, una sola petició de prova
+        clock.now += 61
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open"
+
+        clock.now += 61
+        assert breaker.allow()
+        breaker.record_success()
+        assert breaker.state == "closed" and breaker.failures == 0
+
+    @pytest.mark.unit
+    def test_lost_trial_expires(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker("x", threshold=1, cooldown=10, clock=clock)
+        breaker.record_failure()
+        clock.now += 11
+        assert breaker.allow()
+        # La prova no ha tornat mai
+        clock.now += 11
+        assert breaker.allow()
+
+
+class TestPageCache:
+    """Tests del cache de pàgines"""
+
+    @pytest.mark.unit
+    def test_shared_and_expires(self):
+        clock = FakeClock()
+        calls = []
+
+        async def handler(request):
+            calls.append(str(request.url))
+            await asyncio.sleep(0.01)
+            return httpx.Response(200, text="pàgina")
+
+        async def scenario():
+            cache = PageCache(ttl=60, clock=clock)
+            client = SourceClient("x", mock_client(handler), cache, CircuitBreaker("x"))
+            # Dues peticions simultànies: una sola descàrrega
+            first, second = await asyncio.gather(client.get("http://a/p"), client.get("http://a/p"))
+            assert first.text == second.text == "pàgina"
+            await client.get("http://a/p")
+            clock.now += 61
+            await client.get("http://a/p")
+
+        asyncio.run(scenario())
+        assert len(calls) == 2
+
+    @pytest.mark.unit
+    def test_server_errors_not_cached(self):
+        calls = []
+
+        async def handler(request):
+            calls.append(1)
+            return httpx.Response(503)
+
+        async def scenario():
+            client = SourceClient("x", mock_client(handler), PageCache(), CircuitBreaker("x"))
+            await client.get("http://a/p")
+            await client.get("http://a/p")
+
+        asyncio.run(scenario())
+        assert len(calls) == 2
+
+    @pytest.mark.unit
+    def test_client_errors_not_cached(self):
+        calls = []
+
+        async def handler(request):
+            calls.append(1)
+            return httpx.Response(429)
+
+        async def scenario():
+            client = SourceClient("x", mock_client(handler), PageCache(), CircuitBreaker("x"))
+            await client.get("http://a/p")
+            await client.get("http://a/p")
+
+        asyncio.run(scenario())
+        assert len(calls) == 2
+
+    @pytest.mark.unit
+    def test_owner_cancelled_waiter_gets_page(self):
+        """Si qui ha iniciat la descàrrega es cancel·la, els altres la reben igualment"""
+        calls = []
+
+        async def handler(request):
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return httpx.Response(200, text="pàgina")
+
+        async def scenario():
+            cache = PageCache()
+            client = SourceClient("x", mock_client(handler), cache, CircuitBreaker("x"))
+            owner = asyncio.ensure_future(client.get("http://a/p"))
+            await asyncio.sleep(0.01)
+            waiter = asyncio.ensure_future(client.get("http://a/p"))
+            await asyncio.sleep(0.01)
+            owner.cancel()
+            response = await waiter
+            assert owner.cancelled()
+            assert response.text == "pàgina"
+            assert cache.lookup("http://a/p") is not None
+
+        asyncio.run(scenario())
+        assert len(calls) == 1
+
+
+class TestFanOut:
+    """Tests de la cerca a totes les fonts"""
+
+    @pytest.mark.integration
+    def test_slow_source_does_not_block(self):
+        """Una font lenta queda com a timeout i la resta arriba a temps"""
+        async def flv(request):
+            return httpx.Response(200, text=FLV_SEARCH)
+
+        async def slow(request):
+            await asyncio.sleep(5)
+            return httpx.Response(200, text="")
+
+        async def dead(request):
+            raise httpx.ConnectError("caiguda")
+
+        manager = make_manager({"animeflv": flv, "henaojara": slow, "fansubscat": dead})
+        started = time.monotonic()
+        result = asyncio.run(manager.search_detailed("one piece", deadline=0.3))
+        assert time.monotonic() - started < 2
+
+        assert result["partial"]
+        assert result["results"]["animeflv"][0]["title"] == "One Piece"
+        assert result["sources"]["animeflv"]["status"] == "ok"
+        assert result["sources"]["henaojara"]["status"] == "timeout"
+        assert result["results"]["henaojara"] == []
+        assert result["sources"]["fansubscat"]["status"] == "error"
+
+    @pytest.mark.integration
+    def test_dead_source_skipped(self):
+        """Després de prou errors, la font caiguda ni es prova"""
+        calls = []
+
+        async def dead(request):
+            calls.append(1)
+            raise httpx.ConnectError("caiguda")
+
+        async def empty(request):
+            return httpx.Response(200, text="")
+
+        manager = make_manager({"animeflv": dead, "henaojara": empty, "fansubscat": empty})
+
+        async def scenario():
+            for i in range(4):
+                result = await manager.search_detailed(f"q{i}", deadline=1)
+            return result
+
+        result = asyncio.run(scenario())
+        assert len(calls) == 3
+        assert result["sources"]["animeflv"]["status"] == "skipped"
+        assert manager.health()["animeflv"]["state"] == "open"
+
+    @pytest.mark.integration
+    def test_henaojara_episode_reuses_page(self):
+        """Els servidors d'un episodi reutilitzen la pàgina de l'anime ja baixada"""
+        calls = []
+        page = '<h1>Naruto</h1><a href="https://henaojara.com/episodio-1">Ep 1</a>'
+
+        async def henao(request):
+            calls.append(request.url.path)
+            if request.url.path == "/ver/season/naruto/":
+                return httpx.Response(200, text=page)
+            if request.url.path == "/episodio-1":
+                return httpx.Response(200, text='<iframe src="https://streamtape.com/e/x"></iframe>')
+            return httpx.Response(404)
+
+        manager = make_manager({"henaojara": henao})
+
+        async def scenario():
+            info = await manager.get_anime_info("henaojara", "naruto")
+            servers = await manager.get_episode_sources("henaojara", "naruto", 1)
+            return info, servers
+
+        info, servers = asyncio.run(scenario())
+        assert info["episodes"][0]["number"] == 1
+        assert servers[0]["server"] == "streamtape"
+        assert calls.count("/ver/season/naruto/") == 1
@@ -0,0 +1,167 @@
+"""
+Tests per a la còpia local de l'artwork
+"""
+import asyncio
+import sqlite3
+
+import httpx
+import pytest
+
+from backend.services.artwork import ArtworkMirror, split_tmdb_url, tmdb_url
+
+POSTER = "https://image.tmdb.org/t/p/w500/abc.jpg"
+POSTER_SMALL = "https://image.tmdb.org/t/p/w300/abc.jpg"
+LOGO = "https://assets.fanart.tv/fanart/tv/1/hdtvlogo/show.png"
+
+
+def make_mirror(tmp_path, requests, responses=None):
+    """Mirall amb un origen fals que apunta les peticions"""
+    responses = responses or {}
+
+    def handler(request):
+        url = str(request.url)
+        requests.append(url)
+        if url in responses:
+            return responses[url]
+        content_type = "image/png" if url.endswith(".png") else "image/jpeg"
+        # Contingut segons el fitxer: mides diferents de la mateixa imatge donen el mateix hash
+        return httpx.Response(200, content=url.rsplit("/", 1)[1].encode(),
+                              headers={"Content-Type": content_type})
+
+    return ArtworkMirror(
+        root=tmp_path / "artwork", db_path=tmp_path / "test.db", concurrency=2,
+        client_factory=lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+
+
+async def enqueue_and_drain(mirror, urls):
+    mirror.enqueue(urls)
+    await mirror._drain_task
+    await mirror.close()
+
+
+class TestUrls:
+    """Tests de les URLs de TMDB"""
+
+    @pytest.mark.unit
+    def test_tmdb_url(self):
+        assert tmdb_url("/abc.jpg", "w500") == POSTER
+        assert tmdb_url(POSTER_SMALL, "w500") == POSTER_SMALL
+        assert tmdb_url(None, "w500") is None
+        assert split_tmdb_url(POSTER) == ("w500", "/abc.jpg")
+        assert split_tmdb_url(LOGO) is None
+
+
+class TestMirror:
+    """Tests de la cua de descàrregues"""
+
+    @pytest.mark.integration
+    def test_downloads_and_dedupes(self, tmp_path):
+        """Les imatges es descarreguen una vegada i el contingut repetit es comparteix"""
+        requests = []
+        mirror = make_mirror(tmp_path, requests)
+        asyncio.run(enqueue_and_drain(mirror, [POSTER, POSTER_SMALL, LOGO, POSTER, "https://example.com/x.jpg"]))
+
+        assert sorted(requests) == sorted([POSTER, POSTER_SMALL, LOGO])
+        # Mateix contingut → un sol fitxer
+        assert len(list((tmp_path / "artwork").glob("*/*.jpg"))) == 1
+        assert mirror.find(LOGO).suffix == ".png"
+        assert mirror.stats()["ok"] == 3
+
+        # Tornar a encuar no fa cap petició
+        asyncio.run(enqueue_and_drain(mirror, [POSTER]))
+        assert len(requests) == 3
+
+    @pytest.mark.integration
+    def test_other_size_fallback(self, tmp_path):
+        """Si no hi ha la mida demanada es fa servir la mateixa imatge a una altra mida"""
+        mirror = make_mirror(tmp_path, [])
+        asyncio.run(enqueue_and_drain(mirror, [POSTER]))
+        assert mirror.find(POSTER_SMALL) == mirror.find(POSTER)
+        assert mirror.find("https://image.tmdb.org/t/p/w500/other.jpg") is None
+
+    @pytest.mark.integration
+    def test_failures_retried_later(self, tmp_path):
+        """Un error queda apuntat i no es reintenta immediatament"""
+        requests = []
+        mirror = make_mirror(tmp_path, requests, {POSTER: httpx.Response(404)})
+        asyncio.run(enqueue_and_drain(mirror, [POSTER]))
+        assert mirror.find(POSTER) is None
+        assert mirror.stats()["failed"] == 1
+        assert mirror._next_batch(10) == []
+
+    @pytest.mark.integration
+    def test_rejects_non_images(self, tmp_path):
+        """Les respostes que no són imatges no es guarden"""
+        html = httpx.Response(200, content=b"<html>", headers={"Content-Type": "text/html"})
+        mirror = make_mirror(tmp_path, [], {POSTER: html})
+        asyncio.run(enqueue_and_drain(mirror, [POSTER]))
+        assert mirror.find(POSTER) is None
+
+    @pytest.mark.integration
+    def test_library_urls(self, tmp_path):
+        """Es recullen les referències de la biblioteca, la watchlist i el progrés"""
+        conn = sqlite3.connect(tmp_path / "test.db")
+        conn.execute("CREATE TABLE series (poster TEXT, backdrop TEXT)")
+        conn.execute("CREATE TABLE watchlist (poster_path TEXT, backdrop_path TEXT)")
+        conn.execute("INSERT INTO series VALUES (?, '/local/backdrop.jpg')", (POSTER,))
+        conn.execute("INSERT INTO watchlist VALUES ('/w.jpg', NULL)")
+        conn.commit()
+        conn.close()
+
+        mirror = make_mirror(tmp_path, [])
+        urls = mirror.library_urls()
+        assert POSTER in urls
+        assert "https://image.tmdb.org/t/p/w500/w.jpg" in urls
+        assert "/local/backdrop.jpg" in urls
+        # Sense bucle en marxa només s'encua (els camins locals s'ignoren)
+        assert mirror.mirror_library() == 2
+
+    @pytest.mark.integration
+    def test_fallback_cache(self, tmp_path):
+        """La resposta de Fanart.tv es guarda i les seves imatges s'encuen"""
+        mirror = make_mirror(tmp_path, [])
+        assert mirror.get_fallback("tv", 1) is None
+        mirror.save_fallback("tv", 1, {"tmdb_id": 1, "logo": LOGO, "poster": None})
+        data, fresh = mirror.get_fallback("tv", 1)
+        assert data["logo"] == LOGO and fresh
+        assert mirror._next_batch(10) == [LOGO]
+
+    @pytest.mark.integration
+    def test_lookup_only_known_urls(self, tmp_path):
+        """Una URL que la biblioteca no coneix només s'encua si es permet"""
+        mirror = make_mirror(tmp_path, [])
+        other = "https://image.tmdb.org/t/p/w500/other.jpg"
+        assert mirror.lookup(other) == (None, False)
+        assert mirror._next_batch(10) == []
+
+        # Una altra mida d'una imatge coneguda sí que s'encua
+        mirror.enqueue([POSTER])
+        assert mirror.lookup(POSTER_SMALL) == (None, True)
+        assert mirror.lookup(other, allow_new=True) == (None, True)
+        assert sorted(mirror._next_batch(10)) == sorted([POSTER, POSTER_SMALL, other])
+
+    @pytest.mark.integration
+    def test_rejects_oversized(self, tmp_path, monkeypatch):
+        """Les imatges massa grans no es guarden"""
+        monkeypatch.setattr("backend.services.artwork.MAX_IMAGE_BYTES", 4)
+        big = httpx.Response(200, content=b"x" * 10, headers={"Content-Type": "image/jpeg"})
+        mirror = make_mirror(tmp_path, [], {POSTER: big})
+        asyncio.run(enqueue_and_drain(mirror, [POSTER]))
+        assert mirror.find(POSTER) is None
+        assert mirror.stats()["failed"] == 1
+
+    @pytest.mark.integration
+    def test_quota_pruned_refetched(self, tmp_path):
+        """La còpia local té quota i el que s'esborra es torna a baixar en demanar-ho"""
+        mirror = make_mirror(tmp_path, [])
+        mirror.quota.quota_bytes = 10
+        ticks = iter(range(0, 10 ** 6, 100))
+        mirror.quota._clock = lambda: 10 ** 10 + next(ticks)
+        asyncio.run(enqueue_and_drain(mirror, [POSTER, LOGO]))
+        assert mirror.quota.usage() <= 10
+        assert (mirror.find(POSTER) is None) != (mirror.find(LOGO) is None)
+
+        missing = POSTER if mirror.find(POSTER) is None else LOGO
+        assert mirror.lookup(missing) == (None, True)
+        assert mirror._next_batch(10) == [missing]
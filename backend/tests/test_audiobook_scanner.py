@@ -0,0 +1,108 @@
+"""
+Tests per a l'escaneig incremental d'audiollibres
+"""
+import os
+import sqlite3
+
+import pytest
+
+from backend.audiobooks.scanner import AudiobooksScanner
+
+
+@pytest.fixture
+def library(tmp_path):
+    root = tmp_path / "audiollibres"
+    book = root / "Autor" / "Llibre"
+    book.mkdir(parents=True)
+    for i in (1, 2, 3):
+        (book / f"{i:02d}.mp3").write_bytes(b"x" * 100 * i)
+    (book / "cover.jpg").write_bytes(b"jpg")
+    (root / "Autor" / "solt.m4b").write_bytes(b"y" * 10)
+    return root
+
+
+@pytest.fixture
+def scanner(tmp_path, monkeypatch):
+    scanner = AudiobooksScanner(db_path=str(tmp_path / "test.db"))
+    probed = []
+
+    def fake_info(path):
+        probed.append(os.path.basename(path))
+        return {
+            'file_path': path,
+            'file_name': os.path.basename(path),
+            'format': 'mp3',
+            'file_size': os.path.getsize(path),
+            'duration': 60,
+            'title': os.path.basename(path),
+        }
+
+    monkeypatch.setattr(scanner, "_get_audio_info", fake_info)
+    scanner.probed = probed
+    return scanner
+
+
+def files(scanner):
+    conn = sqlite3.connect(scanner.db_path)
+    rows = dict(conn.execute("SELECT file_name, id FROM audiobook_files").fetchall())
+    conn.close()
+    return rows
+
+
+class TestIncrementalScan:
+    """Tests de l'escaneig incremental"""
+
+    @pytest.mark.integration
+    def test_unchanged_files_not_probed(self, scanner, library):
+        """Un segon escaneig sense canvis no torna a passar per ffprobe"""
+        first = scanner.scan_library(str(library))
+        assert first["audiobooks_found"] == 2
+        assert sorted(scanner.probed) == ["01.mp3", "02.mp3", "03.mp3", "solt.m4b"]
+        ids = files(scanner)
+
+        second = scanner.scan_library(str(library))
+        assert second["audiobooks_updated"] == 2
+        assert len(scanner.probed) == 4
+        assert scanner.files_unchanged == 4
+        assert files(scanner) == ids
+
+    @pytest.mark.integration
+    def test_changed_file_keeps_id(self, scanner, library):
+        """Només es prova el fitxer canviat i els ids es mantenen"""
+        scanner.scan_library(str(library))
+        ids = files(scanner)
+        with open(library / "Autor" / "Llibre" / "02.mp3", "ab") as f:
+            f.write(b"mes")
+        scanner.scan_library(str(library))
+        assert scanner.probed[4:] == ["02.mp3"]
+        assert files(scanner) == ids
+
+    @pytest.mark.integration
+    def test_removed_file_releases_progress(self, scanner, library):
+        """Un fitxer eliminat s'esborra i el progrés que hi apuntava es deslliga"""
+        scanner.scan_library(str(library))
+        ids = files(scanner)
+        conn = sqlite3.connect(scanner.db_path)
+        book_id = conn.execute("SELECT audiobook_id FROM audiobook_files WHERE id = ?", (ids["03.mp3"],)).fetchone()[0]
+        conn.execute("INSERT INTO audiobook_progress (audiobook_id, current_file_id, current_position) VALUES (?, ?, 30)",
+                     (book_id, ids["03.mp3"]))
+        conn.commit()
+
+        os.remove(library / "Autor" / "Llibre" / "03.mp3")
+        scanner.scan_library(str(library))
+        assert "03.mp3" not in files(scanner)
+        progress = conn.execute("SELECT current_file_id, current_position FROM audiobook_progress").fetchone()
+        total = conn.execute("SELECT total_files, total_duration, cover FROM audiobooks WHERE id = ?", (book_id,)).fetchone()
+        conn.close()
+        assert progress == (None, 0)
+        assert total[:2] == (2, 120)
+        assert total[2].endswith("cover.jpg")
+
+    @pytest.mark.unit
+    def test_listing_cached_per_pass(self, scanner, library, monkeypatch):
+        """Cada directori es llegeix una sola vegada per passada"""
+        calls = []
+        real = os.scandir
+        monkeypatch.setattr(os, "scandir", lambda path: calls.append(path) or real(path))
+        scanner.scan_library(str(library))
+        assert len(calls) == len(set(calls)) == 3
@@ -0,0 +1,388 @@
+"""
+Tests per al stream continu i el mapa de capítols dels audiollibres
+"""
+import sqlite3
+import threading
+from pathlib import Path
+
+import pytest
+
+from backend.audiobooks import streaming
+from backend.audiobooks.streaming import (
+    AudiobookStreams, AudiobookStreamError, audio_payload, hls_master_playlist, hls_playlist,
+    iter_concat, locate, negotiate_profile
+)
+from backend.services import probe_cache
+from backend.services.thumbnails import FfmpegBudget
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz: frames de 417 bytes
+FRAME_HEADER = b"\xff\xfb\x90\x00"
+FRAME_LENGTH = 417
+
+
+def make_mp3(path, payload, tags=True):
+    """MP3 fals: ID3v2 + frame Xing + àudio + ID3v1"""
+    data = b""
+    if tags:
+        data += b"ID3\x03\x00\x00\x00\x00\x00\x05" + b"\x00" * 5
+    xing = FRAME_HEADER + b"\x00" * 32 + b"Xing"
+    data += xing + b"\x00" * (FRAME_LENGTH - len(xing))
+    data += payload
+    if tags:
+        data += b"TAG" + b"\x00" * 125
+    path.write_bytes(data)
+    return str(path)
+
+
+@pytest.fixture
+def probes(monkeypatch):
+    """ffprobe fals: durades, paràmetres i capítols per nom de fitxer"""
+    info = {}
+
+    def probe_media(path, timeout=None):
+        entry = info.get(str(path).rsplit("/", 1)[-1], {})
+        return {"format": {}, "streams": [{"codec_type": "audio", "codec_name": entry.get("codec", "mp3"),
+                                           "sample_rate": "44100", "channels": entry.get("channels", 2)}]}
+
+    monkeypatch.setattr(probe_cache, "probe_media", probe_media)
+    monkeypatch.setattr(probe_cache, "probe_duration",
+                        lambda path: info.get(str(path).rsplit("/", 1)[-1], {}).get("duration", 10.0))
+    monkeypatch.setattr(probe_cache, "probe_chapters",
+                        lambda path: info.get(str(path).rsplit("/", 1)[-1], {}).get("chapters", []))
+    return info
+
+
+@pytest.fixture
+def book(tmp_path):
+    """Audiollibres amb tres MP3 (ordre per track_number)"""
+    paths = [make_mp3(tmp_path / f"{i}.mp3", bytes([i]) * (100 * i)) for i in (1, 2, 3)]
+    conn = sqlite3.connect(tmp_path / "test.db")
+    conn.execute("""
+        CREATE TABLE audiobook_files (
+            id INTEGER PRIMARY KEY, audiobook_id INTEGER, file_path TEXT, file_name TEXT,
+            title TEXT, track_number INTEGER, duration INTEGER, format TEXT
+        )
+    """)
+    for i, path in enumerate(paths, 1):
+        conn.execute("INSERT INTO audiobook_files VALUES (?, 1, ?, ?, ?, ?, 10, ?)",
+                     (10 + i, path, f"{i}.mp3", f"Capítol {i}", i, path.rsplit(".", 1)[-1]))
+    conn.commit()
+    conn.close()
+    return paths
+
+
+def make_streams(tmp_path, runner=None, spawn=None, budget=None):
+    return AudiobookStreams(db_path=tmp_path / "test.db", cache_root=tmp_path / "hls",
+                            runner=runner, spawn=spawn, budget=budget or FfmpegBudget(2))
+
+
+class FakeProcess:
+    def __init__(self, returncode):
+        self.returncode = returncode
+
+    def poll(self):
+        return self.returncode
+
+    def kill(self):
+        pass
+
+    def wait(self):
+        return self.returncode
+
+
+class SlowProcess(FakeProcess):
+    """ffmpeg que no acaba fins que se li diu"""
+    def __init__(self, finish):
+        super().__init__(0)
+        self.finish = finish
+
+    def poll(self):
+        return 0 if self.finish.is_set() else None
+
+    def kill(self):
+        self.finish.set()
+
+    def wait(self):
+        self.finish.wait(5)
+        return 0
+
+
+def fake_encoder(spawned, duration=10.0, fail=False):
+    """ffmpeg fals que escriu de cop tots els segments que li toquen"""
+    def spawn(cmd, log_path):
+        spawned.append(cmd)
+        if fail:
+            log_path.write_bytes(b"Unsupported codec")
+            return FakeProcess(1)
+        first = int(cmd[cmd.index("-start_number") + 1])
+        length = float(cmd[cmd.index("-t") + 1]) if "-t" in cmd else duration - first * 30
+        pattern = cmd[cmd.index("-hls_segment_filename") + 1]
+        if "-hls_segment_type" in cmd:
+            (Path(cmd[-1]).parent / "init.mp4").write_bytes(b"moov")
+        for n in range(first, first + max(1, int(-(-length // 30)))):
+            Path(pattern % n).write_bytes(b"TS%d" % n)
+        return FakeProcess(0)
+    return spawn
+
+
+class TestPayload:
+    """Tests dels bytes d'àudio de cada fitxer"""
+
+    @pytest.mark.unit
+    def test_tags_and_xing_skipped(self, tmp_path):
+        path = make_mp3(tmp_path / "a.mp3", b"\x01" * 50)
+        start, end = audio_payload(path, "mp3")
+        with open(path, "rb") as f:
+            data = f.read()
+        assert data[start:end] == b"\x01" * 50
+
+    @pytest.mark.unit
+    def test_plain_file(self, tmp_path):
+        path = tmp_path / "a.aac"
+        path.write_bytes(b"\x02" * 300)
+        assert audio_payload(str(path), "aac") == (0, 300)
+
+
+class TestTimeline:
+    """Tests de la línia de temps i el stream concatenat"""
+
+    @pytest.mark.integration
+    def test_concat_across_files(self, tmp_path, book, probes):
+        streams = make_streams(tmp_path)
+        timeline = streams.timeline(1)
+        assert timeline["mode"] == "concat"
+        assert timeline["duration"] == 30.0
+        assert timeline["size"] == 600
+        assert [f["start"] for f in timeline["files"]] == [0.0, 10.0, 20.0]
+
+        data = b"".join(iter_concat(timeline, 0, timeline["size"] - 1))
+        assert data == b"\x01" * 100 + b"\x02" * 200 + b"\x03" * 300
+        # Un rang que travessa dos fitxers
+        assert b"".join(iter_concat(timeline, 90, 109)) == b"\x01" * 10 + b"\x02" * 10
+
+    @pytest.mark.integration
+    def test_cached_until_files_change(self, tmp_path, book, probes):
+        streams = make_streams(tmp_path)
+        streams.timeline(1)
+        streams.timeline(1)
+        assert streams.built == 1
+        make_mp3(Path(book[1]), b"\x02" * 250)
+        assert streams.timeline(1)["size"] == 650
+        assert streams.built == 2
+
+    @pytest.mark.integration
+    def test_mixed_parameters_use_hls(self, tmp_path, book, probes):
+        probes["2.mp3"] = {"channels": 1}
+        assert make_streams(tmp_path).timeline(1)["mode"] == "hls"
+
+    @pytest.mark.unit
+    def test_locate(self, tmp_path, book, probes):
+        timeline = make_streams(tmp_path).timeline(1)
+        entry, offset = locate(timeline, 25.5)
+        assert entry["file_id"] == 13 and offset == pytest.approx(5.5)
+        entry, offset = locate(timeline, 99)
+        assert entry["file_id"] == 13 and offset == 10.0
+
+
+class TestChapters:
+    """Tests del mapa de capítols"""
+
+    @pytest.mark.integration
+    def test_file_boundaries_and_embedded(self, tmp_path, book, probes):
+        # El segon fitxer és un m4b amb capítols propis
+        conn = sqlite3.connect(tmp_path / "test.db")
+        conn.execute("UPDATE audiobook_files SET format = 'm4b' WHERE id = 12")
+        conn.commit()
+        conn.close()
+        probes["2.mp3"] = {"duration": 20.0, "chapters": [
+            {"start_time": "0.0", "end_time": "5.0", "tags": {"title": "Pròleg"}},
+            {"start_time": "5.0", "end_time": "20.0", "tags": {}},
+        ]}
+        chapters = make_streams(tmp_path).timeline(1)["chapters"]
+        assert [(c["title"], c["start"], c["end"]) for c in chapters] == [
+            ("Capítol 1", 0.0, 10.0),
+            ("Pròleg", 10.0, 15.0),
+            ("Capítol 2", 15.0, 30.0),
+            ("Capítol 3", 30.0, 40.0),
+        ]
+        assert chapters[2]["file_id"] == 12 and chapters[2]["file_offset"] == 5.0
+        assert [c["index"] for c in chapters] == [0, 1, 2, 3]
+
+
+class TestHls:
+    """Tests de la playlist HLS i els segments"""
+
+    @pytest.mark.integration
+    def test_playlist(self, tmp_path, book, probes):
+        probes["3.mp3"] = {"duration": 45.0}
+        playlist = hls_playlist(make_streams(tmp_path).timeline(1), "/hls")
+        assert playlist.count("#EXT-X-DISCONTINUITY") == 2
+        assert "/hls/source/13/1.ts" in playlist and "/hls/source/13/2.ts" not in playlist
+        assert "#EXTINF:15.000," in playlist
+        assert playlist.rstrip().endswith("#EXT-X-ENDLIST")
+
+    @pytest.mark.integration
+    def test_segment_made_once(self, tmp_path, book, probes):
+        calls = []
+
+        def runner(cmd):
+            calls.append(cmd)
+            with open(cmd[-1], "wb") as f:
+                f.write(b"TS")
+            return True, ""
+
+        streams = make_streams(tmp_path, runner)
+        first = streams.segment_file(1, 12, 0)
+        assert streams.segment_file(1, 12, 0) == first
+        assert len(calls) == 1
+        # Còpia de l'àudio i marques de temps del llibre
+        assert calls[0][calls[0].index("-c:a") + 1] == "copy"
+        assert calls[0][calls[0].index("-output_ts_offset") + 1] == "10.000"
+        with pytest.raises(AudiobookStreamError):
+            streams.segment_file(1, 12, 1)
+
+    @pytest.mark.integration
+    def test_failed_segment(self, tmp_path, book, probes):
+        streams = make_streams(tmp_path, lambda cmd: (False, "error"))
+        with pytest.raises(AudiobookStreamError):
+            streams.segment_file(1, 11, 0)
+        assert not list((tmp_path / "hls").rglob("*.part"))
+
+    @pytest.mark.integration
+    def test_reencoded_continuously(self, tmp_path, book, probes):
+        """Un fitxer que s'ha de recodificar surt d'un sol ffmpeg, no d'un per segment"""
+        probes["3.mp3"] = {"codec": "flac", "duration": 75.0}
+        spawned = []
+        streams = make_streams(tmp_path, spawn=fake_encoder(spawned, duration=75.0))
+
+        first = streams.segment_file(1, 13, 0)
+        assert first.read_bytes() == b"TS0"
+        assert streams.segment_file(1, 13, 2).read_bytes() == b"TS2"
+        assert len(spawned) == 1
+        cmd = spawned[0]
+        assert "-ss" not in cmd and "-t" not in cmd
+        assert cmd[cmd.index("-c:a") + 1] == "aac" and cmd[cmd.index("-f") + 1] == "hls"
+        assert cmd[cmd.index("-output_ts_offset") + 1] == "20.000"
+
+        # Un forat es torna a codificar només fins al següent segment que ja hi és
+        first.unlink()
+        streams.segment_file(1, 13, 0)
+        assert len(spawned) == 2
+        assert spawned[1][spawned[1].index("-t") + 1] == "30"
+
+    @pytest.mark.integration
+    def test_encode_holds_budget_slot(self, tmp_path, book, probes):
+        """Una codificació contínua ocupa una plaça d'ffmpeg fins que acaba"""
+        probes["3.mp3"] = {"codec": "flac"}
+        budget = FfmpegBudget(1)
+        finish = threading.Event()
+
+        def spawn(cmd, log_path):
+            fake_encoder([])(cmd, log_path)
+            return SlowProcess(finish)
+
+        streams = make_streams(tmp_path, spawn=spawn, budget=budget)
+        streams.segment_file(1, 13, 0)
+        assert budget.interactive == 1 and not budget.acquire(timeout=0)
+        finish.set()
+        assert budget.acquire(timeout=2)
+        budget.release()
+
+    @pytest.mark.integration
+    def test_failed_encode(self, tmp_path, book, probes):
+        probes["3.mp3"] = {"codec": "flac"}
+        streams = make_streams(tmp_path, spawn=fake_encoder([], fail=True))
+        with pytest.raises(AudiobookStreamError, match="codec"):
+            streams.segment_file(1, 13, 0)
+        streams.close()
+        assert not list((tmp_path / "hls").rglob(".encode-*"))
+
+    @pytest.mark.integration
+    def test_segments_reuse_timeline(self, tmp_path, book, probes, monkeypatch):
+        """Els segments no tornen a llegir la BD ni els fitxers a cada petició"""
+        def runner(cmd):
+            Path(cmd[-1]).write_bytes(b"TS")
+            return True, ""
+
+        streams = make_streams(tmp_path, runner)
+        connects = []
+        connect = streams._connect
+        monkeypatch.setattr(streams, "_connect", lambda: connects.append(1) or connect())
+        streams.timeline(1)
+        for n in range(2):
+            streams.segment_file(1, 11, 0)
+        assert len(connects) == 1
+        streams.invalidate(1)
+        streams.segment_file(1, 11, 0)
+        assert len(connects) == 2
+
+
+@pytest.fixture
+def opus(monkeypatch):
+    """ffmpeg amb libopus"""
+    monkeypatch.setattr(streaming, "encoder_available", lambda name: True)
+
+
+class TestProfiles:
+    """Tests dels perfils de poc ample de banda"""
+
+    @pytest.mark.unit
+    def test_negotiation(self, opus):
+        assert negotiate_profile() == "source"
+        assert negotiate_profile(bandwidth_kbps=5000) == "source"
+        assert negotiate_profile(bandwidth_kbps=150) == "opus-48"
+        assert negotiate_profile(bandwidth_kbps=50) == "opus-32"
+        assert negotiate_profile(save_data=True) == "opus-32"
+        # Client sense Opus
+        assert negotiate_profile(codecs=["aac", "mp3"], bandwidth_kbps=50) == "aac-64"
+        assert negotiate_profile("aac-64") == "aac-64"
+        assert negotiate_profile("inexistent") == "source"
+
+    @pytest.mark.unit
+    def test_without_libopus(self, monkeypatch):
+        monkeypatch.setattr(streaming, "encoder_available", lambda name: False)
+        assert negotiate_profile(save_data=True) == "aac-64"
+        assert negotiate_profile("opus-32", bandwidth_kbps=50) == "aac-64"
+
+    @pytest.mark.integration
+    def test_master_playlist(self, tmp_path, book, probes, opus):
+        master = hls_master_playlist(make_streams(tmp_path).timeline(1), "/hls")
+        variants = [line.split("/")[2] for line in master.splitlines() if line.startswith("/hls/")]
+        # Ordenades per ample de banda (els MP3 de prova en tenen molt poc)
+        assert variants == ["aac-64", "opus-48", "opus-32", "source"]
+        assert 'CODECS="mp4a.40.34"' in master and 'CODECS="opus"' in master
+
+    @pytest.mark.integration
+    def test_opus_playlist_has_init(self, tmp_path, book, probes):
+        playlist = hls_playlist(make_streams(tmp_path).timeline(1), "/hls", "opus-32")
+        assert '#EXT-X-MAP:URI="/hls/opus-32/11/init.mp4"' in playlist
+        assert "/hls/opus-32/11/0.m4s" in playlist
+
+    @pytest.mark.integration
+    def test_opus_segments(self, tmp_path, book, probes):
+        """Opus en fMP4: segments i capçalera d'una sola codificació, separats per perfil"""
+        probes["1.mp3"] = {"duration": 45.0}
+        spawned = []
+        streams = make_streams(tmp_path, spawn=fake_encoder(spawned, duration=45.0))
+        segment = streams.segment_file(1, 11, 0, "opus-32")
+        assert segment.read_bytes() == b"TS0" and segment.parent.name == "opus-32"
+        assert streams.init_file(1, 11, "opus-32").read_bytes() == b"moov"
+        assert streams.segment_file(1, 11, 1, "opus-32").read_bytes() == b"TS1"
+        assert len(spawned) == 1
+        cmd = spawned[0]
+        assert cmd[cmd.index("-c:a") + 1] == "libopus"
+        assert cmd[cmd.index("-b:a") + 1] == "32k" and cmd[cmd.index("-ac") + 1] == "1"
+        assert cmd[cmd.index("-hls_segment_type") + 1] == "fmp4"
+        streams.close()
+        assert not list(segment.parent.glob(".encode-*"))
+        with pytest.raises(AudiobookStreamError):
+            streams.init_file(1, 11, "source")
+
+    @pytest.mark.integration
+    def test_opus_init_first(self, tmp_path, book, probes):
+        """La capçalera es pot demanar abans que cap segment"""
+        spawned = []
+        streams = make_streams(tmp_path, spawn=fake_encoder(spawned))
+        assert streams.init_file(1, 12, "opus-48").read_bytes() == b"moov"
+        assert streams.segment_file(1, 12, 0, "opus-48").exists()
+        assert len(spawned) == 1
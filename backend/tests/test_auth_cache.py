@@ -0,0 +1,172 @@
+"""
+Tests per al cache de sessions i el hashing de contrasenyes fora del bucle
+"""
+import asyncio
+import threading
+
+import pytest
+
+from backend import auth as auth_module
+from backend.auth import AuthManager, TokenCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def auth(tmp_path, monkeypatch):
+    """AuthManager sobre una BD temporal amb un usuari normal"""
+    monkeypatch.setattr(auth_module.settings, "DATABASE_PATH", str(tmp_path / "auth.db"))
+    manager = AuthManager()
+    result = manager.register("anna", "secret1")
+    assert result["status"] == "success"
+    return manager, result["user"]["id"], result["token"]
+
+
+class TestTokenCache:
+    """Tests del cache de tokens i usuaris"""
+
+    @pytest.mark.unit
+    def test_token_expiry(self):
+        """Un token caducat deixa de ser al cache"""
+        clock = FakeClock()
+        cache = TokenCache(clock=clock)
+        cache.set_token("t", 1, exp_ts=clock.now + 10)
+        assert cache.get_token("t") == 1
+        clock.now += 11
+        assert cache.get_token("t") is None
+        assert cache.stats["tokens"] == 0
+
+    @pytest.mark.unit
+    def test_user_ttl(self):
+        """Les dades d'usuari es tornen a llegir passat el TTL"""
+        clock = FakeClock()
+        cache = TokenCache(user_ttl=60, clock=clock)
+        cache.set_user(1, {"id": 1, "is_admin": False})
+        assert cache.get_user(1) == {"id": 1, "is_admin": False}
+        clock.now += 60
+        assert cache.get_user(1) is None
+
+    @pytest.mark.unit
+    def test_returns_copies(self):
+        """Modificar el resultat no altera el cache"""
+        cache = TokenCache()
+        cache.set_user(1, {"id": 1, "is_admin": False})
+        cache.get_user(1)["is_admin"] = True
+        assert cache.get_user(1)["is_admin"] is False
+
+    @pytest.mark.unit
+    def test_bounded(self):
+        cache = TokenCache(max_tokens=2)
+        for i in range(3):
+            cache.set_token(f"t{i}", i, None)
+        assert cache.get_token("t0") is None
+        assert cache.get_token("t2") == 2
+
+    @pytest.mark.unit
+    def test_invalidate_user_tokens(self):
+        cache = TokenCache()
+        cache.set_token("a", 1, None)
+        cache.set_token("b", 2, None)
+        cache.set_user(1, {"id": 1})
+        cache.invalidate_user(1)
+        assert cache.get_user(1) is None and cache.get_token("a") == 1
+        cache.invalidate_user(1, drop_tokens=True)
+        assert cache.get_token("a") is None and cache.get_token("b") == 2
+
+
+class TestAuthManagerCache:
+    """Tests de la invalidació des de l'AuthManager"""
+
+    @pytest.mark.unit
+    def test_verify_uses_cache(self, auth, monkeypatch):
+        """La segona verificació no torna a decodificar ni obrir la BD"""
+        manager, user_id, token = auth
+        assert manager.verify_token(token)["id"] == user_id
+
+        monkeypatch.setattr(manager.jwt, "decode", lambda t: pytest.fail("decode"))
+        monkeypatch.setattr(auth_module.sqlite3, "connect", lambda *a, **k: pytest.fail("connect"))
+        assert manager.verify_token(token)["username"] == "anna"
+
+    @pytest.mark.unit
+    def test_role_change_invalidates(self, auth):
+        """Promoure a admin o premium es veu a la petició següent"""
+        manager, user_id, token = auth
+        assert manager.verify_token(token)["is_admin"] is False
+        manager.toggle_admin(user_id, True)
+        assert manager.verify_token(token)["is_admin"] is True
+        manager.toggle_premium(user_id, True)
+        assert manager.verify_token(token)["is_premium"] is True
+
+    @pytest.mark.unit
+    def test_password_change_invalidates(self, auth):
+        """Canviar la contrasenya descarta les dades en cache de l'usuari"""
+        manager, user_id, token = auth
+        manager.verify_token(token)
+        assert manager.token_cache.stats["users"] == 1
+        assert manager.change_password(user_id, "secret1", "secret2")["status"] == "success"
+        assert manager.token_cache.stats["users"] == 0
+        assert manager.login("anna", "secret2")["status"] == "success"
+
+    @pytest.mark.unit
+    def test_deleted_user_rejected(self, auth):
+        """Un usuari eliminat perd els tokens en cache"""
+        manager, user_id, token = auth
+        conn = auth_module.sqlite3.connect(manager.db_path)
+        for table in ("watch_progress", "book_progress", "audiobook_progress"):
+            conn.execute(f"CREATE TABLE {table} (user_id INTEGER)")
+        conn.commit()
+        conn.close()
+
+        manager.verify_token(token)
+        assert manager.delete_user(user_id, requesting_user_id=0)["status"] == "success"
+        assert manager.token_cache.stats["tokens"] == 0
+        assert manager.verify_token(token) is None
+
+
+class TestPasswordHashing:
+    """Tests del hashing fora del bucle d'esdeveniments"""
+
+    @pytest.mark.unit
+    def test_login_runs_in_pool(self, auth, monkeypatch):
+        """El PBKDF2 s'executa als fils d'autenticació, no al del bucle"""
+        manager, _, _ = auth
+        threads = []
+        verify = manager._verify_password
+
+        def recording(password, password_hash):
+            threads.append(threading.current_thread().name)
+            return verify(password, password_hash)
+
+        monkeypatch.setattr(manager, "_verify_password", recording)
+        result = asyncio.run(manager.login_async("anna", "secret1"))
+        assert result["status"] == "success"
+        assert threads and threads[0].startswith("hermes-auth")
+
+    @pytest.mark.unit
+    def test_loop_stays_responsive(self, auth, monkeypatch):
+        """Mentre es calcula un hash el bucle continua atenent altres tasques"""
+        manager, _, _ = auth
+        release = threading.Event()
+        verify = manager._verify_password
+
+        def slow(password, password_hash):
+            release.wait(5)
+            return verify(password, password_hash)
+
+        monkeypatch.setattr(manager, "_verify_password", slow)
+
+        async def scenario():
+            login = asyncio.create_task(manager.login_async("anna", "secret1"))
+            await asyncio.sleep(0.05)
+            # El bucle no està bloquejat: aquesta tasca s'executa abans que acabi el hash
+            assert not login.done()
+            release.set()
+            return await login
+
+        assert asyncio.run(scenario())["status"] == "success"
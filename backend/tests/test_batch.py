@@ -0,0 +1,114 @@
+"""
+Tests per al batch de peticions
+"""
+import sqlite3
+
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from backend.services import batch
+from backend.services.batch import run_batch
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """App mínima amb rutes JSON, de text, grans i que escriuen a la BD"""
+    db_path = tmp_path / "batch.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE hits (path TEXT)")
+    conn.commit()
+    conn.close()
+
+    app = FastAPI()
+    streamed = []
+
+    def connect():
+        conn = sqlite3.connect(db_path, isolation_level=None, timeout=1)
+        conn.execute("PRAGMA busy_timeout=1000")
+        return conn
+
+    @app.get("/api/items/{item_id}")
+    async def item(item_id: int, request: Request):
+        conn = connect()
+        conn.execute("INSERT INTO hits VALUES (?)", (request.url.path,))
+        conn.close()
+        return {"id": item_id, "user": request.scope.get("hermes_user")}
+
+    @app.get("/api/missing")
+    async def missing():
+        raise HTTPException(status_code=404, detail="No trobat")
+
+    @app.get("/api/text")
+    async def text():
+        return PlainTextResponse("hola")
+
+    @app.get("/api/video")
+    async def video():
+        async def chunks():
+            for _ in range(100):
+                streamed.append(1)
+                yield b"x" * 65536
+        return StreamingResponse(chunks(), media_type="video/mp4")
+
+    @app.get("/api/big")
+    async def big():
+        return {"data": "x" * 4096}
+
+    @app.post("/api/batch")
+    async def run(request: Request):
+        data = await request.json()
+        return {"responses": await run_batch(request, data["requests"], {"id": 7})}
+
+    monkeypatch.setattr(batch, "MAX_BATCH_RESPONSE_BYTES", 1024)
+    test_client = TestClient(app)
+    test_client.db_path = db_path
+    test_client.streamed = streamed
+    return test_client
+
+
+def post(client, paths):
+    response = client.post("/api/batch", json={"requests": paths})
+    assert response.status_code == 200
+    return response.json()["responses"]
+
+
+class TestBatch:
+    """Tests de l'execució de subpeticions"""
+
+    @pytest.mark.integration
+    def test_json_responses_in_order(self, client):
+        """Cada subpetició retorna el seu estat i cos, en l'ordre demanat"""
+        responses = post(client, ["/api/items/1?x=1", "/api/missing", "/api/items/2"])
+        assert [r["status"] for r in responses] == [200, 404, 200]
+        assert responses[0]["body"] == {"id": 1, "user": {"id": 7}}
+        assert responses[1]["body"] == {"detail": "No trobat"}
+        assert responses[2]["body"]["id"] == 2
+
+    @pytest.mark.integration
+    def test_concurrent_writes(self, client):
+        """Les subpeticions que escriuen no es bloquegen entre elles"""
+        responses = post(client, [f"/api/items/{i}" for i in range(10)])
+        assert all(r["status"] == 200 for r in responses)
+        conn = sqlite3.connect(client.db_path)
+        assert conn.execute("SELECT COUNT(*) FROM hits").fetchone()[0] == 10
+        conn.close()
+
+    @pytest.mark.integration
+    def test_non_json_not_buffered(self, client):
+        """Una resposta que no és JSON s'atura a la capçalera"""
+        responses = post(client, ["/api/video", "/api/text"])
+        assert [r["status"] for r in responses] == [415, 415]
+        assert len(client.streamed) <= 1
+
+    @pytest.mark.integration
+    def test_size_cap(self, client):
+        assert post(client, ["/api/big"])[0]["status"] == 413
+
+    @pytest.mark.integration
+    def test_rejected_paths(self, client):
+        """Només rutes /api/ i mai un batch dins d'un altre"""
+        responses = post(client, ["/health", "/api/batch"])
+        assert [r["status"] for r in responses] == [400, 400]
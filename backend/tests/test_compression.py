@@ -0,0 +1,80 @@
+"""
+Tests per a la política de compressió de respostes
+"""
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, Response
+from fastapi.testclient import TestClient
+
+from backend.services.compression import CompressionMiddleware, is_compressible, negotiate_encoding
+
+
+@pytest.fixture
+def client():
+    """App mínima amb respostes de text i de vídeo"""
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+    @app.get("/vtt")
+    async def vtt():
+        return PlainTextResponse("WEBVTT\n\n" + "hola\n" * 200, media_type="text/vtt")
+
+    @app.get("/video")
+    async def video():
+        return Response(b"\x00" * 5000, media_type="video/mp4")
+
+    @app.get("/partial")
+    async def partial():
+        return Response("a" * 5000, status_code=206, media_type="text/plain",
+                        headers={"Content-Range": "bytes 0-4999/10000"})
+
+    return TestClient(app)
+
+
+class TestNegotiation:
+    """Tests de la negociació d'Accept-Encoding"""
+
+    @pytest.mark.unit
+    def test_server_preference_on_tie(self):
+        """A igual q guanya la preferència del servidor"""
+        assert negotiate_encoding("gzip, br, zstd", ["zstd", "br", "gzip"]) == "zstd"
+
+    @pytest.mark.unit
+    def test_q_values(self):
+        """Es respecten els valors q i q=0 exclou"""
+        assert negotiate_encoding("br;q=0.5, gzip", ["br", "gzip"]) == "gzip"
+        assert negotiate_encoding("gzip;q=0", ["gzip"]) is None
+        assert negotiate_encoding("", ["gzip"]) is None
+
+    @pytest.mark.unit
+    def test_content_types(self):
+        """Només es comprimeix text"""
+        assert is_compressible("application/json")
+        assert is_compressible("text/vtt; charset=utf-8")
+        assert not is_compressible("video/mp2t")
+        assert not is_compressible("image/jpeg")
+        assert not is_compressible("text/event-stream")
+
+
+class TestMiddleware:
+    """Tests del middleware de compressió"""
+
+    @pytest.mark.integration
+    def test_compresses_text(self, client):
+        """Els subtítols es comprimeixen amb gzip"""
+        response = client.get("/vtt", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert response.text.startswith("WEBVTT")
+
+    @pytest.mark.integration
+    def test_skips_media_and_ranges(self, client):
+        """Vídeo i respostes parcials passen sense tocar"""
+        video = client.get("/video", headers={"Accept-Encoding": "gzip"})
+        partial = client.get("/partial", headers={"Accept-Encoding": "gzip"})
+        ranged = client.get("/vtt", headers={"Accept-Encoding": "gzip", "Range": "bytes=0-10"})
+
+        assert "content-encoding" not in video.headers
+        assert video.headers["content-length"] == "5000"
+        assert "content-encoding" not in partial.headers
+        assert "content-encoding" not in ranged.headers
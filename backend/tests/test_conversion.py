@@ -0,0 +1,145 @@
+"""
+Tests per a la cua de conversions de llibres
+"""
+import os
+import sqlite3
+import threading
+
+import pytest
+
+from backend.books import conversion
+from backend.books.conversion import BookConverter, PRIORITY_USER, needs_conversion
+
+
+class FakeRunner:
+    """ebook-convert fals: apunta les conversions i pot fallar o bloquejar-se"""
+
+    def __init__(self, fail=False, gate=None):
+        self.calls = []
+        self.fail = fail
+        self.gate = gate
+
+    def __call__(self, source, output):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.calls.append(os.path.basename(source))
+        if self.fail:
+            return False, "format desconegut"
+        with open(output, "wb") as f:
+            f.write(b"EPUB de " + os.path.basename(source).encode())
+        return True, ""
+
+
+@pytest.fixture
+def library(tmp_path):
+    root = tmp_path / "llibres"
+    root.mkdir()
+    paths = []
+    for name in ("a.mobi", "b.azw3", "c.mobi"):
+        path = root / name
+        path.write_bytes(name.encode() * 100)
+        paths.append(str(path))
+    conn = sqlite3.connect(tmp_path / "test.db")
+    conn.execute("CREATE TABLE books (id INTEGER PRIMARY KEY, file_path TEXT, converted_path TEXT)")
+    conn.executemany("INSERT INTO books (id, file_path) VALUES (?, ?)", list(enumerate(paths, 1)))
+    conn.commit()
+    conn.close()
+    return paths
+
+
+def make_converter(tmp_path, runner, workers=1):
+    return BookConverter(db_path=tmp_path / "test.db", output_root=tmp_path / "converted",
+                         workers=workers, runner=runner, available=True)
+
+
+class TestQueue:
+    """Tests de la cua de conversions"""
+
+    @pytest.mark.unit
+    def test_formats(self):
+        assert needs_conversion("MOBI") and needs_conversion("azw3")
+        assert not needs_conversion("epub") and not needs_conversion(None)
+
+    @pytest.mark.integration
+    def test_converts_in_background(self, tmp_path, library):
+        """Els llibres encuats es converteixen i el llibre apunta a l'EPUB"""
+        runner = FakeRunner()
+        converter = make_converter(tmp_path, runner, workers=2)
+        assert converter.enqueue([(path, i) for i, path in enumerate(library, 1)]) == 3
+        converter.wait(5)
+
+        assert sorted(runner.calls) == ["a.mobi", "b.azw3", "c.mobi"]
+        assert converter.stats()["done"] == 3
+        conn = sqlite3.connect(tmp_path / "test.db")
+        converted = dict(conn.execute("SELECT file_path, converted_path FROM books").fetchall())
+        conn.close()
+        assert all(p and p.endswith(".epub") and os.path.exists(p) for p in converted.values())
+
+        # Tornar a escanejar sense canvis no torna a encuar
+        assert converter.enqueue([(path, None) for path in library]) == 0
+
+    @pytest.mark.integration
+    def test_output_keyed_by_hash(self, tmp_path, library):
+        """Un fitxer amb el mateix contingut reutilitza la conversió"""
+        copy = os.path.join(os.path.dirname(library[0]), "copia.mobi")
+        with open(library[0], "rb") as src, open(copy, "wb") as dst:
+            dst.write(src.read())
+        runner = FakeRunner()
+        converter = make_converter(tmp_path, runner)
+        converter.enqueue([(library[0], 1)])
+        converter.wait(5)
+        converter.enqueue([(copy, None)])
+        converter.wait(5)
+
+        assert runner.calls == ["a.mobi"]
+        assert converter.status(copy)["output_path"] == converter.status(library[0])["output_path"]
+
+    @pytest.mark.integration
+    def test_changed_file_requeued(self, tmp_path, library):
+        """Si el fitxer canvia torna a la cua"""
+        converter = make_converter(tmp_path, FakeRunner())
+        converter.enqueue([(library[0], 1)])
+        converter.wait(5)
+        with open(library[0], "ab") as f:
+            f.write(b"nou capitol")
+        assert converter.enqueue([(library[0], 1)]) == 1
+
+    @pytest.mark.integration
+    def test_user_request_jumps_queue(self, tmp_path, library):
+        """Obrir un llibre el passa davant de la resta"""
+        gate = threading.Event()
+        runner = FakeRunner(gate=gate)
+        converter = make_converter(tmp_path, runner)
+        converter.enqueue([(path, i) for i, path in enumerate(library, 1)])
+        status = converter.request(library[2], 3)
+        assert status["priority"] == PRIORITY_USER
+        gate.set()
+        converter.wait(5)
+        # Com a molt, només el que ja estava en curs passa davant
+        assert runner.calls.index("c.mobi") <= 1
+        assert runner.calls[-1] == "b.azw3"
+
+    @pytest.mark.integration
+    def test_failures_tracked(self, tmp_path, library, monkeypatch):
+        """Els errors es guarden i, esgotats els intents, queda com a fallat"""
+        monkeypatch.setattr(conversion, "MAX_ATTEMPTS", 1)
+        converter = make_converter(tmp_path, FakeRunner(fail=True))
+        converter.enqueue([(library[0], 1)])
+        converter.wait(5)
+
+        status = converter.status(library[0])
+        assert status["status"] == "failed"
+        assert status["last_error"] == "format desconegut"
+        assert converter.failures()[0]["source_path"] == library[0]
+
+        # Obrir-lo el torna a intentar
+        assert converter.request(library[0], 1)["status"] in ("pending", "running", "failed")
+
+    @pytest.mark.integration
+    def test_without_ebook_convert(self, tmp_path, library):
+        """Sense ebook-convert s'encua però no s'engega cap fil"""
+        converter = BookConverter(db_path=tmp_path / "test.db", output_root=tmp_path / "converted",
+                                  runner=FakeRunner(), available=False)
+        converter.enqueue([(library[0], 1)])
+        assert converter.stats()["active_workers"] == 0
+        assert converter.status(library[0])["status"] == "pending"
@@ -0,0 +1,69 @@
+"""
+Tests per a la quota dels caches a disc
+"""
+import os
+
+import pytest
+
+from backend.services.disk_quota import DiskQuota
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def write(root, name, size, mtime):
+    path = root / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+class TestDiskQuota:
+    """Tests de l'expulsió LRU"""
+
+    @pytest.mark.unit
+    def test_prunes_least_recently_used(self, tmp_path):
+        """S'esborren els menys usats segons els accessos registrats, no l'atime"""
+        clock = FakeClock()
+        quota = DiskQuota(tmp_path, quota_bytes=350, clock=clock)
+        old = write(tmp_path, "a/old", 100, clock.now - 3000)
+        used = write(tmp_path, "a/used", 100, clock.now - 2000)
+        write(tmp_path, "b/mid", 100, clock.now - 1000)
+        quota.touch(old)
+
+        clock.now += 100
+        new = write(tmp_path, "b/new", 100, clock.now - 100)
+        quota.added(new)
+
+        assert not used.exists()
+        assert old.exists() and new.exists()
+        assert quota.usage() == 300
+
+    @pytest.mark.unit
+    def test_recent_files_kept(self, tmp_path):
+        """Els fitxers acabats d'escriure (potser a mig fer) no s'esborren"""
+        clock = FakeClock()
+        quota = DiskQuota(tmp_path, quota_bytes=150, clock=clock)
+        first = write(tmp_path, "a", 100, clock.now - 10)
+        second = write(tmp_path, "b", 100, clock.now)
+        quota.added(second)
+        assert first.exists() and second.exists()
+
+        clock.now += 120
+        assert quota.prune() == 1
+        assert not first.exists()
+        assert quota.usage() == 100
+
+    @pytest.mark.unit
+    def test_empty_folders_removed(self, tmp_path):
+        clock = FakeClock()
+        quota = DiskQuota(tmp_path, quota_bytes=0, clock=clock)
+        write(tmp_path, "book/00001.jpg", 10, clock.now - 600)
+        quota.prune()
+        assert not (tmp_path / "book").exists()
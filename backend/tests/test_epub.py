@@ -0,0 +1,238 @@
+"""
+Tests per al servei d'EPUB
+"""
+import os
+import zipfile
+
+import pytest
+
+from backend.books.epub import EpubCache, EpubError, ZipPool, parse_epub
+
+CONTAINER = """<?xml version="1.0"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>
+</container>"""
+
+OPF = """<?xml version="1.0"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:title>Tirant lo Blanc</dc:title>
+    <dc:creator>Joanot Martorell</dc:creator>
+    <dc:language>ca</dc:language>
+  </metadata>
+  <manifest>
+    <item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>
+    <item id="ncx" href="toc.ncx" media-type="application/x-dtbncx+xml"/>
+    <item id="c1" href="Text/cap%201.xhtml" media-type="application/xhtml+xml"/>
+    <item id="c2" href="Text/cap2.xhtml" media-type="application/xhtml+xml"/>
+    <item id="img" href="Images/escut.png" media-type="image/png"/>
+  </manifest>
+  <spine toc="ncx">
+    <itemref idref="c1"/>
+    <itemref idref="c2"/>
+  </spine>
+</package>"""
+
+NAV = """<?xml version="1.0"?>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">
+<body><nav epub:type="toc"><ol>
+  <li><a href="Text/cap%201.xhtml">Primera part</a>
+    <ol><li><a href="Text/cap%201.xhtml#s2">Secció 2</a></li></ol>
+  </li>
+  <li><a href="Text/cap2.xhtml">Segona part</a></li>
+</ol></nav></body></html>"""
+
+NCX = """<?xml version="1.0"?>
+<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">
+  <navMap>
+    <navPoint id="p1"><navLabel><text>Capítol u</text></navLabel><content src="Text/cap%201.xhtml"/></navPoint>
+  </navMap>
+</ncx>"""
+
+
+CHAPTER = """<?xml version="1.0" encoding="utf-8"?>
+<html xmlns="http://www.w3.org/1999/xhtml">
+<head>
+  <title>U</title>
+  <link rel="stylesheet" type="text/css" href="../Styles/estil.css"/>
+  <style>p { margin: 0; }</style>
+  <script>alert(1)</script>
+</head>
+<body onload="alert(2)">
+  <h1 id="s1">Primera part</h1>
+  <p>Aquí comença el llibre.</p>
+  <img src="../Images/escut.png" alt="escut" onerror="alert(3)"/>
+  <a href="cap2.xhtml#final">Següent</a>
+  <a href="https://example.com">Web</a>
+  <a href="javascript:alert(4)">Mal</a>
+  <iframe src="https://example.com"></iframe>
+</body>
+</html>"""
+
+
+def make_epub(path, with_nav=True):
+    opf = OPF if with_nav else OPF.replace('properties="nav"', "")
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("mimetype", "application/epub+zip")
+        zf.writestr("META-INF/container.xml", CONTAINER)
+        zf.writestr("OEBPS/content.opf", opf)
+        zf.writestr("OEBPS/nav.xhtml", NAV)
+        zf.writestr("OEBPS/toc.ncx", NCX)
+        zf.writestr("OEBPS/Text/cap 1.xhtml", CHAPTER)
+        zf.writestr("OEBPS/Text/cap2.xhtml", "<html><body><p>Dos</p></body></html>")
+        zf.writestr("OEBPS/Styles/estil.css", "body { color: black; }")
+        zf.writestr("OEBPS/Images/escut.png", b"\x89PNG" + b"0" * 200_000)
+    return path
+
+
+@pytest.fixture
+def epub_path(tmp_path):
+    return make_epub(tmp_path / "llibre.epub")
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return EpubCache(pool=ZipPool(max_open=2), cache_dir_for=lambda path: tmp_path / "cache")
+
+
+class TestParse:
+    """Tests del parseig del manifest"""
+
+    @pytest.mark.unit
+    def test_manifest(self, epub_path):
+        """Spine, metadades i TOC EPUB3 amb camins complets dins del zip"""
+        with zipfile.ZipFile(epub_path) as zf:
+            manifest = parse_epub(zf)
+        assert manifest["title"] == "Tirant lo Blanc"
+        assert manifest["author"] == "Joanot Martorell"
+        assert [s["href"] for s in manifest["spine"]] == ["OEBPS/Text/cap 1.xhtml", "OEBPS/Text/cap2.xhtml"]
+        assert manifest["toc"][0]["title"] == "Primera part"
+        assert manifest["toc"][0]["children"][0]["href"] == "OEBPS/Text/cap 1.xhtml#s2"
+        assert manifest["resources"]["OEBPS/Images/escut.png"]["media_type"] == "image/png"
+
+    @pytest.mark.unit
+    def test_ncx_fallback(self, tmp_path):
+        """Sense document nav es fa servir el NCX"""
+        path = make_epub(tmp_path / "epub2.epub", with_nav=False)
+        with zipfile.ZipFile(path) as zf:
+            manifest = parse_epub(zf)
+        assert manifest["toc"] == [{"title": "Capítol u", "href": "OEBPS/Text/cap 1.xhtml"}]
+
+    @pytest.mark.unit
+    def test_invalid(self, tmp_path):
+        """Un zip sense container no és un EPUB"""
+        path = tmp_path / "buit.epub"
+        with zipfile.ZipFile(path, "w") as zf:
+            zf.writestr("hola.txt", "hola")
+        with zipfile.ZipFile(path) as zf, pytest.raises(EpubError):
+            parse_epub(zf)
+
+
+class TestCache:
+    """Tests del cache de manifests i dels handles"""
+
+    @pytest.mark.unit
+    def test_parsed_once(self, cache, epub_path, tmp_path):
+        """El manifest es parseja una vegada i es recupera del disc"""
+        cache.get(epub_path)
+        cache.get(epub_path)
+        assert cache.parsed == 1
+        assert (tmp_path / "cache" / "manifest.json").exists()
+
+        fresh = EpubCache(pool=cache.pool, cache_dir_for=lambda path: tmp_path / "cache")
+        assert fresh.get(epub_path).spine[1]["href"] == "OEBPS/Text/cap2.xhtml"
+        assert fresh.parsed == 0
+
+    @pytest.mark.unit
+    def test_invalidated_on_change(self, cache, epub_path):
+        """Si el fitxer canvia es torna a parsejar"""
+        cache.get(epub_path)
+        stat = os.stat(epub_path)
+        os.utime(epub_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        cache.get(epub_path)
+        assert cache.parsed == 2
+
+    @pytest.mark.unit
+    def test_resource_lookup(self, cache, epub_path):
+        """Cerca exacta, relativa a l'OPF i per final de camí"""
+        book = cache.get(epub_path)
+        assert book.find("OEBPS/Images/escut.png") == "OEBPS/Images/escut.png"
+        assert book.find("Images/escut.png") == "OEBPS/Images/escut.png"
+        assert book.find("../Images/escut.png") == "OEBPS/Images/escut.png"
+        assert book.find("Text/cap%201.xhtml") == "OEBPS/Text/cap 1.xhtml"
+        assert book.find("no/existeix.png") is None
+
+    @pytest.mark.unit
+    def test_reuses_zip_handles(self, cache, epub_path):
+        """Molts recursos del mateix llibre obren el zip una sola vegada"""
+        book = cache.get(epub_path)
+        for _ in range(30):
+            book.read("OEBPS/Text/cap2.xhtml")
+        chunks = list(book.iter_resource("OEBPS/Images/escut.png", chunk_size=65536))
+        assert len(chunks) == 4
+        assert sum(map(len, chunks)) == book.resources["OEBPS/Images/escut.png"]["size"]
+        assert cache.pool.opened == 1
+
+    @pytest.mark.unit
+    def test_pool_eviction(self, tmp_path):
+        """L'LRU tanca els handles antics però no els que estan en ús"""
+        pool = ZipPool(max_open=1)
+        first = make_epub(tmp_path / "a.epub")
+        second = make_epub(tmp_path / "b.epub")
+        with pool.open(first) as zf_a:
+            with pool.open(second):
+                pass
+            # Expulsat de l'LRU però encara llegible
+            assert zf_a.read("mimetype") == b"application/epub+zip"
+        assert zf_a.fp is None
+
+
+class TestChapters:
+    """Tests dels capítols processats"""
+
+    @pytest.mark.unit
+    def test_toc(self, cache, epub_path):
+        """El TOC lleuger porta l'índex de capítol i no els recursos"""
+        toc = cache.get(epub_path).toc()
+        assert toc["total"] == 2
+        assert toc["chapters"][0]["chapter"] == 0
+        assert toc["chapters"][0]["children"][0] == {"title": "Secció 2", "chapter": 0, "anchor": "s2"}
+        assert toc["chapters"][1]["chapter"] == 1
+        assert toc["spine"][1]["title"] == "Segona part"
+        assert "resources" not in toc
+
+    @pytest.mark.unit
+    def test_sanitized_and_rewritten(self, cache, epub_path):
+        """Scripts i handlers fora; recursos i enllaços apuntant a l'API"""
+        chapter = cache.get(epub_path).chapter(0, "/api/books/7")
+        html = chapter["html"]
+        assert "<script" not in html and "<iframe" not in html
+        assert "onload" not in html and "onerror" not in html and "javascript:" not in html
+        assert 'src="/api/books/7/resource/OEBPS/Images/escut.png"' in html
+        assert 'data-chapter="1"' in html and 'data-anchor="final"' in html
+        assert 'target="_blank"' in html
+        assert "p { margin: 0; }" in html
+        assert chapter["stylesheets"] == ["/api/books/7/resource/OEBPS/Styles/estil.css"]
+        assert chapter["title"] == "Primera part"
+        assert (chapter["prev"], chapter["next"], chapter["total"]) == (None, 1, 2)
+        assert chapter["words"] > 0
+
+    @pytest.mark.unit
+    def test_cached_on_disk(self, cache, epub_path, tmp_path, monkeypatch):
+        """El capítol es processa una vegada i es descarta si el fitxer canvia"""
+        book = cache.get(epub_path)
+        book.chapter(1, "/api/books/7")
+        assert (tmp_path / "cache" / "chapters" / "1.json").exists()
+
+        monkeypatch.setattr(book, "_render_chapter", lambda *a: pytest.fail("no s'havia de tornar a processar"))
+        assert book.chapter(1, "/api/books/7")["next"] is None
+
+        stat = os.stat(epub_path)
+        os.utime(epub_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        cache.get(epub_path)
+        assert not (tmp_path / "cache" / "chapters").exists()
+
+    @pytest.mark.unit
+    def test_out_of_range(self, cache, epub_path):
+        with pytest.raises(IndexError):
+            cache.get(epub_path).chapter(5, "/api/books/7")
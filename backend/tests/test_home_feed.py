@@ -0,0 +1,121 @@
+"""
+Tests per al feed materialitzat de la pàgina d'inici
+"""
+import sqlite3
+import pytest
+
+from backend.services import home_feed
+
+
+@pytest.fixture
+def feed_db():
+    """BD en memòria amb les taules de progrés i del feed"""
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.executescript("""
+        CREATE TABLE series (id INTEGER PRIMARY KEY, name TEXT, media_type TEXT,
+                             poster TEXT, backdrop TEXT, tmdb_id INTEGER);
+        CREATE TABLE media_files (id INTEGER PRIMARY KEY, series_id INTEGER, title TEXT,
+                                  season_number INTEGER, episode_number INTEGER, duration REAL);
+        CREATE TABLE watch_progress (id INTEGER PRIMARY KEY, user_id INTEGER, media_id INTEGER,
+                                     progress_seconds REAL, total_seconds REAL, updated_date TEXT,
+                                     UNIQUE(user_id, media_id));
+        CREATE TABLE streaming_progress (id INTEGER PRIMARY KEY, user_id INTEGER, tmdb_id INTEGER,
+                                         media_type TEXT, season_number INTEGER, episode_number INTEGER,
+                                         progress_percent REAL, progress_seconds INTEGER,
+                                         total_seconds INTEGER, completed INTEGER DEFAULT 0,
+                                         title TEXT, poster_path TEXT, backdrop_path TEXT,
+                                         still_path TEXT, updated_date TEXT);
+        INSERT INTO series VALUES (1, 'Breaking Bad', 'series', 'p.jpg', 'b.jpg', 1396);
+        INSERT INTO media_files VALUES (10, 1, 'Pilot', 1, 1, 3000);
+    """)
+    home_feed.init_home_feed_tables(conn)
+    home_feed.clear_cache()
+    yield conn
+    conn.close()
+
+
+def _watch(conn, progress, date):
+    conn.execute("""
+        INSERT INTO watch_progress (user_id, media_id, progress_seconds, total_seconds, updated_date)
+        VALUES (1, 10, ?, 3000, ?)
+        ON CONFLICT(user_id, media_id) DO UPDATE SET
+            progress_seconds = excluded.progress_seconds, updated_date = excluded.updated_date
+    """, (progress, date))
+    home_feed.on_watch_progress(conn, 1, 10)
+
+
+class TestHomeFeed:
+    """Tests del feed materialitzat"""
+
+    @pytest.mark.integration
+    def test_rebuild_on_first_read(self, feed_db):
+        """La primera lectura construeix el feed des de les taules de progrés"""
+        feed_db.execute("""
+            INSERT INTO watch_progress (user_id, media_id, progress_seconds, total_seconds, updated_date)
+            VALUES (1, 10, 600, 3000, '2024-01-01 10:00:00')
+        """)
+        items, cursor = home_feed.get_items(feed_db, 1, home_feed.KIND_CONTINUE, 20)
+
+        assert len(items) == 1
+        assert items[0]["series_name"] == "Breaking Bad"
+        assert cursor > 0
+
+    @pytest.mark.integration
+    def test_progress_updates_feed(self, feed_db):
+        """Guardar progrés actualitza el feed i el cache"""
+        home_feed.get_items(feed_db, 1, home_feed.KIND_CONTINUE, 20)
+        _watch(feed_db, 600, '2024-01-01 10:00:00')
+
+        items, _ = home_feed.get_items(feed_db, 1, home_feed.KIND_CONTINUE, 20)
+        recent, _ = home_feed.get_items(feed_db, 1, home_feed.KIND_RECENT, 10)
+        assert items[0]["progress_seconds"] == 600
+        assert recent[0]["series_id"] == 1
+
+    @pytest.mark.integration
+    def test_since_cursor_reports_removals(self, feed_db):
+        """Amb cursor, un episodi acabat apareix com a eliminat"""
+        home_feed.get_items(feed_db, 1, home_feed.KIND_CONTINUE, 20)
+        _watch(feed_db, 600, '2024-01-01 10:00:00')
+        _, cursor = home_feed.get_items(feed_db, 1, home_feed.KIND_CONTINUE, 20)
+
+        _watch(feed_db, 2950, '2024-01-01 11:00:00')
+        changes = home_feed.get_changes(feed_db, 1, home_feed.KIND_CONTINUE, cursor)
+
+        assert changes["items"] == []
+        assert changes["removed"] == ["local:10"]
+        assert changes["cursor"] > cursor
+
+    @pytest.mark.integration
+    def test_streaming_series_single_entry(self, feed_db):
+        """Una sèrie de streaming només té una entrada (l'episodi més recent)"""
+        for episode, date in [(1, '2024-01-01 10:00:00'), (2, '2024-01-02 10:00:00')]:
+            feed_db.execute("""
+                INSERT INTO streaming_progress (user_id, tmdb_id, media_type, season_number,
+                                                episode_number, progress_percent, title, updated_date)
+                VALUES (1, 42, 'series', 1, ?, 50, 'Show', ?)
+            """, (episode, date))
+            home_feed.on_streaming_progress(feed_db, 1, 42, 'series')
+
+        items, _ = home_feed.get_items(feed_db, 1, home_feed.KIND_CONTINUE, 20)
+        streaming = [i for i in items if i["source"] == "streaming"]
+        assert len(streaming) == 1
+        assert streaming[0]["episode_number"] == 2
+
+    @pytest.mark.integration
+    def test_library_changes_rebuild_feed(self, feed_db):
+        """Canviar o eliminar una sèrie des de qualsevol camí es reflecteix al feed"""
+        from backend.services.validators import install_change_counters
+        install_change_counters(feed_db)
+        _watch(feed_db, 600, '2024-01-01 10:00:00')
+        home_feed.get_items(feed_db, 1, home_feed.KIND_CONTINUE, 20)
+
+        feed_db.execute("UPDATE series SET poster = 'nou.jpg' WHERE id = 1")
+        recent, _ = home_feed.get_items(feed_db, 1, home_feed.KIND_RECENT, 10)
+        assert recent[0]["poster"] == "nou.jpg"
+
+        feed_db.execute("DELETE FROM media_files WHERE series_id = 1")
+        feed_db.execute("DELETE FROM series WHERE id = 1")
+        items, _ = home_feed.get_items(feed_db, 1, home_feed.KIND_CONTINUE, 20)
+        recent, _ = home_feed.get_items(feed_db, 1, home_feed.KIND_RECENT, 10)
+        assert items == [] and recent == []
@@ -0,0 +1,136 @@
+"""
+Tests per a les variants d'imatges
+"""
+import asyncio
+import os
+import time
+
+import pytest
+
+pytest.importorskip("PIL")
+from PIL import Image
+
+from backend.services import images
+from backend.services.images import ImageVariantCache, negotiate_format, pick_width
+
+
+@pytest.fixture
+def poster(tmp_path):
+    path = tmp_path / "poster.jpg"
+    Image.new("RGB", (1000, 1500), (200, 30, 30)).save(path, quality=95)
+    return path
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ImageVariantCache(tmp_path / "variants", workers=2)
+    yield cache
+    cache.shutdown()
+
+
+class TestNegotiation:
+    """Tests de l'elecció d'amplada i format"""
+
+    @pytest.mark.unit
+    def test_width_buckets(self):
+        """L'amplada s'arrodoneix al bucket següent"""
+        assert pick_width(None) is None
+        assert pick_width(100) == 160
+        assert pick_width(342) == 342
+        assert pick_width(360) == 500
+        assert pick_width(10_000) == images.WIDTH_BUCKETS[-1]
+
+    @pytest.mark.unit
+    def test_format_from_accept(self, monkeypatch):
+        """AVIF i WebP només si el navegador els accepta"""
+        monkeypatch.setattr(images, "ENCODERS", {"avif": True, "webp": True, "jpeg": True})
+        assert negotiate_format("image/avif,image/webp,*/*") == "avif"
+        assert negotiate_format("image/webp,*/*") == "webp"
+        assert negotiate_format("*/*") == "jpeg"
+        assert negotiate_format("image/avif", requested="jpg") == "jpeg"
+
+    @pytest.mark.unit
+    def test_format_without_encoder(self, monkeypatch):
+        """Sense codificador AVIF es passa a WebP"""
+        monkeypatch.setattr(images, "ENCODERS", {"avif": False, "webp": True, "jpeg": True})
+        assert negotiate_format("image/avif,image/webp") == "webp"
+
+
+class TestVariantCache:
+    """Tests del cache de variants"""
+
+    @pytest.mark.unit
+    def test_resized_once(self, cache, poster, monkeypatch):
+        """La variant es genera una vegada i es reutilitza"""
+        renders = []
+        original = images.render_variant
+        monkeypatch.setattr(images, "render_variant", lambda *a: (renders.append(a), original(*a)))
+
+        path = asyncio.run(cache.get(poster, 342, "webp"))
+        again = asyncio.run(cache.get(poster, 342, "webp"))
+        assert path == again
+        assert len(renders) == 1
+        with Image.open(path) as image:
+            assert image.format == "WEBP"
+            assert image.size == (342, 513)
+        assert path.stat().st_size < poster.stat().st_size
+
+    @pytest.mark.unit
+    def test_content_addressed(self, cache, poster, tmp_path):
+        """Dos fitxers iguals comparteixen variant; si l'original canvia, la clau també"""
+        copy = tmp_path / "copy.jpg"
+        copy.write_bytes(poster.read_bytes())
+        assert cache.source_digest(poster) == cache.source_digest(copy)
+
+        before = cache.source_digest(poster)
+        Image.new("RGB", (1000, 1500), (30, 30, 200)).save(poster)
+        assert cache.source_digest(poster) != before
+
+    @pytest.mark.unit
+    def test_no_upscale(self, cache, tmp_path):
+        """Les imatges petites no s'amplien"""
+        small = tmp_path / "small.png"
+        Image.new("RGBA", (100, 150), (0, 0, 0, 0)).save(small)
+        path = asyncio.run(cache.get(small, 500, "webp"))
+        with Image.open(path) as image:
+            assert image.size == (100, 150)
+            assert image.mode == "RGBA"
+
+    @pytest.mark.unit
+    def test_prune(self, cache, poster):
+        """Per sobre de la quota s'esborren variants"""
+        for width in (160, 240, 342):
+            asyncio.run(cache.get(poster, width, "jpeg"))
+        cache.quota.quota_bytes = 1
+        # Les variants acabades de generar es conserven una estona
+        assert cache.prune() == 0
+        cache.quota._clock = lambda: time.time() + 3600
+        assert cache.prune() == 3
+
+    @pytest.mark.unit
+    def test_prune_keeps_recently_served(self, cache, poster):
+        """S'expulsen les variants menys servides, no les més antigues"""
+        paths = [asyncio.run(cache.get(poster, width, "jpeg")) for width in (160, 240, 342)]
+        now = time.time()
+        for i, path in enumerate(paths):
+            os.utime(path, (now - 7200 + i, now - 7200 + i))
+        cache.quota.invalidate()
+        cache.quota._access.clear()
+        cache.quota._clock = lambda: now
+        cache.quota.touch(paths[0])
+        cache.quota.quota_bytes = sum(p.stat().st_size for p in paths) - 1
+        cache.prune()
+        assert paths[0].exists()
+        assert not paths[1].exists()
+
+    @pytest.mark.unit
+    def test_digest_cache_bounded(self, cache, poster, tmp_path, monkeypatch):
+        """El cache de hashos no creix sense límit"""
+        monkeypatch.setattr(images, "MAX_DIGESTS", 2)
+        for i in range(4):
+            copy = tmp_path / f"copy{i}.jpg"
+            copy.write_bytes(poster.read_bytes())
+            cache.source_digest(copy)
+        assert len(cache._digests) == 2
+        assert cache.cached_digest(tmp_path / "copy3.jpg") is not None
+        assert cache.cached_digest(tmp_path / "copy0.jpg") is None
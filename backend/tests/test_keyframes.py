@@ -0,0 +1,123 @@
+"""
+Tests per a l'índex de keyframes
+"""
+import subprocess
+import threading
+import time
+
+import pytest
+
+from backend.streaming import keyframes
+from backend.streaming.keyframes import (
+    KeyframeIndex, KeyframeStore, decode_deltas, encode_deltas, extract_keyframes
+)
+
+
+FFPROBE_OUTPUT = """0.000000,48,K__
+0.041708,9120,___
+2.002000,150332,K__
+N/A,160000,K__
+4.004000,N/A,K_
+1.001000,90000,___
+"""
+
+
+@pytest.fixture
+def fake_ffprobe(monkeypatch):
+    calls = []
+
+    def run(cmd, **kwargs):
+        calls.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0, stdout=FFPROBE_OUTPUT, stderr="")
+
+    monkeypatch.setattr(keyframes.subprocess, "run", run)
+    return calls
+
+
+class TestEncoding:
+    """Tests de la codificació en deltes"""
+
+    @pytest.mark.unit
+    def test_roundtrip(self):
+        """Codificar i descodificar retorna els mateixos valors"""
+        values = [0, 2002, 4004, 6006, 1_000_000_000]
+        assert decode_deltas(encode_deltas(values)) == values
+
+    @pytest.mark.unit
+    def test_compact(self):
+        """Keyframes regulars ocupen molt poc"""
+        values = list(range(0, 7_200_000, 2000))
+        assert len(encode_deltas(values)) < len(values)
+
+
+class TestIndex:
+    """Tests de l'ajust als keyframes"""
+
+    @pytest.mark.unit
+    def test_snap_to_previous(self):
+        """El seek va al keyframe anterior"""
+        index = KeyframeIndex([0, 2000, 4000], [0, 100, 200])
+        assert index.snap(3.9) == (2.0, 100)
+        assert index.snap(4.0) == (4.0, 200)
+        assert index.snap(0.0) == (0.0, 0)
+
+    @pytest.mark.unit
+    def test_nearest(self):
+        """Per a miniatures, el keyframe més proper"""
+        index = KeyframeIndex([0, 2000, 4000], [0, 100, 200])
+        assert index.nearest(3.1) == 4.0
+        assert index.nearest(2.9) == 2.0
+        assert index.nearest(99) == 4.0
+
+
+class TestExtraction:
+    """Tests de l'extracció amb ffprobe"""
+
+    @pytest.mark.unit
+    def test_parses_keyframes_only(self, fake_ffprobe):
+        """Només es guarden els paquets amb flag K i pts conegut"""
+        index = extract_keyframes("/video.mkv")
+        assert index.times_ms == [0, 2002, 4004]
+        assert index.offsets == [48, 150332, -1]
+
+    @pytest.mark.integration
+    def test_store_roundtrip_and_invalidation(self, fake_ffprobe, tmp_path):
+        """L'índex es guarda per identitat i caduca si el fitxer canvia"""
+        video = tmp_path / "video.mkv"
+        video.write_bytes(b"x" * 10)
+        store = KeyframeStore(db_path=tmp_path / "kf.db")
+
+        assert store.get(video) is None
+        assert store.index_missing([str(video)]) == 1
+        assert store.get(video).times_ms == [0, 2002, 4004]
+        assert store.index_missing([str(video)]) == 0
+
+        video.write_bytes(b"y" * 20)
+        assert store.get(video) is None
+        assert len(fake_ffprobe) == 1
+
+    @pytest.mark.integration
+    def test_ensure_single_flight(self, monkeypatch, tmp_path):
+        """Diversos fils demanant el mateix fitxer fan una sola extracció"""
+        calls = []
+
+        def run(cmd, **kwargs):
+            calls.append(cmd)
+            time.sleep(0.05)
+            return subprocess.CompletedProcess(cmd, 0, stdout=FFPROBE_OUTPUT, stderr="")
+
+        monkeypatch.setattr(keyframes.subprocess, "run", run)
+        video = tmp_path / "video.mkv"
+        video.write_bytes(b"x" * 10)
+        store = KeyframeStore(db_path=tmp_path / "kf.db")
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(store.ensure(video)))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(calls) == 1
+        assert all(index.times_ms == [0, 2002, 4004] for index in results)
+        assert store._building == {}
@@ -0,0 +1,162 @@
+"""
+Tests per als documents paginats (PDF i còmics)
+"""
+import sqlite3
+import zipfile
+from io import BytesIO
+
+import pytest
+
+from backend.books.pages import PageIndex, PagedDocumentError, comic_members, index_document
+from backend.services.validators import parse_range
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def make_cbz(path, count=3):
+    """CBZ amb pàgines numerades sense zeros (l'ordre ha de ser natural)"""
+    with zipfile.ZipFile(path, "w") as zf:
+        for i in range(count, 0, -1):
+            image = Image.new("RGB", (400 + i, 600), (i * 20, 0, 0))
+            buffer = BytesIO()
+            image.save(buffer, "JPEG")
+            zf.writestr(f"comic/p{i}.jpg", buffer.getvalue())
+        zf.writestr("comic/info.txt", "no és una pàgina")
+        zf.writestr("__MACOSX/comic/._p1.jpg", b"")
+    return path
+
+
+@pytest.fixture
+def index(tmp_path):
+    conn = sqlite3.connect(tmp_path / "test.db")
+    conn.execute("CREATE TABLE books (id INTEGER PRIMARY KEY, pages INTEGER)")
+    conn.execute("INSERT INTO books (id) VALUES (1)")
+    conn.commit()
+    conn.close()
+    return PageIndex(db_path=tmp_path / "test.db", cache_root=tmp_path / "pages")
+
+
+class TestRange:
+    """Tests de la capçalera Range"""
+
+    @pytest.mark.unit
+    def test_forms(self):
+        assert parse_range("bytes=0-99", 1000) == (0, 99)
+        assert parse_range("bytes=900-", 1000) == (900, 999)
+        assert parse_range("bytes=-100", 1000) == (900, 999)
+        assert parse_range("bytes=0-5000", 1000) == (0, 999)
+        assert parse_range("bytes=-5000", 1000) == (0, 999)
+
+    @pytest.mark.unit
+    def test_ignored_and_unsatisfiable(self):
+        assert parse_range(None, 1000) is None
+        assert parse_range("items=0-1", 1000) is None
+        assert parse_range("bytes=a-b", 1000) is None
+        # Diversos rangs: es serveix el fitxer sencer
+        assert parse_range("bytes=0-1,5-6", 1000) is None
+        with pytest.raises(ValueError):
+            parse_range("bytes=1000-", 1000)
+        with pytest.raises(ValueError):
+            parse_range("bytes=50-10", 1000)
+
+
+class TestComics:
+    """Tests de l'índex i l'extracció de pàgines de còmics"""
+
+    @pytest.mark.unit
+    def test_natural_order(self, tmp_path):
+        """Les pàgines van en ordre natural i s'ignoren els fitxers que no ho són"""
+        path = make_cbz(tmp_path / "c.cbz", count=11)
+        with zipfile.ZipFile(path) as zf:
+            names = comic_members(zf)
+        assert names[:3] == ["comic/p1.jpg", "comic/p2.jpg", "comic/p3.jpg"]
+        assert names[-1] == "comic/p11.jpg"
+
+    @pytest.mark.unit
+    def test_index_dimensions(self, tmp_path):
+        index = index_document(make_cbz(tmp_path / "c.cbz"), "cbz")
+        assert index["page_count"] == 3
+        assert (index["pages"][0]["w"], index["pages"][0]["h"]) == (401, 600)
+
+    @pytest.mark.unit
+    def test_cbr_that_is_zip(self, tmp_path):
+        """Un .cbr que en realitat és un zip també es llegeix"""
+        path = make_cbz(tmp_path / "c.cbr")
+        assert index_document(path, "cbr")["page_count"] == 3
+
+    @pytest.mark.integration
+    def test_indexed_once(self, index, tmp_path):
+        """L'índex es guarda i només es refà si el fitxer canvia"""
+        path = str(make_cbz(tmp_path / "c.cbz"))
+        assert index.index_books([(1, path, "cbz")]) == 1
+        assert index.index_books([(1, path, "cbz")]) == 0
+        assert index.get(1, path, "cbz")["page_count"] == 3
+        assert index.indexed == 1
+
+        conn = sqlite3.connect(tmp_path / "test.db")
+        assert conn.execute("SELECT pages FROM books WHERE id = 1").fetchone()[0] == 3
+        conn.close()
+
+        make_cbz(path, count=5)
+        assert index.get(1, path, "cbz")["page_count"] == 5
+
+    @pytest.mark.integration
+    def test_page_extracted_once(self, index, tmp_path):
+        """Una pàgina s'extreu una sola vegada al cache"""
+        path = str(make_cbz(tmp_path / "c.cbz"))
+        page, media_type = index.page_file(1, path, "cbz", 1)
+        again, _ = index.page_file(1, path, "cbz", 1)
+        assert page == again and media_type == "image/jpeg"
+        assert index.extracted == 1
+        with Image.open(page) as image:
+            assert image.size == (402, 600)
+        with pytest.raises(PagedDocumentError):
+            index.page_file(1, path, "cbz", 3)
+
+    @pytest.mark.integration
+    def test_page_cache_bounded(self, tmp_path):
+        """El cache de pàgines no passa de la quota"""
+        index = PageIndex(db_path=tmp_path / "test.db", cache_root=tmp_path / "pages", quota_bytes=1)
+        path = str(make_cbz(tmp_path / "c.cbz"))
+        for page in range(3):
+            index.page_file(1, path, "cbz", page)
+        # Les pàgines acabades d'extreure es conserven una estona
+        assert len(list((tmp_path / "pages").glob("*/*"))) == 3
+        index.quota._clock = lambda: 4_000_000_000
+        index.quota.prune()
+        assert len(list((tmp_path / "pages").glob("*/*"))) == 0
+        # Es torna a extreure si cal
+        page_path, _ = index.page_file(1, path, "cbz", 0)
+        assert page_path.exists()
+
+    @pytest.mark.integration
+    def test_unreadable(self, index, tmp_path):
+        """Un fitxer il·legible queda marcat i no es reintenta fins que canviï"""
+        path = tmp_path / "trencat.cbz"
+        path.write_bytes(b"res")
+        with pytest.raises(PagedDocumentError):
+            index.get(1, str(path), "cbz")
+        with pytest.raises(PagedDocumentError):
+            index.get(1, str(path), "cbz")
+        assert index.indexed == 1
+
+
+class TestPdf:
+    """Tests de l'índex i el render de PDFs"""
+
+    @pytest.mark.integration
+    def test_pdf_pages(self, index, tmp_path):
+        fitz = pytest.importorskip("fitz")
+        path = str(tmp_path / "doc.pdf")
+        doc = fitz.open()
+        doc.new_page(width=595, height=842)
+        doc.new_page(width=842, height=595)
+        doc.save(path)
+        doc.close()
+
+        pages = index.get(1, path, "pdf")
+        assert pages["pages"] == [{"w": 595, "h": 842}, {"w": 842, "h": 595}]
+        image, media_type = index.page_file(1, path, "pdf", 1)
+        assert media_type == "image/png"
+        with Image.open(image) as rendered:
+            assert rendered.width == 1280
@@ -0,0 +1,202 @@
+"""
+Tests per al prefetch del següent episodi
+"""
+import asyncio
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import StreamingResponse
+from starlette.routing import Route
+
+from backend.services import prefetch
+from backend.services.prefetch import (
+    LiveStreamMiddleware, LiveStreams, Prefetcher, should_prefetch, warm_file
+)
+
+
+class TestTrigger:
+    """Tests del punt d'activació"""
+
+    @pytest.mark.unit
+    def test_threshold(self):
+        """S'activa a partir del llindar de la durada"""
+        assert not should_prefetch(800, 1000, threshold=0.85)
+        assert should_prefetch(850, 1000, threshold=0.85)
+
+    @pytest.mark.unit
+    def test_outro_triggers_earlier(self):
+        """L'outro detectat avança el prefetch, també en valors negatius"""
+        assert should_prefetch(700, 1000, outro_start=650, threshold=0.85)
+        assert should_prefetch(700, 1000, outro_start=-300, threshold=0.85)
+        assert not should_prefetch(600, 1000, outro_start=-300, threshold=0.85)
+
+    @pytest.mark.unit
+    def test_missing_duration(self):
+        """Sense durada no es fa res"""
+        assert not should_prefetch(100, 0)
+        assert not should_prefetch(None, 1000)
+
+
+class TestPrefetcher:
+    """Tests de la cua amb pressupost"""
+
+    @pytest.mark.integration
+    def test_dedupes_same_key(self):
+        """El mateix element només es prepara una vegada"""
+        calls = []
+
+        async def run():
+            prefetcher = Prefetcher(is_busy=lambda: False)
+
+            async def job():
+                calls.append(1)
+
+            assert prefetcher.schedule("a", job)
+            assert not prefetcher.schedule("a", job)
+            await asyncio.sleep(0.05)
+            assert not prefetcher.schedule("a", job)
+            return prefetcher.stats
+
+        stats = asyncio.run(run())
+        assert calls == [1]
+        assert stats["completed"] == 1
+
+    @pytest.mark.integration
+    def test_skips_when_busy(self):
+        """Si la reproducció en directe està ocupada no es fa prefetch"""
+        async def run():
+            prefetcher = Prefetcher(is_busy=lambda: True)
+
+            async def job():
+                raise AssertionError("no s'hauria d'executar")
+
+            return prefetcher.schedule("a", job), prefetcher.stats
+
+        scheduled, stats = asyncio.run(run())
+        assert not scheduled
+        assert stats["skipped_busy"] == 1
+
+    @pytest.mark.integration
+    def test_one_job_at_a_time(self):
+        """Els treballs s'executen d'un en un"""
+        running = []
+        peak = []
+
+        async def run():
+            prefetcher = Prefetcher(is_busy=lambda: False)
+
+            def make_job():
+                async def job():
+                    running.append(1)
+                    peak.append(len(running))
+                    await asyncio.sleep(0.01)
+                    running.pop()
+                return job
+
+            for key in ("a", "b", "c"):
+                prefetcher.schedule(key, make_job())
+            await asyncio.sleep(0.1)
+
+        asyncio.run(run())
+        assert max(peak) == 1 and len(peak) == 3
+
+    @pytest.mark.integration
+    def test_failures_are_contained(self):
+        """Un error del treball no surt del prefetch"""
+        async def run():
+            prefetcher = Prefetcher(is_busy=lambda: False)
+
+            async def job():
+                raise RuntimeError("boom")
+
+            prefetcher.schedule("a", job)
+            await asyncio.sleep(0.05)
+            return prefetcher.stats
+
+        assert asyncio.run(run())["failed"] == 1
+
+    @pytest.mark.unit
+    def test_remember_expires(self, monkeypatch):
+        """Les resolucions recordades caduquen"""
+        prefetcher = Prefetcher(is_busy=lambda: False)
+        prefetcher.remember(1, "rd", info_hash="abc", season=1)
+        assert prefetcher.resolutions(1)["rd"]["info_hash"] == "abc"
+
+        monkeypatch.setattr(prefetch, "RESOLUTION_TTL", -1)
+        prefetcher.remember(1, "rd", info_hash="abc", season=1)
+        assert prefetcher.resolutions(1) == {}
+
+
+class TestLiveStreams:
+    """Tests del comptador de reproduccions en directe"""
+
+    @pytest.mark.unit
+    def test_grace_and_clients(self):
+        """Un client compta mentre reprodueix i una estona després; el llindar és per clients"""
+        now = [0.0]
+        streams = LiveStreams(grace=10, busy_clients=2, clock=lambda: now[0])
+        streams.begin("a")
+        streams.begin("a")
+        assert streams.clients() == 1 and not streams.busy()
+        streams.begin("b")
+        assert streams.busy()
+        streams.end("b")
+        now[0] = 5
+        assert streams.busy()
+        now[0] = 11
+        assert not streams.busy()
+        streams.end("a")
+        streams.end("a")
+        assert streams.clients() == 1
+
+    @pytest.mark.integration
+    def test_running_stream_blocks_prefetch(self):
+        """Mentre s'està servint un stream, el prefetch no s'executa"""
+        streams = LiveStreams(grace=0, busy_clients=1)
+        release = asyncio.Event()
+
+        async def body():
+            yield b"a"
+            await release.wait()
+            yield b"b"
+
+        async def video(request):
+            return StreamingResponse(body(), media_type="video/mp4")
+
+        app = LiveStreamMiddleware(Starlette(routes=[Route("/api/stream/movie/1", video)]),
+                                   streams, r"^/api/stream/")
+        prefetcher = Prefetcher(is_busy=streams.busy)
+        ran = []
+
+        async def job():
+            ran.append(1)
+
+        async def scenario():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app),
+                                         base_url="http://test") as client:
+                request = asyncio.create_task(client.get("/api/stream/movie/1"))
+                for _ in range(100):
+                    if streams.clients():
+                        break
+                    await asyncio.sleep(0.01)
+                blocked = prefetcher.schedule("episode:2", job)
+                release.set()
+                response = await request
+                assert response.content == b"ab"
+                # Acabat el stream, el prefetch torna a passar
+                allowed = prefetcher.schedule("episode:3", job)
+                await asyncio.sleep(0.05)
+                return blocked, allowed
+
+        blocked, allowed = asyncio.run(scenario())
+        assert not blocked and allowed
+        assert ran == [1] and prefetcher.stats["skipped_busy"] == 1
+
+
+@pytest.mark.unit
+def test_warm_file(tmp_path):
+    """Es demanen l'inici i el final del fitxer"""
+    path = tmp_path / "video.mkv"
+    path.write_bytes(b"x" * 1000)
+    assert warm_file(str(path)) == 1000
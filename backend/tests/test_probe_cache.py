@@ -0,0 +1,85 @@
+"""
+Tests per al cache de ffprobe
+"""
+import os
+
+import pytest
+
+from backend.services import probe_cache as module
+from backend.services.probe_cache import ProbeCache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """Cache sobre una BD temporal amb un ffprobe fals que compta crides"""
+    calls = []
+
+    def fake_ffprobe(path, timeout=30):
+        calls.append(str(path))
+        return {"format": {"duration": "42.5"}, "streams": [{"codec_type": "video", "codec_name": "h264"}]}
+
+    monkeypatch.setattr(module, "run_ffprobe", fake_ffprobe)
+    cache = ProbeCache(db_path=tmp_path / "probe.db")
+    cache.calls = calls
+    return cache
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "video.mkv"
+    path.write_bytes(b"x" * 100)
+    return path
+
+
+class TestProbeCache:
+    """Tests del cache per identitat de fitxer"""
+
+    @pytest.mark.unit
+    def test_second_probe_is_cached(self, cache, video):
+        """Un fitxer sense canvis només es prova una vegada"""
+        first = cache.probe(video)
+        second = cache.probe(video)
+        assert first == second
+        assert len(cache.calls) == 1
+        assert cache.hits == 1
+
+    @pytest.mark.unit
+    def test_persists_across_instances(self, cache, video, tmp_path):
+        """El resultat es llegeix de la BD en un procés nou"""
+        cache.probe(video)
+        fresh = ProbeCache(db_path=tmp_path / "probe.db")
+        assert fresh.get(video)["format"]["duration"] == "42.5"
+
+    @pytest.mark.unit
+    def test_modified_file_is_reprobed(self, cache, video):
+        """Canviar el contingut invalida l'entrada"""
+        cache.probe(video)
+        video.write_bytes(b"y" * 200)
+        cache.probe(video)
+        assert len(cache.calls) == 2
+
+    @pytest.mark.unit
+    def test_touch_invalidates(self, cache, video):
+        """Canviar només mtime també invalida l'entrada"""
+        cache.probe(video)
+        st = os.stat(video)
+        os.utime(video, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+        cache.clear_memory()
+        cache.probe(video)
+        assert len(cache.calls) == 2
+
+    @pytest.mark.unit
+    def test_rename_keeps_entry(self, cache, video, tmp_path):
+        """Un fitxer mogut dins el mateix disc conserva el resultat"""
+        cache.probe(video)
+        moved = tmp_path / "renamed.mkv"
+        video.rename(moved)
+        cache.probe(moved)
+        assert len(cache.calls) == 1
+
+    @pytest.mark.unit
+    def test_missing_file_is_not_cached(self, cache, tmp_path):
+        """Les URLs i fitxers inexistents no es guarden"""
+        cache.probe(tmp_path / "missing.mkv")
+        cache.probe(tmp_path / "missing.mkv")
+        assert len(cache.calls) == 2
@@ -0,0 +1,73 @@
+"""
+Tests per a la selecció de camps dels llistats
+"""
+import pytest
+
+from backend.services.projection import FieldError, parse_fields, project, select_list
+
+
+COLUMNS = {
+    "id": ["b.id"],
+    "title": ["b.title"],
+    "author_name": ["a.name AS author_name"],
+    "label": ["b.title", "b.subtitle"],
+}
+
+ITEMS = [
+    {"id": 1, "title": "Alfa", "author_name": "Àlex"},
+    {"id": 2, "title": "Beta", "author_name": None},
+]
+
+
+class TestParseFields:
+    """Tests del paràmetre fields="""
+
+    @pytest.mark.unit
+    def test_none_when_empty(self):
+        """Sense camps es retorna el llistat complet"""
+        assert parse_fields(None, COLUMNS) is None
+        assert parse_fields("", COLUMNS) is None
+
+    @pytest.mark.unit
+    def test_keeps_order_and_dedups(self):
+        """Respecta l'ordre demanat i elimina duplicats"""
+        assert parse_fields("title, id,title", COLUMNS) == ["title", "id"]
+
+    @pytest.mark.unit
+    def test_unknown_field(self):
+        """Un camp inexistent és un error"""
+        with pytest.raises(FieldError):
+            parse_fields("id,overview", COLUMNS)
+
+
+class TestProjection:
+    """Tests de la projecció SQL i de la sortida"""
+
+    @pytest.mark.unit
+    def test_select_list_dedups_expressions(self):
+        """Les expressions compartides només apareixen un cop"""
+        assert select_list(["title", "label"], COLUMNS) == "b.title, b.subtitle"
+
+    @pytest.mark.unit
+    def test_project_fields(self):
+        """Només es retornen els camps demanats"""
+        assert project(ITEMS, ["id"]) == [{"id": 1}, {"id": 2}]
+        assert project(ITEMS, None) is ITEMS
+
+    @pytest.mark.unit
+    def test_project_compact(self):
+        """El format compacte retorna noms de camp i files"""
+        assert project(ITEMS, ["id", "title"], compact=True) == {
+            "fields": ["id", "title"],
+            "items": [[1, "Alfa"], [2, "Beta"]],
+        }
+        assert project(ITEMS, None, compact=True)["fields"] == ["id", "title", "author_name"]
+
+    @pytest.mark.unit
+    def test_project_compact_empty(self):
+        """Una llista buida en format compacte manté els noms dels camps"""
+        assert project([], None, compact=True, available=COLUMNS) == {
+            "fields": list(COLUMNS),
+            "items": [],
+        }
+        assert project([], ["id"], compact=True, available=COLUMNS)["fields"] == ["id"]
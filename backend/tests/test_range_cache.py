@@ -0,0 +1,205 @@
+"""
+Tests per al cache de rangs dels streams remots
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from backend.streaming import range_cache as module
+from backend.streaming.range_cache import RangeCache, UpstreamError, cache_key
+
+URL = "https://abc.download.real-debrid.com/d/XYZ/video.mkv"
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    """Blocs petits per provar amb fitxers petits"""
+    monkeypatch.setattr(module, "CHUNK_SIZE", 10)
+    monkeypatch.setattr(module, "READ_AHEAD_CHUNKS", 1)
+    monkeypatch.setattr(module, "MAX_RUN_CHUNKS", 4)
+
+
+def make_cache(tmp_path, blob, requests, quota=10_000, status=206):
+    """Cache amb un origen fals que respecta Range i apunta les peticions"""
+    def handler(request):
+        header = request.headers["range"].replace("bytes=", "")
+        start, end = (int(x) for x in header.split("-"))
+        requests.append((start, end))
+        if status != 206:
+            return httpx.Response(status)
+        return httpx.Response(206, content=blob[start:end + 1], headers={
+            "Content-Range": f"bytes {start}-{end}/{len(blob)}",
+            "Content-Type": "video/x-matroska",
+        })
+
+    return RangeCache(
+        root=tmp_path / "ranges", quota_bytes=quota,
+        client_factory=lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+
+
+async def read(cache, start, end, key="k", url=URL):
+    entry = await cache.open(url, key)
+    return b"".join([chunk async for chunk in cache.stream(url, key, entry, start, end)])
+
+
+class TestRangeCache:
+    """Tests del cache dispers per blocs"""
+
+    @pytest.mark.integration
+    def test_serves_exact_range(self, tmp_path, small_chunks):
+        """Es retornen exactament els bytes demanats"""
+        blob = bytes(range(95))
+        cache = make_cache(tmp_path, blob, [])
+        assert asyncio.run(read(cache, 13, 47)) == blob[13:48]
+
+    @pytest.mark.integration
+    def test_second_read_is_local(self, tmp_path, small_chunks):
+        """Tornar enrere no torna a descarregar"""
+        blob = bytes(range(95))
+        requests = []
+        cache = make_cache(tmp_path, blob, requests)
+
+        async def run():
+            first = await read(cache, 0, 29)
+            count = len(requests)
+            second = await read(cache, 5, 25)
+            return first, second, count
+
+        first, second, count = asyncio.run(run())
+        assert first == blob[:30] and second == blob[5:26]
+        assert len(requests) == count
+
+    @pytest.mark.integration
+    def test_read_ahead(self, tmp_path, small_chunks):
+        """Es baixa un bloc de més després del rang demanat"""
+        blob = bytes(range(95))
+        requests = []
+        cache = make_cache(tmp_path, blob, requests)
+        asyncio.run(read(cache, 0, 9))
+        # Petició de mida (0-0) i un tros de dos blocs
+        assert requests[-1] == (0, 19)
+        assert asyncio.run(read(cache, 10, 19)) == blob[10:20]
+        assert len(requests) == 2
+
+    @pytest.mark.integration
+    def test_fills_only_gaps(self, tmp_path, small_chunks):
+        """Amb blocs presents al mig, només es demanen els que falten"""
+        blob = bytes(range(95))
+        requests = []
+        cache = make_cache(tmp_path, blob, requests)
+
+        async def run():
+            await read(cache, 30, 39)
+            requests.clear()
+            return await read(cache, 0, 94)
+
+        assert asyncio.run(run()) == blob
+        assert all(not (s <= 30 <= e) for s, e in requests)
+
+    @pytest.mark.integration
+    def test_persists_on_disk(self, tmp_path, small_chunks):
+        """Una instància nova reutilitza els blocs del disc"""
+        blob = bytes(range(95))
+        requests = []
+        asyncio.run(read(make_cache(tmp_path, blob, requests), 0, 94))
+        requests.clear()
+
+        fresh = make_cache(tmp_path, blob, requests)
+        assert asyncio.run(read(fresh, 0, 94)) == blob
+        assert requests == []
+
+    @pytest.mark.integration
+    def test_lru_quota(self, tmp_path, small_chunks):
+        """En superar la quota s'expulsa l'entrada menys usada"""
+        blob = bytes(range(95))
+        cache = make_cache(tmp_path, blob, [], quota=150)
+
+        async def run():
+            await read(cache, 0, 94, key="old")
+            await read(cache, 0, 94, key="new")
+
+        asyncio.run(run())
+        assert cache.usage_bytes <= 150
+        assert not (tmp_path / "ranges" / "old").exists()
+        assert (tmp_path / "ranges" / "new").exists()
+
+    @pytest.mark.integration
+    def test_disk_work_off_loop(self, tmp_path, small_chunks, monkeypatch):
+        """Les escriptures, la càrrega inicial i les expulsions es fan fora del bucle"""
+        blob = bytes(range(95))
+        cache = make_cache(tmp_path, blob, [], quota=150)
+        offloaded = []
+        to_thread = asyncio.to_thread
+
+        async def record(fn, *args, **kwargs):
+            offloaded.append(getattr(fn, "__name__", ""))
+            return await to_thread(fn, *args, **kwargs)
+
+        monkeypatch.setattr(module.asyncio, "to_thread", record)
+
+        async def run():
+            await read(cache, 0, 94, key="old")
+            await read(cache, 0, 94, key="new")
+
+        asyncio.run(run())
+        assert offloaded.count("_load_usage") == 1
+        assert offloaded.count("_write_chunk") == 20
+        assert "rmtree" in offloaded
+        assert not list((tmp_path / "ranges").glob("*/*.part"))
+
+    @pytest.mark.integration
+    def test_upstream_error(self, tmp_path, small_chunks):
+        """Un error de l'origen es propaga en obrir l'entrada"""
+        cache = make_cache(tmp_path, b"x" * 10, [], status=403)
+        with pytest.raises(UpstreamError):
+            asyncio.run(read(cache, 0, 9))
+
+    @pytest.mark.integration
+    def test_slow_reader_does_not_block(self, tmp_path, small_chunks, monkeypatch):
+        """Si el client que descarrega un bloc s'atura, els altres van a l'origen"""
+        monkeypatch.setattr(module, "WAIT_TIMEOUT", 0.05)
+        blob = bytes(range(95))
+        requests = []
+        cache = make_cache(tmp_path, blob, requests)
+
+        async def run():
+            entry = await cache.open(URL, "k")
+            slow = cache.stream(URL, "k", entry, 0, 9)
+            await slow.__anext__()  # Comença la descàrrega i s'atura
+            data = await read(cache, 0, 9)
+            await slow.aclose()
+            return data
+
+        assert asyncio.run(run()) == blob[:10]
+        assert requests[-1] == (0, 9)
+
+    @pytest.mark.integration
+    def test_size_mismatch_discards_entry(self, tmp_path, small_chunks):
+        """Si l'origen ja no té la mida guardada, l'entrada s'esborra"""
+        requests = []
+        asyncio.run(read(make_cache(tmp_path, bytes(range(95)), requests), 0, 9))
+
+        other = make_cache(tmp_path, bytes(range(50)), requests)
+        with pytest.raises(UpstreamError):
+            asyncio.run(read(other, 40, 49))
+        assert not (tmp_path / "ranges" / "k").exists()
+
+    @pytest.mark.unit
+    def test_key_ignores_host(self):
+        """Els hosts de RD canvien però el fitxer és el mateix"""
+        other = URL.replace("abc.", "xyz.")
+        assert cache_key(URL) == cache_key(other)
+        assert cache_key(URL, "hash:s1e1") != cache_key(URL)
+
+    @pytest.mark.unit
+    def test_key_registered_by_server(self):
+        """Els links resolts pel servidor per al mateix fitxer comparteixen clau"""
+        cache = RangeCache()
+        relinked = "https://def.download.real-debrid.com/d/NEW/video.mkv"
+        cache.register(URL, "abc:s1e2")
+        cache.register(relinked, "abc:s1e2")
+        assert cache.key_for(URL) == cache.key_for(relinked) == cache_key(URL, "abc:s1e2")
+        # Una URL desconeguda no pot fer servir la clau d'un altre fitxer
+        assert cache.key_for("https://x.download.real-debrid.com/d/OTHER/v.mkv") != cache.key_for(URL)
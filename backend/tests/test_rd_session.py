@@ -0,0 +1,192 @@
+"""
+Tests per a la sessió de Real-Debrid (reutilització de torrents i links)
+"""
+import asyncio
+import sqlite3
+from contextlib import contextmanager
+
+import pytest
+
+from backend.debrid import realdebrid
+from backend.debrid.rd_session import RealDebridSession, file_key, link_for_file
+from backend.debrid.realdebrid import RealDebridError
+
+
+SEASON_PACK = {
+    "id": "T1",
+    "status": "downloaded",
+    "files": [
+        {"id": 1, "path": "/Show.S01E01.mkv", "bytes": 100, "selected": 1},
+        {"id": 2, "path": "/Show.S01E02.mkv", "bytes": 100, "selected": 1},
+        {"id": 3, "path": "/sample.txt", "bytes": 1, "selected": 0},
+    ],
+    "links": ["https://rd/d/E01", "https://rd/d/E02"],
+}
+
+
+class FakeRD:
+    """Client de RD fals que compta les crides"""
+
+    def __init__(self, torrents=None, infos=None):
+        self.torrents = torrents or []
+        self.infos = infos or {}
+        self.calls = []
+
+    async def get_torrents(self, limit=100):
+        self.calls.append("torrents")
+        return self.torrents
+
+    async def get_torrent_info(self, torrent_id):
+        self.calls.append("info")
+        return self.infos[torrent_id]
+
+    async def unrestrict_link(self, link):
+        self.calls.append("unrestrict")
+        return {"download": link.replace("rd/d", "cdn/dl"), "filename": link[-3:], "filesize": 100}
+
+    async def add_magnet(self, magnet):
+        self.calls.append("add")
+        return {"id": "NEW"}
+
+    async def select_files(self, torrent_id, file_ids):
+        self.calls.append(f"select:{file_ids}")
+
+    async def wait_until_downloaded(self, torrent_id):
+        self.calls.append("wait")
+        return self.infos[torrent_id]
+
+    choose_file = realdebrid.RealDebridClient.choose_file
+    matches_episode = realdebrid.RealDebridClient.matches_episode
+
+
+@pytest.fixture
+def make_session():
+    conn = sqlite3.connect(":memory:")
+
+    @contextmanager
+    def db():
+        yield conn
+
+    def make(fake):
+        session = RealDebridSession("key", db_factory=db)
+        session.client = fake
+        return session
+
+    yield make
+    conn.close()
+
+
+class TestLinkMapping:
+    """Tests de la correspondència fitxer → link"""
+
+    @pytest.mark.unit
+    def test_link_follows_selected_order(self):
+        """El link és el de la posició del fitxer entre els seleccionats"""
+        assert link_for_file(SEASON_PACK, 2) == "https://rd/d/E02"
+        assert link_for_file(SEASON_PACK, 3) is None
+
+    @pytest.mark.unit
+    def test_file_key(self):
+        """L'episodi té prioritat sobre l'índex del fitxer"""
+        assert file_key(4, 1, 2) == "s1e2"
+        assert file_key(4) == "idx4"
+        assert file_key() == "main"
+
+
+class TestSession:
+    """Tests de la resolució d'streams"""
+
+    @pytest.mark.integration
+    def test_reuses_existing_torrent(self, make_session):
+        """Un torrent que ja és al compte no es torna a afegir"""
+        fake = FakeRD(torrents=[{"id": "T1", "hash": "ABC", "status": "downloaded"}],
+                      infos={"T1": SEASON_PACK})
+        session = make_session(fake)
+
+        result = asyncio.run(session.get_stream("abc", "magnet:?xt", season=1, episode=2))
+
+        assert result["url"] == "https://cdn/dl/E02"
+        assert "add" not in fake.calls
+
+    @pytest.mark.integration
+    def test_repeat_play_uses_saved_link(self, make_session):
+        """Una segona reproducció no fa cap crida mentre el link és vigent"""
+        fake = FakeRD(torrents=[{"id": "T1", "hash": "abc", "status": "downloaded"}],
+                      infos={"T1": SEASON_PACK})
+        session = make_session(fake)
+        asyncio.run(session.get_stream("abc", "magnet:?xt", season=1, episode=1))
+        fake.calls.clear()
+
+        result = asyncio.run(session.get_stream("abc", "magnet:?xt", season=1, episode=1))
+
+        assert result["url"] == "https://cdn/dl/E01"
+        assert fake.calls == []
+
+    @pytest.mark.integration
+    def test_expired_download_needs_one_call(self, make_session):
+        """Amb el link de descàrrega caducat només cal un unrestrict"""
+        fake = FakeRD(torrents=[{"id": "T1", "hash": "abc", "status": "downloaded"}],
+                      infos={"T1": SEASON_PACK})
+        session = make_session(fake)
+        asyncio.run(session.get_stream("abc", "magnet:?xt", season=1, episode=1))
+        with session._db() as conn:
+            conn.execute("UPDATE rd_links SET download_expires_at = 0")
+        fake.calls.clear()
+
+        asyncio.run(session.get_stream("abc", "magnet:?xt", season=1, episode=1))
+
+        assert fake.calls == ["unrestrict"]
+
+    @pytest.mark.integration
+    def test_adds_magnet_when_not_in_account(self, make_session):
+        """Si el torrent no és al compte s'afegeix i se selecciona l'episodi"""
+        new = dict(SEASON_PACK, id="NEW", status="waiting_files_selection")
+        fake = FakeRD(infos={"NEW": new})
+        fake.infos["NEW"] = new
+        session = make_session(fake)
+
+        async def wait(torrent_id):
+            fake.calls.append("wait")
+            return SEASON_PACK
+        fake.wait_until_downloaded = wait
+
+        result = asyncio.run(session.get_stream("abc", "magnet:?xt", season=1, episode=2))
+
+        assert "add" in fake.calls and "select:2" in fake.calls
+        assert result["url"] == "https://cdn/dl/E02"
+
+    @pytest.mark.integration
+    def test_invalid_saved_link_falls_back(self, make_session):
+        """Si el link guardat ja no és vàlid es torna a resoldre"""
+        fake = FakeRD(torrents=[{"id": "T1", "hash": "abc", "status": "downloaded"}],
+                      infos={"T1": SEASON_PACK})
+        session = make_session(fake)
+        asyncio.run(session.get_stream("abc", "magnet:?xt", season=1, episode=1))
+        with session._db() as conn:
+            conn.execute("UPDATE rd_links SET download_expires_at = 0, link = 'https://rd/d/GONE'")
+
+        original = fake.unrestrict_link
+
+        async def unrestrict(link):
+            if link.endswith("GONE"):
+                raise RealDebridError("unknown_ressource")
+            return await original(link)
+        fake.unrestrict_link = unrestrict
+
+        result = asyncio.run(session.get_stream("abc", "magnet:?xt", season=1, episode=1))
+
+        assert result["url"] == "https://cdn/dl/E01"
+
+    @pytest.mark.integration
+    def test_prefetch_only_existing_torrents(self, make_session):
+        """La preparació del següent episodi aprofita el torrent del compte i no n'afegeix"""
+        fake = FakeRD(torrents=[{"id": "T1", "hash": "abc", "status": "downloaded"}],
+                      infos={"T1": SEASON_PACK})
+        session = make_session(fake)
+
+        assert asyncio.run(session.prefetch_episode("abc", "magnet:?xt", 1, 2))
+        assert not asyncio.run(session.prefetch_episode("abc", "magnet:?xt", 1, 3))
+        assert "add" not in fake.calls
+        fake.calls.clear()
+        assert asyncio.run(session.get_stream("abc", "magnet:?xt", season=1, episode=2))["url"] == "https://cdn/dl/E02"
+        assert fake.calls == []
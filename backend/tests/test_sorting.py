@@ -0,0 +1,91 @@
+"""
+Tests per a les claus d'ordenació sense accents
+"""
+import sqlite3
+import pytest
+
+from backend.services.sorting import sort_key, install_sort_keys
+
+
+@pytest.fixture
+def sort_db():
+    """BD en memòria amb les taules que tenen clau d'ordenació"""
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE series (id INTEGER PRIMARY KEY, name TEXT)")
+    conn.execute("CREATE TABLE books (id INTEGER PRIMARY KEY, title TEXT, author_id INTEGER)")
+    conn.execute("INSERT INTO series (name) VALUES ('Érase una vez')")
+    install_sort_keys(conn)
+    yield conn
+    conn.close()
+
+
+class TestSortKey:
+    """Tests de la funció sort_key"""
+
+    @pytest.mark.unit
+    def test_folds_accents_and_case(self):
+        """Elimina accents i passa a minúscules"""
+        assert sort_key("Èxit") == "exit"
+        assert sort_key("ÉLITE") == "elite"
+
+    @pytest.mark.unit
+    def test_catalan_rules(self):
+        """Ela geminada i ce trencada s'ordenen com a lletres simples"""
+        assert sort_key("Col·lecció") == "colleccio"
+        assert sort_key("Barça") == "barca"
+
+    @pytest.mark.unit
+    def test_ignores_leading_punctuation(self):
+        """Els signes inicials no afecten l'ordre"""
+        assert sort_key("¿Quién?") == "quien?"
+        assert sort_key('"Hola"') == 'hola"'
+
+    @pytest.mark.unit
+    def test_empty(self):
+        """Text buit o None retorna cadena buida"""
+        assert sort_key(None) == ""
+        assert sort_key("") == ""
+
+
+class TestSortKeyTriggers:
+    """Tests dels triggers que mantenen les claus a la BD"""
+
+    @pytest.mark.integration
+    def test_backfills_existing_rows(self, sort_db):
+        """Omple la clau dels registres existents"""
+        row = sort_db.execute("SELECT sort_name FROM series WHERE id = 1").fetchone()
+        assert row[0] == "erase una vez"
+
+    @pytest.mark.integration
+    def test_trigger_matches_python(self, sort_db):
+        """Els triggers SQL produeixen la mateixa clau que Python"""
+        names = ["Col·lecció", "«Àngel»", "Ærø Straße", "Ñandú", "Zebra"]
+        for name in names:
+            sort_db.execute("INSERT INTO series (name) VALUES (?)", (name,))
+        sort_db.execute("UPDATE series SET name = 'Òscar' WHERE id = 1")
+
+        rows = sort_db.execute("SELECT name, sort_name FROM series").fetchall()
+        for name, key in rows:
+            assert key == sort_key(name)
+
+    @pytest.mark.integration
+    def test_order_uses_index(self, sort_db):
+        """L'ORDER BY per clau fa servir l'índex"""
+        plan = sort_db.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM series ORDER BY sort_name"
+        ).fetchall()
+        assert any("idx_series_sort_name" in str(step) for step in plan)
+
+    @pytest.mark.integration
+    def test_ascii_insert_single_write(self, sort_db):
+        """Un títol ASCII es resol amb una sola escriptura de la clau"""
+        sort_db.execute("CREATE TABLE writes (n INTEGER)")
+        sort_db.execute("""
+            CREATE TRIGGER count_writes AFTER UPDATE OF sort_name ON series BEGIN
+                INSERT INTO writes VALUES (1);
+            END
+        """)
+        sort_db.execute("INSERT INTO series (name) VALUES ('The Wire')")
+        assert sort_db.execute("SELECT COUNT(*) FROM writes").fetchone()[0] == 1
+        sort_db.execute("UPDATE series SET name = 'The Wire' WHERE name = 'The Wire'")
+        assert sort_db.execute("SELECT COUNT(*) FROM writes").fetchone()[0] == 1
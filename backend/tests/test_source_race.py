@@ -0,0 +1,97 @@
+"""
+Tests per a la cursa d'extractors d'streams
+"""
+import asyncio
+import sqlite3
+from contextlib import contextmanager
+
+import pytest
+
+from backend.streaming import source_race
+from backend.streaming.source_race import ExtractorHealth, hedged_race
+
+
+@pytest.fixture
+def health(monkeypatch):
+    """Salut dels extractors sobre una BD en memòria, amb esperes curtes"""
+    conn = sqlite3.connect(":memory:")
+
+    @contextmanager
+    def db():
+        yield conn
+
+    monkeypatch.setattr(source_race, "HEDGE_DELAY_MIN", 0.05)
+    monkeypatch.setattr(source_race, "HEDGE_DELAY_MAX", 0.05)
+    yield ExtractorHealth(db_factory=db)
+    conn.close()
+
+
+def _extractor(delay, url=None, calls=None, name=None):
+    async def run():
+        if calls is not None:
+            calls.append(name)
+        await asyncio.sleep(delay)
+        return {"url": url} if url else None
+    return run
+
+
+class TestHedgedRace:
+    """Tests de la cursa esglaonada"""
+
+    @pytest.mark.integration
+    def test_fast_source_wins_and_slow_is_cancelled(self, health):
+        """Guanya el primer stream vàlid encara que no sigui la primera font"""
+        extractors = {
+            "slow": _extractor(5.0, "http://slow/x.m3u8"),
+            "fast": _extractor(0.01, "http://fast/x.m3u8"),
+        }
+        result = asyncio.run(hedged_race(extractors, "movie:1::", preferred="slow", health=health))
+
+        assert result["url"] == "http://fast/x.m3u8"
+        assert health.stats["fast"]["success_rate"] > source_race.DEFAULT_SUCCESS_RATE
+
+    @pytest.mark.integration
+    def test_hedge_waits_for_primary(self, health):
+        """Si la font principal respon a temps, les altres no es llancen"""
+        calls = []
+        extractors = {
+            "a": _extractor(0.0, "http://a/x.m3u8", calls, "a"),
+            "b": _extractor(0.0, "http://b/x.m3u8", calls, "b"),
+        }
+        asyncio.run(hedged_race(extractors, "movie:1::", preferred="a", health=health))
+        assert calls == ["a"]
+
+    @pytest.mark.integration
+    def test_negative_cache_skips_source(self, health):
+        """Una font sense resultat no es torna a provar pel mateix contingut"""
+        calls = []
+        extractors = {"empty": _extractor(0.0, None, calls, "empty")}
+
+        assert asyncio.run(hedged_race(extractors, "tv:5:1:2", health=health)) is None
+        assert asyncio.run(hedged_race(extractors, "tv:5:1:2", health=health)) is None
+        assert calls == ["empty"]
+
+    @pytest.mark.integration
+    def test_errors_not_negative(self, health):
+        """Una font que falla (xarxa, HTTP 5xx) es torna a provar la propera vegada"""
+        calls = []
+
+        async def failing():
+            calls.append("down")
+            raise ConnectionError("reset")
+
+        extractors = {"down": failing}
+        assert asyncio.run(hedged_race(extractors, "tv:5:1:3", health=health)) is None
+        assert asyncio.run(hedged_race(extractors, "tv:5:1:3", health=health)) is None
+        assert calls == ["down", "down"]
+        assert not health.is_negative("tv:5:1:3", "down")
+
+    @pytest.mark.integration
+    def test_scores_persist(self, health):
+        """Les puntuacions es guarden i es recuperen de la BD"""
+        extractors = {"ok": _extractor(0.0, "http://ok/x.m3u8"), "bad": _extractor(0.0, None)}
+        asyncio.run(hedged_race(extractors, "movie:2::", preferred="bad", health=health))
+
+        reloaded = ExtractorHealth(db_factory=health._db_factory)
+        assert reloaded.rank(["bad", "ok"]) == ["ok", "bad"]
+        assert reloaded.is_negative("movie:2::", "bad")
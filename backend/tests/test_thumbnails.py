@@ -0,0 +1,249 @@
+"""
+Tests per a les miniatures i el trickplay
+"""
+import re
+import json
+import asyncio
+import threading
+import time
+import subprocess
+
+import pytest
+
+from backend.services import thumbnails
+from backend.services.thumbnails import FfmpegBudget, ThumbnailPool, ThumbnailStore, build_vtt
+from backend.streaming.keyframes import KeyframeIndex
+
+
+PROBE = {
+    "format": {"duration": "1250.0"},
+    "streams": [
+        {"codec_type": "video", "width": 1920, "height": 800, "disposition": {"attached_pic": 0}},
+        {"codec_type": "audio"},
+    ],
+}
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "video.mkv"
+    path.write_bytes(b"x" * 1024)
+    return path
+
+
+@pytest.fixture
+def fake_ffmpeg(monkeypatch):
+    """ffmpeg fals: crea els fitxers de sortida. Es pot fer fallar el WebP."""
+    state = {"calls": [], "indexed": [], "webp_fails": False, "fails": False}
+
+    def run(cmd, **kwargs):
+        state["calls"].append(cmd)
+        output = cmd[-1]
+        if state["fails"]:
+            return subprocess.CompletedProcess(cmd, 1, stdout=b"", stderr=b"Invalid data found when processing input")
+        if state["webp_fails"] and "libwebp" in cmd:
+            return subprocess.CompletedProcess(cmd, 1, stdout=b"", stderr=b"Unknown encoder 'libwebp'")
+        if "%03d" in output:
+            for i in range(2):
+                with open(output % i, "wb") as f:
+                    f.write(b"sheet")
+        else:
+            with open(output, "wb") as f:
+                f.write(b"img")
+        return subprocess.CompletedProcess(cmd, 0, stdout=b"", stderr=b"")
+
+    monkeypatch.setattr(thumbnails.subprocess, "run", run)
+    monkeypatch.setattr(thumbnails, "probe_media", lambda path, *a: PROBE)
+    monkeypatch.setattr(thumbnails.keyframe_store, "get", lambda path: None)
+    monkeypatch.setattr(thumbnails.thumbnail_pool, "submit",
+                        lambda key, fn, *args, **kwargs: state["indexed"].append(key))
+    return state
+
+
+class TestVtt:
+    """Tests de l'índex WebVTT"""
+
+    @pytest.mark.unit
+    def test_cells(self):
+        """Cada interval apunta a la cel·la i al full correctes"""
+        vtt = build_vtt(count=102, duration=1015, width=160, height=90)
+        cues = re.findall(r"(\S+) --> (\S+)\n(\S+)", vtt)
+        assert vtt.startswith("WEBVTT")
+        assert len(cues) == 102
+        assert cues[0] == ("00:00:00.000", "00:00:10.000", "trickplay/sheet_000.webp#xywh=0,0,160,90")
+        assert cues[11][2] == "trickplay/sheet_000.webp#xywh=160,90,160,90"
+        assert cues[100][2] == "trickplay/sheet_001.webp#xywh=0,0,160,90"
+        # L'últim interval acaba amb el vídeo
+        assert cues[101][1] == "00:16:55.000"
+
+
+class TestStore:
+    """Tests de la generació amb identitat del vídeo"""
+
+    @pytest.mark.unit
+    def test_poster_webp(self, tmp_path, video, fake_ffmpeg):
+        """El pòster es genera en WebP al 20% de la durada"""
+        store = ThumbnailStore(tmp_path / "thumbs")
+        path = store.generate_poster(7, video)
+        assert path == tmp_path / "thumbs" / "7.webp"
+        cmd = fake_ffmpeg["calls"][0]
+        assert cmd[cmd.index("-ss") + 1] == "250.0"
+        assert store.poster_path(7) == path
+        # Sense índex de keyframes, es demana en segon pla
+        assert fake_ffmpeg["indexed"] == [f"keyframes:{video}"]
+
+    @pytest.mark.unit
+    def test_poster_on_keyframe(self, tmp_path, video, fake_ffmpeg, monkeypatch):
+        """Amb l'índex fet, el pòster va al keyframe més proper"""
+        index = KeyframeIndex([0, 248000, 252500], [0, 10, 20])
+        monkeypatch.setattr(thumbnails.keyframe_store, "get", lambda path: index)
+        ThumbnailStore(tmp_path / "thumbs").generate_poster(7, video)
+        cmd = fake_ffmpeg["calls"][0]
+        assert cmd[cmd.index("-ss") + 1] == "248.0"
+        assert fake_ffmpeg["indexed"] == []
+
+    @pytest.mark.unit
+    def test_poster_jpeg_fallback(self, tmp_path, video, fake_ffmpeg):
+        """Sense libwebp es fa servir JPEG"""
+        fake_ffmpeg["webp_fails"] = True
+        store = ThumbnailStore(tmp_path / "thumbs")
+        assert store.generate_poster(7, video).name == "7.jpg"
+
+    @pytest.mark.unit
+    def test_poster_failure_no_jpeg_retry(self, tmp_path, video, fake_ffmpeg):
+        """Si el vídeo no es pot llegir no es torna a provar en JPEG"""
+        fake_ffmpeg["fails"] = True
+        store = ThumbnailStore(tmp_path / "thumbs")
+        assert store.generate_poster(7, video) is None
+        assert len(fake_ffmpeg["calls"]) == 1
+
+    @pytest.mark.unit
+    def test_unchanged_video_skipped(self, tmp_path, video, fake_ffmpeg):
+        """Si el vídeo no ha canviat no es torna a executar ffmpeg"""
+        store = ThumbnailStore(tmp_path / "thumbs")
+        assert store.generate(7, video)
+        calls = len(fake_ffmpeg["calls"])
+        assert store.is_complete(7, video)
+        assert store.generate(7, video)
+        assert len(fake_ffmpeg["calls"]) == calls
+
+        video.write_bytes(b"y" * 2048)
+        assert not store.is_complete(7, video)
+        assert store.generate(7, video)
+        assert len(fake_ffmpeg["calls"]) == calls + 2
+
+    @pytest.mark.unit
+    def test_trickplay_single_pass(self, tmp_path, video, fake_ffmpeg):
+        """Una sola crida a ffmpeg, només keyframes, amb mida de cel·la segons l'aspecte"""
+        store = ThumbnailStore(tmp_path / "thumbs")
+        vtt_path = store.generate_trickplay(3, video)
+        assert len(fake_ffmpeg["calls"]) == 1
+        cmd = fake_ffmpeg["calls"][0]
+        assert cmd[cmd.index("-skip_frame") + 1] == "nokey"
+        assert "scale=160:66" in cmd[cmd.index("-vf") + 1]
+
+        assert vtt_path == tmp_path / "thumbs" / "trickplay" / "3" / "index.vtt"
+        # 1250 s / 10 = 125 miniatures en 2 fulls
+        assert vtt_path.read_text().count("-->") == 125
+        assert store.trickplay_sheet(3, "sheet_001.webp") is not None
+        assert store.trickplay_sheet(3, "../3.json") is None
+        manifest = json.loads((tmp_path / "thumbs" / "3.json").read_text())
+        assert manifest["trickplay"]["sheets"] == 2
+
+    @pytest.mark.unit
+    def test_clear(self, tmp_path, video, fake_ffmpeg):
+        """clear() esborra pòsters, manifests i trickplay"""
+        store = ThumbnailStore(tmp_path / "thumbs")
+        store.generate(1, video)
+        assert store.clear() == 1
+        assert store.poster_path(1) is None
+        assert store.trickplay_vtt(1) is None
+
+
+class TestPool:
+    """Tests del pool de treballs"""
+
+    @pytest.mark.unit
+    def test_dedupes_inflight(self):
+        """Dues peticions del mateix element comparteixen el treball"""
+        pool = ThumbnailPool(workers=2)
+        release = threading.Event()
+        calls = []
+
+        def job():
+            calls.append(1)
+            release.wait(5)
+            return "ok"
+
+        first = pool.submit("poster:1", job)
+        second = pool.submit("poster:1", job)
+        release.set()
+        assert first is second
+        assert first.result(5) == "ok"
+        assert len(calls) == 1
+        pool.shutdown()
+
+    @pytest.mark.unit
+    def test_batch_bounded(self):
+        """La tanda no té mai més treballs en cua que processos"""
+        pool = ThumbnailPool(workers=2)
+        lock = threading.Lock()
+        state = {"running": 0, "peak": 0}
+
+        def job(n):
+            with lock:
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+            with lock:
+                state["running"] -= 1
+            if n == 3:
+                raise RuntimeError("ffmpeg")
+            return n % 2 == 0
+
+        done = []
+        ok, errors = pool.run_batch(
+            ((f"batch:{n}", job, (n,)) for n in range(8)),
+            lambda key, success: done.append(key),
+        )
+        assert (ok, errors) == (4, 4)
+        assert len(done) == 8
+        assert state["peak"] <= 2
+        pool.shutdown()
+
+    @pytest.mark.unit
+    def test_budget_keeps_slot_for_playback(self):
+        """Les tandes no ocupen l'última plaça i la reproducció passa per davant"""
+        budget = FfmpegBudget(slots=2)
+        assert budget.acquire()
+        assert not budget.acquire(timeout=0)
+        assert budget.acquire(interactive=True, timeout=0)
+        assert budget.interactive == 1
+
+        got = []
+        waiter = threading.Thread(target=lambda: got.append(budget.acquire(interactive=True, timeout=5)))
+        waiter.start()
+        time.sleep(0.05)
+        budget.release(interactive=True)
+        waiter.join(5)
+        # La plaça alliberada és per a la reproducció, no per a una tanda
+        assert got == [True]
+        budget.release()
+        # Amb la reproducció ocupant-ne una, la tanda encara no hi cap
+        assert not budget.acquire(timeout=0)
+
+    @pytest.mark.unit
+    def test_run_not_stuck_behind_batch(self):
+        """Una petició interactiva no espera que acabi una tanda llarga"""
+        budget = FfmpegBudget(slots=2)
+        pool = ThumbnailPool(workers=2, budget=budget)
+        release = threading.Event()
+        for n in range(3):
+            pool.submit(f"trickplay:{n}", release.wait, 5)
+
+        async def poster():
+            return await pool.run("poster:1", lambda: "ok")
+
+        assert asyncio.run(asyncio.wait_for(poster(), 2)) == "ok"
+        release.set()
+        pool.shutdown()
+
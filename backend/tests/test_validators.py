@@ -0,0 +1,77 @@
+"""
+Tests per als ETags basats en comptadors de canvis
+"""
+import sqlite3
+import pytest
+
+from backend.services.sorting import install_sort_keys
+from backend.services.validators import (
+    etag_matches, get_versions, install_change_counters, make_etag, table_etag
+)
+
+
+@pytest.fixture
+def counters_db():
+    """BD en memòria amb taules seguides pels comptadors"""
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE series (id INTEGER PRIMARY KEY, name TEXT)")
+    conn.execute("CREATE TABLE watch_progress (id INTEGER PRIMARY KEY, user_id INTEGER, media_id INTEGER)")
+    install_change_counters(conn)
+    yield conn
+    conn.close()
+
+
+class TestEtagMatching:
+    """Tests de la comparació d'If-None-Match"""
+
+    @pytest.mark.unit
+    def test_weak_comparison(self):
+        """Un ETag fort i un de feble amb el mateix valor coincideixen"""
+        etag = make_etag("a")
+        assert etag_matches(etag, etag)
+        assert etag_matches(etag[2:], etag)
+        assert etag_matches(f'"x", {etag}', etag)
+
+    @pytest.mark.unit
+    def test_no_match(self):
+        """Capçalera absent o diferent no coincideix"""
+        assert not etag_matches(None, make_etag("a"))
+        assert not etag_matches(make_etag("b"), make_etag("a"))
+        assert etag_matches("*", make_etag("a"))
+
+
+class TestChangeCounters:
+    """Tests dels triggers de comptadors"""
+
+    @pytest.mark.integration
+    def test_table_changes_bump_etag(self, counters_db):
+        """Inserir, modificar o esborrar canvia l'ETag"""
+        first = table_etag(counters_db, ["series"], "q")
+        assert table_etag(counters_db, ["series"], "q") == first
+
+        counters_db.execute("INSERT INTO series (name) VALUES ('A')")
+        second = table_etag(counters_db, ["series"], "q")
+        counters_db.execute("DELETE FROM series")
+        assert len({first, second, table_etag(counters_db, ["series"], "q")}) == 3
+
+    @pytest.mark.integration
+    def test_per_user_counter(self, counters_db):
+        """El progrés d'un usuari no invalida el d'un altre"""
+        counters_db.execute("INSERT INTO watch_progress (user_id, media_id) VALUES (1, 10)")
+        counters_db.execute("UPDATE watch_progress SET media_id = 11 WHERE user_id = 1")
+
+        versions = get_versions(counters_db, ["watch_progress:1", "watch_progress:2"])
+        assert versions == {"watch_progress:1": 2, "watch_progress:2": 0}
+
+    @pytest.mark.integration
+    def test_sort_key_writes_not_counted(self):
+        """Les claus d'ordenació que escriuen els triggers no compten com a canvis"""
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE TABLE series (id INTEGER PRIMARY KEY, name TEXT)")
+        install_sort_keys(conn)
+        install_change_counters(conn)
+        conn.execute("INSERT INTO series (name) VALUES ('Èxit «total»')")
+        assert get_versions(conn, ["series"]) == {"series": 1}
+        conn.execute("UPDATE series SET name = 'Àngel'")
+        assert get_versions(conn, ["series"]) == {"series": 2}
+        conn.close()
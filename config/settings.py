@@ -19,6 +19,7 @@ DATABASE_PATH = BASE_DIR / "storage" / "hermes.db"
 CACHE_DIR = BASE_DIR / "storage" / "cache"
 METADATA_DIR = BASE_DIR / "storage" / "metadata"
 DATA_DIR = BASE_DIR / "data"
+FRONTEND_BUILD_DIR = BASE_DIR / "frontend" / "build"
 
 # === ENTORN ===
 # Detectar si estem en mode producció
@@ -0,0 +1,36 @@
+/**
+ * Genera variants .br i .gz dels fitxers de text del build.
+ * El backend les serveix directament si el navegador les accepta.
+ */
+const fs = require('fs');
+const path = require('path');
+const zlib = require('zlib');
+
+const BUILD_DIR = path.join(__dirname, '..', 'build');
+const EXTENSIONS = ['.js', '.css', '.html', '.json', '.svg', '.txt', '.ico'];
+const MIN_SIZE = 1024;
+
+function walk(dir) {
+  return fs.readdirSync(dir, { withFileTypes: true }).flatMap((entry) => {
+    const fullPath = path.join(dir, entry.name);
+    return entry.isDirectory() ? walk(fullPath) : [fullPath];
+  });
+}
+
+let count = 0;
+for (const file of walk(BUILD_DIR)) {
+  if (!EXTENSIONS.includes(path.extname(file))) continue;
+  const data = fs.readFileSync(file);
+  if (data.length < MIN_SIZE) continue;
+
+  fs.writeFileSync(`${file}.gz`, zlib.gzipSync(data, { level: 9 }));
+  fs.writeFileSync(`${file}.br`, zlib.brotliCompressSync(data, {
+    params: {
+      [zlib.constants.BROTLI_PARAM_QUALITY]: zlib.constants.BROTLI_MAX_QUALITY,
+      [zlib.constants.BROTLI_PARAM_SIZE_HINT]: data.length,
+    },
+  }));
+  count += 1;
+}
+
+console.log(`Precomprimits ${count} fitxers a ${BUILD_DIR}`);
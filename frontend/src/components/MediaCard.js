@@ -4,7 +4,7 @@ import TitleAudioPlayer from './TitleAudioPlayer';
 import LazyImage from './LazyImage';
 import { useAuth } from '../context/AuthContext';
 import { useBBC } from '../context/BBCContext';
-import { getPosterUrl } from '../config/api';
+import { getArtworkUrl, getPosterUrl } from '../config/api';
 import { TvIcon, MovieIcon, PlayIcon, InfoIcon } from './icons';
 import './MediaCard.css';
 
@@ -91,8 +91,8 @@ function MediaCard({ item, type = 'series', width = 180, isTmdb = false }) {
 
   // URL del poster (TMDB directe o local)
   const posterUrl = isStreamingOnly && item.poster
-    ? item.poster
-    : item.poster ? getPosterUrl(item.id) : null;
+    ? getArtworkUrl(item.poster)
+    : item.poster ? getPosterUrl(item.id, '', width) : null;
 
   return (
     <div
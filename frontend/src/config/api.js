@@ -27,24 +27,49 @@ export const configureAxios = (axios) => {
 
 // === IMAGE URL HELPERS ===
 
+/**
+ * Add ?w= so the server returns a resized variant (WebP/AVIF if supported).
+ * Width is in CSS pixels; it is scaled by the device pixel ratio.
+ */
+export const withImageWidth = (url, width) => {
+  if (!url || !width) return url;
+  const pixels = Math.round(width * (window.devicePixelRatio || 1));
+  return `${url}${url.includes('?') ? '&' : '?'}w=${pixels}`;
+};
+
 /**
  * Get local image URL (poster/backdrop from Hermes server)
  */
-export const getImageUrl = (type, id, cacheBust = '') => {
+export const getImageUrl = (type, id, cacheBust = '', width = null) => {
   if (!id) return null;
-  return `${API_URL}/api/image/${type}/${id}${cacheBust}`;
+  return withImageWidth(`${API_URL}/api/image/${type}/${id}${cacheBust}`, width);
 };
 
-export const getPosterUrl = (id, cacheBust = '') => getImageUrl('poster', id, cacheBust);
-export const getBackdropUrl = (id, cacheBust = '') => getImageUrl('backdrop', id, cacheBust);
+export const getPosterUrl = (id, cacheBust = '', width = null) => getImageUrl('poster', id, cacheBust, width);
+export const getBackdropUrl = (id, cacheBust = '', width = null) => getImageUrl('backdrop', id, cacheBust, width);
+
+/**
+ * Route TMDB / Fanart.tv artwork through Hermes' local mirror
+ * (the server redirects to the CDN until the image has been downloaded)
+ */
+export const getArtworkUrl = (url) => {
+  if (!url) return null;
+  if (url.startsWith(`${TMDB_IMAGE_BASE}/`)) {
+    return `${API_URL}/api/artwork/tmdb/${url.slice(TMDB_IMAGE_BASE.length + 1)}`;
+  }
+  if (url.startsWith('https://assets.fanart.tv/')) {
+    return `${API_URL}/api/artwork/remote?url=${encodeURIComponent(url)}`;
+  }
+  return url;
+};
 
 /**
  * Get TMDB image URL
  */
 export const getTmdbImageUrl = (path, size = 'w500') => {
   if (!path) return null;
-  if (path.startsWith('http')) return path;
-  return `${TMDB_IMAGE_BASE}/${size}${path}`;
+  if (path.startsWith('http')) return getArtworkUrl(path);
+  return `${API_URL}/api/artwork/tmdb/${size}${path}`;
 };
 
 export const getTmdbPosterUrl = (path, size = 'w500') => getTmdbImageUrl(path, size);
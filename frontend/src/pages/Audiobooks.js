@@ -3,7 +3,7 @@ import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import { useAuth } from '../context/AuthContext';
 import { useLibrary } from '../context/LibraryContext';
-import { API_URL, formatDuration } from '../config/api';
+import { API_URL, formatDuration, withImageWidth } from '../config/api';
 import {
   AudiobookIcon,
   AuthorIcon,
@@ -266,7 +266,7 @@ function Audiobooks() {
 
   const getAudiobookCover = (audiobook) => {
     if (audiobook.cover) {
-      return `${API_URL}/api/audiobooks/${audiobook.id}/cover`;
+      return withImageWidth(`${API_URL}/api/audiobooks/${audiobook.id}/cover`, 200);
     }
     return null;
   };
@@ -100,6 +100,8 @@ function BookReader() {
   const [readingTime, setReadingTime] = useState(null);
 
   const contentRef = useRef(null);
+  // Capítols ja demanats (promeses), per no repetir peticions ni prefetch
+  const chaptersRef = useRef(new Map());
   // eslint-disable-next-line no-unused-vars
   const controlsTimeoutRef = useRef(null);
 
@@ -146,18 +148,23 @@ function BookReader() {
     localStorage.setItem(`bookmarks_${id}`, JSON.stringify(newBookmarks));
   }, [bookmarks, currentChapter, content, id]);
 
-  // Calcular temps de lectura
-  const calculateReadingTime = useCallback((html) => {
-    if (!html) return null;
-    // Extreure text del HTML
-    const div = document.createElement('div');
-    div.innerHTML = html;
-    const text = div.textContent || div.innerText;
-    const words = text.trim().split(/\s+/).length;
-    // Velocitat mitjana de lectura: 200 paraules/minut
-    const minutes = Math.ceil(words / 200);
-    return minutes;
-  }, []);
+  // Calcular temps de lectura (velocitat mitjana: 200 paraules/minut)
+  const calculateReadingTime = (words) => (words ? Math.ceil(words / 200) : null);
+
+  // Capítol processat pel servidor (cada capítol es demana una sola vegada)
+  const fetchChapter = useCallback((chapterIndex) => {
+    const cache = chaptersRef.current;
+    if (!cache.has(chapterIndex)) {
+      const request = axios.get(`/api/books/${id}/chapters/${chapterIndex}`)
+        .then(response => response.data)
+        .catch(err => {
+          cache.delete(chapterIndex);
+          throw err;
+        });
+      cache.set(chapterIndex, request);
+    }
+    return cache.get(chapterIndex);
+  }, [id]);
 
   const loadBook = useCallback(async () => {
     try {
@@ -170,19 +177,19 @@ function BookReader() {
       const contentResponse = await axios.get(`/api/books/${id}/content`);
       setContent(contentResponse.data);
 
-      if (contentResponse.data.type === 'epub') {
-        // Carregar primer capítol
-        loadChapter(0, contentResponse.data.content);
-      }
-
-      // Carregar progrés guardat
-      try {
-        const progressResponse = await axios.get(`/api/books/${id}/progress`);
-        if (progressResponse.data.current_page) {
-          setCurrentChapter(progressResponse.data.current_page);
+      if (contentResponse.data.type === 'epub' && contentResponse.data.content) {
+        // Carregar progrés guardat i obrir només aquell capítol
+        let startChapter = 0;
+        try {
+          const progressResponse = await axios.get(`/api/books/${id}/progress`);
+          const saved = progressResponse.data.current_page;
+          if (saved > 0 && saved < contentResponse.data.content.total) {
+            startChapter = saved;
+          }
+        } catch {
+          // Ignorar errors de progrés
         }
-      } catch {
-        // Ignorar errors de progrés
+        await loadChapter(startChapter, null, contentResponse.data.content);
       }
 
       // Carregar marcadors
@@ -198,38 +205,50 @@ function BookReader() {
   }, [id, loadBookmarks]);
 
   useEffect(() => {
+    chaptersRef.current = new Map();
     loadBook();
   }, [loadBook]);
 
-  const loadChapter = useCallback(async (chapterIndex, bookContent = content?.content) => {
-    if (!bookContent || !bookContent.spine || !bookContent.spine[chapterIndex]) {
+  // Llibre a la cua de conversió a EPUB: comprovar-ho periòdicament
+  const conversion = content?.conversion;
+  useEffect(() => {
+    if (!conversion?.available || !['pending', 'running'].includes(conversion.status)) return;
+    const timer = setTimeout(async () => {
+      try {
+        const response = await axios.get(`/api/books/${id}/content`);
+        if (response.data.type === 'epub') {
+          loadBook();
+        } else {
+          setContent(response.data);
+        }
+      } catch (err) {
+        console.error('Error comprovant la conversió:', err);
+      }
+    }, 5000);
+    return () => clearTimeout(timer);
+  }, [conversion, id, loadBook]);
+
+  const loadChapter = useCallback(async (chapterIndex, anchor = null, bookContent = content?.content) => {
+    if (!bookContent || chapterIndex < 0 || chapterIndex >= bookContent.total) {
       return;
     }
 
     try {
-      const chapterHref = bookContent.spine[chapterIndex].href;
-      const response = await axios.get(`/api/books/${id}/resource/${chapterHref}`, {
-        responseType: 'text'
-      });
+      const chapter = await fetchChapter(chapterIndex);
 
-      // Processar HTML per adaptar-lo
-      let html = response.data;
-
-      // Reemplaçar URLs de recursos
-      html = html.replace(/src="([^"]+)"/g, (match, src) => {
-        if (src.startsWith('http')) return match;
-        return `src="${API_URL}/api/books/${id}/resource/${src}"`;
-      });
-
-      html = html.replace(/href="([^"]+\.css)"/g, (match, href) => {
-        return `href="${API_URL}/api/books/${id}/resource/${href}"`;
-      });
+      // El servidor ja ha netejat el HTML i reescrit els recursos a /api/books/...
+      const links = chapter.stylesheets
+        .map(href => `<link rel="stylesheet" href="${API_URL}${href}">`)
+        .join('');
+      const html = links + (API_URL
+        ? chapter.html.replaceAll('="/api/books/', `="${API_URL}/api/books/`)
+        : chapter.html);
 
       setChapterContent(html);
       setCurrentChapter(chapterIndex);
 
       // Calcular temps de lectura
-      setReadingTime(calculateReadingTime(html));
+      setReadingTime(calculateReadingTime(chapter.words));
 
       // Comprovar si està marcat
       setIsBookmarked(bookmarks.some(b => b.chapter === chapterIndex));
@@ -237,23 +256,33 @@ function BookReader() {
       // Guardar progrés
       saveProgress(chapterIndex);
 
-      // Scroll al principi
+      // Scroll al principi (o a l'àncora de l'enllaç)
       if (contentRef.current) {
         contentRef.current.scrollTop = 0;
+        if (anchor) {
+          requestAnimationFrame(() => {
+            document.getElementById(anchor)?.scrollIntoView();
+          });
+        }
+      }
+
+      // Prefetch del capítol següent
+      if (chapter.next !== null) {
+        fetchChapter(chapter.next).catch(() => {});
       }
 
     } catch (err) {
       console.error('Error carregant capítol:', err);
     }
     // eslint-disable-next-line react-hooks/exhaustive-deps
-  }, [id, content, calculateReadingTime, bookmarks]);
+  }, [id, content, fetchChapter, bookmarks]);
 
   const saveProgress = async (chapterIndex) => {
     try {
       await axios.post(`/api/books/${id}/progress`, {
         position: `chapter:${chapterIndex}`,
         page: chapterIndex,
-        total_pages: content?.content?.spine?.length || 0
+        total_pages: content?.content?.total || 0
       });
     } catch (err) {
       console.error('Error guardant progrés:', err);
@@ -261,7 +290,7 @@ function BookReader() {
   };
 
   const goToNextChapter = useCallback(() => {
-    if (content?.content?.spine && currentChapter < content.content.spine.length - 1) {
+    if (content?.content && currentChapter < content.content.total - 1) {
       loadChapter(currentChapter + 1);
     }
   }, [content, currentChapter, loadChapter]);
@@ -299,6 +328,15 @@ function BookReader() {
   }, [handleKeyDown]);
 
   const handleContentClick = (e) => {
+    // Enllaços interns del llibre: anar al capítol indicat
+    const link = e.target.closest?.('a[data-chapter]');
+    if (link) {
+      e.preventDefault();
+      loadChapter(parseInt(link.dataset.chapter), link.dataset.anchor || null);
+      return;
+    }
+    if (e.target.closest?.('a[href]')) return;
+
     const rect = contentRef.current?.getBoundingClientRect();
     if (!rect) return;
 
@@ -362,6 +400,36 @@ function BookReader() {
     );
   }
 
+  // Còmics: cada pàgina és una imatge que es demana quan s'acosta a la pantalla
+  if (content?.type === 'comic') {
+    const pageUrl = (index, width) => `${API_URL}/api/books/${id}/pages/${index}?w=${width}`;
+    return (
+      <div className="book-reader" style={{ backgroundColor: currentTheme.bg }}>
+        <div className="reader-header visible" style={{ backgroundColor: currentTheme.bg, color: currentTheme.text }}>
+          <button className="icon-btn" onClick={() => navigate('/books')}>
+            <BackIcon />
+          </button>
+          <h1>{book?.title}</h1>
+        </div>
+        <div className="comic-pages">
+          {content.pages.map((page, index) => (
+            <img
+              key={index}
+              className="comic-page"
+              loading="lazy"
+              alt={`Pagina ${index + 1}`}
+              src={pageUrl(index, 1280)}
+              srcSet={`${pageUrl(index, 780)} 780w, ${pageUrl(index, 1280)} 1280w, ${pageUrl(index, 1920)} 1920w`}
+              sizes="(max-width: 1000px) 100vw, 1000px"
+              width={page.w || undefined}
+              height={page.h || undefined}
+            />
+          ))}
+        </div>
+      </div>
+    );
+  }
+
   if (loading) {
     return (
       <div className="loading-screen" style={{ backgroundColor: currentTheme.bg, color: currentTheme.text }}>
@@ -380,6 +448,23 @@ function BookReader() {
     );
   }
 
+  // MOBI/AZW encara sense convertir
+  if (conversion) {
+    const converting = conversion.available && ['pending', 'running'].includes(conversion.status);
+    return (
+      <div className={converting ? 'loading-screen' : 'error-screen'} style={{ backgroundColor: currentTheme.bg, color: currentTheme.text }}>
+        {converting && <div className="loading-spinner"></div>}
+        <div className={converting ? 'loading-text' : 'error-text'}>
+          {converting
+            ? `Convertint a EPUB...${conversion.queue_position ? ` (${conversion.queue_position} per davant)` : ''}`
+            : content.message}
+        </div>
+        <a href={`${API_URL}/api/books/${id}/file`} download>Descarregar l'original</a>
+        <button onClick={() => navigate('/books')}>Tornar a la biblioteca</button>
+      </div>
+    );
+  }
+
   return (
     <div
       className={`book-reader theme-${theme}`}
@@ -402,7 +487,7 @@ function BookReader() {
         <div className="header-center">
           <h1 className="book-title">{book?.title}</h1>
           <span className="chapter-indicator">
-            Capitol {currentChapter + 1} de {content?.content?.spine?.length || 0}
+            Capitol {currentChapter + 1} de {content?.content?.total || 0}
             {readingTime && ` - ${readingTime} min lectura`}
           </span>
         </div>
@@ -464,13 +549,10 @@ function BookReader() {
             {content?.content?.chapters?.map((chapter, index) => (
               <div
                 key={index}
-                className={`toc-item ${currentChapter === index ? 'active' : ''}`}
+                className={`toc-item ${currentChapter === chapter.chapter ? 'active' : ''}`}
                 onClick={() => {
-                  const spineIndex = content.content.spine.findIndex(s =>
-                    s.href.includes(chapter.href?.split('#')[0])
-                  );
-                  if (spineIndex !== -1) {
-                    loadChapter(spineIndex);
+                  if (chapter.chapter !== null) {
+                    loadChapter(chapter.chapter, chapter.anchor);
                     setShowToc(false);
                   }
                 }}
@@ -627,7 +709,7 @@ function BookReader() {
       <button
         className={`nav-arrow nav-arrow-right ${showControls ? 'visible' : ''}`}
         onClick={goToNextChapter}
-        disabled={currentChapter >= (content?.content?.spine?.length || 1) - 1}
+        disabled={currentChapter >= (content?.content?.total || 1) - 1}
       >
         <ChevronRightIcon />
       </button>
@@ -635,13 +717,13 @@ function BookReader() {
       {/* Bottom Progress */}
       <div className={`reader-footer ${showControls ? 'visible' : ''}`}>
         <div className="progress-info">
-          <span>{Math.round(((currentChapter + 1) / (content?.content?.spine?.length || 1)) * 100)}% llegit</span>
+          <span>{Math.round(((currentChapter + 1) / (content?.content?.total || 1)) * 100)}% llegit</span>
         </div>
         <div className="reading-progress">
           <div
             className="progress-bar"
             style={{
-              width: `${((currentChapter + 1) / (content?.content?.spine?.length || 1)) * 100}%`
+              width: `${((currentChapter + 1) / (content?.content?.total || 1)) * 100}%`
             }}
           />
         </div>
@@ -3,7 +3,7 @@ import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import { useAuth } from '../context/AuthContext';
 import { useLibrary } from '../context/LibraryContext';
-import { API_URL } from '../config/api';
+import { API_URL, withImageWidth } from '../config/api';
 import {
   BookIcon,
   EpubIcon,
@@ -414,7 +414,7 @@ function Books() {
 
   const getBookCover = (book) => {
     if (book.cover) {
-      return `${API_URL}/api/books/${book.id}/cover`;
+      return withImageWidth(`${API_URL}/api/books/${book.id}/cover`, 200);
     }
     return null;
   };
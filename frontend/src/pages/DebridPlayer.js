@@ -747,6 +747,8 @@ function DebridPlayer() {
       if (type !== 'movie' && season && episode) {
         params.season = season;
         params.episode = episode;
+        // Permet al servidor preparar el següent episodi del mateix pack
+        params.tmdb_id = tmdbId;
       }
 
       const response = await axios.post(`${API_URL}/api/debrid/stream`, null, {
@@ -794,7 +796,7 @@ function DebridPlayer() {
         setLoadingStream(false);
       }
     }
-  }, [getCachedStreamUrl, cacheStreamUrl, type, season, episode]);
+  }, [getCachedStreamUrl, cacheStreamUrl, type, tmdbId, season, episode]);
 
   // Change quality - 'auto' per mode automàtic o '4K'/'1080p'/'720p' per manual
   const changeTorrent = useCallback((quality) => {
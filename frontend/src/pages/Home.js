@@ -2,7 +2,7 @@ import React, { useState, useEffect, useCallback } from 'react';
 import { Link, useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import { useAuth } from '../context/AuthContext';
-import { API_URL } from '../config/api';
+import { API_URL, getTmdbImageUrl, withImageWidth } from '../config/api';
 import LazyImage from '../components/LazyImage';
 import CenterFocusCarousel from '../components/CenterFocusCarousel';
 import ContinueWatchingCarousel from '../components/ContinueWatchingCarousel';
@@ -41,14 +41,30 @@ function Home() {
   const loadData = useCallback(async () => {
     try {
       if (isAuthenticated) {
+        // Historial, watchlist i continuar veient en una sola petició
+        const userRoutes = [
+          '/api/user/watch-history?limit=5',
+          '/api/user/watchlist?limit=20',
+          '/api/user/continue-watching'
+        ];
+        const batchRes = await axios.post('/api/batch', { requests: userRoutes }).catch(() => null);
+        const batchParts = batchRes?.data?.responses || [];
+        // Cos d'una subpetició, o la ruta individual si el batch ha fallat
+        const userData = async (index) => {
+          const part = batchParts[index];
+          if (part) {
+            if (part.status !== 200) throw new Error(`${part.path}: ${part.status}`);
+            return part.body;
+          }
+          return (await axios.get(userRoutes[index])).data;
+        };
 
         // Carregar recomanacions basades en l'historial o populars de TMDB
         try {
           let recommendedItems = [];
 
           // Si l'usuari té historial, basar recomanacions en això
-          const watchHistoryRes = await axios.get('/api/user/watch-history?limit=5').catch(() => null);
-          const watchHistory = watchHistoryRes?.data || [];
+          const watchHistory = (await userData(0).catch(() => null)) || [];
 
           if (watchHistory.length > 0) {
             // Obtenir recomanacions basades en els últims títols vistos
@@ -64,7 +80,7 @@ function Home() {
                   type: mediaType === 'movie' ? 'movie' : 'series',
                   name: rec.title || rec.name,
                   year: (rec.release_date || rec.first_air_date || '').split('-')[0],
-                  poster: rec.poster_path ? `https://image.tmdb.org/t/p/w300${rec.poster_path}` : null,
+                  poster: getTmdbImageUrl(rec.poster_path, 'w300'),
                   tmdb_id: rec.id,
                   is_tmdb: true
                 }));
@@ -97,7 +113,7 @@ function Home() {
               type: 'movie',
               name: m.title,
               year: (m.release_date || '').split('-')[0],
-              poster: m.poster_path ? `https://image.tmdb.org/t/p/w300${m.poster_path}` : null,
+              poster: getTmdbImageUrl(m.poster_path, 'w300'),
               tmdb_id: m.id,
               is_tmdb: true
             }));
@@ -107,7 +123,7 @@ function Home() {
               type: 'series',
               name: s.name,
               year: (s.first_air_date || '').split('-')[0],
-              poster: s.poster_path ? `https://image.tmdb.org/t/p/w300${s.poster_path}` : null,
+              poster: getTmdbImageUrl(s.poster_path, 'w300'),
               tmdb_id: s.id,
               is_tmdb: true
             }));
@@ -150,16 +166,14 @@ function Home() {
 
         // Watchlist
         try {
-          const watchlistRes = await axios.get('/api/user/watchlist?limit=20');
-          setWatchlist(watchlistRes.data || []);
+          setWatchlist((await userData(1)) || []);
         } catch (e) {
           console.debug('Watchlist no disponible');
         }
 
         // Continue Watching - carrega contingut en progrés (local i streaming)
         try {
-          const continueRes = await axios.get('/api/user/continue-watching');
-          const items = (continueRes.data || []).map(item => ({
+          const items = ((await userData(2)) || []).map(item => ({
             ...item,
             // Normalitzar el tipus
             type: item.type === 'episode' ? 'series' : item.type,
@@ -199,7 +213,7 @@ function Home() {
     const link = item.is_tmdb
       ? `/${itemType === 'movie' ? 'movies' : 'series'}/tmdb-${item.tmdb_id}`
       : `/${itemType === 'movie' ? 'movies' : 'series'}/${item.id}`;
-    const image = item.poster || (item.id ? `${API_URL}/api/image/poster/${item.id}` : null);
+    const image = item.poster || (item.id ? withImageWidth(`${API_URL}/api/image/poster/${item.id}`, 300) : null);
 
     return (
       <div
@@ -267,20 +281,14 @@ function Home() {
     let image = null;
     if (item.backdrop_path) {
       // Pot ser una URL relativa de TMDB o una URL completa
-      image = item.backdrop_path.startsWith('http')
-        ? item.backdrop_path
-        : `https://image.tmdb.org/t/p/w500${item.backdrop_path}`;
+      image = getTmdbImageUrl(item.backdrop_path, 'w500');
     } else if (item.still_path) {
-      image = item.still_path.startsWith('http')
-        ? item.still_path
-        : `https://image.tmdb.org/t/p/w500${item.still_path}`;
+      image = getTmdbImageUrl(item.still_path, 'w500');
     } else if (item.poster_path) {
-      image = item.poster_path.startsWith('http')
-        ? item.poster_path
-        : `https://image.tmdb.org/t/p/w300${item.poster_path}`;
+      image = getTmdbImageUrl(item.poster_path, 'w300');
     } else if (item.series_id) {
       // Contingut local - usar la API d'imatges
-      image = `${API_URL}/api/image/backdrop/${item.series_id}`;
+      image = withImageWidth(`${API_URL}/api/image/backdrop/${item.series_id}`, 500);
     }
 
     const progress = item.progress || 0;
@@ -332,9 +340,7 @@ function Home() {
   const renderWatchlistItem = useCallback((item, index, isCenter) => {
     const itemType = item.media_type === 'movie' ? 'movies' : 'series';
     const link = `/${itemType}/tmdb-${item.tmdb_id}`;
-    const image = item.poster_path
-      ? `https://image.tmdb.org/t/p/w300${item.poster_path}`
-      : null;
+    const image = getTmdbImageUrl(item.poster_path, 'w300');
 
     return (
       <div
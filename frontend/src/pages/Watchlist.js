@@ -2,7 +2,7 @@ import React, { useState, useEffect, useCallback } from 'react';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import { useAuth } from '../context/AuthContext';
-import { API_URL } from '../config/api';
+import { API_URL, getTmdbImageUrl } from '../config/api';
 import {
   BookmarkIcon,
   PlayIcon,
@@ -328,7 +328,7 @@ function Watchlist() {
               >
                 {item.poster_path ? (
                   <img
-                    src={`https://image.tmdb.org/t/p/w500${item.poster_path}`}
+                    src={getTmdbImageUrl(item.poster_path, 'w500')}
                     alt={item.title}
                   />
                 ) : (